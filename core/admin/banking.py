@@ -471,6 +471,7 @@ class BankTransactionAdmin(CSVExportMixin, admin.ModelAdmin):
         "create_expenses_bulk",
         "download_revolut_receipts",
         "export_selected_as_csv",
+        "export_selected_as_xlsx",
     ]
 
     csv_export_filename_prefix = "bank_transactions"
@@ -975,7 +976,8 @@ class BankTransactionAdmin(CSVExportMixin, admin.ModelAdmin):
     @admin.action(description="Привязать к инвойсу")
     def link_to_invoice(self, request, queryset):
         """Привязка выбранных транзакций к конкретному инвойсу через промежуточную страницу"""
-        from core.models.billing import NewInvoice
+        from core.models.billing import NewInvoice, Transaction
+        from core.models.series import reserve_document_numbers
 
         eligible = queryset.filter(
             matched_invoice__isnull=True,
@@ -998,16 +1000,20 @@ class BankTransactionAdmin(CSVExportMixin, admin.ModelAdmin):
                 return None
 
             linked = 0
-            for bt in eligible:
-                with transaction.atomic():
-                    bt.matched_invoice = invoice
-                    bt.reconciliation_note = f"Привязано вручную к {invoice.number}"
-                    bt.save(update_fields=["matched_invoice", "reconciliation_note", "fetched_at"])
-                    # Единая точка создания платежа (TOPUP+PAYMENT для
-                    # клиентов). Раньше тут был свой PAYMENT(TRANSFER) от
-                    # клиента — уводил Client.balance в минус.
-                    BillingService.create_payment_for_bank_match(bt.pk)
-                    linked += 1
+            bank_trxs = list(eligible)
+            # До двух транзакций (TOPUP+PAYMENT) на операцию — номера блоком
+            # серии; лишние вернутся в серию при выходе из резерва.
+            with reserve_document_numbers(Transaction, Transaction.series_prefix(), 2 * len(bank_trxs)):
+                for bt in bank_trxs:
+                    with transaction.atomic():
+                        bt.matched_invoice = invoice
+                        bt.reconciliation_note = f"Привязано вручную к {invoice.number}"
+                        bt.save(update_fields=["matched_invoice", "reconciliation_note", "fetched_at"])
+                        # Единая точка создания платежа (TOPUP+PAYMENT для
+                        # клиентов). Раньше тут был свой PAYMENT(TRANSFER) от
+                        # клиента — уводил Client.balance в минус.
+                        BillingService.create_payment_for_bank_match(bt.pk)
+                        linked += 1
 
             messages.success(request, f"{linked} транзакций привязано к {invoice.number}.")
             return None
@@ -1088,7 +1094,8 @@ class BankTransactionAdmin(CSVExportMixin, admin.ModelAdmin):
     def create_expenses_bulk(self, request, queryset):
         """Массовое создание расходов из банковских транзакций"""
         from core.models import Company
-        from core.models.billing import ExpenseCategory, InvoiceItem, NewInvoice
+        from core.models.billing import ExpenseCategory, InvoiceItem, NewInvoice, Transaction
+        from core.models.series import document_savepoint, reserve_document_numbers
 
         # Фильтруем только несопоставленные транзакции
         eligible = queryset.filter(
@@ -1130,41 +1137,51 @@ class BankTransactionAdmin(CSVExportMixin, admin.ModelAdmin):
             created_count = 0
             errors = 0
 
-            for bank_trx in eligible:
-                try:
-                    with transaction.atomic():
-                        expense_amount = abs(bank_trx.amount)
-                        invoice = NewInvoice(
-                            document_type="INVOICE_FACT",
-                            date=bank_trx.created_at.date(),
-                            status="ISSUED",
-                            category=category,
-                            recipient_company=caromoto,
-                            currency=bank_trx.currency or "EUR",
-                            notes=f"Авто-создано (массово) из банковской операции {bank_trx.external_id}",
-                        )
-                        invoice.save()
-
-                        item_desc = bank_trx.description or bank_trx.counterparty_name or f"Расход ({category.name})"
-                        InvoiceItem.objects.create(
-                            invoice=invoice,
-                            description=item_desc,
-                            quantity=Decimal("1"),
-                            unit_price=expense_amount,
-                            total_price=expense_amount,
-                            order=0,
-                        )
-                        invoice.calculate_totals()
-                        invoice.save(update_fields=["subtotal", "total", "updated_at"])
-
-                        bank_trx.matched_invoice = invoice
-                        bank_trx.reconciliation_note = f"FACT-расход (массово): {category.name}"
-                        bank_trx.save(update_fields=["matched_invoice", "reconciliation_note", "fetched_at"])
-                        BillingService.create_payment_for_bank_match(bank_trx.pk)
-                        created_count += 1
-                except Exception as e:
-                    logger.error(f"[create_expenses_bulk] BankTrx {bank_trx.pk}: {e}")
-                    errors += 1
+            # Номера FACT и TRX (платёж) — блоками серий, а не upsert'ом
+            # счётчика на каждый документ. Упавшая операция отдаёт свои
+            # номера следующей.
+            bank_trxs = list(eligible)
+            with (
+                reserve_document_numbers(NewInvoice, NewInvoice.series_prefix("INVOICE_FACT"), len(bank_trxs)) as facts,
+                reserve_document_numbers(Transaction, Transaction.series_prefix(), len(bank_trxs)) as payments,
+            ):
+                for bank_trx in bank_trxs:
+                    try:
+                        with document_savepoint(facts, payments):
+                            expense_amount = abs(bank_trx.amount)
+                            invoice = NewInvoice(
+                                document_type="INVOICE_FACT",
+                                date=bank_trx.created_at.date(),
+                                status="ISSUED",
+                                category=category,
+                                recipient_company=caromoto,
+                                currency=bank_trx.currency or "EUR",
+                                notes=f"Авто-создано (массово) из банковской операции {bank_trx.external_id}",
+                            )
+                            invoice.save()
+
+                            item_desc = (
+                                bank_trx.description or bank_trx.counterparty_name or f"Расход ({category.name})"
+                            )
+                            InvoiceItem.objects.create(
+                                invoice=invoice,
+                                description=item_desc,
+                                quantity=Decimal("1"),
+                                unit_price=expense_amount,
+                                total_price=expense_amount,
+                                order=0,
+                            )
+                            invoice.calculate_totals()
+                            invoice.save(update_fields=["subtotal", "total", "updated_at"])
+
+                            bank_trx.matched_invoice = invoice
+                            bank_trx.reconciliation_note = f"FACT-расход (массово): {category.name}"
+                            bank_trx.save(update_fields=["matched_invoice", "reconciliation_note", "fetched_at"])
+                            BillingService.create_payment_for_bank_match(bank_trx.pk)
+                            created_count += 1
+                    except Exception as e:
+                        logger.error(f"[create_expenses_bulk] BankTrx {bank_trx.pk}: {e}")
+                        errors += 1
 
             if created_count:
                 messages.success(request, f"Создано {created_count} расходов ({category.name}).")
@@ -205,4 +205,5 @@ class NewInvoiceAdmin(
         "delete_invoices_with_transactions",
         "recalculate_all_balances",
         "export_selected_as_csv",
+        "export_selected_as_xlsx",
     ]
@@ -33,7 +33,7 @@ class TransactionAdmin(CSVExportMixin, admin.ModelAdmin):
         "category",
     )
 
-    actions = ["export_selected_as_csv"]
+    actions = ["export_selected_as_csv", "export_selected_as_xlsx"]
     csv_export_filename_prefix = "transactions"
     csv_export_fields = [
         ("number", "Номер"),
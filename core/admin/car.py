@@ -22,6 +22,7 @@ from core.models import (
     LineService,
     WarehouseService,
 )
+from core.services.client_portal_listing import invalidate_facets_for_cars
 
 logger = logging.getLogger(__name__)
 
@@ -293,12 +294,9 @@ class CarHasUnreadEmailsFilter(SimpleListFilter):
     def queryset(self, request, queryset):
         value = self.value()
         if value == "unread":
-            return queryset.filter(email_links__is_read=False).distinct()
+            return queryset.filter(emails_unread__gt=0)
         if value == "need_reply":
-            return queryset.filter(
-                email_links__email__needs_reply=True,
-                email_links__email__direction="INCOMING",
-            ).distinct()
+            return queryset.filter(emails_need_reply__gt=0)
         if value == "any":
             return queryset.filter(email_links__isnull=False).distinct()
         if value == "none":
@@ -409,7 +407,7 @@ class CarAdmin(CSVExportMixin, admin.ModelAdmin):
         умножена на число писем. См. карточку авто (services_summary_display)
         — там расчёт через отдельный aggregate, всегда корректен.
         """
-        from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum
+        from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
         from django.db.models.functions import Coalesce
 
         from core.service_codes import storage_service_q
@@ -449,19 +447,6 @@ class CarAdmin(CSVExportMixin, admin.ModelAdmin):
                 output_field=DecimalField(max_digits=12, decimal_places=2),
             ),
             _storage_daily_rate_ann_wh=F("warehouse_id"),
-            _emails_unread=Count(
-                "email_links",
-                filter=Q(email_links__is_read=False),
-                distinct=True,
-            ),
-            _emails_need_reply=Count(
-                "email_links__email",
-                filter=Q(
-                    email_links__email__needs_reply=True,
-                    email_links__email__direction="INCOMING",
-                ),
-                distinct=True,
-            ),
         )
         return qs
 
@@ -528,6 +513,7 @@ class CarAdmin(CSVExportMixin, admin.ModelAdmin):
         "resend_car_unload_notification",
         "resend_car_unload_telegram",
         "export_selected_as_csv",
+        "export_selected_as_xlsx",
     ]
 
     def get_form(self, request, obj=None, **kwargs):
@@ -898,10 +884,9 @@ class CarAdmin(CSVExportMixin, admin.ModelAdmin):
     colored_status.short_description = "Статус"
 
     def vin_display(self, obj):
-        unread = getattr(obj, "_emails_unread", None)
-        if unread is None:
-            unread = obj.email_links.filter(is_read=False).count() if obj.pk else 0
-        need_reply = getattr(obj, "_emails_need_reply", 0) or 0
+        # Денормализованные счётчики (core.services.email_counters).
+        unread = obj.emails_unread or 0
+        need_reply = obj.emails_need_reply or 0
 
         if unread > 0:
             badge_bg, badge_title = "#dc2626", f"{unread} непрочитанных письма"
@@ -1199,6 +1184,7 @@ class CarAdmin(CSVExportMixin, admin.ModelAdmin):
             allowed_pks.append(pk)
 
         updated = Car.objects.filter(pk__in=allowed_pks).update(status=status)
+        invalidate_facets_for_cars(allowed_pks)
         if enqueue_recalc and allowed_pks:
             _enqueue_recalc_cars_total_price(allowed_pks)
 
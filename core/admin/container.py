@@ -59,12 +59,9 @@ class HasUnreadEmailsFilter(SimpleListFilter):
     def queryset(self, request, queryset):
         value = self.value()
         if value == "unread":
-            return queryset.filter(email_links__is_read=False).distinct()
+            return queryset.filter(emails_unread__gt=0)
         if value == "need_reply":
-            return queryset.filter(
-                emails__needs_reply=True,
-                emails__direction="INCOMING",
-            ).distinct()
+            return queryset.filter(emails_need_reply__gt=0)
         if value == "any":
             return queryset.filter(emails__isnull=False).distinct()
         if value == "none":
@@ -158,7 +155,7 @@ class ContainerAdmin(admin.ModelAdmin):
         return initial
 
     def get_queryset(self, request):
-        from django.db.models import Count, Q
+        from django.db.models import Count
 
         qs = super().get_queryset(request)
         return (
@@ -166,20 +163,6 @@ class ContainerAdmin(admin.ModelAdmin):
             .prefetch_related("container_cars")
             .annotate(
                 _photos_count=Count("photos", distinct=True),
-                _emails_total=Count("emails", distinct=True),
-                _emails_unread=Count(
-                    "email_links",
-                    filter=Q(email_links__is_read=False),
-                    distinct=True,
-                ),
-                _emails_need_reply=Count(
-                    "emails",
-                    filter=Q(
-                        emails__needs_reply=True,
-                        emails__direction="INCOMING",
-                    ),
-                    distinct=True,
-                ),
             )
         )
 
@@ -350,10 +333,7 @@ class ContainerAdmin(admin.ModelAdmin):
             try:
                 from django.db import transaction
 
-                from core.services.car_service_manager import (
-                    apply_client_tariffs_for_container,
-                    create_ths_services_for_container,
-                )
+                from core.services.tariff_engine import recalculate_containers, reprice_cars_and_invoices
 
                 # Force refresh container data from DB
                 parent.refresh_from_db()
@@ -363,22 +343,15 @@ class ContainerAdmin(admin.ModelAdmin):
                 # Use savepoint for safe recalculation
                 with transaction.atomic():
                     if parent.container_cars.exists():
-                        created = create_ths_services_for_container(parent)
-                        logger.info(f"[FORMSET] Created/updated {created} THS services for container {parent.number}")
-                        # Apply client tariffs
-                        apply_client_tariffs_for_container(parent)
-
-                        # Пересчёт цен ВСЕХ машин контейнера после обновления THS.
-                        # Перечитываем машины уже ПОСЛЕ изменений THS/тарифов (вместо
-                        # refresh_from_db на каждую) и пишем итог одним bulk_update —
-                        # без N save() и без N сигнальных каскадов (WS, Celery и т.д.).
-                        cars_in_container = list(
-                            parent.container_cars.select_related("warehouse").prefetch_related("car_services")
+                        # THS + тарифы клиентов одним пакетом, затем пересчёт цен
+                        # ВСЕХ машин контейнера батчем (без N save() и сигнальных
+                        # каскадов) и одна задача регенерации их инвойсов.
+                        result = recalculate_containers([parent])
+                        logger.info(
+                            f"[FORMSET] Created/updated {result.ths_services} THS services for container {parent.number}"
                         )
-                        for car in cars_in_container:
-                            car.calculate_total_price()
-                        Car.objects.bulk_update(cars_in_container, ["total_price", "storage_cost", "days"])
-                        logger.info(f"[FORMSET] Recalculated prices for all {len(cars_in_container)} cars")
+                        repriced = reprice_cars_and_invoices(result.car_ids)
+                        logger.info(f"[FORMSET] Recalculated prices for all {repriced} cars")
                     else:
                         logger.info(f"[FORMSET] No cars left in container {parent.number}")
             except Exception as e:
@@ -425,11 +398,10 @@ class ContainerAdmin(admin.ModelAdmin):
         * Зелёный «0» — писем либо нет вовсе, либо все прочитаны
         * Оранжевый 🚩 — есть входящие, помеченные «ответить позже»
         """
-        unread = getattr(obj, "_emails_unread", None)
-        if unread is None:
-            unread = obj.email_links.filter(is_read=False).count() if obj.pk else 0
-
-        need_reply = getattr(obj, "_emails_need_reply", 0) or 0
+        # Денормализованные счётчики (core.services.email_counters) — без
+        # джойна таблиц писем в changelist.
+        unread = obj.emails_unread or 0
+        need_reply = obj.emails_need_reply or 0
 
         if unread > 0:
             bg, title = "#dc2626", f"{unread} непрочитанных письма"
@@ -471,32 +443,29 @@ class ContainerAdmin(admin.ModelAdmin):
         Раньше ``queryset.update()`` обходил ``validate_status_transition`` —
         можно было массово откатить переданный контейнер (и его авто) в
         FLOATING. Теперь недопустимые переходы пропускаются с предупреждением.
-        ``sync_cars`` (bulk) обновляет статус/склад/даты/days/storage_cost
-        машин; собственного хранения у контейнера больше нет.
+        Переход, синхронизация машин (статус/склад/даты/days/storage_cost/
+        total_price) и регенерация инвойсов — батчем в
+        ``set_containers_status``; собственного хранения у контейнера нет.
         """
-        from core.models.containers import ALLOWED_STATUS_TRANSITIONS
-
-        allowed_pks = []
-        skipped = []
-        for pk, number, cur_status in queryset.values_list("pk", "number", "status"):
-            if cur_status == status:
-                continue  # уже в целевом статусе — no-op
-            if status not in ALLOWED_STATUS_TRANSITIONS.get(cur_status, set()):
-                skipped.append(number)
-                continue
-            allowed_pks.append(pk)
+        from core.services.container_lifecycle_service import set_containers_status
 
-        updated = Container.objects.filter(pk__in=allowed_pks).update(status=status)
-        for obj in Container.objects.filter(pk__in=allowed_pks):
-            obj.sync_cars()
+        result = set_containers_status(queryset.values_list("pk", flat=True), status)
 
-        if skipped:
+        if result.skipped_fsm:
             self.message_user(
                 request,
-                f"Пропущены (недопустимый переход статуса → '{status_label}'): " + ", ".join(skipped),
+                f"Пропущены (недопустимый переход статуса → '{status_label}'): " + ", ".join(result.skipped_fsm),
                 level="warning",
             )
-        self.message_user(request, f"Статус изменён на '{status_label}' для {updated} контейнеров и их авто.")
+        if result.skipped_incomplete:
+            self.message_user(
+                request,
+                "Не обновлены (требуются поля 'Склад' и 'Дата разгрузки'): " + ", ".join(result.skipped_incomplete),
+                level="warning",
+            )
+        self.message_user(
+            request, f"Статус изменён на '{status_label}' для {len(result.updated)} контейнеров и их авто."
+        )
 
     def set_status_floating(self, request, queryset):
         self._bulk_set_status(request, queryset, "FLOATING", "В пути")
@@ -509,31 +478,8 @@ class ContainerAdmin(admin.ModelAdmin):
     set_status_in_port.short_description = "Изменить статус на В порту"
 
     def set_status_unloaded(self, request, queryset):
-        from django.core.exceptions import ValidationError
-
-        updated = 0
-        for obj in queryset:
-            if obj.warehouse and obj.unload_date:
-                obj.status = "UNLOADED"
-                try:
-                    # save() с update_fields=["status"] прогоняет FSM-валидацию.
-                    obj.save(update_fields=["status"])
-                except ValidationError as e:
-                    self.message_user(
-                        request,
-                        f"Контейнер {obj.number} не обновлён: {'; '.join(e.messages)}",
-                        level="warning",
-                    )
-                    continue
-                obj.sync_cars()
-                updated += 1
-            else:
-                self.message_user(
-                    request,
-                    f"Контейнер {obj.number} не обновлён: требуются поля 'Склад' и 'Дата разгрузки'.",
-                    level="warning",
-                )
-        self.message_user(request, f"Статус изменён на 'Разгружен' для {updated} контейнеров и их авто.")
+        # Склад и дата разгрузки проверяются в set_containers_status.
+        self._bulk_set_status(request, queryset, "UNLOADED", "Разгружен")
 
     set_status_unloaded.short_description = "Изменить статус на Разгружен"
 
@@ -23,6 +23,7 @@ from core.models_email import (
     EmailIngestFilter,
     GmailSyncState,
 )
+from core.services.email_counters import schedule_refresh, schedule_refresh_for_emails
 
 
 class MatchedByListFilter(admin.SimpleListFilter):
@@ -298,6 +299,7 @@ class ContainerEmailAdmin(admin.ModelAdmin):
                     links,
                     ignore_conflicts=True,
                 )
+                schedule_refresh(container_ids=[container.id])
                 self.message_user(
                     request,
                     f"Привязано {len(email_ids)} писем к контейнеру {container}",
@@ -331,6 +333,7 @@ class ContainerEmailAdmin(admin.ModelAdmin):
             email_id__in=email_ids,
             is_read=False,
         ).update(is_read=True)
+        schedule_refresh_for_emails(email_ids)
         self.message_user(
             request,
             f"{updated} связей письмо↔контейнер отмечено прочитанными.",
@@ -343,6 +346,7 @@ class ContainerEmailAdmin(admin.ModelAdmin):
             email_id__in=email_ids,
             is_read=True,
         ).update(is_read=False)
+        schedule_refresh_for_emails(email_ids)
         self.message_user(
             request,
             f"{updated} связей письмо↔контейнер отмечено непрочитанными.",
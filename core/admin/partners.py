@@ -1234,10 +1234,7 @@ class LineAdmin(admin.ModelAdmin):
         from django.shortcuts import redirect
 
         from core.models import Line
-        from core.services.car_service_manager import (
-            apply_client_tariffs_for_container,
-            create_ths_services_for_container,
-        )
+        from core.services.tariff_engine import recalculate_containers, reprice_cars_and_invoices
 
         logger = logging.getLogger(__name__)
 
@@ -1251,39 +1248,20 @@ class LineAdmin(admin.ModelAdmin):
             return redirect("admin:core_line_changelist")
         logger.info(f"[RECALC THS] Starting for line {line.name}")
 
-        # Find all containers of this line with cars in needed statuses
-        containers = Container.objects.filter(line=line, container_cars__status__in=["UNLOADED", "IN_PORT"]).distinct()
-
-        updated_containers = 0
-        updated_cars = 0
+        # Контейнеры линии с THS и машинами в нужных статусах — одним пакетом
+        # (см. core.services.tariff_engine): THS, тарифы клиентов, цены машин.
+        container_ids = list(
+            Container.objects.filter(line=line, ths__gt=0, container_cars__status__in=["UNLOADED", "IN_PORT"])
+            .values_list("pk", flat=True)
+            .distinct()
+        )
 
         try:
             with transaction.atomic():
-                for container in containers:
-                    if container.ths:
-                        logger.info(f"[RECALC THS] Container {container.number}, THS={container.ths}")
-
-                        # Recalculate THS services
-                        created = create_ths_services_for_container(container)
-                        logger.info(f"[RECALC THS] Created {created} THS services")
-                        # Apply client tariffs
-                        apply_client_tariffs_for_container(container)
-                        updated_containers += 1
-
-                        # Recalculate car prices
-                        for car in container.container_cars.filter(status__in=["UNLOADED", "IN_PORT"]):
-                            old_price = car.total_price
-                            # Clear cache and get fresh data
-                            car.refresh_from_db()
-                            if hasattr(car, "_prefetched_objects_cache"):
-                                car._prefetched_objects_cache.clear()
-
-                            car.calculate_total_price()
-                            car.save(update_fields=["total_price", "storage_cost", "days"])
-                            logger.info(f"[RECALC THS] Car {car.vin}: {old_price} -> {car.total_price}")
-                            updated_cars += 1
-
-            messages.success(request, f"Пересчитано: {updated_containers} контейнеров, {updated_cars} машин")
+                result = recalculate_containers(container_ids)
+                updated_cars = reprice_cars_and_invoices(result.car_ids)
+            logger.info(f"[RECALC THS] {result.containers} containers, {result.ths_services} THS services")
+            messages.success(request, f"Пересчитано: {result.containers} контейнеров, {updated_cars} машин")
         except Exception as e:
             logger.error(f"[RECALC THS] Error: {e}", exc_info=True)
             messages.error(request, f"Ошибка при пересчёте: {e}")
@@ -110,6 +110,7 @@ class ScanProcessingJobAdmin(admin.ModelAdmin):
         "apply_jobs_force_action",
         "ignore_jobs_action",
         "reprocess_jobs_action",
+        "reprocess_jobs_fresh_action",
     )
 
     change_form_template = "admin/scan_processing_job/change_form.html"
@@ -355,7 +356,7 @@ class ScanProcessingJobAdmin(admin.ModelAdmin):
 
     ignore_jobs_action.short_description = "🚫 Игнорировать"
 
-    def reprocess_jobs_action(self, request, queryset):
+    def _reprocess_jobs(self, request, queryset, *, use_cache: bool):
         from core.tasks import process_scan_job
 
         n = 0
@@ -366,15 +367,25 @@ class ScanProcessingJobAdmin(admin.ModelAdmin):
             job.error_message = ""
             job.save(update_fields=["status", "error_message"])
             try:
-                process_scan_job.delay(job.id)
+                process_scan_job.delay(job.id, use_cache=use_cache)
             except Exception:
                 # eager / no broker — выполняем синхронно
-                process_scan_job(job.id)  # type: ignore[call-arg]
+                process_scan_job(job.id, use_cache=use_cache)  # type: ignore[call-arg]
             n += 1
         self.message_user(request, f"Поставлено на повторную обработку: {n}", messages.INFO)
 
+    def reprocess_jobs_action(self, request, queryset):
+        # Ответ модели по тому же файлу берётся из кэша LLM-извлечений —
+        # пост-обработка VIN и применение прогоняются заново бесплатно.
+        self._reprocess_jobs(request, queryset, use_cache=True)
+
     reprocess_jobs_action.short_description = "🔁 Повторить AI-обработку"
 
+    def reprocess_jobs_fresh_action(self, request, queryset):
+        self._reprocess_jobs(request, queryset, use_cache=False)
+
+    reprocess_jobs_fresh_action.short_description = "🔁 Повторить AI-обработку (заново спросить модель)"
+
     # ── Custom URL: multi-file upload ─────────────────────────────────────
 
     change_list_template = "admin/scan_processing_job/change_list.html"
@@ -226,7 +226,10 @@ def cache_warehouse_stats(warehouse_id):
 
 def cache_comparison_data(start_date, end_date):
     """Кэширует данные для системы сравнения"""
-    cache_key = get_cache_key("comparison_data", start_date, end_date)
+    from .services.comparison_buckets import report_cache_key
+
+    # Ключ с версиями месяцев периода — см. core.services.comparison_buckets.
+    cache_key = report_cache_key("comparison_data", start_date, end_date)
     cached_data = cache.get(cache_key)
 
     if cached_data is not None:
@@ -245,7 +248,7 @@ def cache_comparison_data(start_date, end_date):
             "cached_at": timezone.now().isoformat(),
         }
 
-        cache.set(cache_key, data, CACHE_TIMEOUTS["short"])
+        cache.set(cache_key, data, CACHE_TIMEOUTS["medium"])
         return data
 
     except Exception as e:
@@ -300,7 +303,6 @@ def invalidate_cache(pattern):
             "company_stats:",
             "client_stats:",
             "warehouse_stats:",
-            "comparison_data:",
         ]
         pattern_stripped = pattern.rstrip("*").rstrip(":")
         matching = [k for k in base_keys if pattern_stripped in k]
@@ -362,11 +364,9 @@ def invalidate_related_cache(model_name, instance_id):
         # Любой Car/Container/Tx/Invoice потенциально влияет на склад.
         invalidate_cache("warehouse_stats:*")
 
-    # 4. comparison_data — зависит от CarService/InvoiceItem/SupplierCost и от
-    #    Client/Warehouse при наличии. Меняется реже — pattern допустим, но
-    #    только при «настоящих» сущностях расчёта.
-    if model_lower in ("newinvoice", "transaction", "car", "client", "warehouse"):
-        invalidate_cache("comparison_data:*")
+    # 4. comparison_data / comparison_dashboard — ключи версионируются по
+    #    месяцам периода (core.services.comparison_buckets.report_cache_key):
+    #    пересчёт бакета сбрасывает только задетые отчёты, pattern не нужен.
 
     # 5. Дашборд компании: KPI, aging, recent-списки, cash wallet. Все эти
     #    ключи зависят от транзакций/инвойсов/машин/контейнеров — без явной
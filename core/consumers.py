@@ -8,21 +8,28 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 logger = logging.getLogger(__name__)
 
 
+async def _reject_non_staff(consumer: AsyncWebsocketConsumer) -> bool:
+    """Close the socket for anonymous/non-staff users; True if rejected."""
+    user = consumer.scope.get("user")
+    if user is None or not getattr(user, "is_authenticated", False):
+        logger.info("WS rejected: anonymous user from %s", consumer.scope.get("client"))
+        await consumer.close(code=4401)
+        return True
+
+    if not (getattr(user, "is_staff", False) or getattr(user, "is_superuser", False)):
+        logger.info("WS rejected: non-staff user %s", getattr(user, "username", "?"))
+        await consumer.close(code=4403)
+        return True
+    return False
+
+
 class DataUpdateConsumer(AsyncWebsocketConsumer):
     """Broadcasts admin data updates to authenticated staff users only."""
 
     GROUP_NAME = "updates"
 
     async def connect(self):
-        user = self.scope.get("user")
-        if user is None or not getattr(user, "is_authenticated", False):
-            logger.info("WS rejected: anonymous user from %s", self.scope.get("client"))
-            await self.close(code=4401)
-            return
-
-        if not (getattr(user, "is_staff", False) or getattr(user, "is_superuser", False)):
-            logger.info("WS rejected: non-staff user %s", getattr(user, "username", "?"))
-            await self.close(code=4403)
+        if await _reject_non_staff(self):
             return
 
         await self.channel_layer.group_add(self.GROUP_NAME, self.channel_name)
@@ -39,3 +46,34 @@ class DataUpdateConsumer(AsyncWebsocketConsumer):
 
     async def data_update_batch(self, event):
         await self.send(text_data=json.dumps(event.get("data", event)))
+
+
+class EmailPanelConsumer(AsyncWebsocketConsumer):
+    """Pushes new email bubbles to the correspondence panel of one card.
+
+    URL: ``ws/emails/<kind>/<id>/`` (kind: container / car / autotransport /
+    transportrequest). Events come from ``core.services.email_live``.
+    """
+
+    async def connect(self):
+        from core.services.email_live import PANEL_KINDS, panel_group
+
+        if await _reject_non_staff(self):
+            return
+
+        kwargs = self.scope["url_route"]["kwargs"]
+        if kwargs.get("kind") not in PANEL_KINDS:
+            await self.close(code=4404)
+            return
+
+        self.group_name = panel_group(kwargs["kind"], int(kwargs["entity_id"]))
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        group_name = getattr(self, "group_name", None)
+        if group_name:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    async def email_bubbles(self, event):
+        await self.send(text_data=json.dumps(event["data"]))
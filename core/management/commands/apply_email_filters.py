@@ -33,6 +33,7 @@ from core.models_email import (
     ContainerEmail,
     ContainerEmailLink,
 )
+from core.services.email_counters import schedule_refresh
 from core.services.email_ingest import (
     load_active_ingest_filters,
     matches_ingest_filter,
@@ -230,6 +231,10 @@ class Command(BaseCommand):
                             ],
                             ignore_conflicts=True,
                         )
+                    schedule_refresh(
+                        container_ids=[h.container_id for h in match.hits],
+                        car_ids=[h.car_id for h in match.car_hits],
+                    )
                 restored.append((e.id, len(match.hits), len(match.car_hits)))
 
         self.stdout.write(f"Кандидатов на восстановление: {len(restored)}.")
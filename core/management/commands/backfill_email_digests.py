@@ -0,0 +1,80 @@
+"""Заполнение ``ContainerEmail.content_digest`` у писем, сохранённых до
+появления поля.
+
+Проверка дублей при ингесте (``email_ingest._is_content_duplicate``) ищет
+копию по сохранённому дайджесту. Письма без дайджеста в поиске не
+участвуют, поэтому после миграции команду нужно прогнать один раз.
+Повторный запуск трогает только строки с пустым дайджестом (пустые
+письма — без темы и тела — пропускаются: дайджест им не положен).
+
+Примеры:
+    python manage.py backfill_email_digests
+    python manage.py backfill_email_digests --dry-run
+    python manage.py backfill_email_digests --all --batch-size 1000
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from core.models_email import ContainerEmail
+from core.services.email_ingest import email_content_digest
+
+
+class Command(BaseCommand):
+    help = "Посчитать и сохранить content_digest у писем ContainerEmail, где он пуст."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересчитать дайджест у всех писем (после изменения нормализации тела).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько писем обновлять за один bulk_update (default: 500).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать, сколько писем будет обновлено.",
+        )
+
+    def handle(self, *args, **opts):
+        batch_size: int = max(1, opts["batch_size"])
+
+        qs = ContainerEmail.objects.exclude(subject="", body_text="", body_html="")
+        if not opts["all"]:
+            qs = qs.filter(content_digest="")
+        total = qs.count()
+        self.stdout.write(f"Писем к обработке: {total}")
+        if opts["dry_run"] or not total:
+            return
+
+        updated = 0
+        batch: list[ContainerEmail] = []
+        rows = (
+            qs.only("id", "from_addr", "subject", "body_text", "body_html", "content_digest")
+            .order_by("id")
+            .iterator(chunk_size=batch_size)
+        )
+        for email in rows:
+            digest = email_content_digest(
+                from_addr=email.from_addr,
+                subject=email.subject,
+                body_text=email.body_text,
+                body_html=email.body_html,
+            )
+            if digest == email.content_digest:
+                continue
+            email.content_digest = digest
+            batch.append(email)
+            if len(batch) >= batch_size:
+                updated += ContainerEmail.objects.bulk_update(batch, ["content_digest"])
+                batch = []
+        if batch:
+            updated += ContainerEmail.objects.bulk_update(batch, ["content_digest"])
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено писем: {updated}"))
@@ -0,0 +1,37 @@
+"""Пересборка месячных бакетов отчёта сравнения (``ComparisonBucket``).
+
+Отчёт «Сравнение» складывает суммы за период из бакетов (см.
+``core.services.comparison_buckets``). Команда пересобирает их из исходных
+таблиц — после ручных правок в БД, импорта задним числом или при
+подозрении на дрейф. Идемпотентна. Ночью последние месяцы пересобирает
+``refresh_comparison_buckets_task``.
+
+Примеры:
+    python manage.py rebuild_comparison_buckets
+    python manage.py rebuild_comparison_buckets --months 12
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from core.services.comparison_buckets import rebuild_buckets
+
+
+class Command(BaseCommand):
+    help = "Пересобрать месячные бакеты отчёта сравнения."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=None,
+            help="Только последние N месяцев (по умолчанию — вся история).",
+        )
+
+    def handle(self, *args, **opts):
+        result = rebuild_buckets(months=opts["months"])
+        self.stdout.write(
+            f"Месяцев: {result['months']}, бакетов: {result['buckets']}, удалено лишних: {result['deleted']}"
+        )
+        self.stdout.write(self.style.SUCCESS("Бакеты сравнения пересобраны."))
@@ -0,0 +1,35 @@
+"""Пересборка месячной свёртки расходов (``ExpenseRollup``).
+
+Аналитика расходов читает суммы и позиции чеков из свёртки (см.
+``core.services.expense_rollup``). Команда пересобирает её из транзакций —
+после ручных правок в БД, импорта задним числом или при подозрении на
+дрейф. Идемпотентна. Ночью последние месяцы пересобирает
+``refresh_expense_rollup_task``.
+
+Примеры:
+    python manage.py rebuild_expense_rollup
+    python manage.py rebuild_expense_rollup --months 12
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from core.services.expense_rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = "Пересобрать месячную свёртку расходов для аналитики."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=None,
+            help="Только последние N месяцев (по умолчанию — вся история).",
+        )
+
+    def handle(self, *args, **opts):
+        result = rebuild_rollup(months=opts["months"])
+        self.stdout.write(f"Месяцев: {result['months']}, строк: {result['rows']}, удалено лишних: {result['deleted']}")
+        self.stdout.write(self.style.SUCCESS("Свёртка расходов пересобрана."))
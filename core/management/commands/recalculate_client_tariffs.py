@@ -8,18 +8,27 @@
 По умолчанию обрабатываются только АКТИВНЫЕ авто (не TRANSFERRED), чтобы не
 трогать историю и уже выставленные инвойсы. `--all` снимает это ограничение
 (использовать осознанно — изменит и переданные авто).
+
+Тариф применяется пачками (``core.services.tariff_engine``): ставки,
+услуги и состав контейнеров грузятся разом на пачку, наценки и цены
+пишутся ``bulk_update`` — ретро-пересчёт сезона идёт одним проходом.
 """
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from core.models import Car
-from core.services.car_service_manager import apply_client_tariff_for_car
+from core.services.car_pricing import PRICE_FIELDS, reprice_cars
+from core.services.comparison_buckets import schedule_refresh_for_cars
+from core.services.tariff_engine import apply_client_tariffs
+from core.services.task_coalescer import JOB_CAR_INVOICES, schedule
 
 
 class Command(BaseCommand):
     help = "Переприменяет тариф (скрытую наценку) к авто клиентов FIXED/FLEXIBLE под актуальную логику"
 
+    BATCH_SIZE = 1000
+
     def add_arguments(self, parser):
         parser.add_argument(
             "--all",
@@ -46,32 +55,35 @@ class Command(BaseCommand):
         changed = 0
         self.stdout.write(f"Кандидатов (FIXED/FLEXIBLE, {'все' if include_all else 'активные'}): {total}")
 
-        for car in cars_qs.iterator():
-            old_total = car.total_price
-
-            with transaction.atomic():
-                sid = transaction.savepoint()
-                apply_client_tariff_for_car(car)
-                car.calculate_total_price()
-                new_total = car.total_price
-
-                if new_total != old_total:
-                    if dry_run:
-                        transaction.savepoint_rollback(sid)
-                    else:
-                        Car.objects.filter(pk=car.pk).update(
-                            days=car.days,
-                            storage_cost=car.storage_cost,
-                            total_price=car.total_price,
-                        )
-                        transaction.savepoint_commit(sid)
-                    changed += 1
-                    self.stdout.write(
-                        f"  #{car.id} {car.vin} {car.client.name} [{car.client.tariff_type}]: "
-                        f"{old_total} -> {new_total}"
-                    )
-                else:
-                    transaction.savepoint_rollback(sid)
+        pks = list(cars_qs.order_by("pk").values_list("pk", flat=True))
+        for start in range(0, len(pks), self.BATCH_SIZE):
+            changed += self._apply_batch(cars_qs.filter(pk__in=pks[start : start + self.BATCH_SIZE]), dry_run)
 
         prefix = "[dry-run] " if dry_run else ""
         self.stdout.write(self.style.SUCCESS(f"{prefix}Изменено авто: {changed} из {total}"))
+
+    def _apply_batch(self, cars_qs, dry_run):
+        with transaction.atomic():
+            cars = list(cars_qs)
+            old_totals = {car.pk: car.total_price for car in cars}
+            # Наценка могла перераспределиться и при той же цене машины —
+            # позиции инвойса всё равно меняются.
+            markup_car_ids = {svc.car_id for svc in apply_client_tariffs(cars)}
+            # Перечитываем услуги уже с новыми наценками.
+            cars = list(cars_qs.prefetch_related("car_services"))
+            changed = [car for car in reprice_cars(cars) if car.total_price != old_totals[car.pk]]
+            for car in changed:
+                self.stdout.write(
+                    f"  #{car.id} {car.vin} {car.client.name} [{car.client.tariff_type}]: "
+                    f"{old_totals[car.pk]} -> {car.total_price}"
+                )
+            if dry_run:
+                transaction.set_rollback(True)
+            else:
+                if changed:
+                    Car.objects.bulk_update(changed, list(PRICE_FIELDS), batch_size=200)
+                    schedule_refresh_for_cars(changed)
+                invoice_car_ids = markup_car_ids | {car.pk for car in changed}
+                if invoice_car_ids:
+                    schedule(JOB_CAR_INVOICES, sorted(invoice_car_ids))
+        return len(changed)
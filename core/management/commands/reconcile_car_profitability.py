@@ -0,0 +1,35 @@
+"""Пересборка сводки прибыли по машинам (``CarProfitability``).
+
+Dashboard сверки читает прибыль из таблицы (см.
+``core.services.car_profitability``). Команда пересчитывает строки всех
+машин с затратами поставщиков и удаляет лишние — после ручных правок в БД
+или при подозрении на дрейф. Идемпотентна. Ночью то же делает
+``reconcile_car_profitability_task``.
+
+Примеры:
+    python manage.py reconcile_car_profitability
+    python manage.py reconcile_car_profitability --batch-size 5000
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from core.services.car_profitability import reconcile_car_profitability
+
+
+class Command(BaseCommand):
+    help = "Пересчитать сводку прибыли по машинам для Dashboard сверки."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Сколько машин пересчитывать за один проход агрегатов (default: 2000).",
+        )
+
+    def handle(self, *args, **opts):
+        result = reconcile_car_profitability(batch_size=max(1, opts["batch_size"]))
+        self.stdout.write(f"Пересчитано: {result['refreshed']}, удалено: {result['deleted']}")
+        self.stdout.write(self.style.SUCCESS("Сводка прибыли пересобрана."))
@@ -0,0 +1,36 @@
+"""Пересборка денормализованных счётчиков писем на карточках.
+
+``Car`` / ``Container`` / ``TransportRequest`` хранят ``emails_unread`` и
+``emails_need_reply`` (см. ``core.services.email_counters``). Команда
+пересчитывает их по таблицам связей — после миграции, ручных правок в БД
+или при подозрении на дрейф. Идемпотентна. Ночью то же делает
+``reconcile_email_counters_task``.
+
+Примеры:
+    python manage.py reconcile_email_counters
+    python manage.py reconcile_email_counters --batch-size 5000
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from core.services.email_counters import reconcile_email_counters
+
+
+class Command(BaseCommand):
+    help = "Пересчитать emails_unread / emails_need_reply у машин, контейнеров и заявок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Сколько карточек пересчитывать за один агрегатный запрос (default: 2000).",
+        )
+
+    def handle(self, *args, **opts):
+        result = reconcile_email_counters(batch_size=max(1, opts["batch_size"]))
+        for kind, updated in result.items():
+            self.stdout.write(f"{kind}: {updated}")
+        self.stdout.write(self.style.SUCCESS("Счётчики писем пересобраны."))
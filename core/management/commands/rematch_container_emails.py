@@ -27,6 +27,7 @@ from django.core.management.base import BaseCommand
 
 from core.models import Container
 from core.models_email import ContainerEmail, ContainerEmailLink
+from core.services.email_counters import refresh_email_counters
 
 
 class Command(BaseCommand):
@@ -81,6 +82,7 @@ class Command(BaseCommand):
         new_links_created = 0
         emails_touched = 0
         emails_primary_updated = 0
+        linked_container_ids: set[int] = set()
 
         # Минимальный совместимый с email_matcher объект: достаточно полей
         # subject / body_text / from_addr / to_addrs / cc_addrs / thread_id.
@@ -138,6 +140,7 @@ class Command(BaseCommand):
                         to_create,
                         ignore_conflicts=True,
                     )
+                    linked_container_ids.update(link.container_id for link in to_create)
                 if email.matched_by == ContainerEmail.MATCHED_BY_UNMATCHED:
                     email.matched_by = result.primary_matched_by
                     email.save(update_fields=["matched_by"])
@@ -145,6 +148,10 @@ class Command(BaseCommand):
             elif email.matched_by == ContainerEmail.MATCHED_BY_UNMATCHED:
                 emails_primary_updated += 1
 
+        if linked_container_ids:
+            # bulk_create не шлёт сигналы — счётчики писем пересчитываем разом.
+            refresh_email_counters(container_ids=linked_container_ids)
+
         prefix = "[DRY RUN] " if dry_run else ""
         self.stdout.write("")
         self.stdout.write(self.style.SUCCESS(f"{prefix}Писем затронуто:              {emails_touched}"))
@@ -93,27 +93,19 @@ class OptimizedContainerManager(models.Manager):
         )
 
     def update_related(self, instance):
-        """Обновить связанные объекты контейнера (bulk, без сигналов)."""
+        """Обновить связанные объекты контейнера (bulk, без сигналов).
+
+        Фаза 2: legacy fee-поля (ths/markup/unload_fee/…/rate) больше не
+        пишутся — цена считается из CarService. Обновляются только живые
+        поля: статус/склад/даты + денормализованные days/storage_cost/
+        total_price (батчем, см. ``sync_cars_for_containers``).
+        """
         if not instance.pk:
             return
 
-        cars = list(instance.container_cars.select_related("warehouse").all())
-        if not cars:
-            return
-        # Фаза 2: legacy fee-поля (ths/markup/unload_fee/…/rate) больше не
-        # пишутся — цена считается из CarService. Обновляем только живые
-        # поля: статус/склад/даты + денормализованные days/storage_cost/
-        # total_price.
-        for car in cars:
-            car.sync_with_container(instance)
-
-        from core.models import Car
-
-        Car.objects.bulk_update(
-            cars,
-            ["status", "warehouse", "unload_date", "transfer_date", "days", "storage_cost", "total_price"],
-            batch_size=50,
-        )
+        from core.services.container_lifecycle_service import sync_cars_for_containers
+
+        sync_cars_for_containers([instance.pk])
 
 
 class OptimizedClientManager(models.Manager):
@@ -0,0 +1,76 @@
+"""Middleware замера производительности запросов (``RequestMetric``).
+
+На каждый запрос:
+
+- время ответа (``perf_counter`` вокруг ``get_response``);
+- число SQL-запросов и время в SQL — через
+  ``connection.execute_wrapper``, без ``DEBUG`` и ``connection.queries``;
+- эндпоинт — ``resolver_match.view_name`` (``admin:core_car_changelist``),
+  для безымянных view — шаблон URL.
+
+Метрики копятся в памяти процесса и периодически сливаются в БД
+(:mod:`core.services.request_metrics`). Статика, медиа и ``/health/`` не
+меряются. Выключается ``REQUEST_METRICS_ENABLED=False``.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from core.services import request_metrics
+
+logger = logging.getLogger(__name__)
+
+_UNRESOLVED = "<unresolved>"
+
+
+def _route_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return _UNRESOLVED
+    return match.view_name or match.route or _UNRESOLVED
+
+
+class RequestMetricsMiddleware:
+    """Меряет запрос и отдаёт метрики в :mod:`core.services.request_metrics`.
+
+    Ставится сразу после ``RequestContextMiddleware``: в замер попадает
+    вся работа view и внутренних middleware (сессии уже загружены).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.skip_prefixes = tuple(
+            p for p in (getattr(settings, "STATIC_URL", None), getattr(settings, "MEDIA_URL", None), "/health/") if p
+        )
+
+    def __call__(self, request):
+        if not getattr(settings, "REQUEST_METRICS_ENABLED", True) or request.path.startswith(self.skip_prefixes):
+            return self.get_response(request)
+
+        timer = request_metrics.QueryTimer()
+        status = 500
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            try:
+                request_metrics.record(
+                    _route_name(request),
+                    request.method or "",
+                    status,
+                    duration_ms,
+                    timer.count,
+                    timer.seconds * 1000,
+                )
+                request_metrics.maybe_flush()
+            except Exception:  # метрики не должны ронять ответ
+                logger.exception("[request_metrics] failed to record request")
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.16 on 2026-10-19 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_client_country'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMExtractionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Хэш документа')),
+                ('prompt_version', models.CharField(max_length=64, verbose_name='Версия промпта')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('pipeline', models.CharField(choices=[('INVOICE_AUDIT', 'Аудит счетов'), ('SCAN', 'Сканы (титулы, dock receipts, пакеты)'), ('RECEIPT', 'Кассовые чеки')], db_index=True, max_length=20, verbose_name='Пайплайн')),
+                ('result', models.JSONField(default=dict, verbose_name='Результат извлечения')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Попаданий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее попадание')),
+            ],
+            options={
+                'verbose_name': 'Кэш LLM-извлечения',
+                'verbose_name_plural': 'Кэш LLM-извлечений',
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'prompt_version', 'model'), name='llm_cache_key_uniq')],
+            },
+        ),
+    ]
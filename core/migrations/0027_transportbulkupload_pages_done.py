@@ -0,0 +1,18 @@
+# Generated by Django 5.2.16 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_llmextractioncache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transportbulkupload',
+            name='pages_done',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Страниц разобрано'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.16 on 2026-10-19 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_transportbulkupload_pages_done'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='containeremail',
+            name='content_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Дайджест содержимого'),
+        ),
+        migrations.AddIndex(
+            model_name='containeremail',
+            index=models.Index(fields=['content_digest', 'received_at'], name='containeremail_digest_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_email_counters(apps, schema_editor):
+    """Первичное заполнение счётчиков писем по таблицам связей.
+
+    Логика совпадает с ``core.services.email_counters`` (сервис работает с
+    актуальными моделями, поэтому в миграции — своя копия). Карточки без
+    писем остаются с нулями по умолчанию.
+    """
+    targets = (
+        ('ContainerEmailLink', 'container_id', 'Container'),
+        ('CarEmailLink', 'car_id', 'Car'),
+        ('TransportRequestEmailLink', 'request_id', 'TransportRequest'),
+    )
+    for link_name, fk, model_name in targets:
+        link_model = apps.get_model('core', link_name)
+        model = apps.get_model('core', model_name)
+        rows = (
+            link_model.objects.values(fk)
+            .annotate(
+                unread=Count('pk', filter=Q(is_read=False)),
+                need_reply=Count('pk', filter=Q(email__needs_reply=True, email__direction='INCOMING')),
+            )
+            .filter(Q(unread__gt=0) | Q(need_reply__gt=0))
+            .order_by()
+        )
+        objs = [model(pk=row[fk], emails_unread=row['unread'], emails_need_reply=row['need_reply']) for row in rows]
+        model.objects.bulk_update(objs, ['emails_unread', 'emails_need_reply'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_containeremail_content_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='emails_need_reply',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Писем ждут ответа'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='emails_unread',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Непрочитанных писем'),
+        ),
+        migrations.AddField(
+            model_name='container',
+            name='emails_need_reply',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Писем ждут ответа'),
+        ),
+        migrations.AddField(
+            model_name='container',
+            name='emails_unread',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Непрочитанных писем'),
+        ),
+        migrations.AddField(
+            model_name='transportrequest',
+            name='emails_need_reply',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Писем ждут ответа'),
+        ),
+        migrations.AddField(
+            model_name='transportrequest',
+            name='emails_unread',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Непрочитанных писем'),
+        ),
+        migrations.RunPython(fill_email_counters, migrations.RunPython.noop),
+    ]
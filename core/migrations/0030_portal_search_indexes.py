@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Индекс поиска кабинета клиента (core.services.client_portal_listing).
+# Только PostgreSQL, как и pg_trgm-индексы baseline.
+#
+# Поиск — ``icontains`` по VIN / марке / номеру контейнера; Django строит
+# ``UPPER(col::text) LIKE UPPER('%abc%')``, поэтому GIN pg_trgm по номеру
+# контейнера построен по тому же выражению. Префикс отдельных индексов не
+# требует: он влияет только на ранг в сортировке, а не на выборку.
+_INDEXES = [
+    ('container_number_upper_trgm_idx', 'core_container', 'USING gin ((UPPER(number::text)) gin_trgm_ops)'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, definition in _INDEXES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _table, _definition in _INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_email_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
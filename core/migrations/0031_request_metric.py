@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_portal_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('route', models.CharField(help_text='view_name или шаблон URL', max_length=200)),
+                ('method', models.CharField(max_length=8)),
+                ('count', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0, help_text='Ответы 5xx')),
+                ('total_ms', models.FloatField(default=0.0)),
+                ('max_ms', models.FloatField(default=0.0)),
+                ('sql_count', models.IntegerField(default=0, help_text='Сумма SQL-запросов')),
+                ('sql_ms', models.FloatField(default=0.0)),
+                ('max_sql_count', models.IntegerField(default=0)),
+                ('histogram', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'db_table': 'core_request_metric',
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('bucket_start', 'route', 'method'), name='rm_bucket_route_method_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_request_metric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('task_name', models.CharField(max_length=200)),
+                ('count', models.IntegerField(default=0, help_text='Завершённые запуски')),
+                ('failures', models.IntegerField(default=0)),
+                ('retries', models.IntegerField(default=0)),
+                ('time_limit_hits', models.IntegerField(default=0)),
+                ('total_runtime_ms', models.FloatField(default=0.0)),
+                ('max_runtime_ms', models.FloatField(default=0.0)),
+                ('wait_samples', models.IntegerField(default=0, help_text='Запуски с известным временем постановки')),
+                ('total_wait_ms', models.FloatField(default=0.0)),
+                ('max_wait_ms', models.FloatField(default=0.0)),
+                ('sql_count', models.IntegerField(default=0)),
+                ('max_sql_count', models.IntegerField(default=0)),
+                ('histogram', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'db_table': 'core_task_metric',
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('bucket_start', 'task_name'), name='tm_bucket_task_uniq')],
+            },
+        ),
+    ]
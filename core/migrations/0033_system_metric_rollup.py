@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0032_task_metric"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SystemMetricRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tier", models.CharField(choices=[("5m", "5 минут"), ("1h", "1 час")], max_length=2)),
+                ("bucket_start", models.DateTimeField()),
+                ("samples", models.IntegerField(default=0, help_text="Сырых снимков в bucket'е")),
+                ("stats", models.JSONField(blank=True, default=dict)),
+                ("uptime_checks", models.IntegerField(default=0)),
+                ("uptime_ok", models.IntegerField(default=0)),
+                (
+                    "uptime_avg_ms",
+                    models.FloatField(blank=True, help_text="Среднее время ответа успешных пингов", null=True),
+                ),
+            ],
+            options={
+                "db_table": "core_system_metric_rollup",
+                "ordering": ["tier", "bucket_start"],
+                "constraints": [models.UniqueConstraint(fields=("tier", "bucket_start"), name="smr_tier_bucket_uniq")],
+            },
+        ),
+    ]
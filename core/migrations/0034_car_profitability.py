@@ -0,0 +1,115 @@
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_car_profitability(apps, schema_editor):
+    """Первичное заполнение сводки прибыли по машинам с затратами.
+
+    Строка считается как в ``core.services.car_profitability.refresh_car_profitability``.
+    """
+    Car = apps.get_model('core', 'Car')
+    CarService = apps.get_model('core', 'CarService')
+    SupplierCost = apps.get_model('core', 'SupplierCost')
+    CarProfitability = apps.get_model('core', 'CarProfitability')
+
+    breakdown = defaultdict(dict)
+    for row in (
+        SupplierCost.objects.filter(car__isnull=False)
+        .values('car_id', 'service_type')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    ):
+        breakdown[row['car_id']][row['service_type']] = row['total'] or Decimal('0')
+    if not breakdown:
+        return
+
+    links = {
+        row['car_id']: (row['confirmed'], row['unlinked'])
+        for row in SupplierCost.objects.filter(car__isnull=False)
+        .values('car_id')
+        .annotate(
+            confirmed=Count('car_service_id', distinct=True),
+            unlinked=Count('pk', filter=Q(car_service__isnull=True)),
+        )
+        .order_by()
+    }
+    services = dict(
+        CarService.objects.filter(car_id__in=list(breakdown))
+        .values('car_id')
+        .annotate(cnt=Count('id'))
+        .order_by()
+        .values_list('car_id', 'cnt')
+    )
+
+    rows = []
+    for car_id, total_price, container_id, client_id in Car.objects.filter(pk__in=list(breakdown)).values_list(
+        'pk', 'total_price', 'container_id', 'client_id'
+    ):
+        revenue = total_price or Decimal('0')
+        total_cost = sum(breakdown[car_id].values(), Decimal('0'))
+        profit = revenue - total_cost
+        confirmed, unlinked = links.get(car_id, (0, 0))
+        total_services = services.get(car_id, 0)
+        if total_services and confirmed >= total_services:
+            status = 'full'
+        elif total_services and confirmed:
+            status = 'partial'
+        else:
+            status = 'none'
+        rows.append(
+            CarProfitability(
+                car_id=car_id,
+                container_id=container_id,
+                client_id=client_id,
+                revenue=revenue,
+                total_cost=total_cost,
+                profit=profit,
+                margin_pct=(profit / revenue * 100).quantize(Decimal('0.1')) if revenue > 0 else Decimal('0.0'),
+                cost_breakdown={stype: str(amount.quantize(Decimal('0.01'))) for stype, amount in sorted(breakdown[car_id].items())},
+                total_services=total_services,
+                confirmed_services=confirmed,
+                unlinked_costs=unlinked,
+                cost_status=status,
+                is_final=status == 'full' and unlinked == 0,
+            )
+        )
+    CarProfitability.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_system_metric_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarProfitability',
+            fields=[
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profitability', serialize=False, to='core.car', verbose_name='Машина')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка')),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Затраты')),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Прибыль')),
+                ('margin_pct', models.DecimalField(decimal_places=1, default=0, max_digits=7, verbose_name='Маржа, %')),
+                ('cost_breakdown', models.JSONField(blank=True, default=dict, verbose_name='Затраты по типам услуг')),
+                ('total_services', models.PositiveIntegerField(default=0, verbose_name='Услуг в карточке')),
+                ('confirmed_services', models.PositiveIntegerField(default=0, verbose_name='Подтверждено услуг')),
+                ('unlinked_costs', models.PositiveIntegerField(default=0, verbose_name='Непривязанных затрат')),
+                ('cost_status', models.CharField(choices=[('full', 'Все услуги подтверждены'), ('partial', 'Подтверждены частично'), ('none', 'Не подтверждены')], default='none', max_length=10, verbose_name='Подтверждённость затрат')),
+                ('is_final', models.BooleanField(default=False, verbose_name='Себестоимость окончательная')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.client', verbose_name='Клиент')),
+                ('container', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.container', verbose_name='Контейнер')),
+            ],
+            options={
+                'verbose_name': 'Прибыль по машине',
+                'verbose_name_plural': 'Прибыль по машинам',
+                'indexes': [models.Index(fields=['profit'], name='car_profit_profit_idx'), models.Index(fields=['margin_pct'], name='car_profit_margin_idx'), models.Index(fields=['revenue'], name='car_profit_revenue_idx'), models.Index(fields=['total_cost'], name='car_profit_cost_idx'), models.Index(fields=['container', 'profit'], name='car_profit_container_idx'), models.Index(fields=['client', 'profit'], name='car_profit_client_idx')],
+            },
+        ),
+        migrations.RunPython(fill_car_profitability, migrations.RunPython.noop),
+    ]
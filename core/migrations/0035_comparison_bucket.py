@@ -0,0 +1,121 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+COUNTERS = ('cars_count', 'cars_total', 'invoices_count', 'invoices_total', 'payments_count', 'payments_total')
+
+
+def fill_comparison_buckets(apps, schema_editor):
+    """Первичное заполнение месячных бакетов сравнения за всю историю.
+
+    Разрезы — как в ``core.services.comparison_buckets.collect``: машины по
+    дате разгрузки, инвойсы и платежи — по своей дате.
+    """
+    Car = apps.get_model('core', 'Car')
+    NewInvoice = apps.get_model('core', 'NewInvoice')
+    Transaction = apps.get_model('core', 'Transaction')
+    ComparisonBucket = apps.get_model('core', 'ComparisonBucket')
+
+    def month_of(field):
+        return TruncMonth(field, output_field=DateField())
+
+    rows = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def add(keys, count_field, total_field, cnt, amount):
+        for key in keys:
+            rows[key][count_field] += cnt
+            rows[key][total_field] += amount or Decimal('0')
+
+    cars = (
+        Car.objects.filter(unload_date__isnull=False)
+        .annotate(month=month_of('unload_date'))
+        .values('month', 'client_id')
+        .annotate(cnt=Count('id'), amount=Sum('total_price'))
+        .order_by()
+    )
+    for row in cars:
+        keys = [(row['month'], 'total', 0)]
+        if row['client_id']:
+            keys.append((row['month'], 'client', row['client_id']))
+        add(keys, 'cars_count', 'cars_total', row['cnt'], row['amount'])
+
+    invoices = (
+        NewInvoice.objects.annotate(month=month_of('date'))
+        .values('month', 'issuer_warehouse_id')
+        .annotate(cnt=Count('id'), amount=Sum('total'))
+        .order_by()
+    )
+    for row in invoices:
+        keys = [(row['month'], 'total', 0)]
+        if row['issuer_warehouse_id']:
+            keys.append((row['month'], 'warehouse', row['issuer_warehouse_id']))
+        add(keys, 'invoices_count', 'invoices_total', row['cnt'], row['amount'])
+
+    pairs = (
+        NewInvoice.cars.through.objects.filter(
+            newinvoice__issuer_warehouse__isnull=False, car__client__isnull=False
+        )
+        .annotate(month=month_of('newinvoice__date'))
+        .values_list('month', 'newinvoice_id', 'car__client_id', 'newinvoice__total')
+        .order_by()
+        .distinct()
+    )
+    for month, _invoice_id, client_id, amount in pairs:
+        add([(month, 'client', client_id)], 'invoices_count', 'invoices_total', 1, amount)
+
+    payments = (
+        Transaction.objects.annotate(month=month_of('date'))
+        .values('month', 'to_warehouse_id')
+        .annotate(cnt=Count('id'), amount=Sum('amount'))
+        .order_by()
+    )
+    for row in payments:
+        keys = [(row['month'], 'total', 0)]
+        if row['to_warehouse_id']:
+            keys.append((row['month'], 'warehouse', row['to_warehouse_id']))
+        add(keys, 'payments_count', 'payments_total', row['cnt'], row['amount'])
+
+    ComparisonBucket.objects.bulk_create(
+        [
+            ComparisonBucket(month=month, kind=kind, entity_id=entity_id, **counters)
+            for (month, kind, entity_id), counters in rows.items()
+            if month is not None
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_car_profitability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComparisonBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (1-е число)')),
+                ('kind', models.CharField(choices=[('client', 'Клиент'), ('warehouse', 'Склад'), ('total', 'Всего')], max_length=10, verbose_name='Разрез')),
+                ('entity_id', models.PositiveIntegerField(default=0, verbose_name='ID клиента / склада')),
+                ('cars_count', models.PositiveIntegerField(default=0, verbose_name='Машин')),
+                ('cars_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Стоимость машин')),
+                ('invoices_count', models.PositiveIntegerField(default=0, verbose_name='Инвойсов')),
+                ('invoices_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма инвойсов')),
+                ('payments_count', models.PositiveIntegerField(default=0, verbose_name='Платежей')),
+                ('payments_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма платежей')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+            ],
+            options={
+                'verbose_name': 'Месячный бакет сравнения',
+                'verbose_name_plural': 'Месячные бакеты сравнения',
+                'indexes': [models.Index(fields=['kind', 'month'], name='comparison_bucket_kind_idx')],
+                'constraints': [models.UniqueConstraint(fields=('month', 'kind', 'entity_id'), name='unique_comparison_bucket')],
+            },
+        ),
+        migrations.RunPython(fill_comparison_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,119 @@
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+COUNTERPARTIES = (
+    ('to_client_id', 'client'),
+    ('to_warehouse_id', 'warehouse'),
+    ('to_line_id', 'line'),
+    ('to_carrier_id', 'carrier'),
+    ('to_company_id', 'company'),
+)
+GROUP = ('from_company_id', 'month', 'category_id', 'method', *(field for field, _ in COUNTERPARTIES))
+
+
+def _key(row):
+    cp_type, cp_id = '', 0
+    for field, kind in COUNTERPARTIES:
+        if row[field]:
+            cp_type, cp_id = kind, row[field]
+            break
+    return row['from_company_id'], row['month'], row['category_id'], row['method'], cp_type, cp_id
+
+
+def _decimal(value, default):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return Decimal(default)
+
+
+def fill_expense_rollup(apps, schema_editor):
+    """Первичное заполнение месячной свёртки расходов за всю историю.
+
+    Ключ строки и разбор позиций чеков — как в
+    ``core.services.expense_rollup.collect``.
+    """
+    Transaction = apps.get_model('core', 'Transaction')
+    ExpenseRollup = apps.get_model('core', 'ExpenseRollup')
+
+    qs = Transaction.objects.filter(
+        status='COMPLETED', from_company__isnull=False, category__isnull=False
+    ).annotate(month=TruncMonth('date', output_field=DateField()))
+
+    rows = {}
+    for row in qs.values(*GROUP).annotate(amount=Sum('amount'), cnt=Count('id')).order_by():
+        entry = rows.setdefault(_key(row), {'total': Decimal('0'), 'count': 0, 'items': {}})
+        entry['total'] += row['amount'] or Decimal('0')
+        entry['count'] += row['cnt']
+
+    for row in qs.exclude(receipt_data__isnull=True).values(*GROUP, 'receipt_data').order_by():
+        items = rows[_key(row)]['items']
+        for item in (row['receipt_data'] or {}).get('items', []):
+            name = (item.get('name') or '').strip()
+            if not name:
+                continue
+            qty = _decimal(item.get('qty', 1), '1')
+            price = _decimal(item.get('price', 0), '0')
+            entry = items.setdefault(name.lower(), {'name': name, 'qty': Decimal('0'), 'total': Decimal('0'), 'count': 0})
+            entry['qty'] += qty
+            entry['total'] += price * qty
+            entry['count'] += 1
+
+    ExpenseRollup.objects.bulk_create(
+        [
+            ExpenseRollup(
+                company_id=company_id,
+                month=month,
+                category_id=category_id,
+                method=method,
+                counterparty_type=cp_type,
+                counterparty_id=cp_id,
+                total=entry['total'],
+                count=entry['count'],
+                receipt_items={
+                    key: {'name': it['name'], 'qty': str(it['qty']), 'total': str(it['total']), 'count': it['count']}
+                    for key, it in sorted(entry['items'].items())
+                },
+            )
+            for (company_id, month, category_id, method, cp_type, cp_id), entry in rows.items()
+            if month is not None
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_comparison_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (1-е число)')),
+                ('method', models.CharField(max_length=20, verbose_name='Способ оплаты')),
+                ('counterparty_type', models.CharField(blank=True, choices=[('', 'Не указан'), ('client', 'Клиент'), ('warehouse', 'Склад'), ('line', 'Линия'), ('carrier', 'Перевозчик'), ('company', 'Компания')], default='', max_length=10, verbose_name='Тип получателя')),
+                ('counterparty_id', models.PositiveIntegerField(default=0, verbose_name='ID получателя')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Транзакций')),
+                ('receipt_items', models.JSONField(blank=True, default=dict, verbose_name='Позиции чеков')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.expensecategory', verbose_name='Категория')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.company', verbose_name='Компания')),
+            ],
+            options={
+                'verbose_name': 'Месячная свёртка расходов',
+                'verbose_name_plural': 'Месячные свёртки расходов',
+                'indexes': [models.Index(fields=['company', 'month'], name='expense_rollup_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('company', 'month', 'category', 'method', 'counterparty_type', 'counterparty_id'), name='unique_expense_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_expense_rollup, migrations.RunPython.noop),
+    ]
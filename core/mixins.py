@@ -200,3 +200,25 @@ class BalanceMethodsMixin:
             "total_balance_status": self.total_balance_status,
             "total_balance_color": self.total_balance_color,
         }
+
+
+# ============================================================================
+# СЧЁТЧИКИ ПИСЕМ НА КАРТОЧКАХ
+# ============================================================================
+# ``emails_unread`` / ``emails_need_reply`` на Car / Container /
+# TransportRequest пишет только core.services.email_counters (bulk_update).
+EMAIL_COUNTER_FIELDS = ("emails_unread", "emails_need_reply")
+
+
+class EmailCountersMixin:
+    """Полный ``save()`` карточки не трогает счётчики писем.
+
+    Экземпляр, загруженный до изменения переписки, иначе вернул бы в строку
+    устаревшие значения. Явный ``save(update_fields=[...])`` со счётчиками
+    их по-прежнему записывает.
+    """
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, *args, **kwargs):
+        if not update_fields:
+            values = [value for value in values if value[0].attname not in EMAIL_COUNTER_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, *args, **kwargs)
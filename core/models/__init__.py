@@ -90,15 +90,21 @@ from .email import (  # noqa: E402, F401
     GmailSyncState,
     TransportRequestEmailLink,
 )
+from .ai_cache import LLMExtractionCache  # noqa: E402, F401
 from .invoice_audit import (  # noqa: E402, F401
+    CarProfitability,
     InvoiceAudit,
     SupplierCost,
 )
 from .monitoring import (  # noqa: E402, F401
+    RequestMetric,
     SystemMetric,
+    SystemMetricRollup,
+    TaskMetric,
     UptimeCheck,
 )
 from .scans import ScanProcessingJob  # noqa: E402, F401
+from .analytics import ComparisonBucket, ExpenseRollup  # noqa: E402, F401
 
 __all__ = [
     # constants
@@ -130,7 +136,10 @@ __all__ = [
     'ContainerEmail', 'ContainerEmailLink', 'CarEmailLink',
     'TransportRequestEmailLink',
     'EmailGroup', 'EmailGroupMember', 'EmailIngestFilter', 'GmailSyncState',
-    'InvoiceAudit', 'SupplierCost',
-    'SystemMetric', 'UptimeCheck',
+    'InvoiceAudit', 'SupplierCost', 'CarProfitability',
+    'LLMExtractionCache',
+    'SystemMetric', 'SystemMetricRollup', 'UptimeCheck', 'RequestMetric', 'TaskMetric',
+    'ComparisonBucket',
+    'ExpenseRollup',
     'ScanProcessingJob',
 ]
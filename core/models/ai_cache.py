@@ -0,0 +1,51 @@
+"""
+Кэш результатов LLM-извлечения (аудит счетов, сканы, чеки).
+
+Ключ — (хэш содержимого документа, версия промпта, модель): одинаковый
+документ, отправленный тем же промптом в ту же модель, повторно в API не
+уходит. Версия промпта — хэш системного промпта и текста запроса, поэтому
+правка промпта автоматически даёт промах, а не устаревший ответ.
+
+Каждая строка — это один промах (первый вызов), ``hits`` — сколько раз
+результат отдали из кэша; отсюда же считается hit rate по пайплайнам
+(``core.services.extraction_cache.get_cache_stats``).
+"""
+
+from django.db import models
+
+
+class LLMExtractionCache(models.Model):
+    """Сохранённый JSON-ответ модели для конкретного документа и промпта."""
+
+    PIPELINE_INVOICE_AUDIT = "INVOICE_AUDIT"
+    PIPELINE_SCAN = "SCAN"
+    PIPELINE_RECEIPT = "RECEIPT"
+    PIPELINE_CHOICES = [
+        (PIPELINE_INVOICE_AUDIT, "Аудит счетов"),
+        (PIPELINE_SCAN, "Сканы (титулы, dock receipts, пакеты)"),
+        (PIPELINE_RECEIPT, "Кассовые чеки"),
+    ]
+
+    content_hash = models.CharField(max_length=64, verbose_name="Хэш документа")
+    prompt_version = models.CharField(max_length=64, verbose_name="Версия промпта")
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    pipeline = models.CharField(max_length=20, choices=PIPELINE_CHOICES, db_index=True, verbose_name="Пайплайн")
+
+    result = models.JSONField(default=dict, verbose_name="Результат извлечения")
+
+    hits = models.PositiveIntegerField(default=0, verbose_name="Попаданий")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    last_hit_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее попадание")
+
+    class Meta:
+        verbose_name = "Кэш LLM-извлечения"
+        verbose_name_plural = "Кэш LLM-извлечений"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_hash", "prompt_version", "model"],
+                name="llm_cache_key_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.pipeline} {self.content_hash[:12]} ({self.model})"
@@ -0,0 +1,108 @@
+"""Предагрегаты для аналитических отчётов.
+
+``ComparisonBucket`` — месячные суммы по клиентам и складам для отчёта
+сравнения расчётов со счетами склада (``core.services.comparison_buckets``).
+Отчёт за период складывается из бакетов полных месяцев и живого расчёта
+по неполным крайним месяцам.
+
+``ExpenseRollup`` — месячные расходы компании по категории, способу оплаты
+и получателю для аналитики расходов (``core.services.expense_rollup``).
+"""
+
+from __future__ import annotations
+
+from django.db import models
+
+
+class ComparisonBucket(models.Model):
+    """Суммы за календарный месяц по клиенту, складу или по всей компании."""
+
+    KIND_CLIENT = "client"
+    KIND_WAREHOUSE = "warehouse"
+    KIND_TOTAL = "total"
+    KIND_CHOICES = [
+        (KIND_CLIENT, "Клиент"),
+        (KIND_WAREHOUSE, "Склад"),
+        (KIND_TOTAL, "Всего"),
+    ]
+
+    month = models.DateField(verbose_name="Месяц (1-е число)")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Разрез")
+    # id клиента / склада; 0 — для KIND_TOTAL.
+    entity_id = models.PositiveIntegerField(default=0, verbose_name="ID клиента / склада")
+
+    # Машины, разгруженные в месяце (клиент / всего).
+    cars_count = models.PositiveIntegerField(default=0, verbose_name="Машин")
+    cars_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Стоимость машин")
+    # Клиент — счета складов на его машины; склад — выставленные им счета;
+    # всего — все инвойсы. По дате инвойса.
+    invoices_count = models.PositiveIntegerField(default=0, verbose_name="Инвойсов")
+    invoices_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма инвойсов")
+    # Склад — платежи складу; всего — все транзакции.
+    payments_count = models.PositiveIntegerField(default=0, verbose_name="Платежей")
+    payments_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма платежей")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Пересчитано")
+
+    class Meta:
+        verbose_name = "Месячный бакет сравнения"
+        verbose_name_plural = "Месячные бакеты сравнения"
+        constraints = [
+            models.UniqueConstraint(fields=["month", "kind", "entity_id"], name="unique_comparison_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["kind", "month"], name="comparison_bucket_kind_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.kind}#{self.entity_id}"
+
+
+class ExpenseRollup(models.Model):
+    """Расходы компании за месяц: категория × способ оплаты × получатель."""
+
+    COUNTERPARTY_CHOICES = [
+        ("", "Не указан"),
+        ("client", "Клиент"),
+        ("warehouse", "Склад"),
+        ("line", "Линия"),
+        ("carrier", "Перевозчик"),
+        ("company", "Компания"),
+    ]
+
+    company = models.ForeignKey("core.Company", on_delete=models.CASCADE, related_name="+", verbose_name="Компания")
+    month = models.DateField(verbose_name="Месяц (1-е число)")
+    # CASCADE: при удалении категории транзакции получают NULL и из
+    # аналитики по категориям выпадают — строки свёртки тоже не нужны.
+    category = models.ForeignKey(
+        "core.ExpenseCategory", on_delete=models.CASCADE, related_name="+", verbose_name="Категория"
+    )
+    method = models.CharField(max_length=20, verbose_name="Способ оплаты")
+    counterparty_type = models.CharField(
+        max_length=10, blank=True, default="", choices=COUNTERPARTY_CHOICES, verbose_name="Тип получателя"
+    )
+    counterparty_id = models.PositiveIntegerField(default=0, verbose_name="ID получателя")
+
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма")
+    count = models.PositiveIntegerField(default=0, verbose_name="Транзакций")
+    # Позиции чеков (receipt_data.items): {ключ: {name, qty, total, count}},
+    # суммы — строками Decimal.
+    receipt_items = models.JSONField(default=dict, blank=True, verbose_name="Позиции чеков")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Пересчитано")
+
+    class Meta:
+        verbose_name = "Месячная свёртка расходов"
+        verbose_name_plural = "Месячные свёртки расходов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "month", "category", "method", "counterparty_type", "counterparty_id"],
+                name="unique_expense_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["company", "month"], name="expense_rollup_month_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} company#{self.company_id} category#{self.category_id} {self.method}"
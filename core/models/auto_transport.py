@@ -217,49 +217,60 @@ class AutoTransport(models.Model):
         """
         from django.utils import timezone
 
+        from core.models.series import reserve_document_numbers
         from core.models_billing import NewInvoice
 
         from .company import Company
 
-        clients = self.get_clients()
+        clients = list(self.get_clients())
         created_invoices = []
 
-        for client in clients:
-            client_cars = self.cars.filter(client=client)
-
-            if not client_cars.exists():
-                continue
-
-            existing_invoice = (
-                NewInvoice.objects.filter(auto_transport=self, recipient_client=client)
-                .exclude(status__in=["PAID", "CANCELLED"])
-                .first()
+        # Новые PROFORMA_BLC берут номера из одного блока серии, а не по
+        # upsert'у счётчика на клиента. Клиентам с любым инвойсом рейса
+        # новый номер не нужен; неиспользованный хвост вернётся в серию.
+        invoiced = set(
+            NewInvoice.objects.filter(auto_transport=self, recipient_client__in=clients).values_list(
+                "recipient_client_id", flat=True
             )
+        )
+        new_count = sum(1 for client in clients if client.pk not in invoiced)
+        with reserve_document_numbers(NewInvoice, NewInvoice.series_prefix("PROFORMA_BLC"), new_count):
+            for client in clients:
+                client_cars = self.cars.filter(client=client)
 
-            if existing_invoice:
-                existing_invoice.cars.set(client_cars)
-                existing_invoice.regenerate_items_from_cars()
-                created_invoices.append(existing_invoice)
-            else:
-                has_finalized = NewInvoice.objects.filter(
-                    auto_transport=self, recipient_client=client, status__in=["PAID", "CANCELLED"]
-                ).exists()
-                if has_finalized:
+                if not client_cars.exists():
                     continue
 
-                company = Company.get_default()
-
-                if company:
-                    invoice = NewInvoice.objects.create(
-                        issuer_company=company,
-                        recipient_client=client,
-                        auto_transport=self,
-                        document_type="PROFORMA_BLC",
-                        status="DRAFT",
-                        date=timezone.now().date(),
-                    )
-                    invoice.cars.set(client_cars)
-                    invoice.regenerate_items_from_cars()
-                    created_invoices.append(invoice)
+                existing_invoice = (
+                    NewInvoice.objects.filter(auto_transport=self, recipient_client=client)
+                    .exclude(status__in=["PAID", "CANCELLED"])
+                    .first()
+                )
+
+                if existing_invoice:
+                    existing_invoice.cars.set(client_cars)
+                    existing_invoice.regenerate_items_from_cars()
+                    created_invoices.append(existing_invoice)
+                else:
+                    has_finalized = NewInvoice.objects.filter(
+                        auto_transport=self, recipient_client=client, status__in=["PAID", "CANCELLED"]
+                    ).exists()
+                    if has_finalized:
+                        continue
+
+                    company = Company.get_default()
+
+                    if company:
+                        invoice = NewInvoice.objects.create(
+                            issuer_company=company,
+                            recipient_client=client,
+                            auto_transport=self,
+                            document_type="PROFORMA_BLC",
+                            status="DRAFT",
+                            date=timezone.now().date(),
+                        )
+                        invoice.cars.set(client_cars)
+                        invoice.regenerate_items_from_cars()
+                        created_invoices.append(invoice)
 
         return created_invoices
@@ -752,8 +752,12 @@ class NewInvoice(models.Model):
         """
         from core.models.series import next_document_number
 
-        prefix = self.DOCTYPE_PREFIX_MAP.get(self.document_type, "AV")
-        return next_document_number(NewInvoice, prefix, pad=6)
+        return next_document_number(NewInvoice, self.series_prefix(self.document_type), pad=6)
+
+    @classmethod
+    def series_prefix(cls, document_type):
+        """Префикс серии номеров для типа документа (см. ``generate_number``)."""
+        return cls.DOCTYPE_PREFIX_MAP.get(document_type, "AV")
 
     # Команды с побочными эффектами — смена серии (change_series) и
     # кассовые платежи (register/reverse cash payment) — перенесены в
@@ -1711,13 +1715,17 @@ class Transaction(models.Model):
 
         Номер выдаётся атомарным счётчиком серии (SeriesCounter) — без гонок.
         """
-        from django.utils.timezone import now
-
         from core.models.series import next_document_number
 
+        return next_document_number(Transaction, self.series_prefix(), pad=5)
+
+    @staticmethod
+    def series_prefix():
+        """Префикс серии номеров транзакций — по текущей дате (``TRX-YYYYMMDD``)."""
+        from django.utils.timezone import now
+
         date = now()
-        prefix = f"TRX-{date.year}{date.month:02d}{date.day:02d}"
-        return next_document_number(Transaction, prefix, pad=5)
+        return f"TRX-{date.year}{date.month:02d}{date.day:02d}"
 
     def delete(self, *args, force=False, **kwargs):
         if not force and self.status in ("COMPLETED", "CANCELLED"):
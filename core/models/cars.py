@@ -10,6 +10,7 @@ from django.utils import timezone
 
 from core.constants import STATUS_COLORS
 from core.managers import OptimizedCarManager
+from core.mixins import EmailCountersMixin
 from core.service_codes import is_storage_service, storage_service_q
 
 from ._vehicle_types import VEHICLE_TYPE_CHOICES
@@ -19,7 +20,7 @@ from .warehouses import Warehouse
 logger = logging.getLogger(__name__)
 
 
-class Car(models.Model):
+class Car(EmailCountersMixin, models.Model):
     """Автомобиль — крупнейшая бизнес-сущность.
 
     DEPRECATED FIELDS (оставлены для совместимости с историческими данными
@@ -279,6 +280,12 @@ class Car(models.Model):
         validators=[MinValueValidator(0)],
     )
 
+    # Денормализованные счётчики переписки для списков (бейджи в changelist).
+    # Поддерживаются core.services.email_counters; пересборка —
+    # ``manage.py reconcile_email_counters``.
+    emails_unread = models.PositiveIntegerField(default=0, editable=False, verbose_name="Непрочитанных писем")
+    emails_need_reply = models.PositiveIntegerField(default=0, editable=False, verbose_name="Писем ждут ответа")
+
     objects = OptimizedCarManager()
 
     def get_status_color(self):
@@ -469,12 +476,22 @@ class Car(models.Model):
         legacy fee-полей (``ths``/``declaration_fee``/``markup`` и складских
         дефолтов) прекращена — они больше не источник истины.
         """
+        self.apply_container_state(container)
+        self.update_days_and_storage()
+        self.calculate_total_price()
+
+    # Поля, которые машина наследует от контейнера (см. apply_container_state).
+    CONTAINER_STATE_FIELDS = ("status", "warehouse", "unload_date", "transfer_date")
+
+    def apply_container_state(self, container):
+        """Статус/склад/даты контейнера — в память, без пересчёта цены.
+
+        Для пачки машин цену затем считает ``core.services.car_pricing``.
+        """
         self.status = container.status
         self.warehouse = container.warehouse
         self.unload_date = container.unload_date
         self.transfer_date = timezone.now().date() if container.status == "TRANSFERRED" else None
-        self.update_days_and_storage()
-        self.calculate_total_price()
 
     WAREHOUSE_FEE_FIELDS = (
         "unload_fee",  # цена за разгрузку
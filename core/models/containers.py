@@ -7,6 +7,7 @@ from django.db import models, transaction
 
 from core.constants import STATUS_COLORS
 from core.managers import OptimizedContainerManager
+from core.mixins import EmailCountersMixin
 
 from .warehouses import Warehouse
 
@@ -51,7 +52,7 @@ def validate_status_transition(instance, old_status):
         )
 
 
-class Container(models.Model):
+class Container(EmailCountersMixin, models.Model):
     STATUS_CHOICES = [
         ("FLOATING", "В пути"),
         ("IN_PORT", "В порту"),
@@ -172,6 +173,12 @@ class Container(models.Model):
         "Автоматически проставляется при открытии листа печати.",
     )
 
+    # Денормализованные счётчики переписки для списков (бейджи в changelist).
+    # Поддерживаются core.services.email_counters; пересборка —
+    # ``manage.py reconcile_email_counters``.
+    emails_unread = models.PositiveIntegerField(default=0, editable=False, verbose_name="Непрочитанных писем")
+    emails_need_reply = models.PositiveIntegerField(default=0, editable=False, verbose_name="Писем ждут ответа")
+
     objects = OptimizedContainerManager()
 
     @property
@@ -242,39 +249,37 @@ class Container(models.Model):
         - ставит warehouse
         - жёстко перезаписывает все складские поля дефолтами нового склада
         - дата разгрузки ВСЕГДА наследуется из контейнера (принудительно)
+        - пересоздаёт складские CarService у переехавших машин (пачкой)
         - пересчитывает хранение и суммы
         Использует bulk_update для минимизации запросов.
         """
         if not self.pk:
             return
 
-        cars = list(self.container_cars.select_related("warehouse").all())
+        cars = list(self.container_cars.select_related("warehouse").prefetch_related("car_services"))
         if not cars:
             return
 
         # Фаза 2: legacy fee-поля больше не пишутся (источник цены —
         # CarService). Обновляем склад/дату разгрузки + денормализованные
-        # days/storage_cost/total_price.
-        update_fields = [
-            "warehouse",
-            "unload_date",
-            "storage_cost",
-            "days",
-            "total_price",
-        ]
+        # days/storage_cost/total_price (батч-пересчёт без запросов на
+        # каждую машину, см. core.services.car_pricing).
+        from core.services.car_pricing import PRICE_FIELDS, reprice_cars
+        from core.services.car_service_manager import sync_services_for_moved_cars
+        from core.services.comparison_buckets import schedule_refresh_for_cars as schedule_comparison_refresh
 
         from .cars import Car
 
         with transaction.atomic():
+            old_warehouse_ids = {car.pk: car.warehouse_id for car in cars}
             for car in cars:
                 car.warehouse = self.warehouse
                 if self.unload_date:
                     car.unload_date = self.unload_date
-                    logger.debug(f"Car {car.vin}: forced unload_date={self.unload_date} from container {self.number}")
-                car.update_days_and_storage()
-                car.calculate_total_price()
-
-            Car.objects.bulk_update(cars, update_fields, batch_size=50)
+            sync_services_for_moved_cars(cars, old_warehouse_ids)
+            reprice_cars(cars)
+            Car.objects.bulk_update(cars, ["warehouse", "unload_date", *PRICE_FIELDS], batch_size=200)
+            schedule_comparison_refresh(cars)
 
     def check_and_update_status_from_cars(self):
         """Если ВСЕ авто в контейнере уже TRANSFERRED — обновить статус контейнера.
@@ -257,6 +257,17 @@ class ContainerEmail(models.Model):
         default="",
         verbose_name="Скрыто при ингесте",
     )
+    # sha256 нормализованного «видимого» содержимого (FROM + SUBJECT + тело,
+    # см. ``email_ingest._content_digest``). Считается один раз при записи;
+    # проверка дубля при ингесте — индексный exists() по этому полю.
+    # Пусто у пустых писем и у строк до бэкфилла (``backfill_email_digests``).
+    content_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Дайджест содержимого",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -268,6 +279,7 @@ class ContainerEmail(models.Model):
             models.Index(fields=["-received_at"]),
             models.Index(fields=["thread_id", "received_at"]),
             models.Index(fields=["matched_by", "-received_at"]),
+            models.Index(fields=["content_digest", "received_at"], name="containeremail_digest_idx"),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -1,11 +1,14 @@
 """
 InvoiceAudit + SupplierCost — модели для проверки счетов и сверки затрат.
+CarProfitability — поддерживаемая сводка прибыли по машине для сверки.
 """
 
 from django.contrib.auth.models import User
 from django.db import models
 
 from .cars import Car
+from .clients import Client
+from .containers import Container
 from .services import CarService
 
 
@@ -156,3 +159,58 @@ class SupplierCost(models.Model):
         car_str = self.vin or "—"
         src = "📎" if self.source == "INVOICE" else "✍️"
         return f"{src} {self.counterparty} | {self.get_service_type_display()} | {car_str} | {self.amount}€"
+
+
+class CarProfitability(models.Model):
+    """Прибыль по машине: выручка, затраты поставщиков, подтверждённость.
+
+    Денормализованная сводка для Dashboard сверки — пересчитывается целиком
+    для затронутых машин (см. ``core.services.car_profitability``). Строка есть
+    только у машин, на которые пришла хотя бы одна ``SupplierCost``.
+    """
+
+    COST_STATUS_CHOICES = [
+        ("full", "Все услуги подтверждены"),
+        ("partial", "Подтверждены частично"),
+        ("none", "Не подтверждены"),
+    ]
+
+    car = models.OneToOneField(
+        Car, on_delete=models.CASCADE, primary_key=True, related_name="profitability", verbose_name="Машина"
+    )
+    # Копии Car.container / Car.client — для сводок без JOIN'а на машины.
+    container = models.ForeignKey(
+        Container, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="Контейнер"
+    )
+    client = models.ForeignKey(
+        Client, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="Клиент"
+    )
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Выручка")
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Затраты")
+    profit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Прибыль")
+    margin_pct = models.DecimalField(max_digits=7, decimal_places=1, default=0, verbose_name="Маржа, %")
+    cost_breakdown = models.JSONField(default=dict, blank=True, verbose_name="Затраты по типам услуг")
+    total_services = models.PositiveIntegerField(default=0, verbose_name="Услуг в карточке")
+    confirmed_services = models.PositiveIntegerField(default=0, verbose_name="Подтверждено услуг")
+    unlinked_costs = models.PositiveIntegerField(default=0, verbose_name="Непривязанных затрат")
+    cost_status = models.CharField(
+        max_length=10, choices=COST_STATUS_CHOICES, default="none", verbose_name="Подтверждённость затрат"
+    )
+    is_final = models.BooleanField(default=False, verbose_name="Себестоимость окончательная")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Пересчитано")
+
+    class Meta:
+        verbose_name = "Прибыль по машине"
+        verbose_name_plural = "Прибыль по машинам"
+        indexes = [
+            # Сортировки вкладки «По машинам» и сводки по контейнерам / клиентам.
+            models.Index(fields=["profit"], name="car_profit_profit_idx"),
+            models.Index(fields=["margin_pct"], name="car_profit_margin_idx"),
+            models.Index(fields=["revenue"], name="car_profit_revenue_idx"),
+            models.Index(fields=["total_cost"], name="car_profit_cost_idx"),
+            models.Index(fields=["container", "profit"], name="car_profit_container_idx"),
+            models.Index(fields=["client", "profit"], name="car_profit_client_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.car_id}: {self.profit}€"
@@ -1,10 +1,13 @@
 """Модели для страницы /admin/system-monitor/.
 
-Хранят историю метрик системы (RAM/CPU/disk/процессы/Postgres/Redis)
-и пингов uptime. Используются для построения графиков и расчёта SLA.
-
-Retention настраивается через MONITORING_RETENTION_DAYS в settings (default 30).
-Очистка делается task'ом `core.tasks_monitoring.cleanup_old_metrics`.
+Хранят историю метрик системы (RAM/CPU/disk/процессы/Postgres/Redis),
+пингов uptime, свёртки производительности HTTP-запросов и Celery-задач.
+Используются для построения графиков и расчёта SLA.
+
+Сырые SystemMetric живут MONITORING_RAW_RETENTION_HOURS (свёрнутые в
+SystemMetricRollup), свёртки — MONITORING_5M_RETENTION_DAYS /
+MONITORING_HOURLY_RETENTION_DAYS, остальное — MONITORING_RETENTION_DAYS
+(default 30). Очистка делается task'ом `core.tasks_monitoring.cleanup_old_metrics`.
 """
 
 from __future__ import annotations
@@ -19,8 +22,9 @@ class SystemMetric(models.Model):
     `core.tasks_monitoring.collect_system_metrics`.
 
     JSONB-поле `data` хранит сырой снимок (для расширения без миграций),
-    плюс ключевые числа вынесены в отдельные индексированные колонки
-    для быстрой агрегации в графиках.
+    плюс ключевые числа вынесены в отдельные индексированные колонки.
+    После свёртки в `SystemMetricRollup` `data` очищается, сама строка
+    удаляется через MONITORING_RAW_RETENTION_HOURS.
     """
 
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -93,3 +97,120 @@ class UptimeCheck(models.Model):
     def __str__(self) -> str:
         status = "OK" if self.ok else f"FAIL ({self.error or self.status_code})"
         return f"UptimeCheck@{self.created_at:%Y-%m-%d %H:%M} {status}"
+
+
+class RequestMetric(models.Model):
+    """Свёртка производительности HTTP-запросов по эндпоинту за 5 минут.
+
+    Пишется из ``core.middleware_performance.RequestMetricsMiddleware``:
+    каждый процесс копит метрики в памяти и раз в
+    ``REQUEST_METRICS_FLUSH_SECONDS`` сливает их сюда, прибавляя к строке
+    (bucket, route, method). Читается панелью «медленные эндпоинты» на
+    /admin/system-monitor/ (см. ``core.services.request_metrics``).
+
+    ``histogram`` — число запросов по корзинам латентности
+    (``{"50": n, "100": n, ..., "inf": n}``, верхняя граница в ms).
+    """
+
+    bucket_start = models.DateTimeField(db_index=True)
+    route = models.CharField(max_length=200, help_text="view_name или шаблон URL")
+    method = models.CharField(max_length=8)
+
+    count = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0, help_text="Ответы 5xx")
+    total_ms = models.FloatField(default=0.0)
+    max_ms = models.FloatField(default=0.0)
+
+    sql_count = models.IntegerField(default=0, help_text="Сумма SQL-запросов")
+    sql_ms = models.FloatField(default=0.0)
+    max_sql_count = models.IntegerField(default=0)
+
+    histogram = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        db_table = "core_request_metric"
+        ordering = ["-bucket_start"]
+        constraints = [
+            models.UniqueConstraint(fields=["bucket_start", "route", "method"], name="rm_bucket_route_method_uniq"),
+        ]
+
+    def __str__(self) -> str:
+        return f"RequestMetric@{self.bucket_start:%Y-%m-%d %H:%M} {self.method} {self.route}"
+
+
+class TaskMetric(models.Model):
+    """Свёртка телеметрии Celery-задачи за 5 минут.
+
+    Пишется из сигналов Celery (``core.signals.task_telemetry``): воркер
+    копит метрики в памяти и периодически прибавляет их к строке
+    (bucket, task_name), см. ``core.services.task_metrics``.
+
+    ``wait`` — от постановки в очередь (или ``eta``) до старта;
+    ``histogram`` — запуски по корзинам времени выполнения (верхняя
+    граница в ms, ``"inf"`` — выше последней).
+    """
+
+    bucket_start = models.DateTimeField(db_index=True)
+    task_name = models.CharField(max_length=200)
+
+    count = models.IntegerField(default=0, help_text="Завершённые запуски")
+    failures = models.IntegerField(default=0)
+    retries = models.IntegerField(default=0)
+    time_limit_hits = models.IntegerField(default=0)
+
+    total_runtime_ms = models.FloatField(default=0.0)
+    max_runtime_ms = models.FloatField(default=0.0)
+
+    wait_samples = models.IntegerField(default=0, help_text="Запуски с известным временем постановки")
+    total_wait_ms = models.FloatField(default=0.0)
+    max_wait_ms = models.FloatField(default=0.0)
+
+    sql_count = models.IntegerField(default=0)
+    max_sql_count = models.IntegerField(default=0)
+
+    histogram = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        db_table = "core_task_metric"
+        ordering = ["-bucket_start"]
+        constraints = [
+            models.UniqueConstraint(fields=["bucket_start", "task_name"], name="tm_bucket_task_uniq"),
+        ]
+
+    def __str__(self) -> str:
+        return f"TaskMetric@{self.bucket_start:%Y-%m-%d %H:%M} {self.task_name}"
+
+
+class SystemMetricRollup(models.Model):
+    """Свёртка ``SystemMetric`` / ``UptimeCheck`` за 5 минут или час.
+
+    Строит ``core.tasks_monitoring.rollup_system_metrics``
+    (``core.services.metric_rollup``): сырые снимки живут коротко, графики
+    за 7/30/90 дней читают готовые bucket'ы нужного уровня вместо
+    агрегации по сырой таблице.
+
+    ``stats`` — ``{"cpu_percent": {"min": .., "avg": .., "max": ..}, ...}``.
+    """
+
+    TIER_5M = "5m"
+    TIER_1H = "1h"
+    TIER_CHOICES = [(TIER_5M, "5 минут"), (TIER_1H, "1 час")]
+
+    tier = models.CharField(max_length=2, choices=TIER_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField(default=0, help_text="Сырых снимков в bucket'е")
+    stats = models.JSONField(default=dict, blank=True)
+
+    uptime_checks = models.IntegerField(default=0)
+    uptime_ok = models.IntegerField(default=0)
+    uptime_avg_ms = models.FloatField(null=True, blank=True, help_text="Среднее время ответа успешных пингов")
+
+    class Meta:
+        db_table = "core_system_metric_rollup"
+        ordering = ["tier", "bucket_start"]
+        constraints = [
+            models.UniqueConstraint(fields=["tier", "bucket_start"], name="smr_tier_bucket_uniq"),
+        ]
+
+    def __str__(self) -> str:
+        return f"SystemMetricRollup[{self.tier}]@{self.bucket_start:%Y-%m-%d %H:%M}"
@@ -6,9 +6,22 @@
 (IntegrityError → 500). Таблица счётчиков сериализует выдачу номеров
 одним атомарным upsert-стейтментом (``INSERT … ON CONFLICT … DO UPDATE …
 RETURNING``), который поддерживают и PostgreSQL, и SQLite (тесты).
+
+Массовые создатели документов (инвойсы автовоза, расходы из банковских
+операций) резервируют блок номеров одним upsert'ом —
+:func:`reserve_document_numbers` — и раздают его локально, не трогая
+строку счётчика на каждый документ. Резерв и документы живут в одной
+транзакции: строка счётчика заблокирована до коммита, неизрасходованный
+хвост возвращается в серию, а при ошибке откатывается вместе с
+документами. Документ, откатившийся в своём savepoint
+(:func:`document_savepoint`), отдаёт номера следующему. Серии остаются
+без пропусков, как и при штучных созданиях.
 """
 
-from django.db import connection, models
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, models, transaction
 
 
 class SeriesCounter(models.Model):
@@ -45,6 +58,129 @@ class SeriesCounter(models.Model):
             )
             return cursor.fetchone()[0]
 
+    @classmethod
+    def reserve_block(cls, prefix: str, count: int, seed: int = 0) -> int:
+        """Атомарно зарезервировать ``count`` номеров подряд; вернуть первый.
+
+        Тот же upsert, что и ``next_value``, но со сдвигом на ``count``.
+        """
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (prefix, last_value) VALUES (%s, %s + %s) "  # nosec B608
+                f"ON CONFLICT (prefix) DO UPDATE SET last_value = {table}.last_value + %s "
+                "RETURNING last_value",
+                [prefix, seed, count, count],
+            )
+            return cursor.fetchone()[0] - count + 1
+
+    @classmethod
+    def release_block_tail(cls, prefix: str, first_unused: int, last_reserved: int) -> bool:
+        """Вернуть в серию неизрасходованный хвост блока.
+
+        Срабатывает, только если счётчик всё ещё стоит на конце блока
+        (после резерва номеров никто не брал) — иначе хвост остаётся
+        пропуском. ``True``, если хвост возвращён.
+        """
+        if first_unused > last_reserved:
+            return False
+        return bool(cls.objects.filter(prefix=prefix, last_value=last_reserved).update(last_value=first_unused - 1))
+
+
+class _NumberBlock:
+    """Зарезервированный диапазон ``[next_value, last_value]`` серии."""
+
+    __slots__ = ("last_value", "next_value", "prefix")
+
+    def __init__(self, prefix: str, first: int, last: int):
+        self.prefix = prefix
+        self.next_value = first
+        self.last_value = last
+
+    def take(self):
+        if self.next_value > self.last_value:
+            return None
+        value = self.next_value
+        self.next_value += 1
+        return value
+
+
+_blocks = threading.local()
+
+
+def _active_blocks() -> dict[str, list[_NumberBlock]]:
+    active = getattr(_blocks, "by_prefix", None)
+    if active is None:
+        active = _blocks.by_prefix = {}
+    return active
+
+
+def _seed_for(model, prefix: str) -> int:
+    """Максимальный существующий номер серии — для первого обращения."""
+    if SeriesCounter.objects.filter(prefix=prefix).exists():
+        return 0
+    last = (
+        model.objects.filter(number__startswith=f"{prefix}-")
+        .order_by("-number")
+        .values_list("number", flat=True)
+        .first()
+    )
+    if not last:
+        return 0
+    try:
+        return int(last.rsplit("-", 1)[1])
+    except (ValueError, IndexError):
+        return 0
+
+
+@contextmanager
+def reserve_document_numbers(model, prefix: str, count: int):
+    """Зарезервировать до ``count`` номеров серии на время блока ``with``.
+
+    Блок — одна транзакция (``transaction.atomic``): ``next_document_number``
+    для этого ``prefix`` в текущем потоке берёт номера из резерва, пока он не
+    кончится (дальше — обычный путь), на выходе неизрасходованный хвост
+    возвращается в серию (``SeriesCounter.release_block_tail`` — строка
+    счётчика до коммита за нами, так что хвост возвращается всегда). Ошибка,
+    вышедшая из блока, откатывает резерв вместе с документами. Документы,
+    которые могут упасть по отдельности, создаются в
+    :func:`document_savepoint`.
+
+    При ``count <= 1`` ничего не резервирует.
+    """
+    with transaction.atomic():
+        if count <= 1:
+            yield None
+            return
+        first = SeriesCounter.reserve_block(prefix, count, _seed_for(model, prefix))
+        block = _NumberBlock(prefix, first, first + count - 1)
+        stack = _active_blocks().setdefault(prefix, [])
+        stack.append(block)
+        try:
+            yield block
+        finally:
+            stack.remove(block)
+            if not stack:
+                _active_blocks().pop(prefix, None)
+        SeriesCounter.release_block_tail(prefix, block.next_value, block.last_value)
+
+
+@contextmanager
+def document_savepoint(*blocks):
+    """Savepoint одного документа внутри :func:`reserve_document_numbers`.
+
+    Если документ откатился, номера, взятые им из ``blocks``, возвращаются в
+    блоки и достаются следующему документу — пропуска в серии нет.
+    """
+    marks = [(block, block.next_value) for block in blocks if block is not None]
+    try:
+        with transaction.atomic():
+            yield
+    except BaseException:
+        for block, mark in marks:
+            block.next_value = mark
+        raise
+
 
 def next_document_number(model, prefix: str, pad: int) -> str:
     """Вернуть следующий номер документа вида ``{prefix}-NNN…N``.
@@ -52,20 +188,12 @@ def next_document_number(model, prefix: str, pad: int) -> str:
     При первом обращении к серии счётчик «засевается» максимальным уже
     существующим номером модели (важно для прода и восстановленных
     дампов). Гонка двух одновременных первых обращений безопасна:
-    upsert в ``next_value`` гарантирует разные значения.
+    upsert в ``next_value`` гарантирует разные значения. Внутри
+    :func:`reserve_document_numbers` номер берётся из блока без запросов.
     """
-    seed = 0
-    if not SeriesCounter.objects.filter(prefix=prefix).exists():
-        last = (
-            model.objects.filter(number__startswith=f"{prefix}-")
-            .order_by("-number")
-            .values_list("number", flat=True)
-            .first()
-        )
-        if last:
-            try:
-                seed = int(last.rsplit("-", 1)[1])
-            except (ValueError, IndexError):
-                seed = 0
-    value = SeriesCounter.next_value(prefix, seed)
+    for block in reversed(_active_blocks().get(prefix, ())):
+        value = block.take()
+        if value is not None:
+            return f"{prefix}-{value:0{pad}d}"
+    value = SeriesCounter.next_value(prefix, _seed_for(model, prefix))
     return f"{prefix}-{value:0{pad}d}"
@@ -13,6 +13,8 @@ from django.db import models
 from django.utils import timezone
 from PIL import Image
 
+from core.mixins import EmailCountersMixin
+
 from .cars import Car
 from .clients import Client
 from .containers import Container
@@ -820,7 +822,7 @@ class TransportDocumentRule(models.Model):
         return [labels.get(code, code) for code in self.required_doc_types or []]
 
 
-class TransportRequest(models.Model):
+class TransportRequest(EmailCountersMixin, models.Model):
     """Заявка клиента с данными автовоза, который заберёт его автомобили.
 
     Жизненный цикл: Черновик → Подана → Принята → В процессе → Оформлена.
@@ -942,6 +944,12 @@ class TransportRequest(models.Model):
     # догружать файлы даже когда заявка уже в работе.
     awaiting_client_docs = models.BooleanField(default=False, verbose_name="Ожидаем документы от клиента")
 
+    # Денормализованные счётчики переписки для списков (бейджи на доске заявок).
+    # Поддерживаются core.services.email_counters; пересборка —
+    # ``manage.py reconcile_email_counters``.
+    emails_unread = models.PositiveIntegerField(default=0, editable=False, verbose_name="Непрочитанных писем")
+    emails_need_reply = models.PositiveIntegerField(default=0, editable=False, verbose_name="Писем ждут ответа")
+
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Создал")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
@@ -1094,6 +1102,8 @@ class TransportBulkUpload(models.Model):
     )
     status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Статус")
     pages_total = models.PositiveSmallIntegerField(default=0, verbose_name="Страниц в файле")
+    # Прогресс классификации: сколько страниц уже разобрано моделью.
+    pages_done = models.PositiveSmallIntegerField(default=0, verbose_name="Страниц разобрано")
     # {"documents": [{"doc_type", "pages": [1,2], "filename"}], "unrecognized": [5, 6]}
     result = models.JSONField(default=dict, blank=True, verbose_name="Результат разбора")
     error_message = models.TextField(blank=True, verbose_name="Ошибка")
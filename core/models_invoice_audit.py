@@ -1,4 +1,4 @@
 """Реэкспорт: модуль перенесён в ``core/models/invoice_audit.py`` (A1, AUDIT_ROUND3)."""
 
 from core.models.invoice_audit import *  # noqa: F403
-from core.models.invoice_audit import InvoiceAudit, SupplierCost  # noqa: F401
+from core.models.invoice_audit import CarProfitability, InvoiceAudit, SupplierCost  # noqa: F401
@@ -1,4 +1,10 @@
 """Реэкспорт: модуль перенесён в ``core/models/monitoring.py`` (A1, AUDIT_ROUND3)."""
 
 from core.models.monitoring import *  # noqa: F403
-from core.models.monitoring import SystemMetric, UptimeCheck  # noqa: F401
+from core.models.monitoring import (  # noqa: F401
+    RequestMetric,
+    SystemMetric,
+    SystemMetricRollup,
+    TaskMetric,
+    UptimeCheck,
+)
@@ -4,4 +4,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r"ws/updates/$", consumers.DataUpdateConsumer.as_asgi()),
+    re_path(r"ws/emails/(?P<kind>[a-z]+)/(?P<entity_id>\d+)/$", consumers.EmailPanelConsumer.as_asgi()),
 ]
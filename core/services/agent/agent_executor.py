@@ -159,6 +159,8 @@ def _execute_create_container(action, by: str = "") -> dict:
     """
     from datetime import date
 
+    from django.db.models.functions import Upper
+
     from core.models import Car, Container
 
     payload = action.payload or {}
@@ -183,32 +185,44 @@ def _execute_create_container(action, by: str = "") -> dict:
     )
 
     created_vins, attached_vins, skipped = [], [], []
-    for item in payload.get("cars") or []:
-        vin = (item.get("vin") or "").strip().upper()
+    items = [(item, (item.get("vin") or "").strip().upper()) for item in payload.get("cars") or []]
+    # VIN в базе мог быть записан в другом регистре — сравниваем по UPPER.
+    existing = {
+        car.vin.upper(): car
+        for car in Car.objects.annotate(vin_upper=Upper("vin"))
+        .filter(vin_upper__in={vin for _item, vin in items if vin})
+        .select_related("container")
+    }
+    new_cars, attached = [], []
+    for item, vin in items:
         if not vin:
             continue
-        existing = Car.objects.filter(vin__iexact=vin).first()
-        if existing:
-            if existing.container_id:
-                skipped.append(f"{vin} (уже в контейнере {existing.container.number})")
+        car = existing.get(vin)
+        if car is not None:
+            if car.container_id:
+                skipped.append(f"{vin} (уже в контейнере {car.container.number})")
             else:
-                existing.container = container
-                existing.save(update_fields=["container"])
+                car.container = container
+                attached.append(car)
                 attached_vins.append(vin)
             continue
         try:
             year = int(item.get("year") or 0)
         except (TypeError, ValueError):
             year = 0
-        Car.objects.create(
+        car = Car(
             vin=vin,
             brand=(item.get("brand") or "")[:50],
             year=year,
             status="FLOATING",
             container=container,
         )
+        existing[vin] = car  # повтор VIN в payload — как уже привязанный
+        new_cars.append(car)
         created_vins.append(vin)
 
+    _save_container_cars(new_cars, attached)
+
     return {
         "container_id": container.pk,
         "number": container.number,
@@ -218,6 +232,36 @@ def _execute_create_container(action, by: str = "") -> dict:
     }
 
 
+def _save_container_cars(new_cars: list, attached: list) -> None:
+    """Записать машины нового контейнера пачкой (как ``scan_applier``):
+    ``bulk_create`` / ``bulk_update`` без сигналов, услуги — одним
+    ``sync_car_services_for_cars``, пересчёт цены — одной задачей, фасеты
+    портала владельцев — одним сбросом."""
+    from core.models import Car
+    from core.services import client_portal_listing
+    from core.services.car_lifecycle_service import send_car_ws_notification
+    from core.services.car_service_manager import sync_car_services_for_cars
+    from core.services.cascade_control import CAR_SIGNALS, signals_disabled
+    from core.signals.service_catalog import _enqueue_recalc_cars_total_price
+
+    if not (new_cars or attached):
+        return
+    with signals_disabled(*CAR_SIGNALS):
+        if new_cars:
+            Car.objects.bulk_create(new_cars, batch_size=100)
+            sync_car_services_for_cars(
+                new_cars, created=True, warehouse_changed=True, line_changed=True, carrier_changed=True
+            )
+        if attached:
+            Car.objects.bulk_update(attached, ["container"], batch_size=100)
+
+    cars = new_cars + attached
+    _enqueue_recalc_cars_total_price([car.pk for car in cars])
+    client_portal_listing.invalidate_client_facets(car.client_id for car in cars)
+    for car in cars:
+        send_car_ws_notification(car)
+
+
 def _execute_complete_task(action, by: str = "") -> dict:
     from core.models import Task
 
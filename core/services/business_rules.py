@@ -0,0 +1,172 @@
+"""Аудит бизнес-правил учёта (``core.tasks.check_business_rules``).
+
+Правила (см. ``docs/accounting_session_handoff.md``):
+
+1. FACT (INVOICE_FACT, INCOMING) — должен иметь Transaction(PAYMENT,
+   COMPLETED) + attachment.
+2. AV (PROFORMA, OUTGOING) — НЕ должно быть транзакций.
+3. PARDP (INVOICE, OUTGOING) — должен иметь Transaction(PAYMENT,
+   COMPLETED) на сумму ≥ total + attachment.
+
+Каждое правило — запрос, возвращающий только id нарушителей:
+``direction`` выражен через колонки issuer/recipient (как property
+``NewInvoice.direction``), оплаты — условные Count/Sum по транзакциям.
+В Python остаётся только проверка файлов вложений на диске: параллельно
+и с кэшем по пути + mtime каталога (удаление/замена файла меняет mtime
+каталога — кэш сам инвалидируется).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+
+FILE_CHECK_WORKERS = 8
+FILE_CACHE_TTL = 7 * 24 * 3600
+MISMATCH_TOLERANCE = Decimal("0.01")
+
+# Порядок id в выборках — как у NewInvoice.Meta.ordering.
+_ORDERING = ("-date", "-created_at", "-id")
+
+_PAID = Q(transactions__type="PAYMENT", transactions__status="COMPLETED")
+
+
+def direction_q(direction: str, default_id: int | None) -> Q:
+    """Условие ``NewInvoice.direction == direction`` для queryset'а.
+
+    При ``default_id=None`` сравнения превращаются в ``IS NULL`` — как и
+    ``issuer_company_id == None`` в property.
+    """
+    from core.models_billing import NewInvoice
+
+    outgoing = Q(issuer_company_id=default_id)
+    if direction == NewInvoice.DIRECTION_OUTGOING:
+        return outgoing
+    incoming = Q(recipient_company_id=default_id) & ~outgoing
+    if direction == NewInvoice.DIRECTION_INCOMING:
+        return incoming
+    return ~outgoing & ~incoming
+
+
+def _ids(qs) -> list[int]:
+    return list(qs.values_list("id", flat=True))
+
+
+def _with_payments(qs):
+    return (
+        qs.values("id")
+        .annotate(paid_count=Count("transactions", filter=_PAID), paid_sum=Sum("transactions__amount", filter=_PAID))
+        .order_by(*_ORDERING)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Файлы вложений
+# ---------------------------------------------------------------------------
+
+
+def _dir_mtime(directory: str) -> int | None:
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _file_ok(path: str) -> bool:
+    try:
+        return os.stat(path).st_size > 0
+    except OSError:
+        return False
+
+
+def _cache_key(path: str, dir_mtime: int) -> str:
+    digest = hashlib.md5(f"{path}|{dir_mtime}".encode(), usedforsecurity=False).hexdigest()
+    return f"business_rules:file:{digest}"
+
+
+def attachments_present(paths: list[str]) -> dict[str, bool]:
+    """{путь: файл существует и не пуст} — stat'ы параллельно, с кэшем."""
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=FILE_CHECK_WORKERS) as pool:
+        directories = sorted({os.path.dirname(p) for p in paths})
+        dir_mtimes = dict(zip(directories, pool.map(_dir_mtime, directories), strict=True))
+
+        result: dict[str, bool] = {}
+        keys: dict[str, str] = {}
+        for path in paths:
+            mtime = dir_mtimes[os.path.dirname(path)]
+            if mtime is None:
+                result[path] = False  # нет каталога — нет и файла
+            else:
+                keys[path] = _cache_key(path, mtime)
+        cached = cache.get_many(list(keys.values()))
+        to_check = [p for p, key in keys.items() if key not in cached]
+        result.update({p: cached[keys[p]] for p in keys if keys[p] in cached})
+
+        checked = dict(zip(to_check, pool.map(_file_ok, to_check), strict=True))
+    result.update(checked)
+    if checked:
+        cache.set_many({keys[p]: ok for p, ok in checked.items()}, timeout=FILE_CACHE_TTL)
+    return result
+
+
+def _missing_files(qs) -> list[int]:
+    """id из ``qs`` без вложения или с отсутствующим / пустым файлом."""
+    from core.models_billing import NewInvoice
+
+    storage = NewInvoice._meta.get_field("attachment").storage
+    rows = list(qs.order_by(*_ORDERING).values_list("id", "attachment"))
+    paths: dict[int, str] = {}
+    for invoice_id, name in rows:
+        if not name:
+            continue
+        try:
+            paths[invoice_id] = storage.path(name)
+        except NotImplementedError:
+            continue  # remote storage — считаем что файл есть
+    present = attachments_present(list(set(paths.values())))
+    return [
+        invoice_id for invoice_id, name in rows if not name or (invoice_id in paths and not present[paths[invoice_id]])
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Правила
+# ---------------------------------------------------------------------------
+
+
+def audit_business_rules() -> dict[str, list[int]]:
+    """id нарушителей по каждому правилу (порядок — как в списке инвойсов)."""
+    from core.models import Company
+    from core.models_billing import NewInvoice, Transaction
+
+    default_id = Company.get_default_id()
+    incoming = direction_q(NewInvoice.DIRECTION_INCOMING, default_id)
+    outgoing = direction_q(NewInvoice.DIRECTION_OUTGOING, default_id)
+
+    fact = NewInvoice.objects.filter(incoming, document_type="INVOICE_FACT")
+    av = NewInvoice.objects.filter(outgoing, document_type="PROFORMA")
+    pardp = NewInvoice.objects.filter(outgoing, document_type="INVOICE")
+
+    pardp_paid = _with_payments(pardp)
+    mismatch = (
+        pardp_paid.filter(paid_count__gt=0)
+        .exclude(status="PAID")
+        .filter(Q(paid_sum__gt=F("total") + MISMATCH_TOLERANCE) | Q(paid_sum__lt=F("total") - MISMATCH_TOLERANCE))
+    )
+    return {
+        "fact_no_tx": _ids(_with_payments(fact).filter(paid_count=0)),
+        "fact_no_file": _missing_files(fact),
+        "av_with_tx": _ids(
+            av.filter(Exists(Transaction.objects.filter(invoice_id=OuterRef("pk")))).order_by(*_ORDERING)
+        ),
+        "pardp_no_tx": _ids(pardp_paid.filter(paid_count=0)),
+        "pardp_tx_mismatch": _ids(mismatch),
+        "pardp_no_file": _missing_files(pardp),
+    }
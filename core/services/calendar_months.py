@@ -0,0 +1,61 @@
+"""
+Календарные месяцы месячных сводок (``comparison_buckets``, ``expense_rollup``).
+
+Месяц — ``date`` первого числа. В очереди фоновых пересчётов
+(:mod:`core.services.task_coalescer`) месяц едет целым ``YYYYMM``.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Iterator, Sequence
+
+from django.utils import timezone
+
+# Пересборка истории идёт пачками по году: один набор агрегатов на пачку.
+YEAR_CHUNK = 12
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_end(day: date) -> date:
+    return next_month(month_start(day)) - timedelta(days=1)
+
+
+def iter_months(start: date, end: date) -> Iterator[date]:
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = next_month(month)
+
+
+def last_months(today: date, count: int) -> date:
+    """Первый из последних ``count`` месяцев (текущий включительно)."""
+    first = month_start(today)
+    for _ in range(max(1, count) - 1):
+        first = month_start(first - timedelta(days=1))
+    return first
+
+
+def year_chunks(months: Sequence[date]) -> Iterator[Sequence[date]]:
+    for i in range(0, len(months), YEAR_CHUNK):
+        yield months[i : i + YEAR_CHUNK]
+
+
+def local_date(value):
+    """Дата в локальной зоне (для ``DateTimeField``); ``date``/``None`` — как есть."""
+    return timezone.localtime(value).date() if isinstance(value, datetime) else value
+
+
+def month_key(day: date) -> int:
+    return day.year * 100 + day.month
+
+
+def from_month_key(key: int) -> date:
+    return date(key // 100, key % 100, 1)
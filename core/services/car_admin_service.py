@@ -283,11 +283,13 @@ def apply_car_service_edits(car, *, post, changed_data, is_change) -> None:
         client = car.client
         try:
             from core.services.car_service_manager import apply_client_tariff_for_car
+            from core.services.comparison_buckets import schedule_refresh_for_cars
 
             if (client and client.tariff_type in ("FIXED", "FLEXIBLE")) or client_cleared:
                 apply_client_tariff_for_car(car)
                 car.calculate_total_price()
                 Car.objects.filter(pk=car.pk).update(total_price=car.total_price)
+                schedule_refresh_for_cars([car])
         except Exception:
             # B4: сбой применения тарифа = неверные клиентские цены — пробрасываем.
             logger.exception("Ошибка при пересчете тарифа клиента для car=%s", car.pk)
@@ -0,0 +1,96 @@
+"""
+Батч-пересчёт денормализованных цен машин (``days`` / ``storage_cost`` /
+``total_price``).
+
+``Car.calculate_total_price()`` на каждую машину делает два запроса к
+каталогу склада (ставка хранения), ``UPDATE`` услуги «Хранение» и
+``SELECT`` услуг. Для пачки машин (смена статуса контейнеров, ночной
+пересчёт хранения) это сотни запросов. ``reprice_cars`` считает то же
+самое за фиксированное число запросов:
+
+* ставки хранения — один запрос на все склады пачки;
+* каталог услуг — ``prefetch_service_objects`` (до 4 ``in_bulk``);
+* цены услуг «Хранение» — один ``bulk_update``.
+
+Результат совпадает с ``calculate_total_price()``; сохранение самих машин
+(``bulk_update`` нужных полей) остаётся за вызывающим кодом.
+"""
+
+from __future__ import annotations
+
+import logging
+from decimal import Decimal
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ("days", "storage_cost", "total_price")
+
+
+def storage_services_by_warehouse(warehouse_ids: Iterable[int]) -> dict[int, tuple[int, Decimal]]:
+    """``{warehouse_id: (id услуги «Хранение», ставка за день)}`` одним запросом.
+
+    Как и ``Car._get_storage_daily_rate``, при нескольких подходящих
+    услугах берётся первая по pk.
+    """
+    from core.models import WarehouseService
+    from core.service_codes import storage_service_q
+
+    warehouse_ids = {wh_id for wh_id in warehouse_ids if wh_id}
+    if not warehouse_ids:
+        return {}
+    result: dict[int, tuple[int, Decimal]] = {}
+    rows = (
+        WarehouseService.objects.filter(warehouse_id__in=warehouse_ids, is_active=True)
+        .filter(storage_service_q())
+        .order_by("warehouse_id", "pk")
+        .values_list("warehouse_id", "pk", "default_price")
+    )
+    for wh_id, service_id, price in rows:
+        result.setdefault(wh_id, (service_id, Decimal(str(price or 0))))
+    return result
+
+
+def reprice_cars(cars: list) -> list:
+    """Пересчитать ``days`` / ``storage_cost`` / ``total_price`` у пачки машин.
+
+    Машины должны быть загружены с ``prefetch_related("car_services")`` и
+    ``select_related("warehouse")``. Цена услуги «Хранение» пишется в БД
+    (как в ``_update_storage_service_price``), поля машин — только в
+    памяти. Возвращает машины, пересчитанные без ошибок.
+    """
+    from core.models import CarService
+    from core.models.services import prefetch_service_objects
+
+    if not cars:
+        return []
+
+    storage = storage_services_by_warehouse(car.warehouse_id for car in cars)
+    prefetch_service_objects(svc for car in cars for svc in car.car_services.all())
+
+    repriced = []
+    storage_rows = []
+    for car in cars:
+        try:
+            service_id, rate = storage.get(car.warehouse_id, (None, Decimal("0.00")))
+            # Ставка уже известна — update_days_and_storage не пойдёт в БД.
+            car._cached_storage_rate = rate
+            car._cached_storage_rate_wh_id = car.warehouse_id
+            car.update_days_and_storage()
+
+            total = Decimal("0.00")
+            for svc in car.car_services.all():
+                if service_id is not None and svc.service_type == "WAREHOUSE" and svc.service_id == service_id:
+                    price = Decimal(str(car.days)) * rate
+                    if svc.custom_price != price:
+                        svc.custom_price = price
+                        storage_rows.append(svc)
+                total += Decimal(str(svc.invoice_price))
+            car.total_price = total
+            repriced.append(car)
+        except Exception:
+            logger.exception("[car_pricing] reprice failed for car %s", car.pk)
+
+    if storage_rows:
+        CarService.objects.bulk_update(storage_rows, ["custom_price"], batch_size=200)
+    return repriced
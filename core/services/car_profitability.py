@@ -0,0 +1,204 @@
+"""
+Поддерживаемая сводка прибыли по машинам (``CarProfitability``).
+
+Dashboard сверки раньше на каждый запрос агрегировал всю историю
+``SupplierCost``, собирал dict'ы по машинам и сортировал список в Python.
+Теперь прибыль хранится построчно, а Dashboard читает таблицу: сортировка
+и постраничный вывод — ``ORDER BY`` по индексам, сводки по контейнерам и
+клиентам — ``GROUP BY`` по этой же таблице.
+
+Строка пересчитывается целиком для затронутых машин (как счётчики писем в
+``core.services.email_counters``): несколько агрегатных запросов на пачку и
+один upsert. Строка есть только у машины хотя бы с одной ``SupplierCost``;
+без затрат — удаляется.
+
+Когда пересчитывается:
+
+* сигналы (``core.signals.car_profitability``) — ``save``/``delete``
+  ``SupplierCost`` и ``CarService``, ``save`` машины с изменением цены,
+  контейнера или клиента;
+* явный ``schedule_refresh`` — там, где затраты создаются ``bulk_create``
+  (разбор счёта поставщика), и после пакетной пересинхронизации услуг
+  (``sync_car_services_for_cars``, пересборка THS в
+  ``tariff_engine.recalculate_containers``);
+* ``refresh_stale_revenue`` при открытии Dashboard — догоняет выручку,
+  изменённую массовыми путями (``bulk_update`` / ``update`` цены машин);
+* полная сверка — ``manage.py reconcile_car_profitability`` и ночная задача
+  ``reconcile_car_profitability_task``.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+from django.db.models import Count, F, Q, Sum
+
+from core.services.summary_refresh import DeferredRefresh
+
+ROW_FIELDS = (
+    "container",
+    "client",
+    "revenue",
+    "total_cost",
+    "profit",
+    "margin_pct",
+    "cost_breakdown",
+    "total_services",
+    "confirmed_services",
+    "unlinked_costs",
+    "cost_status",
+    "is_final",
+    "updated_at",
+)
+
+CENT = Decimal("0.01")
+
+# Сколько строк с устаревшей выручкой догонять при открытии Dashboard.
+STALE_REFRESH_LIMIT = 2000
+
+
+def cost_status(total_services: int, confirmed_services: int) -> str:
+    """``full`` / ``partial`` / ``none`` — как в прежнем ``get_car_profitability``."""
+    if total_services and confirmed_services >= total_services:
+        return "full"
+    if total_services and confirmed_services:
+        return "partial"
+    return "none"
+
+
+def margin_pct(profit: Decimal, revenue: Decimal) -> Decimal:
+    if revenue > 0:
+        return (profit / revenue * 100).quantize(Decimal("0.1"))
+    return Decimal("0.0")
+
+
+def refresh_car_profitability(car_ids: Iterable[int]) -> int:
+    """Пересчитать строки указанных машин. Возвращает число записанных строк."""
+    from core.models import Car, CarProfitability, CarService, SupplierCost
+
+    ids = {pk for pk in car_ids if pk}
+    if not ids:
+        return 0
+
+    breakdown: dict[int, dict[str, Decimal]] = defaultdict(dict)
+    for row in (
+        SupplierCost.objects.filter(car_id__in=ids)
+        .values("car_id", "service_type")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    ):
+        breakdown[row["car_id"]][row["service_type"]] = row["total"] or Decimal("0")
+
+    CarProfitability.objects.filter(car_id__in=ids - set(breakdown)).delete()
+    if not breakdown:
+        return 0
+
+    links = {
+        row["car_id"]: (row["confirmed"], row["unlinked"])
+        for row in SupplierCost.objects.filter(car_id__in=breakdown.keys())
+        .values("car_id")
+        .annotate(
+            confirmed=Count("car_service_id", distinct=True),
+            unlinked=Count("pk", filter=Q(car_service__isnull=True)),
+        )
+        .order_by()
+    }
+    services = dict(
+        CarService.objects.filter(car_id__in=breakdown.keys())
+        .values("car_id")
+        .annotate(cnt=Count("id"))
+        .order_by()
+        .values_list("car_id", "cnt")
+    )
+
+    rows = []
+    for car_id, total_price, container_id, client_id in Car.objects.filter(pk__in=breakdown.keys()).values_list(
+        "pk", "total_price", "container_id", "client_id"
+    ):
+        revenue = total_price or Decimal("0")
+        total_cost = sum(breakdown[car_id].values(), Decimal("0"))
+        confirmed, unlinked = links.get(car_id, (0, 0))
+        total_services = services.get(car_id, 0)
+        status = cost_status(total_services, confirmed)
+        rows.append(
+            CarProfitability(
+                car_id=car_id,
+                container_id=container_id,
+                client_id=client_id,
+                revenue=revenue,
+                total_cost=total_cost,
+                profit=revenue - total_cost,
+                margin_pct=margin_pct(revenue - total_cost, revenue),
+                cost_breakdown={
+                    stype: str(amount.quantize(CENT)) for stype, amount in sorted(breakdown[car_id].items())
+                },
+                total_services=total_services,
+                confirmed_services=confirmed,
+                unlinked_costs=unlinked,
+                cost_status=status,
+                is_final=status == "full" and unlinked == 0,
+            )
+        )
+    CarProfitability.objects.bulk_create(
+        rows, batch_size=500, update_conflicts=True, unique_fields=["car"], update_fields=ROW_FIELDS
+    )
+    return len(rows)
+
+
+def refresh_stale_revenue(*, limit: int = STALE_REFRESH_LIMIT) -> int:
+    """Пересчитать строки, где выручка разошлась с ``Car.total_price``.
+
+    Цену машины меняют и массовые пути без сигналов (``bulk_update`` при
+    перерасчёте хранения, тарифов и THS). Запрос идёт по таблице сводки
+    с JOIN'ом по первичному ключу машины — история затрат не читается.
+    """
+    from core.models import CarProfitability
+
+    stale = list(
+        CarProfitability.objects.exclude(revenue=F("car__total_price")).values_list("car_id", flat=True)[:limit]
+    )
+    return refresh_car_profitability(stale) if stale else 0
+
+
+# ---------------------------------------------------------------------------
+# Отложенный пересчёт (после коммита, с дедупликацией в пределах потока)
+# ---------------------------------------------------------------------------
+
+# Сводка — кэш для Dashboard: сбой пересчёта догонит ночная сверка.
+_deferred = DeferredRefresh("car_profitability", refresh_car_profitability)
+
+
+def schedule_refresh(car_ids: Iterable[int]) -> None:
+    """Пересчитать строки машин после коммита текущей транзакции.
+
+    Пересохранение сотни затрат счёта даёт один пересчёт.
+    """
+    _deferred.schedule(pk for pk in car_ids if pk)
+
+
+# ---------------------------------------------------------------------------
+# Полная сверка
+# ---------------------------------------------------------------------------
+
+
+def reconcile_car_profitability(*, batch_size: int = 2000) -> dict[str, int]:
+    """Пересобрать сводку по всем машинам с затратами и удалить лишние строки."""
+    from core.models import CarProfitability, SupplierCost
+
+    car_ids = (
+        SupplierCost.objects.filter(car__isnull=False).values_list("car_id", flat=True).order_by("car_id").distinct()
+    )
+    orphaned, _ = CarProfitability.objects.exclude(car_id__in=car_ids).delete()
+
+    refreshed = 0
+    batch: list[int] = []
+    for pk in car_ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            refreshed += refresh_car_profitability(batch)
+            batch = []
+    if batch:
+        refreshed += refresh_car_profitability(batch)
+    return {"refreshed": refreshed, "deleted": orphaned}
@@ -8,7 +8,6 @@ import logging
 from decimal import Decimal
 
 from django.db import models as db_models
-from django.db import transaction
 from django.db.models import Q
 
 from core.service_codes import ServiceCode, is_storage_service
@@ -22,50 +21,17 @@ def calculate_ths_for_container(container):
 
     Returns dict: {car_id: ths_amount}.
     """
-    from core.models import LineTHSCoefficient
+    from core.services.tariff_engine import load_ths_coefficients, ths_shares
 
-    if not container or not container.line or not container.ths:
+    if not container or not container.line_id or not container.ths:
         return {}
 
-    total_ths = Decimal(str(container.ths))
-    if total_ths <= 0:
-        return {}
-
-    cars = list(container.container_cars.all())
-    if not cars:
-        return {}
-
-    ths_coefficients = {
-        tc.vehicle_type: Decimal(str(tc.coefficient)) for tc in LineTHSCoefficient.objects.filter(line=container.line)
-    }
-
-    total_coefficient = Decimal("0.00")
-    car_coefficients = {}
-
-    for car in cars:
-        coeff = ths_coefficients.get(car.vehicle_type, Decimal("1.00"))
-        car_coefficients[car.id] = coeff
-        total_coefficient += coeff
-
-    from core.utils import round_up_to_5
-
-    if total_coefficient == 0:
-        equal_share = total_ths / len(cars)
-        return {car.id: round_up_to_5(equal_share) for car in cars}
-
-    result = {}
-    for car in cars:
-        car_share = car_coefficients[car.id] / total_coefficient
-        car_ths = total_ths * car_share
-        result[car.id] = round_up_to_5(car_ths)
-
-    logger.info(
-        "THS distribution for container %s: total=%s, coefficients=%s, result=%s",
-        container.number,
-        total_ths,
-        car_coefficients,
-        result,
+    result = ths_shares(
+        container.ths,
+        list(container.container_cars.all()),
+        load_ths_coefficients([container.line_id]).get(container.line_id, {}),
     )
+    logger.info("THS distribution for container %s: total=%s, result=%s", container.number, container.ths, result)
     return result
 
 
@@ -75,131 +41,21 @@ def create_ths_services_for_container(container):
 
     Service provider type (LINE or WAREHOUSE) is determined by container.ths_payer.
     Returns the number of created services.
-    """
-    from core.models import (
-        Car,
-        CarService,
-        LineService,
-        WarehouseService,
-    )
 
-    if not container or not container.line:
-        return 0
+    Делегирует в пакетный :mod:`core.services.tariff_engine` (весь
+    пересчёт — одна транзакция, при ошибке откатывается целиком и
+    пробрасывается). Сигналы ``CarService`` не шлются — ``total_price``
+    машин и регенерация их инвойсов — здесь явно
+    (``reprice_cars_and_invoices``).
+    """
+    from core.services.tariff_engine import recalculate_containers, reprice_cars_and_invoices
 
-    ths_distribution = calculate_ths_for_container(container)
-    if not ths_distribution:
+    if not container or not container.line_id:
         return 0
-
-    service_type = container.ths_payer if hasattr(container, "ths_payer") else "LINE"
-
-    if service_type == "WAREHOUSE" and not container.warehouse:
-        logger.warning(
-            "Container %s: ths_payer=WAREHOUSE but no warehouse set. Falling back to LINE.",
-            container.number,
-        )
-        service_type = "LINE"
-
-    line_service = None
-    if service_type == "LINE":
-        line_service = (
-            LineService.objects.filter(
-                line=container.line,
-                is_active=True,
-            )
-            .filter(
-                Q(code=ServiceCode.THS) | Q(name__icontains="THS"),
-            )
-            .first()
-        )
-        if not line_service:
-            line_service, _ = LineService.objects.get_or_create(
-                line=container.line,
-                name=f"THS {container.line.name}",
-                defaults={
-                    "code": ServiceCode.THS,
-                    "description": "Услуга THS (рассчитывается пропорционально)",
-                    "default_price": 0,
-                    "is_active": True,
-                },
-            )
-
-    warehouse_service = None
-    if service_type == "WAREHOUSE" and container.warehouse:
-        warehouse_service = (
-            WarehouseService.objects.filter(
-                warehouse=container.warehouse,
-                is_active=True,
-            )
-            .filter(
-                Q(code=ServiceCode.THS) | Q(name__icontains="THS"),
-            )
-            .first()
-        )
-        if not warehouse_service:
-            warehouse_service, _ = WarehouseService.objects.get_or_create(
-                warehouse=container.warehouse,
-                name=f"THS {container.warehouse.name}",
-                defaults={
-                    "code": ServiceCode.THS,
-                    "description": "Услуга THS (рассчитывается пропорционально)",
-                    "default_price": 0,
-                    "is_active": True,
-                    "add_by_default": False,
-                },
-            )
-
-    created_count = 0
-    car_ids = list(ths_distribution.keys())
-    cars_by_id = {c.id: c for c in Car.objects.filter(id__in=car_ids)}
-
-    # Весь пересчёт THS контейнера — одна транзакция. Раньше delete старых
-    # THS и create новых шли по машинам без atomic, а исключение только
-    # логировалось: сбой посередине оставлял часть машин контейнера ВООБЩЕ
-    # без THS-услуги (старая удалена, новая не создана) — тихо неправильные
-    # инвойсы. Теперь при любой ошибке транзакция откатывается целиком и
-    # исключение пробрасывается наверх (админка покажет ошибку, Sentry —
-    # алерт).
-    with transaction.atomic():
-        for car_id, ths_amount in ths_distribution.items():
-            car = cars_by_id.get(car_id)
-            if not car:
-                logger.warning("Car %s not found when creating THS service", car_id)
-                continue
-
-            CarService.objects.filter(car=car, service_type="LINE").filter(
-                service_id__in=LineService.objects.filter(
-                    Q(code=ServiceCode.THS) | Q(name__icontains="THS")
-                ).values_list("id", flat=True)
-            ).delete()
-
-            CarService.objects.filter(car=car, service_type="WAREHOUSE").filter(
-                service_id__in=WarehouseService.objects.filter(
-                    Q(code=ServiceCode.THS) | Q(name__icontains="THS")
-                ).values_list("id", flat=True)
-            ).delete()
-
-            if service_type == "LINE" and line_service:
-                CarService.objects.create(
-                    car=car,
-                    service_type="LINE",
-                    service_id=line_service.id,
-                    custom_price=ths_amount,
-                    quantity=1,
-                    notes=f"THS рассчитан пропорционально. Тип ТС: {car.get_vehicle_type_display()}",
-                )
-                created_count += 1
-            elif service_type == "WAREHOUSE" and warehouse_service:
-                CarService.objects.create(
-                    car=car,
-                    service_type="WAREHOUSE",
-                    service_id=warehouse_service.id,
-                    custom_price=ths_amount,
-                    quantity=1,
-                    notes=f"THS рассчитан пропорционально. Тип ТС: {car.get_vehicle_type_display()}",
-                )
-                created_count += 1
-
-    return created_count
+    result = recalculate_containers([container], tariffs=False)
+    if result.ths_services:
+        reprice_cars_and_invoices(result.car_ids)
+    return result.ths_services
 
 
 # Типы ТС, которые считаются мотоциклами. Мотоциклы НЕ участвуют в подсчёте
@@ -230,33 +86,20 @@ def apply_client_tariffs_for_container(container):
 
     Количество ТС для подбора тарифа считается по категориям: мотоциклы не
     учитываются при подсчёте легковых авто (и наоборот).
+
+    Делегирует в пакетный :mod:`core.services.tariff_engine`: ставки
+    клиентов и услуги машин грузятся разом, наценки пишутся одним
+    ``bulk_update``, цены машин и инвойсы пересчитываются
+    ``reprice_cars_and_invoices``.
     """
-    if not container:
-        return
+    from core.services.tariff_engine import recalculate_containers, reprice_cars_and_invoices
 
-    cars = list(container.container_cars.select_related("client").all())
-    if not cars:
+    if not container:
         return
 
-    for car in cars:
-        if not car.client or car.client.tariff_type == "NONE":
-            continue
-
-        client = car.client
-        count = _count_vehicles_for_tariff(cars, car.vehicle_type)
-        agreed_total = _get_agreed_total(client, car.vehicle_type, count)
-
-        if agreed_total is None:
-            logger.debug(
-                "Нет тарифа для %s (%s), тип ТС: %s, кол-во ТС (без учёта др. категории): %s",
-                client.name,
-                client.tariff_type,
-                car.vehicle_type,
-                count,
-            )
-            continue
-
-        _distribute_markup_for_car(car, agreed_total, count)
+    result = recalculate_containers([container], ths=False)
+    if result.markups_changed:
+        reprice_cars_and_invoices(result.car_ids)
 
 
 def apply_client_tariff_for_car(car):
@@ -324,58 +167,19 @@ def _distribute_markup_for_car(car, agreed_total, total_cars_in_container):
     (CARRIER) и отдельные услуги компаний (COMPANY) тоже не затрагиваются.
     """
     from core.models import CarService
+    from core.services.tariff_engine import distribute_markup
 
-    all_services = list(CarService.objects.filter(car=car))
-
-    warehouse_non_storage = [
-        svc for svc in all_services if svc.service_type == "WAREHOUSE" and not is_storage_service(svc)
-    ]
-
-    storage_services = [svc for svc in all_services if is_storage_service(svc)]
-    for svc in storage_services:
-        if svc.markup_amount != 0:
-            svc.markup_amount = Decimal("0")
-            svc.save(update_fields=["markup_amount"])
-
-    if not warehouse_non_storage:
-        logger.info(
-            "Tariff for %s (%s): agreed=%s, но нет услуг склада (кроме хранения) — наценка не распределена",
-            car.vin,
-            car.client.name if car.client else "?",
-            agreed_total,
-        )
-        return
-
-    tariff_type = car.client.tariff_type if car.client else "?"
-
-    # Базовая стоимость пакета — БЕЗ скрытой наценки.
-    base_total = sum(Decimal(str(svc.final_price)) for svc in warehouse_non_storage)
-
-    # Цена пакета не может быть выше тарифа: приводим ровно к тарифу.
-    # diff > 0 → прибыль, diff < 0 → убыток (отрицательная наценка).
-    diff = agreed_total - base_total
-
-    share = (diff / len(warehouse_non_storage)).quantize(Decimal("0.01"))
-    remainder = diff - share * len(warehouse_non_storage)
-
-    for i, svc in enumerate(warehouse_non_storage):
-        new_markup = share
-        if i == len(warehouse_non_storage) - 1:
-            new_markup = share + remainder
-        if svc.markup_amount != new_markup:
-            svc.markup_amount = new_markup
-            svc.save(update_fields=["markup_amount"])
+    services = list(CarService.objects.filter(car=car).order_by("pk"))
+    for svc in distribute_markup(services, agreed_total):
+        svc.save(update_fields=["markup_amount"])
 
     logger.info(
-        "Tariff for %s (%s): type=%s, agreed=%s, base=%s, diff=%s, cars_count=%s, распределено по %d услугам склада",
+        "Tariff for %s (%s): type=%s, agreed=%s, cars_count=%s",
         car.vin,
         car.client.name if car.client else "?",
-        tariff_type,
+        car.client.tariff_type if car.client else "?",
         agreed_total,
-        base_total,
-        diff,
         total_cars_in_container,
-        len(warehouse_non_storage),
     )
 
 
@@ -466,8 +270,14 @@ def sync_car_services_for_car(
     Пересоздаются только услуги изменившегося типа — ручные правки
     остальных типов сохраняются. Услуги, удалённые пользователем
     (``DeletedCarService``), не восстанавливаются.
+
+    Делегирует в :func:`sync_car_services_for_cars` (один запрос к
+    ``DeletedCarService`` и ``bulk_create`` вместо ``get_or_create`` на
+    каждую услугу каталога). Сигналы ``CarService`` при этом не шлются,
+    поэтому регенерация инвойсов машины ставится здесь явно — как раньше
+    её ставил ``post_save`` каждой созданной услуги.
     """
-    from core.models import CarService, DeletedCarService, LineService
+    from core.services.task_coalescer import JOB_CAR_INVOICES, schedule
 
     if not car.pk:
         return
@@ -477,81 +287,190 @@ def sync_car_services_for_car(
     if not (created or warehouse_changed or line_changed or carrier_changed):
         return
 
-    car._creating_services = True
-    try:
-        deleted_by_type = {}
-        for stype in ("WAREHOUSE", "LINE", "CARRIER", "COMPANY"):
-            deleted_by_type[stype] = set(
-                DeletedCarService.objects.filter(car=car, service_type=stype).values_list("service_id", flat=True)
+    sync_car_services_for_cars(
+        [car],
+        created=created,
+        warehouse_changed=warehouse_changed,
+        line_changed=line_changed,
+        carrier_changed=carrier_changed,
+    )
+    schedule(JOB_CAR_INVOICES, [car.pk])
+
+
+def _group_catalog(queryset, fk_field):
+    grouped = {}
+    for service in queryset:
+        grouped.setdefault(getattr(service, fk_field), []).append(service)
+    return grouped
+
+
+def sync_car_services_for_cars(
+    cars,
+    *,
+    created: bool,
+    warehouse_changed: bool = False,
+    line_changed: bool = False,
+    carrier_changed: bool = False,
+) -> int:
+    """Пакетный вариант :func:`sync_car_services_for_car` для набора машин
+    с одинаковым набором изменений (например, все машины, только что
+    созданные из Dock Receipt).
+
+    Семантика та же — пересоздаются услуги изменившихся типов, удалённые
+    пользователем (``DeletedCarService``) не восстанавливаются. Но число
+    запросов не зависит от числа машин: ``DeletedCarService`` — один
+    запрос, каталог — один запрос на тип контрактника, удаление — один
+    DELETE на тип, создание — ``bulk_create(ignore_conflicts=True)``
+    (аналог ``get_or_create`` по ``unique_car_service``).
+
+    Сигналы ``CarService`` при ``bulk_create`` не срабатывают, удаление
+    тоже идёт без ``post_delete`` (иначе на каждую удалённую услугу —
+    ленивая загрузка машины и отложенный пересчёт): пересчёт
+    ``total_price`` и инвойсов вызывающий код делает сам, одним батчем.
+    Сводку прибыли (число и подтверждённость услуг) пересчитывает эта
+    функция — одним отложенным ``schedule_refresh`` на пачку.
+
+    Returns:
+        число созданных ``CarService``.
+    """
+    from core.services import car_profitability
+    from core.services.cascade_control import CAR_SERVICE_DELETE_SIGNALS, signals_disabled
+
+    if not (created or warehouse_changed or line_changed or carrier_changed):
+        return 0
+    cars = [car for car in cars if car.pk and not getattr(car, "_creating_services", False)]
+    if not cars:
+        return 0
+
+    with signals_disabled(*CAR_SERVICE_DELETE_SIGNALS):
+        count = _sync_car_services_for_cars(
+            cars,
+            created=created,
+            warehouse_changed=warehouse_changed,
+            line_changed=line_changed,
+            carrier_changed=carrier_changed,
+        )
+    car_profitability.schedule_refresh(car.pk for car in cars)
+    return count
+
+
+def sync_services_for_moved_cars(cars, old_warehouse_ids: dict) -> list:
+    """Пересоздать складские услуги машин, у которых сменился склад.
+
+    ``old_warehouse_ids`` — ``{car.pk: warehouse_id}`` до смены. Машины
+    грузятся вызывающим кодом с ``prefetch_related("car_services")``
+    (для ``reprice_cars``) — у пересинхронизированных prefetch
+    перечитывается одним запросом. Возвращает переехавшие машины.
+    """
+    from django.db.models import prefetch_related_objects
+
+    moved = [car for car in cars if car.warehouse_id != old_warehouse_ids.get(car.pk)]
+    if not moved:
+        return []
+    sync_car_services_for_cars(moved, created=False, warehouse_changed=True)
+    for car in moved:
+        getattr(car, "_prefetched_objects_cache", {}).pop("car_services", None)
+    prefetch_related_objects(moved, "car_services")
+    return moved
+
+
+def _sync_car_services_for_cars(cars, *, created, warehouse_changed, line_changed, carrier_changed) -> int:
+    from core.models import (
+        CarrierService,
+        CarService,
+        CompanyService,
+        DeletedCarService,
+        LineService,
+        WarehouseService,
+    )
+
+    car_ids = [car.pk for car in cars]
+    deleted = set(
+        DeletedCarService.objects.filter(car_id__in=car_ids).values_list("car_id", "service_type", "service_id")
+    )
+    to_create = []
+
+    def _add(car, service_type, service, custom_price, markup):
+        if (car.pk, service_type, service.id) in deleted:
+            return
+        to_create.append(
+            CarService(
+                car_id=car.pk,
+                service_type=service_type,
+                service_id=service.id,
+                custom_price=custom_price,
+                markup_amount=markup,
             )
+        )
 
-        # WAREHOUSE — только если склад действительно сменился
-        if warehouse_changed:
-            car.car_services.filter(service_type="WAREHOUSE").delete()
-            if car.warehouse:
-                for service in find_warehouse_services_for_car(car.warehouse):
-                    if service.id in deleted_by_type["WAREHOUSE"]:
-                        continue
-                    if is_storage_service(service):
-                        days = Decimal(str(car.days or 0))
-                        custom_price = days * Decimal(str(service.default_price or 0))
-                        default_markup = days * Decimal(str(getattr(service, "default_markup", 0) or 0))
-                    else:
-                        custom_price = service.default_price
-                        default_markup = getattr(service, "default_markup", None) or Decimal("0")
-                    CarService.objects.get_or_create(
-                        car=car,
-                        service_type="WAREHOUSE",
-                        service_id=service.id,
-                        defaults={"custom_price": custom_price, "markup_amount": default_markup},
-                    )
-
-        # LINE (без THS: THS управляется create_ths_services_for_container)
-        if line_changed:
-            ths_line_ids = LineService.objects.filter(Q(code=ServiceCode.THS) | Q(name__icontains="THS")).values_list(
-                "id", flat=True
+    if warehouse_changed:
+        CarService.objects.filter(car_id__in=car_ids, service_type="WAREHOUSE").delete()
+        warehouse_ids = {car.warehouse_id for car in cars if car.warehouse_id}
+        catalog = (
+            _group_catalog(
+                WarehouseService.objects.filter(warehouse_id__in=warehouse_ids, is_active=True, add_by_default=True),
+                "warehouse_id",
+            )
+            if warehouse_ids
+            else {}
+        )
+        for car in cars:
+            for service in catalog.get(car.warehouse_id, []):
+                if is_storage_service(service):
+                    days = Decimal(str(car.days or 0))
+                    custom_price = days * Decimal(str(service.default_price or 0))
+                    markup = days * Decimal(str(getattr(service, "default_markup", 0) or 0))
+                else:
+                    custom_price = service.default_price
+                    markup = getattr(service, "default_markup", None) or Decimal("0")
+                _add(car, "WAREHOUSE", service, custom_price, markup)
+
+    if line_changed:
+        ths_line_ids = LineService.objects.filter(Q(code=ServiceCode.THS) | Q(name__icontains="THS")).values_list(
+            "id", flat=True
+        )
+        CarService.objects.filter(car_id__in=car_ids, service_type="LINE").exclude(service_id__in=ths_line_ids).delete()
+        line_ids = {car.line_id for car in cars if car.line_id}
+        catalog = (
+            _group_catalog(
+                LineService.objects.filter(line_id__in=line_ids, is_active=True, add_by_default=True).exclude(
+                    name__icontains="THS"
+                ),
+                "line_id",
+            )
+            if line_ids
+            else {}
+        )
+        for car in cars:
+            for service in catalog.get(car.line_id, []):
+                _add(car, "LINE", service, service.default_price, service.default_markup or Decimal("0"))
+
+    if carrier_changed:
+        CarService.objects.filter(car_id__in=car_ids, service_type="CARRIER").delete()
+        carrier_ids = {car.carrier_id for car in cars if car.carrier_id}
+        catalog = (
+            _group_catalog(
+                CarrierService.objects.filter(carrier_id__in=carrier_ids, is_active=True, add_by_default=True),
+                "carrier_id",
             )
-            car.car_services.filter(service_type="LINE").exclude(service_id__in=ths_line_ids).delete()
-            if car.line:
-                for service in find_line_services_for_car(car.line):
-                    if service.id in deleted_by_type["LINE"]:
-                        continue
-                    default_markup = getattr(service, "default_markup", None) or Decimal("0")
-                    CarService.objects.get_or_create(
-                        car=car,
-                        service_type="LINE",
-                        service_id=service.id,
-                        defaults={"custom_price": service.default_price, "markup_amount": default_markup},
-                    )
-
-        # CARRIER — только если перевозчик действительно сменился
-        if carrier_changed:
-            car.car_services.filter(service_type="CARRIER").delete()
-            if car.carrier:
-                for service in find_carrier_services_for_car(car.carrier):
-                    if service.id in deleted_by_type["CARRIER"]:
-                        continue
-                    default_markup = getattr(service, "default_markup", None) or Decimal("0")
-                    CarService.objects.get_or_create(
-                        car=car,
-                        service_type="CARRIER",
-                        service_id=service.id,
-                        defaults={"custom_price": service.default_price, "markup_amount": default_markup},
-                    )
-
-        # COMPANY (только для новых машин)
-        if created:
-            main_company = get_main_company()
-            if main_company:
-                for service in find_company_services_for_car(main_company):
-                    if service.id in deleted_by_type["COMPANY"]:
-                        continue
-                    default_markup = getattr(service, "default_markup", None) or Decimal("0")
-                    CarService.objects.get_or_create(
-                        car=car,
-                        service_type="COMPANY",
-                        service_id=service.id,
-                        defaults={"custom_price": service.default_price, "markup_amount": default_markup},
-                    )
-    finally:
-        car._creating_services = False
+            if carrier_ids
+            else {}
+        )
+        for car in cars:
+            for service in catalog.get(car.carrier_id, []):
+                _add(car, "CARRIER", service, service.default_price, service.default_markup or Decimal("0"))
+
+    if created:
+        main_company = get_main_company()
+        company_services = (
+            list(CompanyService.objects.filter(company=main_company, is_active=True, add_by_default=True))
+            if main_company
+            else []
+        )
+        for car in cars:
+            for service in company_services:
+                _add(car, "COMPANY", service, service.default_price, service.default_markup or Decimal("0"))
+
+    if to_create:
+        CarService.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=500)
+    return len(to_create)
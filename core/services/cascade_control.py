@@ -37,14 +37,20 @@ def signals_disabled(*signal_pairs):
     """Временно отключает сигналы, гарантируя обратное подключение даже при
     исключении.
 
+    Вложенные вызовы безопасны: обратно подключаются только те
+    обработчики, которые отключил именно этот вызов.
+
     :param signal_pairs: кортежи ``(signal, handler, sender)``.
     """
-    for signal, handler, sender in signal_pairs:
-        signal.disconnect(handler, sender=sender)
+    disconnected = [
+        (signal, handler, sender)
+        for signal, handler, sender in signal_pairs
+        if signal.disconnect(handler, sender=sender)
+    ]
     try:
         yield
     finally:
-        for signal, handler, sender in signal_pairs:
+        for signal, handler, sender in disconnected:
             signal.connect(handler, sender=sender)
 
 
@@ -60,3 +66,10 @@ INVOICE_SIGNALS = [
     (post_save, recalculate_invoices_on_car_service_save, CarService),
     (post_delete, recalculate_invoices_on_car_service_delete, CarService),
 ]
+
+# post_delete услуг авто: пакетная пересинхронизация CarService удаляет их
+# без сигналов — цену и инвойсы пересчитывает вызывающий код.
+CAR_SERVICE_DELETE_SIGNALS = [
+    (post_delete, recalculate_car_price_on_service_delete, CarService),
+    (post_delete, recalculate_invoices_on_car_service_delete, CarService),
+]
@@ -0,0 +1,317 @@
+"""Список авто в кабинете клиента (:func:`core.views_website.client_portal.client_dashboard`).
+
+Раньше дашборд листался ``Paginator``-ом: на каждую страницу полный
+``COUNT`` по выборке с ``Exists``/``Subquery`` и ``OFFSET`` — у дилера с
+тысячами машин дальние страницы заметно медленнее первых. Здесь:
+
+* **keyset-пагинация** по составной сортировке дашборда (статус →
+  ``transfer_date`` desc → ``unload_date`` asc → ``id`` desc). Nullable-даты
+  сводятся к ключам без NULL через ``Coalesce`` с датой-ограничителем,
+  страница — ``WHERE (ключ) после курсора LIMIT n+1``, время не зависит от
+  глубины. Курсор — подписанный токен (``django.core.signing``) с ключом
+  граничной строки, направлением и позицией;
+* **счётчики по статусам** (фасеты фильтра) — один ``GROUP BY status`` на
+  клиента, в кэше ``FACETS_TTL``. Сбрасываются сигналами Car
+  (:mod:`core.signals.portal_listing`) и явно из массовых путей без
+  сигналов. Из них же берётся «из N» в пагинации — без ``COUNT``;
+* **поиск** по подстроке VIN / номера контейнера / марки (``icontains``,
+  pg_trgm, миграция 0030). Префикс выборку не сужает — совпадения по нему
+  идут первыми: ранг совпадения стоит в начале ключа сортировки, так что
+  хвост VIN и начало номера находятся в одной выдаче и листаются тем же
+  курсором.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+FACETS_TTL = 60 * 10
+
+_FACETS_KEY_PREFIX = "portal:facets:v1:"
+_CURSOR_SALT = "core.client_portal.cars"
+
+SEARCH_PREFIX = "prefix"
+SEARCH_CONTAINS = "contains"
+
+# Ограничители для NULL-дат: ``transfer_date`` desc nulls last → NULL меньше
+# любой даты, ``unload_date`` asc nulls last → больше любой.
+_NULL_TRANSFER = date(1, 1, 1)
+_NULL_UNLOAD = date(9999, 12, 31)
+
+# (аннотация, по возрастанию) — порядок строк дашборда; id замыкает ключ.
+_SORT = (
+    ("sort_rank", True),
+    ("sort_transfer", False),
+    ("sort_unload", True),
+    ("id", False),
+)
+# При поиске: сначала совпадения по префиксу, затем по подстроке.
+_SEARCH_SORT = (("search_rank", True), *_SORT)
+
+
+# ---------------------------------------------------------------------------
+# Фасеты
+# ---------------------------------------------------------------------------
+
+
+def _facets_key(client_id: int) -> str:
+    return f"{_FACETS_KEY_PREFIX}{client_id}"
+
+
+def status_counts(client_id: int) -> dict[str, int]:
+    """Число машин клиента по статусам (кэш, один ``GROUP BY`` на промах)."""
+    from core.models import Car
+
+    key = _facets_key(client_id)
+    counts = cache.get(key)
+    if counts is None:
+        rows = Car.objects.filter(client_id=client_id).order_by().values("status").annotate(n=Count("id"))
+        counts = {row["status"]: row["n"] for row in rows}
+        cache.set(key, counts, FACETS_TTL)
+    return counts
+
+
+def invalidate_client_facets(client_ids: Iterable[int]) -> None:
+    """Сбросить фасеты клиентов — сразу и ещё раз после коммита (как в
+    :func:`core.services.tracking_cache.invalidate_numbers`)."""
+    keys = [_facets_key(cid) for cid in set(client_ids) if cid]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as exc:  # кэш не должен ронять сохранение
+        logger.debug("portal facets invalidation failed: %s", exc)
+        return
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_facets_for_cars(car_ids: Iterable[int]) -> None:
+    """Сбросить фасеты владельцев машин (для ``update()``/``bulk_update``)."""
+    from core.models import Car
+
+    car_ids = [pk for pk in car_ids if pk]
+    if not car_ids:
+        return
+    invalidate_client_facets(
+        Car.objects.filter(pk__in=car_ids).exclude(client_id=None).values_list("client_id", flat=True).distinct()
+    )
+
+
+# ---------------------------------------------------------------------------
+# Поиск
+# ---------------------------------------------------------------------------
+
+
+def search_filter(query: str, mode: str = SEARCH_PREFIX) -> Q:
+    """Условие поиска: префикс или подстрока."""
+    compact = query.replace(" ", "").replace("-", "")
+    if mode == SEARCH_PREFIX:
+        return Q(vin__istartswith=compact) | Q(container__number__istartswith=compact) | Q(brand__istartswith=query)
+    return Q(vin__icontains=compact) | Q(brand__icontains=query) | Q(container__number__icontains=compact)
+
+
+# ---------------------------------------------------------------------------
+# Keyset-пагинация
+# ---------------------------------------------------------------------------
+
+
+def with_sort_keys(queryset):
+    """Аннотировать ключи сортировки дашборда (без NULL — для сравнения)."""
+    return queryset.annotate(
+        # UNLOADED — давние разгрузки сверху (рабочий список склада).
+        # TRANSFERRED — свежие передачи сверху: у старых часто нет фото.
+        sort_rank=Case(
+            When(status="UNLOADED", then=Value(0)),
+            When(status="IN_PORT", then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+        sort_transfer=Coalesce(F("transfer_date"), Value(_NULL_TRANSFER)),
+        sort_unload=Coalesce(F("unload_date"), Value(_NULL_UNLOAD)),
+    )
+
+
+def with_search_rank(queryset, query: str):
+    """Совпадения по подстроке; ``search_rank`` 0 — префикс, 1 — остальные."""
+    return queryset.filter(search_filter(query, SEARCH_CONTAINS)).annotate(
+        search_rank=Case(
+            When(search_filter(query, SEARCH_PREFIX), then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def _ordering(sort, forward: bool) -> list[str]:
+    return [name if asc == forward else f"-{name}" for name, asc in sort]
+
+
+def _seek(sort, key: list, forward: bool) -> Q:
+    """Строки строго после (``forward``) / до ключа в порядке ``sort``.
+
+    Лексикографическое сравнение кортежа, развёрнутое в OR/AND:
+    ``a > x OR (a = x AND (b < y OR (b = y AND ...)))``.
+    """
+    condition = None
+    for (name, asc), value in reversed(list(zip(sort, key, strict=True))):
+        step = Q(**{f"{name}__{'gt' if asc == forward else 'lt'}": value})
+        if condition is not None:
+            step |= Q(**{name: value}) & condition
+        condition = step
+    return condition
+
+
+def _row_key(obj, sort) -> list:
+    values = (getattr(obj, name) for name, _asc in sort)
+    return [value.isoformat() if isinstance(value, date) else value for value in values]
+
+
+def _parse_key(raw: list) -> list:
+    return [date.fromisoformat(value) if isinstance(value, str) else int(value) for value in raw]
+
+
+@dataclass
+class Cursor:
+    key: list
+    forward: bool
+    position: int
+
+    def encode(self) -> str:
+        return signing.dumps(
+            {"k": self.key, "f": self.forward, "p": self.position},
+            salt=_CURSOR_SALT,
+            compress=True,
+        )
+
+    @classmethod
+    def decode(cls, token: str | None) -> Cursor | None:
+        """Разобрать токен; битый/чужой/устаревший — ``None`` (первая страница)."""
+        if not token:
+            return None
+        try:
+            data = signing.loads(token, salt=_CURSOR_SALT)
+            return cls(
+                key=_parse_key(data["k"]),
+                forward=bool(data["f"]),
+                position=max(int(data["p"]), 0),
+            )
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+
+@dataclass
+class CarsPage:
+    """Страница авто; интерфейс для шаблона — как у ``Page`` там, где можно."""
+
+    object_list: list
+    per_page: int
+    position: int = 0
+    total: int | None = None
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    @property
+    def number(self) -> int:
+        return self.position // self.per_page + 1
+
+    @property
+    def num_pages(self) -> int | None:
+        if self.total is None:
+            return None
+        return max((self.total + self.per_page - 1) // self.per_page, 1)
+
+    @property
+    def start_index(self) -> int:
+        return self.position + 1 if self.object_list else 0
+
+    @property
+    def end_index(self) -> int:
+        return self.position + len(self.object_list)
+
+
+def _fetch(queryset, sort, cursor: Cursor | None, per_page: int) -> tuple[list, bool]:
+    """Строки страницы в прямом порядке и флаг «за ними есть ещё»."""
+    forward = cursor is None or cursor.forward
+    qs = queryset
+    if cursor is not None:
+        qs = qs.filter(_seek(sort, cursor.key, forward))
+    rows = list(qs.order_by(*_ordering(sort, forward))[: per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    return rows, more
+
+
+def paginate_cars(
+    queryset,
+    *,
+    cursor_token: str | None,
+    per_page: int,
+    search: str = "",
+    total: int | None = None,
+) -> CarsPage:
+    """Страница ``queryset`` (фильтры клиента/статусов уже наложены) по курсору.
+
+    ``search`` накладывается здесь: ранг совпадения входит в ключ курсора.
+    ``total`` — известное число строк (из фасетов) или ``None``.
+    """
+    qs = with_sort_keys(queryset)
+    sort = _SORT
+    if search:
+        qs, sort = with_search_rank(qs, search), _SEARCH_SORT
+    cursor = Cursor.decode(cursor_token)
+    if cursor is not None and len(cursor.key) != len(sort):
+        # Курсор от выдачи без поиска (или наоборот) — с первой страницы.
+        cursor = None
+    rows, more = _fetch(qs, sort, cursor, per_page)
+
+    if cursor is None:
+        position, has_next, has_previous = 0, more, False
+    elif cursor.forward:
+        position, has_next, has_previous = cursor.position, more, True
+    else:
+        # Назад до самого начала — позицию выравниваем на 0 (страницы могли
+        # сдвинуться, пока клиент листал).
+        has_previous = more
+        position = cursor.position if more else 0
+        has_next = True
+
+    page = CarsPage(object_list=rows, per_page=per_page, position=position, total=total)
+    if rows and has_next:
+        page.next_cursor = Cursor(_row_key(rows[-1], sort), True, position + len(rows)).encode()
+    if rows and has_previous:
+        page.previous_cursor = Cursor(_row_key(rows[0], sort), False, max(position - per_page, 0)).encode()
+    return page
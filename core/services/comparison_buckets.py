@@ -0,0 +1,354 @@
+"""
+Месячные предагрегаты для отчёта сравнения (``ComparisonBucket``).
+
+Отчёт «Сравнение» (``ComparisonService``) раньше на каждый запрос джойнил
+машины с инвойсами через ``cars__client_id`` с OR-фильтрами по датам:
+строки инвойса множились на число машин, агрегаты были тяжёлыми, а кэш
+``comparison_data:*`` выжигался по паттерну почти на любое сохранение.
+
+Теперь суммы лежат по календарным месяцам в разрезах клиент / склад /
+всего. Отчёт за период = сумма бакетов полных месяцев (GROUP BY по паре
+сотен строк за год) + живой расчёт неполных крайних месяцев тем же
+``collect``, что строит бакеты.
+
+Что считается (месяц — по дате события):
+
+* машины — по ``unload_date``: число и ``total_price`` (клиент, всего);
+* инвойсы — по ``date``: выставленные складом (склад), счета складов на
+  машины клиента — каждая пара инвойс/клиент один раз (клиент), все (всего);
+* платежи — по дате транзакции: складу (склад), все (всего).
+
+Когда пересчитывается месяц:
+
+* сигналы (``core.signals.comparison_buckets``) — машина, инвойс, состав
+  машин инвойса, транзакция, если отслеживаемые значения изменились;
+  затронутые месяцы уходят после коммита в фоновую
+  ``refresh_comparison_months_task`` через :mod:`core.services.task_coalescer`
+  (правки за окно склейки — один пересчёт месяца);
+* ``schedule_refresh_for_cars`` — массовые пересчёты цен машин
+  (``bulk_update``/``update`` в обход сигналов);
+* ночная ``refresh_comparison_buckets_task`` — последние
+  ``COMPARISON_BUCKETS_NIGHTLY_MONTHS`` месяцев; полная пересборка —
+  ``manage.py rebuild_comparison_buckets``.
+
+Кэш отчётов версионируется по месяцам (``report_cache_key``): пересчёт
+месяца сбрасывает только отчёты, чей период его задевает.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import task_coalescer
+from .calendar_months import (
+    from_month_key,
+    iter_months,
+    last_months,
+    month_end,
+    month_key,
+    month_start,
+    next_month,
+    year_chunks,
+)
+from .summary_refresh import bump_cache_versions, lock_rebuild
+
+COUNTERS = ("cars_count", "cars_total", "invoices_count", "invoices_total", "payments_count", "payments_total")
+
+_ZERO = Decimal("0.00")
+
+
+def _empty() -> dict:
+    return {
+        "cars_count": 0,
+        "cars_total": _ZERO,
+        "invoices_count": 0,
+        "invoices_total": _ZERO,
+        "payments_count": 0,
+        "payments_total": _ZERO,
+    }
+
+
+def _add(target: dict, source: dict) -> None:
+    for field in COUNTERS:
+        target[field] += source.get(field) or 0
+
+
+# ---------------------------------------------------------------------------
+# Календарь
+# ---------------------------------------------------------------------------
+
+
+def split_period(start: date | None, end: date | None):
+    """Период → (первый полный месяц, последний полный месяц, неполные края).
+
+    ``None`` на границе — без ограничения. Полных месяцев нет, если
+    первый > последнего; края — список ``(с, по)`` внутри одного месяца.
+    """
+    first = None if start is None else (start if start.day == 1 else next_month(month_start(start)))
+    last = (
+        None
+        if end is None
+        else (month_start(end) if end == month_end(end) else month_start(month_start(end) - timedelta(days=1)))
+    )
+    edges = set()
+    if start is not None and start.day != 1:
+        edges.add((start, min(month_end(start), end) if end else month_end(start)))
+    if end is not None and end != month_end(end):
+        edges.add((max(month_start(end), start) if start else month_start(end), end))
+    return first, last, sorted(edges)
+
+
+# ---------------------------------------------------------------------------
+# Расчёт по исходным таблицам
+# ---------------------------------------------------------------------------
+
+
+def collect(start: date | None = None, end: date | None = None) -> dict[tuple[date, str, int], dict]:
+    """Суммы за ``[start, end]`` по исходным таблицам: ``{(месяц, разрез, id): счётчики}``.
+
+    Одна функция и для бакетов, и для неполных месяцев периода — поэтому
+    сложение бакетов с краями даёт то же, что прямой расчёт.
+    """
+    from core.models import Car, ComparisonBucket
+    from core.models_billing import NewInvoice, Transaction
+
+    client, warehouse, total = (
+        ComparisonBucket.KIND_CLIENT,
+        ComparisonBucket.KIND_WAREHOUSE,
+        ComparisonBucket.KIND_TOTAL,
+    )
+
+    def period(qs, field):
+        if start is not None:
+            qs = qs.filter(**{f"{field}__gte": start})
+        if end is not None:
+            qs = qs.filter(**{f"{field}__lte": end})
+        return qs
+
+    def month_of(field):
+        return TruncMonth(field, output_field=DateField())
+
+    rows: dict[tuple[date, str, int], dict] = defaultdict(_empty)
+
+    cars = (
+        period(Car.objects.filter(unload_date__isnull=False), "unload_date")
+        .annotate(month=month_of("unload_date"))
+        .values("month", "client_id")
+        .annotate(cnt=Count("id"), amount=Sum("total_price"))
+        .order_by()
+    )
+    for row in cars:
+        keys = [(row["month"], total, 0)]
+        if row["client_id"]:
+            keys.append((row["month"], client, row["client_id"]))
+        for key in keys:
+            rows[key]["cars_count"] += row["cnt"]
+            rows[key]["cars_total"] += row["amount"] or _ZERO
+
+    invoices = (
+        period(NewInvoice.objects.all(), "date")
+        .annotate(month=month_of("date"))
+        .values("month", "issuer_warehouse_id")
+        .annotate(cnt=Count("id"), amount=Sum("total"))
+        .order_by()
+    )
+    for row in invoices:
+        keys = [(row["month"], total, 0)]
+        if row["issuer_warehouse_id"]:
+            keys.append((row["month"], warehouse, row["issuer_warehouse_id"]))
+        for key in keys:
+            rows[key]["invoices_count"] += row["cnt"]
+            rows[key]["invoices_total"] += row["amount"] or _ZERO
+
+    # Счета складов на машины клиента: пара (инвойс, клиент) — один раз,
+    # сколько бы машин клиента ни было в инвойсе.
+    pairs = (
+        period(NewInvoice.cars.through.objects.all(), "newinvoice__date")
+        .filter(newinvoice__issuer_warehouse__isnull=False, car__client__isnull=False)
+        .annotate(month=month_of("newinvoice__date"))
+        .values_list("month", "newinvoice_id", "car__client_id", "newinvoice__total")
+        .order_by()
+        .distinct()
+    )
+    for month, _invoice_id, client_id, amount in pairs:
+        rows[(month, client, client_id)]["invoices_count"] += 1
+        rows[(month, client, client_id)]["invoices_total"] += amount or _ZERO
+
+    payments = (
+        period(Transaction.objects.all(), "date__date")
+        .annotate(month=month_of("date"))
+        .values("month", "to_warehouse_id")
+        .annotate(cnt=Count("id"), amount=Sum("amount"))
+        .order_by()
+    )
+    for row in payments:
+        keys = [(row["month"], total, 0)]
+        if row["to_warehouse_id"]:
+            keys.append((row["month"], warehouse, row["to_warehouse_id"]))
+        for key in keys:
+            rows[key]["payments_count"] += row["cnt"]
+            rows[key]["payments_total"] += row["amount"] or _ZERO
+
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Бакеты
+# ---------------------------------------------------------------------------
+
+
+def refresh_months(months: Iterable[date]) -> int:
+    """Пересобрать бакеты указанных месяцев. Возвращает число записанных строк.
+
+    Агрегаты читаются в той же транзакции под блокировкой месяцев:
+    параллельная пересборка ждёт, а не удаляет и вставляет те же строки
+    одновременно (уникальный ключ) или поверх свежих — старые.
+    """
+    from core.models import ComparisonBucket
+
+    months = sorted({month_start(m) for m in months if m})
+    if not months:
+        return 0
+    # Подряд идущие месяцы — один набор агрегатов на отрезок.
+    runs: list[list[date]] = []
+    for month in months:
+        if runs and next_month(runs[-1][-1]) == month:
+            runs[-1].append(month)
+        else:
+            runs.append([month])
+    with transaction.atomic():
+        lock_rebuild("comparison_buckets", (month_key(month) for month in months))
+        rows: dict = {}
+        for run in runs:
+            rows.update(collect(run[0], month_end(run[-1])))
+        objs = [
+            ComparisonBucket(month=month, kind=kind, entity_id=entity_id, **counters)
+            for (month, kind, entity_id), counters in rows.items()
+            if any(counters.values())
+        ]
+        ComparisonBucket.objects.filter(month__in=months).delete()
+        ComparisonBucket.objects.bulk_create(objs, batch_size=500)
+    bump_versions(months)
+    return len(objs)
+
+
+def rebuild_buckets(*, months: int | None = None) -> dict[str, int]:
+    """Пересобрать последние ``months`` месяцев (``None`` — всю историю)."""
+    from core.models import Car, ComparisonBucket
+    from core.models_billing import NewInvoice, Transaction
+
+    today = timezone.localdate()
+    if months is not None:
+        first = last_months(today, months)
+    else:
+        bounds = [
+            Car.objects.aggregate(lo=Min("unload_date"), hi=Max("unload_date")),
+            NewInvoice.objects.aggregate(lo=Min("date"), hi=Max("date")),
+        ]
+        tx = Transaction.objects.aggregate(lo=Min("date"), hi=Max("date"))
+        bounds.append({k: timezone.localtime(v).date() if v else None for k, v in tx.items()})
+        los = [b["lo"] for b in bounds if b["lo"]]
+        if not los:
+            deleted, _ = ComparisonBucket.objects.all().delete()
+            return {"months": 0, "buckets": 0, "deleted": deleted}
+        first = month_start(min(los))
+        today = max([today, *(b["hi"] for b in bounds if b["hi"])])
+
+    all_months = list(iter_months(first, today))
+    deleted = 0
+    if months is None:
+        deleted, _ = ComparisonBucket.objects.exclude(month__in=all_months).delete()
+    written = sum(refresh_months(chunk) for chunk in year_chunks(all_months))
+    return {"months": len(all_months), "buckets": written, "deleted": deleted}
+
+
+def period_totals(start: date | None = None, end: date | None = None, *, kind: str | None = None) -> dict:
+    """Суммы за период: ``{(разрез, id): счётчики}`` — бакеты + неполные края."""
+    from core.models import ComparisonBucket
+
+    if start is not None and end is not None and start > end:
+        return {}
+    first, last, edges = split_period(start, end)
+    result: dict[tuple[str, int], dict] = defaultdict(_empty)
+
+    if first is None or last is None or first <= last:
+        qs = ComparisonBucket.objects.all()
+        if kind:
+            qs = qs.filter(kind=kind)
+        if first is not None:
+            qs = qs.filter(month__gte=first)
+        if last is not None:
+            qs = qs.filter(month__lte=last)
+        for row in qs.values("kind", "entity_id").annotate(**{f: Sum(f) for f in COUNTERS}).order_by():
+            _add(result[(row["kind"], row["entity_id"])], row)
+
+    for edge_start, edge_end in edges:
+        for (_month, row_kind, entity_id), counters in collect(edge_start, edge_end).items():
+            if kind is None or row_kind == kind:
+                _add(result[(row_kind, entity_id)], counters)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Версии кэша отчётов
+# ---------------------------------------------------------------------------
+
+_ANY_VERSION = "comparison:v:any"
+_NAMES_VERSION = "comparison:v:names"
+
+
+def _month_version_key(month: date) -> str:
+    return f"comparison:v:{month:%Y-%m}"
+
+
+def bump_versions(months: Iterable[date]) -> None:
+    """Сбросить кэш отчётов, чей период задевает ``months``."""
+    bump_cache_versions([*(_month_version_key(month_start(m)) for m in months), _ANY_VERSION])
+
+
+def bump_names_version() -> None:
+    """Сбросить кэш всех отчётов (переименование клиента / склада)."""
+    bump_cache_versions([_NAMES_VERSION])
+
+
+def report_cache_key(prefix: str, start: date | None, end: date | None) -> str:
+    """Ключ кэша отчёта за период с версиями затронутых месяцев."""
+    if start is None or end is None:
+        keys = [_ANY_VERSION, _NAMES_VERSION]
+    else:
+        keys = [*(_month_version_key(m) for m in iter_months(start, end)), _NAMES_VERSION]
+    versions = cache.get_many(keys)
+    digest = hashlib.md5(
+        "|".join(str(versions.get(key, 0)) for key in keys).encode(), usedforsecurity=False
+    ).hexdigest()[:12]
+    return f"{prefix}:{start}:{end}:{digest}"
+
+
+# ---------------------------------------------------------------------------
+# Фоновый пересчёт
+# ---------------------------------------------------------------------------
+
+
+def schedule_refresh(days: Iterable[date | None]) -> None:
+    """Пересчитать месяцы указанных дат в фоне после коммита текущей транзакции."""
+    task_coalescer.schedule(task_coalescer.JOB_COMPARISON_MONTHS, (month_key(day) for day in days if day))
+
+
+def schedule_refresh_for_cars(cars: Iterable) -> None:
+    """Месяцы разгрузки машин, чьи цены записаны в обход ``save()``."""
+    schedule_refresh(getattr(car, "unload_date", None) for car in cars)
+
+
+def refresh_month_keys(keys: Iterable[int]) -> int:
+    """Пересчитать месяцы из ключей очереди (``refresh_comparison_months_task``)."""
+    return refresh_months(from_month_key(int(key)) for key in keys)
@@ -1,5 +1,9 @@
 """
 Сервис для автоматического сравнения сумм между расчетами и счетами склада
+
+Отчёты за период (клиенты, склады, общая сводка, расхождения) собираются
+из месячных бакетов ``ComparisonBucket`` + живого расчёта неполных крайних
+месяцев (см. ``core.services.comparison_buckets``).
 """
 
 import logging
@@ -7,13 +11,12 @@ from datetime import timedelta
 from decimal import Decimal
 from typing import Any
 
-from django.db import models
-from django.db.models import Count, Q, Sum
+from django.db.models import Count, Sum
 from django.utils import timezone
 
-from ..models import Car, Client, Warehouse
+from ..models import Car, Client, ComparisonBucket, Warehouse
 from ..models_billing import NewInvoice as Invoice
-from ..models_billing import Transaction as Payment
+from .comparison_buckets import period_totals
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +84,51 @@ class ComparisonService:
             "invoices_count": warehouse_invoices.count(),
         }
 
+    def _status(self, difference: Decimal, higher: tuple[str, str], lower: tuple[str, str]) -> tuple[str, str]:
+        if abs(difference) <= self.tolerance:
+            return "match", "Суммы совпадают"
+        if difference > 0:
+            return higher[0], f"{higher[1]} выше на {difference:.2f} €"
+        return lower[0], f"{lower[1]} выше на {abs(difference):.2f} €"
+
+    def _client_result(self, name: str, row: dict, start_date, end_date) -> dict[str, Any]:
+        cars_total = row["cars_total"]
+        wh_total = row["invoices_total"]
+        diff = cars_total - wh_total
+        status, message = self._status(
+            diff, ("cars_higher", "Стоимость автомобилей"), ("warehouse_higher", "Стоимость склада")
+        )
+        return {
+            "status": status,
+            "message": message,
+            "client_name": name,
+            "cars_count": row["cars_count"],
+            "cars_total_cost": str(cars_total),
+            "warehouse_invoices_total": str(wh_total),
+            "difference": str(diff),
+            "invoices_count": row["invoices_count"],
+            "period": {"start_date": start_date, "end_date": end_date},
+        }
+
+    def _warehouse_result(self, name: str, row: dict, start_date, end_date) -> dict[str, Any]:
+        inv_total = row["invoices_total"]
+        pay_total = row["payments_total"]
+        diff = inv_total - pay_total
+        status, message = self._status(
+            diff, ("invoices_higher", "Стоимость инвойсов"), ("payments_higher", "Сумма платежей")
+        )
+        return {
+            "status": status,
+            "message": message,
+            "warehouse_name": name,
+            "invoices_count": row["invoices_count"],
+            "invoices_total": str(inv_total),
+            "payments_count": row["payments_count"],
+            "payments_total": str(pay_total),
+            "difference": str(diff),
+            "period": {"start_date": start_date, "end_date": end_date},
+        }
+
     def compare_client_costs_with_warehouse_invoices(
         self, client: Client, start_date=None, end_date=None
     ) -> dict[str, Any]:
@@ -95,17 +143,20 @@ class ComparisonService:
         Returns:
             Словарь с результатами сравнения
         """
-        # Получаем автомобили клиента
-        cars_query = Car.objects.filter(client=client)
-
-        if start_date:
-            cars_query = cars_query.filter(unload_date__gte=start_date)
-        if end_date:
-            cars_query = cars_query.filter(unload_date__lte=end_date)
-
-        cars = cars_query.all()
-
-        if not cars.exists():
+        key = (ComparisonBucket.KIND_CLIENT, client.pk)
+        totals = period_totals(start_date, end_date, kind=ComparisonBucket.KIND_CLIENT)
+        if start_date is None and end_date is None:
+            # Без границ периода сравниваются все машины клиента. Машины без
+            # даты разгрузки (в пути) в бакеты не попадают — добираем их живым
+            # запросом.
+            undated = Car.objects.filter(client=client, unload_date__isnull=True).aggregate(
+                cars_count=Count("id"), cars_total=Sum("total_price")
+            )
+            if undated["cars_count"]:
+                totals[key]["cars_count"] += undated["cars_count"]
+                totals[key]["cars_total"] += undated["cars_total"] or Decimal("0.00")
+        row = totals.get(key)
+        if not row or not row["cars_count"]:
             return {
                 "status": "no_data",
                 "message": "У клиента нет автомобилей в указанном периоде",
@@ -114,49 +165,7 @@ class ComparisonService:
                 "warehouse_invoices_total": 0,
                 "difference": 0,
             }
-
-        agg = cars_query.aggregate(total_cost=Sum("total_price"), cars_count=models.Count("id"))
-        cars_total_cost = agg["total_cost"] or Decimal("0.00")
-        cars_count = agg["cars_count"]
-
-        warehouse_invoices = Invoice.objects.filter(
-            cars__client=client,
-            issuer_warehouse__isnull=False,
-        )
-        if start_date:
-            warehouse_invoices = warehouse_invoices.filter(
-                Q(date__gte=start_date) | Q(cars__unload_date__gte=start_date)
-            )
-        if end_date:
-            warehouse_invoices = warehouse_invoices.filter(Q(date__lte=end_date) | Q(cars__unload_date__lte=end_date))
-        warehouse_invoices = warehouse_invoices.distinct()
-
-        wh_agg = warehouse_invoices.aggregate(total=Sum("total"), inv_count=models.Count("id"))
-        warehouse_invoices_total = wh_agg["total"] or Decimal("0.00")
-
-        difference = cars_total_cost - warehouse_invoices_total
-
-        if abs(difference) <= self.tolerance:
-            status = "match"
-            message = "Суммы совпадают"
-        elif difference > 0:
-            status = "cars_higher"
-            message = f"Стоимость автомобилей выше на {difference:.2f} €"
-        else:
-            status = "warehouse_higher"
-            message = f"Стоимость склада выше на {abs(difference):.2f} €"
-
-        return {
-            "status": status,
-            "message": message,
-            "client_name": client.name,
-            "cars_count": cars_count,
-            "cars_total_cost": str(cars_total_cost),
-            "warehouse_invoices_total": str(warehouse_invoices_total),
-            "difference": str(difference),
-            "invoices_count": wh_agg["inv_count"],
-            "period": {"start_date": start_date, "end_date": end_date},
-        }
+        return self._client_result(client.name, row, start_date, end_date)
 
     def compare_warehouse_costs_with_payments(
         self, warehouse: Warehouse, start_date=None, end_date=None
@@ -172,18 +181,9 @@ class ComparisonService:
         Returns:
             Словарь с результатами сравнения
         """
-        invoices_query = Invoice.objects.filter(
-            issuer_warehouse=warehouse,
-        )
-
-        if start_date:
-            invoices_query = invoices_query.filter(date__gte=start_date)
-        if end_date:
-            invoices_query = invoices_query.filter(date__lte=end_date)
-
-        invoices = invoices_query.all()
-
-        if not invoices.exists():
+        key = (ComparisonBucket.KIND_WAREHOUSE, warehouse.pk)
+        row = period_totals(start_date, end_date, kind=ComparisonBucket.KIND_WAREHOUSE).get(key)
+        if not row or not row["invoices_count"]:
             return {
                 "status": "no_data",
                 "message": "У склада нет инвойсов в указанном периоде",
@@ -192,45 +192,7 @@ class ComparisonService:
                 "payments_total": 0,
                 "difference": 0,
             }
-
-        # Суммируем стоимость всех инвойсов склада
-        invoices_total = invoices.aggregate(total=Sum("total"))["total"] or Decimal("0.00")
-
-        # Получаем все платежи складу
-        payments_query = Payment.objects.filter(to_warehouse=warehouse)
-
-        if start_date:
-            payments_query = payments_query.filter(date__gte=start_date)
-        if end_date:
-            payments_query = payments_query.filter(date__lte=end_date)
-
-        payments_total = payments_query.aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
-
-        # Вычисляем разницу
-        difference = invoices_total - payments_total
-
-        # Определяем статус
-        if abs(difference) <= self.tolerance:
-            status = "match"
-            message = "Суммы совпадают"
-        elif difference > 0:
-            status = "invoices_higher"
-            message = f"Стоимость инвойсов выше на {difference:.2f} €"
-        else:
-            status = "payments_higher"
-            message = f"Сумма платежей выше на {abs(difference):.2f} €"
-
-        return {
-            "status": status,
-            "message": message,
-            "warehouse_name": warehouse.name,
-            "invoices_count": invoices.count(),
-            "invoices_total": str(invoices_total),
-            "payments_count": payments_query.count(),
-            "payments_total": str(payments_total),
-            "difference": str(difference),
-            "period": {"start_date": start_date, "end_date": end_date},
-        }
+        return self._warehouse_result(warehouse.name, row, start_date, end_date)
 
     def get_comparison_report(self, start_date=None, end_date=None) -> dict[str, Any]:
         """
@@ -248,162 +210,60 @@ class ComparisonService:
         if not end_date:
             end_date = timezone.now().date()
 
-        cars_agg = Car.objects.filter(unload_date__gte=start_date, unload_date__lte=end_date).aggregate(
-            total=Sum("total_price"), cnt=Count("id")
-        )
-        cars_total = cars_agg["total"] or Decimal("0.00")
-
-        invoices_agg = Invoice.objects.filter(date__gte=start_date, date__lte=end_date).aggregate(
-            total=Sum("total"), cnt=Count("id")
-        )
-        invoices_total = invoices_agg["total"] or Decimal("0.00")
-
-        payments_agg = Payment.objects.filter(date__gte=start_date, date__lte=end_date).aggregate(
-            total=Sum("amount"), cnt=Count("id")
-        )
-        payments_total = payments_agg["total"] or Decimal("0.00")
-
-        cars_vs_invoices_diff = cars_total - invoices_total
-        invoices_vs_payments_diff = invoices_total - payments_total
+        totals = period_totals(start_date, end_date, kind=ComparisonBucket.KIND_TOTAL).get(
+            (ComparisonBucket.KIND_TOTAL, 0)
+        ) or dict.fromkeys(("cars_count", "invoices_count", "payments_count"), 0)
+        cars_total = totals.get("cars_total") or Decimal("0.00")
+        invoices_total = totals.get("invoices_total") or Decimal("0.00")
+        payments_total = totals.get("payments_total") or Decimal("0.00")
 
         return {
             "period": {"start_date": start_date, "end_date": end_date},
             "summary": {
-                "cars_count": cars_agg["cnt"],
+                "cars_count": totals["cars_count"],
                 "cars_total": str(cars_total),
-                "invoices_count": invoices_agg["cnt"],
+                "invoices_count": totals["invoices_count"],
                 "invoices_total": str(invoices_total),
-                "payments_count": payments_agg["cnt"],
+                "payments_count": totals["payments_count"],
                 "payments_total": str(payments_total),
-                "cars_vs_invoices_difference": str(cars_vs_invoices_diff),
-                "invoices_vs_payments_difference": str(invoices_vs_payments_diff),
+                "cars_vs_invoices_difference": str(cars_total - invoices_total),
+                "invoices_vs_payments_difference": str(invoices_total - payments_total),
             },
             "status": "success",
         }
 
-    def batch_compare_clients(self, start_date=None, end_date=None) -> list[dict[str, Any]]:
-        """Batch comparison for all clients with cars — 2-3 SQL queries instead of N+1."""
-        car_filters = Q(unload_date__isnull=False)
-        if start_date:
-            car_filters &= Q(unload_date__gte=start_date)
-        if end_date:
-            car_filters &= Q(unload_date__lte=end_date)
-
-        from django.db.models import Count
-
-        client_agg = (
-            Car.objects.filter(car_filters)
-            .values("client_id", "client__name")
-            .annotate(total_cost=Sum("total_price"), cars_count=Count("id"))
-            .filter(client_id__isnull=False)
-            .order_by("client__name")
-        )
-
-        inv_filters = Q(cars__client__isnull=False, issuer_warehouse__isnull=False)
-        if start_date:
-            inv_filters &= Q(date__gte=start_date) | Q(cars__unload_date__gte=start_date)
-        if end_date:
-            inv_filters &= Q(date__lte=end_date) | Q(cars__unload_date__lte=end_date)
-
-        inv_agg = dict(
-            Invoice.objects.filter(inv_filters)
-            .values("cars__client_id")
-            .annotate(total=Sum("total"), cnt=Count("id", distinct=True))
-            .values_list("cars__client_id", "total")
-        )
-
-        results = []
-        for row in client_agg:
-            client_name = row["client__name"]
-            cars_total = row["total_cost"] or Decimal("0.00")
-            wh_total = inv_agg.get(row["client_id"]) or Decimal("0.00")
-            diff = cars_total - wh_total
-
-            if abs(diff) <= self.tolerance:
-                status, message = "match", "Суммы совпадают"
-            elif diff > 0:
-                status, message = "cars_higher", f"Стоимость автомобилей выше на {diff:.2f} €"
-            else:
-                status, message = "warehouse_higher", f"Стоимость склада выше на {abs(diff):.2f} €"
-
-            results.append(
-                {
-                    "status": status,
-                    "message": message,
-                    "client_name": client_name,
-                    "cars_count": row["cars_count"],
-                    "cars_total_cost": str(cars_total),
-                    "warehouse_invoices_total": str(wh_total),
-                    "difference": str(diff),
-                    "invoices_count": 0,
-                    "period": {"start_date": start_date, "end_date": end_date},
-                }
-            )
-        return results
-
-    def batch_compare_warehouses(self, start_date=None, end_date=None) -> list[dict[str, Any]]:
-        """Batch comparison for all warehouses — 2 SQL queries instead of N+1."""
-        inv_filters = Q(issuer_warehouse__isnull=False)
-        if start_date:
-            inv_filters &= Q(date__gte=start_date)
-        if end_date:
-            inv_filters &= Q(date__lte=end_date)
-
-        inv_agg = (
-            Invoice.objects.filter(inv_filters)
-            .values("issuer_warehouse_id")
-            .annotate(total=Sum("total"), cnt=Count("id"))
-        )
-        inv_by_wh = {r["issuer_warehouse_id"]: r for r in inv_agg}
-
-        pay_filters = Q(to_warehouse__isnull=False)
-        if start_date:
-            pay_filters &= Q(date__gte=start_date)
-        if end_date:
-            pay_filters &= Q(date__lte=end_date)
-
-        pay_agg = dict(
-            Payment.objects.filter(pay_filters)
-            .values("to_warehouse_id")
-            .annotate(total=Sum("amount"))
-            .values_list("to_warehouse_id", "total")
-        )
-
-        wh_ids = set(inv_by_wh.keys()) | set(pay_agg.keys())
-        if not wh_ids:
+    def batch_compare_clients(self, start_date=None, end_date=None, *, rows=None) -> list[dict[str, Any]]:
+        """Все клиенты с машинами, разгруженными в периоде — из месячных бакетов."""
+        if rows is None:
+            rows = period_totals(start_date, end_date, kind=ComparisonBucket.KIND_CLIENT)
+        client_rows = {
+            entity_id: row
+            for (kind, entity_id), row in rows.items()
+            if kind == ComparisonBucket.KIND_CLIENT and row["cars_count"]
+        }
+        names = dict(Client.objects.filter(id__in=client_rows).values_list("id", "name"))
+        return [
+            self._client_result(names[client_id], client_rows[client_id], start_date, end_date)
+            for client_id in sorted(client_rows, key=lambda pk: (names.get(pk) or "", pk))
+            if client_id in names
+        ]
+
+    def batch_compare_warehouses(self, start_date=None, end_date=None, *, rows=None) -> list[dict[str, Any]]:
+        """Все склады с инвойсами или платежами в периоде — из месячных бакетов."""
+        if rows is None:
+            rows = period_totals(start_date, end_date, kind=ComparisonBucket.KIND_WAREHOUSE)
+        wh_rows = {
+            entity_id: row
+            for (kind, entity_id), row in rows.items()
+            if kind == ComparisonBucket.KIND_WAREHOUSE and (row["invoices_count"] or row["payments_count"])
+        }
+        if not wh_rows:
             return []
-
-        warehouses = {w.id: w.name for w in Warehouse.objects.filter(id__in=wh_ids)}
-
-        results = []
-        for wh_id in sorted(wh_ids):
-            wh_name = warehouses.get(wh_id, f"Warehouse #{wh_id}")
-            inv_data = inv_by_wh.get(wh_id, {})
-            inv_total = inv_data.get("total") or Decimal("0.00")
-            pay_total = pay_agg.get(wh_id) or Decimal("0.00")
-            diff = inv_total - pay_total
-
-            if abs(diff) <= self.tolerance:
-                status, message = "match", "Суммы совпадают"
-            elif diff > 0:
-                status, message = "invoices_higher", f"Стоимость инвойсов выше на {diff:.2f} €"
-            else:
-                status, message = "payments_higher", f"Сумма платежей выше на {abs(diff):.2f} €"
-
-            results.append(
-                {
-                    "status": status,
-                    "message": message,
-                    "warehouse_name": wh_name,
-                    "invoices_count": inv_data.get("cnt", 0),
-                    "invoices_total": str(inv_total),
-                    "payments_count": 0,
-                    "payments_total": str(pay_total),
-                    "difference": str(diff),
-                    "period": {"start_date": start_date, "end_date": end_date},
-                }
-            )
-        return results
+        names = dict(Warehouse.objects.filter(id__in=wh_rows).values_list("id", "name"))
+        return [
+            self._warehouse_result(names.get(wh_id, f"Warehouse #{wh_id}"), wh_rows[wh_id], start_date, end_date)
+            for wh_id in sorted(wh_rows)
+        ]
 
     def find_discrepancies(self, start_date=None, end_date=None) -> list[dict[str, Any]]:
         """
@@ -416,29 +276,26 @@ class ComparisonService:
         Returns:
             Список расхождений
         """
-        discrepancies = []
-
         if not start_date:
             start_date = timezone.now().date() - timedelta(days=30)
         if not end_date:
             end_date = timezone.now().date()
 
-        clients = Client.objects.filter(car__unload_date__gte=start_date, car__unload_date__lte=end_date).distinct()
-
-        for client in clients:
-            comparison = self.compare_client_costs_with_warehouse_invoices(client, start_date, end_date)
-            if comparison["status"] not in ["match", "no_data"]:
-                discrepancies.append({"type": "client_comparison", "entity": client.name, "comparison": comparison})
-
-        warehouses = Warehouse.objects.filter(
-            Q(car__unload_date__gte=start_date, car__unload_date__lte=end_date)
-        ).distinct()
-
-        for warehouse in warehouses:
-            comparison = self.compare_warehouse_costs_with_payments(warehouse, start_date, end_date)
-            if comparison["status"] not in ["match", "no_data"]:
-                discrepancies.append(
-                    {"type": "warehouse_comparison", "entity": warehouse.name, "comparison": comparison}
-                )
+        rows = period_totals(start_date, end_date)
+        return self.discrepancies(
+            self.batch_compare_clients(start_date, end_date, rows=rows),
+            self.batch_compare_warehouses(start_date, end_date, rows=rows),
+        )
 
-        return discrepancies
+    @staticmethod
+    def discrepancies(clients: list[dict[str, Any]], warehouses: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Расхождения из готовых результатов ``batch_compare_*``."""
+        return [
+            {"type": "client_comparison", "entity": c["client_name"], "comparison": c}
+            for c in clients
+            if c["status"] not in ("match", "no_data")
+        ] + [
+            {"type": "warehouse_comparison", "entity": w["warehouse_name"], "comparison": w}
+            for w in warehouses
+            if w["status"] not in ("match", "no_data")
+        ]
@@ -9,19 +9,135 @@
 
 Поведение полностью повторяет прежний код админки (характеризующие тесты
 + полный прогон гарантируют отсутствие регрессий).
+
+Массовые операции над пачкой контейнеров (admin-actions смены статуса) —
+``set_containers_status`` / ``sync_cars_for_containers``: переходы
+применяются одним ``UPDATE``, машины всех контейнеров пересчитываются
+батчем (``core.services.car_pricing``), а регенерация инвойсов ставится
+одной задачей на всю пачку.
 """
 
 from __future__ import annotations
 
 import logging
 import time
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from django.db import transaction
+from django.utils import timezone
 
-from core.models import Car, CarService, LineService, WarehouseService
+from core.models import Car, CarService, Container, LineService, WarehouseService
+from core.services import client_portal_listing, comparison_buckets, tracking_cache
 from core.services.cascade_control import CAR_SIGNALS, INVOICE_SIGNALS, signals_disabled
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class BulkStatusResult:
+    """Итог ``set_containers_status``: что переведено, что пропущено и почему."""
+
+    updated: list[int] = field(default_factory=list)
+    skipped_fsm: list[str] = field(default_factory=list)
+    skipped_incomplete: list[str] = field(default_factory=list)
+    car_ids: list[int] = field(default_factory=list)
+
+
+def sync_cars_for_containers(container_ids: Iterable[int]) -> list[int]:
+    """Батч-аналог ``Container.sync_cars()`` для пачки контейнеров.
+
+    Статус/склад/даты контейнера проставляются всем его машинам, у
+    переехавших на другой склад складские ``CarService`` пересоздаются
+    одним ``sync_car_services_for_cars``, затем days/storage_cost/total_price пересчитываются одним проходом
+    ``reprice_cars`` и пишутся одним ``bulk_update`` (без сигналов, как и
+    ``sync_cars``). Возвращает pk обновлённых машин.
+    """
+    from core.services.car_pricing import PRICE_FIELDS, reprice_cars
+    from core.services.car_service_manager import sync_services_for_moved_cars
+
+    containers = Container.objects.select_related("warehouse").in_bulk(list(set(container_ids)))
+    if not containers:
+        return []
+    cars = list(
+        Car.objects.filter(container_id__in=containers).select_related("warehouse").prefetch_related("car_services")
+    )
+    if not cars:
+        return []
+    old_warehouse_ids = {car.pk: car.warehouse_id for car in cars}
+    for car in cars:
+        car.apply_container_state(containers[car.container_id])
+    # Сменился склад — пересоздаём складские услуги (как Car.save), пачкой.
+    sync_services_for_moved_cars(cars, old_warehouse_ids)
+    reprice_cars(cars)
+    Car.objects.bulk_update(cars, [*Car.CONTAINER_STATE_FIELDS, *PRICE_FIELDS], batch_size=200)
+    # bulk_update сигналов не шлёт — фасеты кабинета клиентов и бакеты
+    # отчёта сравнения обновляем сами.
+    client_portal_listing.invalidate_client_facets(car.client_id for car in cars)
+    comparison_buckets.schedule_refresh_for_cars(cars)
+    return [car.pk for car in cars]
+
+
+def set_containers_status(container_ids: Iterable[int], status: str) -> BulkStatusResult:
+    """Перевести пачку контейнеров в ``status`` и синхронизировать их машины.
+
+    Проверки — как у одиночного ``Container.save()``: FSM
+    (``ALLOWED_STATUS_TRANSITIONS``) и склад + дата разгрузки для UNLOADED.
+    Контейнеры уже в целевом статусе не трогаются. Всё в одной транзакции;
+    после коммита — одна задача регенерации инвойсов на все машины.
+    """
+    from core.models.containers import ALLOWED_STATUS_TRANSITIONS
+
+    result = BulkStatusResult()
+    rows = Container.objects.filter(pk__in=list(container_ids)).values_list(
+        "pk", "number", "status", "warehouse_id", "unload_date"
+    )
+    for pk, number, cur_status, warehouse_id, unload_date in rows:
+        if cur_status == status:
+            continue
+        if status not in ALLOWED_STATUS_TRANSITIONS.get(cur_status, set()):
+            result.skipped_fsm.append(number)
+            continue
+        if status == "UNLOADED" and not (warehouse_id and unload_date):
+            result.skipped_incomplete.append(number)
+            continue
+        result.updated.append(pk)
+
+    if not result.updated:
+        return result
+
+    with transaction.atomic():
+        Container.objects.filter(pk__in=result.updated).update(status=status)
+        if status == "UNLOADED":
+            # То же, что pre_save делает при полном save(): момент перехода
+            # в UNLOADED нужен окну синхронизации фото.
+            Container.objects.filter(pk__in=result.updated, unloaded_status_at__isnull=True).update(
+                unloaded_status_at=timezone.now()
+            )
+        result.car_ids = sync_cars_for_containers(result.updated)
+        _schedule_invoice_regeneration(result.car_ids)
+        # UPDATE/bulk_update сигналов не шлют — кэш публичного трекинга сбрасываем сами.
+        tracking_cache.invalidate_containers(result.updated)
+
+    logger.info(
+        "[container_lifecycle] %s containers -> %s, %s cars synced",
+        len(result.updated),
+        status,
+        len(result.car_ids),
+    )
+    return result
+
+
+def _schedule_invoice_regeneration(car_ids: list[int]) -> None:
+    """Регенерация инвойсов пачки машин после коммита (склеивается с
+    соседними правками в :mod:`core.services.task_coalescer`)."""
+    if not car_ids:
+        return
+    from core.services.task_coalescer import JOB_CAR_INVOICES, schedule
+
+    schedule(JOB_CAR_INVOICES, car_ids)
+
+
 def sync_warehouse_to_cars(container) -> None:
     """Синхронизировать склад контейнера на все его авто."""
     try:
@@ -37,6 +153,9 @@ def bulk_update_car_statuses(container) -> None:
     try:
         logger.info("Status changed for container %s to %s, bulk updating all cars...", container.id, container.status)
         updated_count = container.container_cars.update(status=container.status)
+        client_portal_listing.invalidate_client_facets(
+            container.container_cars.exclude(client_id=None).values_list("client_id", flat=True).distinct()
+        )
         logger.info(
             "Updated status to '%s' for %s cars in container %s", container.status, updated_count, container.number
         )
@@ -69,15 +188,13 @@ def apply_unload_date_change(container) -> None:
 
             if cars_to_update:
                 Car.objects.bulk_update(cars_to_update, update_fields, batch_size=50)
+                comparison_buckets.schedule_refresh_for_cars(cars_to_update)
+                if "status" in update_fields:
+                    client_portal_listing.invalidate_client_facets(car.client_id for car in cars_to_update)
                 logger.info("Bulk updated %s cars in container %s", len(cars_to_update), container.number)
 
-        # Регенерацию инвойсов выносим из HTTP в Celery (on_commit,
-        # дедупликация по car_id).
-        if cars_to_update:
-            from core.signals.car_service import _deferred_invoice_regeneration
-
-            for car in cars_to_update:
-                _deferred_invoice_regeneration(car.id)
+        # Регенерацию инвойсов выносим из HTTP в Celery — одной пачкой.
+        _schedule_invoice_regeneration([car.id for car in cars_to_update])
 
     except Exception as e:
         logger.error("Failed to update cars after unload_date change for container %s: %s", container.id, e)
@@ -90,10 +207,8 @@ def apply_ths_change(container, changed_data) -> None:
     line_start = time.time()
     try:
         from core.models_billing import NewInvoice
-        from core.services.car_service_manager import (
-            apply_client_tariffs_for_container,
-            create_ths_services_for_container,
-        )
+        from core.services.car_service_manager import sync_car_services_for_cars
+        from core.services.tariff_engine import recalculate_containers
 
         logger.info(
             "[TIMING] THS-related change started for container %s, line: %s, ths: %s, ths_payer: %s",
@@ -105,13 +220,17 @@ def apply_ths_change(container, changed_data) -> None:
 
         with signals_disabled(*(CAR_SIGNALS + INVOICE_SIGNALS)):
             if "line" in changed_data:
+                moved = list(container.container_cars.exclude(line=container.line))
                 updated_count = container.container_cars.update(line=container.line)
                 logger.info("[TIMING] Line updated for %s cars", updated_count)
+                for car in moved:
+                    car.line = container.line
+                # Услуги прежней линии → услуги новой, одним батчем (без THS).
+                sync_car_services_for_cars(moved, created=False, line_changed=True)
 
             if container.line and container.ths:
-                created_count = create_ths_services_for_container(container)
-                logger.info("[TIMING] Created %s THS services with proportional distribution", created_count)
-                apply_client_tariffs_for_container(container)
+                result = recalculate_containers([container])
+                logger.info("[TIMING] Created %s THS services with proportional distribution", result.ths_services)
             else:
                 car_ids = list(container.container_cars.values_list("id", flat=True))
                 deleted_line = (
@@ -147,6 +266,7 @@ def apply_ths_change(container, changed_data) -> None:
 
             if cars_to_update:
                 Car.objects.bulk_update(cars_to_update, ["days", "storage_cost", "total_price"], batch_size=50)
+                comparison_buckets.schedule_refresh_for_cars(cars_to_update)
                 logger.info("[TIMING] Recalculated prices for %s cars", len(cars_to_update))
 
             if affected_invoices:
@@ -38,6 +38,9 @@ from core.models_email import (
     ContainerEmailLink,
     TransportRequestEmailLink,
 )
+from core.services.email_counters import schedule_refresh_for_emails
+from core.services.email_ingest import email_content_digest
+from core.services.email_live import publish_email_links
 from core.services.email_reply_parser import (
     compose_reply_html,
     plain_text_to_simple_html,
@@ -679,6 +682,9 @@ def _send_and_persist(
             body_text=body_text_final,
             body_html=body_html_final,
             snippet=(body_text_final or "")[:300],
+            content_digest=email_content_digest(
+                from_addr=from_addr, subject=subject_final, body_text=body_text_final, body_html=body_html_final
+            ),
             received_at=now,
             gmail_id="",
             labels_json=[],
@@ -718,6 +724,8 @@ def _send_and_persist(
             parent_email=parent_email,
             source_text=source_text_for_matching,
         )
+        schedule_refresh_for_emails([email.pk])
+        publish_email_links([email.pk])
         raise
 
     gmail_id = response.get("id", "") or ""
@@ -744,6 +752,9 @@ def _send_and_persist(
         body_text=body_text_final,
         body_html=body_html_final,
         snippet=(body_text_final or "")[:300],
+        content_digest=email_content_digest(
+            from_addr=from_addr, subject=subject_final, body_text=body_text_final, body_html=body_html_final
+        ),
         received_at=now,
         gmail_id=gmail_id,
         gmail_history_id=None,
@@ -775,6 +786,10 @@ def _send_and_persist(
         parent_email=parent_email,
         source_text=source_text_for_matching,
     )
+    # Баблы — в другие открытые карточки, где засветилось письмо (своя
+    # карточка вставит бабл из ответа эндпоинта, дубль отсекается по id).
+    schedule_refresh_for_emails([email.pk])
+    publish_email_links([email.pk])
 
     # Follow-up flag: если отвечаем на помеченное «ответить позже» письмо —
     # автоматически снимаем флаг, т.к. обязательство закрыто отправкой ответа.
@@ -0,0 +1,191 @@
+"""
+Денормализованные счётчики переписки карточек: ``emails_unread`` и
+``emails_need_reply`` на ``Car``, ``Container`` и ``TransportRequest``.
+
+* ``emails_unread`` — непрочитанные связи письма с карточкой
+  (``*EmailLink.is_read=False``);
+* ``emails_need_reply`` — входящие письма карточки с флагом «ответить позже».
+
+Списки (changelist машин и контейнеров, доска заявок) читают колонки и не
+джойнят таблицы писем. Счётчики не инкрементируются, а пересчитываются целиком
+для затронутых карточек: один агрегатный запрос и один ``bulk_update`` на тип.
+Поэтому повторный или пропущенный пересчёт не копит ошибку.
+
+Когда пересчитывается:
+
+* сигналы (``core.signals.email_counters``) — ``save``/``delete`` связей,
+  включая каскад при удалении письма, и смена ``needs_reply``;
+* явные вызовы ``schedule_refresh_for_emails`` — там, где связи создаются
+  или меняются пачкой в обход сигналов (``bulk_create``/``update``):
+  ингест Gmail, отправка из карточки, отметки «прочитано»;
+* полная сверка — ``manage.py reconcile_email_counters`` и ночная задача
+  ``reconcile_email_counters_task``.
+
+Пишет счётчики только этот модуль: полный ``save()`` карточки их не трогает
+(``core.mixins.EmailCountersMixin``), поэтому экземпляр, загруженный до
+изменения переписки, не вернёт в строку старые значения.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from core.mixins import EMAIL_COUNTER_FIELDS
+from core.services.summary_refresh import DeferredRefresh
+
+KIND_CONTAINER = "container"
+KIND_CAR = "car"
+KIND_TRANSPORT_REQUEST = "transportrequest"
+KINDS = (KIND_CONTAINER, KIND_CAR, KIND_TRANSPORT_REQUEST)
+
+COUNTER_FIELDS = EMAIL_COUNTER_FIELDS
+
+
+def _targets():
+    """``{kind: (модель связи, FK на карточку, модель карточки)}``."""
+    from core.models import Car, Container
+    from core.models.website import TransportRequest
+    from core.models_email import CarEmailLink, ContainerEmailLink, TransportRequestEmailLink
+
+    return {
+        KIND_CONTAINER: (ContainerEmailLink, "container_id", Container),
+        KIND_CAR: (CarEmailLink, "car_id", Car),
+        KIND_TRANSPORT_REQUEST: (TransportRequestEmailLink, "request_id", TransportRequest),
+    }
+
+
+def _refresh_kind(kind: str, entity_ids: Iterable[int]) -> int:
+    from core.models_email import ContainerEmail
+
+    ids = {pk for pk in entity_ids if pk}
+    if not ids:
+        return 0
+    link_model, fk, model = _targets()[kind]
+
+    rows = (
+        link_model.objects.filter(**{f"{fk}__in": ids})
+        .values(fk)
+        .annotate(
+            unread=Count("pk", filter=Q(is_read=False)),
+            need_reply=Count(
+                "pk",
+                filter=Q(email__needs_reply=True, email__direction=ContainerEmail.DIRECTION_INCOMING),
+            ),
+        )
+        .order_by()
+    )
+    counts = {row[fk]: (row["unread"], row["need_reply"]) for row in rows}
+    objs = []
+    for pk in ids:
+        unread, need_reply = counts.get(pk, (0, 0))
+        objs.append(model(pk=pk, emails_unread=unread, emails_need_reply=need_reply))
+    # bulk_update не зовёт save(): у Car/Container он с каскадами.
+    return model.objects.bulk_update(objs, COUNTER_FIELDS, batch_size=500)
+
+
+def refresh_email_counters(
+    *,
+    container_ids: Iterable[int] = (),
+    car_ids: Iterable[int] = (),
+    request_ids: Iterable[int] = (),
+) -> int:
+    """Пересчитать счётчики указанных карточек. Возвращает число обновлённых строк."""
+    return (
+        _refresh_kind(KIND_CONTAINER, container_ids)
+        + _refresh_kind(KIND_CAR, car_ids)
+        + _refresh_kind(KIND_TRANSPORT_REQUEST, request_ids)
+    )
+
+
+def entities_for_emails(email_ids: Iterable[int]) -> dict[str, set[int]]:
+    """Карточки, к которым привязаны письма: ``{kind: {id, ...}}``."""
+    email_ids = list({pk for pk in email_ids if pk})
+    result: dict[str, set[int]] = {kind: set() for kind in KINDS}
+    if not email_ids:
+        return result
+    for kind, (link_model, fk, _model) in _targets().items():
+        result[kind].update(link_model.objects.filter(email_id__in=email_ids).values_list(fk, flat=True))
+    return result
+
+
+def refresh_counters_for_emails(email_ids: Iterable[int]) -> int:
+    entities = entities_for_emails(email_ids)
+    return refresh_email_counters(
+        container_ids=entities[KIND_CONTAINER],
+        car_ids=entities[KIND_CAR],
+        request_ids=entities[KIND_TRANSPORT_REQUEST],
+    )
+
+
+# ---------------------------------------------------------------------------
+# Отложенный пересчёт (после коммита, с дедупликацией в пределах потока)
+# ---------------------------------------------------------------------------
+
+
+def _refresh_batch(keys: set[tuple[str, int]]) -> None:
+    ids: dict[str, set[int]] = {kind: set() for kind in KINDS}
+    for kind, pk in keys:
+        ids[kind].add(pk)
+    refresh_email_counters(
+        container_ids=ids[KIND_CONTAINER],
+        car_ids=ids[KIND_CAR],
+        request_ids=ids[KIND_TRANSPORT_REQUEST],
+    )
+
+
+# Счётчики — кэш для списков: сбой пересчёта догонит ночная сверка.
+_deferred = DeferredRefresh("email_counters", _refresh_batch)
+
+
+def schedule_refresh(
+    *,
+    container_ids: Iterable[int] = (),
+    car_ids: Iterable[int] = (),
+    request_ids: Iterable[int] = (),
+) -> None:
+    """Пересчитать счётчики карточек после коммита текущей транзакции.
+
+    Каскадное удаление сотни связей даёт один пересчёт на тип.
+    """
+    _deferred.schedule(
+        (kind, pk)
+        for kind, ids in (
+            (KIND_CONTAINER, container_ids),
+            (KIND_CAR, car_ids),
+            (KIND_TRANSPORT_REQUEST, request_ids),
+        )
+        for pk in ids
+        if pk
+    )
+
+
+def schedule_refresh_for_emails(email_ids: Iterable[int]) -> None:
+    """Пересчитать после коммита счётчики всех карточек, где засветились письма."""
+    email_ids = [pk for pk in set(email_ids) if pk]
+    if email_ids:
+        transaction.on_commit(lambda: _deferred.run(refresh_counters_for_emails, email_ids))
+
+
+# ---------------------------------------------------------------------------
+# Полная сверка
+# ---------------------------------------------------------------------------
+
+
+def reconcile_email_counters(*, batch_size: int = 2000) -> dict[str, int]:
+    """Пересобрать счётчики всех карточек. ``{kind: обновлено строк}``."""
+    result: dict[str, int] = {}
+    for kind, (_link_model, _fk, model) in _targets().items():
+        updated = 0
+        batch: list[int] = []
+        for pk in model.objects.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=batch_size):
+            batch.append(pk)
+            if len(batch) >= batch_size:
+                updated += _refresh_kind(kind, batch)
+                batch = []
+        if batch:
+            updated += _refresh_kind(kind, batch)
+        result[kind] = updated
+    return result
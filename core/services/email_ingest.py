@@ -7,22 +7,39 @@
 При `history expired` (404 от Google) автоматически фолбэкаемся на полный
 re-sync.
 
-Функция идемпотентна: по gmail_id/message_id используется
-``get_or_create``. Повторный запуск не создаст дублей.
+Письма обрабатываются страницами (``_FETCH_PAGE_SIZE`` id):
+
+1. fetch — уже известные gmail_id отсекаются одним запросом на страницу,
+   тела писем приходят через Gmail batch HTTP (``get_messages``), вложения
+   качаются параллельно (``get_attachments``);
+2. persist — письма страницы пишутся одним ``bulk_create``, связи с
+   контейнерами/машинами/заявками — по одному ``bulk_create`` на тип.
+
+Функция идемпотентна: known-фильтр по gmail_id + уникальный message_id.
+Повторный запуск не создаст дублей.
 """
 
 from __future__ import annotations
 
 import logging
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+from itertools import islice
 from pathlib import Path
 
 from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 
-from core.services.email_matcher import build_booking_index, match_email_to_containers
+from core.services.email_counters import schedule_refresh_for_emails
+from core.services.email_live import bump_versions_for_emails, publish_email_links
+from core.services.email_matcher import (
+    MatchHit,
+    MatchResult,
+    TransportRequestMatchHit,
+    build_booking_index,
+    match_email_to_containers,
+)
 from core.services.gmail_client import (
     GmailApiClient,
     GmailHistoryExpired,
@@ -164,8 +181,7 @@ def _process_incremental(
     report: SyncReport,
     ingest_filters: list[tuple],
 ) -> None:
-    for gmail_id in client.list_history(state.last_history_id):
-        _ingest_one(client, gmail_id, booking_index, report, ingest_filters)
+    _ingest_ids(client, client.list_history(state.last_history_id), booking_index, report, ingest_filters)
 
 
 def _process_full(
@@ -179,8 +195,53 @@ def _process_full(
     # создаёт десятки промежуточных message_id на один черновик, они
     # замусоривают карточки контейнеров/машин/автовозов).
     query = f"newer_than:{int(lookback_days)}d -in:spam -in:trash -in:drafts"
-    for gmail_id in client.list_messages(query):
-        _ingest_one(client, gmail_id, booking_index, report, ingest_filters)
+    _ingest_ids(client, client.list_messages(query), booking_index, report, ingest_filters)
+
+
+# Сколько gmail_id обрабатываем за один проход fetch → persist. Страница
+# ограничивает и память (тела + вложения), и размер одной транзакции.
+_FETCH_PAGE_SIZE = 100
+
+
+def _ingest_ids(
+    client: GmailApiClient,
+    gmail_ids,
+    booking_index: dict[str, int],
+    report: SyncReport,
+    ingest_filters: list[tuple],
+) -> None:
+    iterator = iter(gmail_ids)
+    while True:
+        page = list(islice(iterator, _FETCH_PAGE_SIZE))
+        if not page:
+            return
+        _ingest_page(client, page, booking_index, report, ingest_filters)
+
+
+def _ingest_page(
+    client: GmailApiClient,
+    gmail_ids: list[str],
+    booking_index: dict[str, int],
+    report: SyncReport,
+    ingest_filters: list[tuple] | None = None,
+) -> None:
+    """Fetch-стадия для страницы id: known-фильтр → batch get → persist."""
+    from core.models_email import ContainerEmail
+
+    known = set(ContainerEmail.objects.filter(gmail_id__in=gmail_ids).values_list("gmail_id", flat=True))
+    todo = [gid for gid in dict.fromkeys(gmail_ids) if gid and gid not in known]
+    if not todo:
+        return
+
+    fetched = client.get_messages(todo)
+    messages: list[ParsedMessage] = []
+    for gmail_id in todo:
+        result = fetched.get(gmail_id)
+        if isinstance(result, ParsedMessage):
+            messages.append(result)
+        else:
+            _record_fetch_error(gmail_id, result or RuntimeError("нет ответа в batch"), report)
+    _store_messages(client, messages, booking_index, report, ingest_filters)
 
 
 # ---------------------------------------------------------------------------
@@ -201,6 +262,20 @@ def _is_gmail_not_found(exc: Exception) -> bool:
         return False
 
 
+def _record_fetch_error(gmail_id: str, exc: Exception, report: SyncReport) -> None:
+    # 404 — письмо удалено из ящика после попадания в history (или
+    # недоступно навсегда). Ретраить бессмысленно: без этой ветки те же
+    # письма фейлились на КАЖДОМ прогоне (курсор не двигался из-за
+    # ingest_errors) и заспамили Sentry ~20K ошибок/день (2026-07-21).
+    if _is_gmail_not_found(exc):
+        logger.info("[gmail_sync] Message %s deleted from mailbox (404) — skip", gmail_id)
+        report.not_found_skipped += 1
+        return
+    logger.error("[gmail_sync] Failed to fetch %s: %s", gmail_id, exc, exc_info=exc)
+    report.errors.append(f"get_message({gmail_id}): {exc}")
+    report.ingest_errors += 1
+
+
 def _ingest_one(
     client: GmailApiClient,
     gmail_id: str,
@@ -208,12 +283,8 @@ def _ingest_one(
     report: SyncReport,
     ingest_filters: list[tuple] | None = None,
 ) -> None:
-    from core.models_email import (
-        CarEmailLink,
-        ContainerEmail,
-        ContainerEmailLink,
-        TransportRequestEmailLink,
-    )
+    """Одно письмо по gmail_id (тот же путь, что и страница, без batch)."""
+    from core.models_email import ContainerEmail
 
     if ContainerEmail.objects.filter(gmail_id=gmail_id).exists():
         return
@@ -221,61 +292,186 @@ def _ingest_one(
     try:
         msg = client.get_message(gmail_id)
     except Exception as exc:
-        # 404 — письмо удалено из ящика после попадания в history (или
-        # недоступно навсегда). Ретраить бессмысленно: без этой ветки те же
-        # письма фейлились на КАЖДОМ прогоне (курсор не двигался из-за
-        # ingest_errors) и заспамили Sentry ~20K ошибок/день (2026-07-21).
-        if _is_gmail_not_found(exc):
-            logger.info("[gmail_sync] Message %s deleted from mailbox (404) — skip", gmail_id)
-            report.not_found_skipped += 1
-            return
-        logger.error("[gmail_sync] Failed to fetch %s: %s", gmail_id, exc, exc_info=True)
-        report.errors.append(f"get_message({gmail_id}): {exc}")
-        report.ingest_errors += 1
+        _record_fetch_error(gmail_id, exc, report)
         return
+    _store_messages(client, [msg], booking_index, report, ingest_filters)
+
+
+@dataclass
+class _PreparedEmail:
+    """Письмо, готовое к записи: решения по дублю/фильтру/матчингу приняты."""
+
+    msg: ParsedMessage
+    message_id: str
+    is_new: bool
+    is_duplicate: bool = False
+    content_digest: str = ""
+    filter_hit: str = ""
+    match: MatchResult | None = None
+    attachments_meta: list[dict] = field(default_factory=list)
+
+    @property
+    def creates_links(self) -> bool:
+        return self.is_new and not self.is_duplicate and not self.filter_hit
+
+
+def _fallback_message_id(msg: ParsedMessage) -> str:
+    return msg.message_id or f"gmail:{msg.gmail_id}"
+
+
+def _store_messages(
+    client: GmailApiClient,
+    messages: list[ParsedMessage],
+    booking_index: dict[str, int],
+    report: SyncReport,
+    ingest_filters: list[tuple] | None,
+) -> None:
+    """Persist-стадия: решения по каждому письму, затем запись пачкой."""
+    from core.models_email import ContainerEmail
 
-    # Черновики Gmail пропускаем: при наборе письма в web-интерфейсе Gmail
-    # автосохраняет его каждые несколько секунд и прилетает в history.list
-    # как messageAdded — без фильтра мы плодим «письма» в карточках на
-    # каждое автосохранение. Свои черновики ведём на стороне проекта.
-    if "DRAFT" in (msg.labels or []):
-        report.drafts_skipped += 1
+    accepted: list[ParsedMessage] = []
+    for msg in messages:
+        # Черновики Gmail пропускаем: при наборе письма в web-интерфейсе Gmail
+        # автосохраняет его каждые несколько секунд и прилетает в history.list
+        # как messageAdded — без фильтра мы плодим «письма» в карточках на
+        # каждое автосохранение. Свои черновики ведём на стороне проекта.
+        if "DRAFT" in (msg.labels or []):
+            report.drafts_skipped += 1
+            continue
+        report.processed += 1
+        accepted.append(msg)
+    if not accepted:
         return
 
-    report.processed += 1
-
-    # Дедупликация по содержимому. Автоматика Caromoto/Maersk/Salesforce
-    # периодически присылает одно и то же уведомление несколькими Gmail-
-    # сообщениями с разными Message-ID (рассылка продублировалась внутри
-    # их систем). В карточке контейнера мы видим два «близнеца» с одним
-    # subject/body, но разными matched_by («по треду» + «по номеру»).
-    # Такой дубль сохраняем как ContainerEmail (чтобы sync был идемпотентен
-    # по gmail_id), но НЕ создаём ни ContainerEmailLink, ни CarEmailLink —
-    # дубль не попадёт в emails_for_panel() и не засветится в карточках.
-    is_duplicate = _is_content_duplicate(msg)
-
-    # Пользовательские фильтры по ключевым фразам (админка → «Фильтры
-    # Gmail-ингеста»). Если письмо матчится — сохраняем его в БД (чтобы
-    # sync оставался идемпотентным по gmail_id), но не создаём связей ни
-    # с контейнерами, ни с машинами: в карточках не появится.
-    filter_hit = ""
-    if ingest_filters:
-        filter_hit = matches_ingest_filter(
-            subject=msg.subject or "",
-            body_text=msg.body_text or "",
-            body_html=msg.body_html or "",
-            filters=ingest_filters,
+    existing_ids = set(
+        ContainerEmail.objects.filter(message_id__in={_fallback_message_id(m) for m in accepted}).values_list(
+            "message_id", flat=True
         )
+    )
+
+    # Письма страницы ещё не в БД, поэтому «близнецы» и треды внутри одной
+    # страницы учитываем здесь — так же, как если бы письма сохранялись
+    # по одному в порядке выдачи Gmail.
+    page_digests: set[str] = set()
+    page_message_ids: set[str] = set()
+    page_thread_hits: dict[str, list[MatchHit]] = {}
+    page_parent_hits: dict[str, list[MatchHit]] = {}
+    page_thread_requests: dict[str, list[TransportRequestMatchHit]] = {}
+    page_parent_requests: dict[str, list[TransportRequestMatchHit]] = {}
+
+    prepared: list[_PreparedEmail] = []
+    for msg in accepted:
+        message_id = _fallback_message_id(msg)
+        item = _PreparedEmail(
+            msg=msg,
+            message_id=message_id,
+            is_new=message_id not in existing_ids and message_id not in page_message_ids,
+        )
+        page_message_ids.add(message_id)
+
+        if item.is_new:
+            # Дедупликация по содержимому. Автоматика Caromoto/Maersk/Salesforce
+            # периодически присылает одно и то же уведомление несколькими Gmail-
+            # сообщениями с разными Message-ID. Такой дубль сохраняем как
+            # ContainerEmail (чтобы sync был идемпотентен по gmail_id), но НЕ
+            # создаём связей — он не попадёт в emails_for_panel().
+            digest = item.content_digest = _message_digest(msg)
+            item.is_duplicate = bool(digest) and (digest in page_digests or _is_content_duplicate(msg, digest))
+            if digest:
+                page_digests.add(digest)
+
+            # Пользовательские фильтры по ключевым фразам (админка → «Фильтры
+            # Gmail-ингеста»): письмо сохраняется, но без связей.
+            if ingest_filters:
+                item.filter_hit = matches_ingest_filter(
+                    subject=msg.subject or "",
+                    body_text=msg.body_text or "",
+                    body_html=msg.body_html or "",
+                    filters=ingest_filters,
+                )
+
+        match = match_email_to_containers(msg, booking_index=booking_index)
+        match.hits = _with_page_thread_hits(
+            match.hits, msg, page_thread_hits, page_parent_hits, key=lambda hit: hit.container_id
+        )
+        match.transport_hits = _with_page_thread_hits(
+            match.transport_hits, msg, page_thread_requests, page_parent_requests, key=lambda hit: hit.request_id
+        )
+        item.match = match
+        if item.creates_links:
+            tid = (msg.thread_id or "").strip()
+            if tid:
+                page_thread_hits.setdefault(tid, []).extend(match.hits)
+                page_thread_requests.setdefault(tid, []).extend(match.transport_hits)
+            page_parent_hits[message_id] = list(match.hits)
+            page_parent_requests[message_id] = list(match.transport_hits)
+        prepared.append(item)
+
+    new_items = [item for item in prepared if item.is_new]
+    downloaded = _download_attachments(client, [item.msg for item in new_items])
+    for item in new_items:
+        item.attachments_meta, saved, skipped = _persist_attachments(client, item.msg, downloaded=downloaded)
+        report.attachments_saved += saved
+        report.attachments_skipped += skipped
+
+    counts = SyncReport()
+    try:
+        with transaction.atomic():
+            _save_prepared(prepared, counts)
+    except Exception as exc:
+        # Пачка не легла (гонка по message_id, битое поле у одного письма) —
+        # сохраняем по одному, чтобы сбой затронул только проблемное письмо.
+        logger.warning("[gmail_sync] bulk save of %d emails failed (%s), saving one by one", len(prepared), exc)
+        for item in prepared:
+            try:
+                with transaction.atomic():
+                    if item.is_new:
+                        item.is_new = not ContainerEmail.objects.filter(message_id=item.message_id).exists()
+                    _save_prepared([item], report)
+            except Exception as item_exc:
+                logger.error("[gmail_sync] Failed to save %s: %s", item.msg.gmail_id, item_exc, exc_info=True)
+                report.errors.append(f"save({item.msg.gmail_id}): {item_exc}")
+                report.ingest_errors += 1
+        return
+    report.created += counts.created
+    report.updated += counts.updated
+    report.duplicates_skipped += counts.duplicates_skipped
+    report.filtered_skipped += counts.filtered_skipped
+    report.matched += counts.matched
+    report.unmatched += counts.unmatched
+
 
-    match = match_email_to_containers(msg, booking_index=booking_index)
+def _with_page_thread_hits(hits: list, msg: ParsedMessage, by_thread: dict, by_parent: dict, *, key) -> list:
+    """Добавить к хитам матчера привязки писем той же страницы.
 
-    fallback_message_id = msg.message_id or f"gmail:{msg.gmail_id}"
+    Матчер видит только БД, а письма страницы пишутся одной пачкой в конце.
+    Порядок как у матчера: тред → In-Reply-To (если по треду пусто) → прочее.
+    """
+    from core.models_email import ContainerEmail
 
-    attachments_meta, saved, skipped = _persist_attachments(client, msg)
-    report.attachments_saved += saved
-    report.attachments_skipped += skipped
+    tid = (msg.thread_id or "").strip()
+    irt = (msg.in_reply_to or "").strip()
+    inherited = by_thread.get(tid) if tid else None
+    if not inherited and irt:
+        inherited = by_parent.get(irt)
+    if not inherited:
+        return hits
+
+    merged = [hit for hit in hits if hit.matched_by == ContainerEmail.MATCHED_BY_THREAD]
+    seen = {key(hit) for hit in merged}
+    for hit in inherited:
+        if key(hit) not in seen:
+            seen.add(key(hit))
+            merged.append(replace(hit, matched_by=ContainerEmail.MATCHED_BY_THREAD))
+    merged.extend(hit for hit in hits if key(hit) not in seen)
+    return merged
+
+
+def _email_defaults(item: _PreparedEmail) -> dict:
+    from core.models_email import ContainerEmail
 
-    defaults = {
+    msg = item.msg
+    return {
         "thread_id": msg.thread_id,
         "in_reply_to": msg.in_reply_to,
         "references": msg.references,
@@ -291,139 +487,135 @@ def _ingest_one(
         "gmail_id": msg.gmail_id,
         "gmail_history_id": msg.history_id,
         "labels_json": list(msg.labels),
-        "attachments_json": attachments_meta,
-        "matched_by": match.primary_matched_by,
+        "attachments_json": item.attachments_meta,
+        "matched_by": item.match.primary_matched_by,
+        "content_digest": item.content_digest,
         "hidden_reason": (
-            ContainerEmail.HIDDEN_DUPLICATE if is_duplicate else (ContainerEmail.HIDDEN_FILTERED if filter_hit else "")
+            ContainerEmail.HIDDEN_DUPLICATE
+            if item.is_duplicate
+            else (ContainerEmail.HIDDEN_FILTERED if item.filter_hit else "")
         ),
     }
 
-    # Для обратной синхронизации UNREAD (см. ниже).
-    is_incoming = not msg.is_outgoing
-    gmail_is_unread = "UNREAD" in (msg.labels or [])
 
-    try:
-        with transaction.atomic():
-            obj, created = ContainerEmail.objects.get_or_create(
-                message_id=fallback_message_id,
-                defaults=defaults,
-            )
-            if created:
-                report.created += 1
-                if is_duplicate:
-                    # Не создаём линков — дубль «скрыт» из всех карточек.
-                    report.duplicates_skipped += 1
-                    return
-                if filter_hit:
-                    report.filtered_skipped += 1
-                    logger.info(
-                        "[gmail_sync] filtered out gmail_id=%s by phrase %r",
-                        gmail_id,
-                        filter_hit,
-                    )
-                    return
-                # Создаём M2M-связи сразу при создании письма. Идемпотентно:
-                # повторный sync этого gmail_id отфильтруется в начале функции.
-                if match.hits:
-                    # Reverse-sync при создании: INCOMING-письмо без UNREAD в
-                    # Gmail считаем прочитанным и в карточках сразу (его уже
-                    # прочитали где-то ещё в Gmail).
-                    link_is_read = is_incoming and not gmail_is_unread
-                    links = [
-                        ContainerEmailLink(
-                            email=obj,
-                            container_id=hit.container_id,
-                            matched_by=hit.matched_by,
-                            is_read=link_is_read,
-                        )
-                        for hit in match.hits
-                    ]
-                    ContainerEmailLink.objects.bulk_create(
-                        links,
-                        ignore_conflicts=True,
-                    )
-                # Линки к машинам по VIN. Reverse-sync через тот же флаг:
-                # INCOMING-письмо без UNREAD в Gmail — сразу прочитано и в
-                # карточках машин.
-                if match.car_hits:
-                    link_is_read = is_incoming and not gmail_is_unread
-                    car_links = [
-                        CarEmailLink(
-                            email=obj,
-                            car_id=hit.car_id,
-                            matched_by=hit.matched_by,
-                            is_read=link_is_read,
-                        )
-                        for hit in match.car_hits
-                    ]
-                    CarEmailLink.objects.bulk_create(
-                        car_links,
-                        ignore_conflicts=True,
-                    )
-                # Ответы склада на письмо-заявку по автовозу: тот же тред
-                # (или номер TR-… в теме) → письмо появляется в карточке
-                # заявки на доске заявок.
-                if match.transport_hits:
-                    link_is_read = is_incoming and not gmail_is_unread
-                    tr_links = [
-                        TransportRequestEmailLink(
-                            email=obj,
-                            request_id=hit.request_id,
-                            matched_by=hit.matched_by,
-                            is_read=link_is_read,
-                        )
-                        for hit in match.transport_hits
-                    ]
-                    TransportRequestEmailLink.objects.bulk_create(
-                        tr_links,
-                        ignore_conflicts=True,
-                    )
-            else:
-                # Идемпотентно обновим gmail_id/labels. Связи с контейнерами
-                # не пересчитываем: пользователь мог вручную перепривязать.
-                changed_fields: list[str] = []
-                if not obj.gmail_id and msg.gmail_id:
-                    obj.gmail_id = msg.gmail_id
-                    changed_fields.append("gmail_id")
-                if msg.history_id and obj.gmail_history_id != msg.history_id:
-                    obj.gmail_history_id = msg.history_id
-                    changed_fields.append("gmail_history_id")
-                labels_changed = set(obj.labels_json or []) != set(msg.labels)
-                if labels_changed:
-                    obj.labels_json = list(msg.labels)
-                    changed_fields.append("labels_json")
-                if changed_fields:
-                    obj.save(update_fields=changed_fields)
-                    report.updated += 1
-
-                # Reverse-sync при обновлении: если в Gmail сняли UNREAD
-                # (пользователь прочитал письмо в почте) — протаскиваем
-                # is_read=True на все links. Только INCOMING, чтобы не
-                # ломать «unread»-бейджи для cross-linked OUTGOING-писем,
-                # у которых в Gmail всегда нет UNREAD (они в SENT).
-                if labels_changed and is_incoming and not gmail_is_unread:
-                    ContainerEmailLink.objects.filter(
-                        email_id=obj.pk,
-                        is_read=False,
-                    ).update(is_read=True)
-                    CarEmailLink.objects.filter(
-                        email_id=obj.pk,
-                        is_read=False,
-                    ).update(is_read=True)
-                    TransportRequestEmailLink.objects.filter(
-                        email_id=obj.pk,
-                        is_read=False,
-                    ).update(is_read=True)
-    except Exception as exc:
-        logger.error("[gmail_sync] Failed to save %s: %s", gmail_id, exc, exc_info=True)
-        report.errors.append(f"save({gmail_id}): {exc}")
-        report.ingest_errors += 1
-        return
+def _save_prepared(items: list[_PreparedEmail], report: SyncReport) -> None:
+    """Записать подготовленные письма: новые — ``bulk_create``, связи — по
+    одному ``bulk_create`` на тип, уже известные по message_id — точечный
+    апдейт gmail_id/labels. Вызывается внутри ``transaction.atomic``."""
+    from core.models_email import (
+        CarEmailLink,
+        ContainerEmail,
+        ContainerEmailLink,
+        TransportRequestEmailLink,
+    )
 
-    if match.is_matched:
-        report.matched += 1
-    else:
-        report.unmatched += 1
+    new_items = [item for item in items if item.is_new]
+    emails = ContainerEmail.objects.bulk_create(
+        [ContainerEmail(message_id=item.message_id, **_email_defaults(item)) for item in new_items],
+        batch_size=100,
+    )
+    by_message_id = {email.message_id: email for email in emails}
+
+    container_links: list = []
+    car_links: list = []
+    request_links: list = []
+    for item in new_items:
+        report.created += 1
+        if item.is_duplicate:
+            # Не создаём линков — дубль «скрыт» из всех карточек.
+            report.duplicates_skipped += 1
+            continue
+        if item.filter_hit:
+            report.filtered_skipped += 1
+            logger.info(
+                "[gmail_sync] filtered out gmail_id=%s by phrase %r",
+                item.msg.gmail_id,
+                item.filter_hit,
+            )
+            continue
+        email = by_message_id[item.message_id]
+        # Reverse-sync при создании: INCOMING-письмо без UNREAD в Gmail
+        # считаем прочитанным и в карточках сразу (его уже прочитали где-то
+        # ещё в Gmail).
+        link_is_read = not item.msg.is_outgoing and "UNREAD" not in (item.msg.labels or [])
+        match = item.match
+        container_links.extend(
+            ContainerEmailLink(
+                email=email, container_id=hit.container_id, matched_by=hit.matched_by, is_read=link_is_read
+            )
+            for hit in match.hits
+        )
+        # Линки к машинам по VIN.
+        car_links.extend(
+            CarEmailLink(email=email, car_id=hit.car_id, matched_by=hit.matched_by, is_read=link_is_read)
+            for hit in match.car_hits
+        )
+        # Ответы склада на письмо-заявку по автовозу: тот же тред (или номер
+        # TR-… в теме) → письмо появляется в карточке заявки.
+        request_links.extend(
+            TransportRequestEmailLink(
+                email=email, request_id=hit.request_id, matched_by=hit.matched_by, is_read=link_is_read
+            )
+            for hit in match.transport_hits
+        )
+    if container_links:
+        ContainerEmailLink.objects.bulk_create(container_links, ignore_conflicts=True)
+    if car_links:
+        CarEmailLink.objects.bulk_create(car_links, ignore_conflicts=True)
+    if request_links:
+        TransportRequestEmailLink.objects.bulk_create(request_links, ignore_conflicts=True)
+    linked_ids = {link.email_id for link in (*container_links, *car_links, *request_links)}
+    if linked_ids:
+        # bulk_create не шлёт сигналы — счётчики карточек пересчитываем явно.
+        schedule_refresh_for_emails(linked_ids)
+        publish_email_links(linked_ids)
+
+    known_items = [item for item in items if not item.is_new]
+    if known_items:
+        known = ContainerEmail.objects.in_bulk([item.message_id for item in known_items], field_name="message_id")
+        for item in known_items:
+            _update_known_email(known[item.message_id], item.msg, report)
+
+    for item in items:
+        if item.is_new and not item.creates_links:
+            continue
+        if item.match.is_matched:
+            report.matched += 1
+        else:
+            report.unmatched += 1
+
+
+def _update_known_email(obj, msg: ParsedMessage, report: SyncReport) -> None:
+    """Идемпотентно обновим gmail_id/labels. Связи с контейнерами не
+    пересчитываем: пользователь мог вручную перепривязать."""
+    from core.models_email import CarEmailLink, ContainerEmailLink, TransportRequestEmailLink
+
+    changed_fields: list[str] = []
+    if not obj.gmail_id and msg.gmail_id:
+        obj.gmail_id = msg.gmail_id
+        changed_fields.append("gmail_id")
+    if msg.history_id and obj.gmail_history_id != msg.history_id:
+        obj.gmail_history_id = msg.history_id
+        changed_fields.append("gmail_history_id")
+    labels_changed = set(obj.labels_json or []) != set(msg.labels)
+    if labels_changed:
+        obj.labels_json = list(msg.labels)
+        changed_fields.append("labels_json")
+    if changed_fields:
+        obj.save(update_fields=changed_fields)
+        report.updated += 1
+
+    # Reverse-sync при обновлении: если в Gmail сняли UNREAD (пользователь
+    # прочитал письмо в почте) — протаскиваем is_read=True на все links.
+    # Только INCOMING, чтобы не ломать «unread»-бейджи для cross-linked
+    # OUTGOING-писем, у которых в Gmail всегда нет UNREAD (они в SENT).
+    if labels_changed and not msg.is_outgoing and "UNREAD" not in (msg.labels or []):
+        ContainerEmailLink.objects.filter(email_id=obj.pk, is_read=False).update(is_read=True)
+        CarEmailLink.objects.filter(email_id=obj.pk, is_read=False).update(is_read=True)
+        TransportRequestEmailLink.objects.filter(email_id=obj.pk, is_read=False).update(is_read=True)
+        email_id = obj.pk
+        schedule_refresh_for_emails([email_id])
+        transaction.on_commit(lambda: bump_versions_for_emails([email_id]))
 
 
 # ---------------------------------------------------------------------------
@@ -600,7 +792,35 @@ def matches_ingest_filter(
     return ""
 
 
-def _is_content_duplicate(msg: ParsedMessage) -> bool:
+def email_content_digest(*, from_addr: str, subject: str, body_text: str, body_html: str) -> str:
+    """Значение ``ContainerEmail.content_digest`` для полей письма.
+
+    Поля берутся в том виде, в каком лягут в БД (обрезка from/subject).
+    Пустые письма не дедупим — в карточках они всё равно не появляются,
+    поэтому для них дайджест пустой.
+    """
+    from_addr = (from_addr or "")[:500]
+    subject = (subject or "")[:1000]
+    if not subject and not body_text and not body_html:
+        return ""
+    return _content_digest(
+        from_addr=from_addr,
+        subject=subject,
+        body_text=body_text or "",
+        body_html=body_html or "",
+    )
+
+
+def _message_digest(msg: ParsedMessage) -> str:
+    return email_content_digest(
+        from_addr=msg.from_addr,
+        subject=msg.subject,
+        body_text=msg.body_text,
+        body_html=msg.body_html,
+    )
+
+
+def _is_content_duplicate(msg: ParsedMessage, digest: str | None = None) -> bool:
     """Есть ли уже в БД письмо с тем же «видимым» содержимым.
 
     Дубликаты встречаются у автоматических рассылок (Caromoto, Maersk/
@@ -612,52 +832,26 @@ def _is_content_duplicate(msg: ParsedMessage) -> bool:
     Сравнение идёт по *нормализованному* дайджесту (FROM + SUBJECT +
     очищенное тело), т.к. побайтно отличаться могут Salesforce-скрипты,
     трекинг-пиксели, unsubscribe-токены и прочая вариативная служебка.
+    Дайджест хранится в ``ContainerEmail.content_digest``, поэтому проверка —
+    один индексный exists(), сколько бы копий рассылки ни лежало в БД.
     """
     from datetime import timedelta
 
     from core.models_email import ContainerEmail
 
-    from_addr = (msg.from_addr or "")[:500]
-    subject = (msg.subject or "")[:1000]
-    body_text = msg.body_text or ""
-    body_html = msg.body_html or ""
-
-    # Пустые письма не дедупим — не появляются в карточках всё равно.
-    if not subject and not body_text and not body_html:
+    if digest is None:
+        digest = _message_digest(msg)
+    if not digest:
         return False
 
-    new_digest = _content_digest(
-        from_addr=from_addr,
-        subject=subject,
-        body_text=body_text,
-        body_html=body_html,
-    )
-
-    # Ищем кандидатов по ключу (from_addr, subject) — это индекс-friendly,
-    # а заодно сильно урезает набор. Окно 30 дней — достаточно, чтобы
-    # поймать повторные уведомления (обычно приходят в пределах часа).
+    # Окно 30 дней — достаточно, чтобы поймать повторные уведомления
+    # (обычно приходят в пределах часа).
     since = timezone.now() - timedelta(days=30)
-    candidates = (
-        ContainerEmail.objects.filter(
-            from_addr=from_addr,
-            subject=subject,
-            received_at__gte=since,
-        )
+    return (
+        ContainerEmail.objects.filter(content_digest=digest, received_at__gte=since)
         .exclude(gmail_id=msg.gmail_id)
-        .only("id", "from_addr", "subject", "body_text", "body_html")
-        # Бейлимся после первой же находки — не тянем тысячи кандидатов.
-        .iterator(chunk_size=50)
+        .exists()
     )
-    for cand in candidates:
-        cand_digest = _content_digest(
-            from_addr=cand.from_addr or "",
-            subject=cand.subject or "",
-            body_text=cand.body_text or "",
-            body_html=cand.body_html or "",
-        )
-        if cand_digest == new_digest:
-            return True
-    return False
 
 
 # ---------------------------------------------------------------------------
@@ -667,15 +861,45 @@ def _is_content_duplicate(msg: ParsedMessage) -> bool:
 _SAFE_FILENAME_RE = re.compile(r"[^A-Za-z0-9._\-]+")
 
 
+def _attachment_limit_bytes() -> int:
+    return int(getattr(settings, "GMAIL_MAX_ATTACHMENT_MB", 25)) * 1024 * 1024
+
+
+def _download_attachments(client: GmailApiClient, messages: list[ParsedMessage]) -> dict:
+    """Параллельно скачать вложения писем страницы.
+
+    Возвращает ``{(gmail_id, attachment_id): bytes | Exception}``. Inline и
+    слишком большие вложения не качаются — их отсеет ``_persist_attachments``.
+    """
+    limit_bytes = _attachment_limit_bytes()
+    wanted = [
+        (msg.gmail_id, att.attachment_id)
+        for msg in messages
+        for att in msg.attachments
+        if not att.is_inline and not (att.size and att.size > limit_bytes)
+    ]
+    if not wanted:
+        return {}
+    workers = int(getattr(settings, "GMAIL_ATTACHMENT_WORKERS", 4))
+    return client.get_attachments(wanted, max_workers=workers)
+
+
 def _persist_attachments(
     client: GmailApiClient,
     msg: ParsedMessage,
+    *,
+    downloaded: dict | None = None,
 ) -> tuple[list[dict], int, int]:
-    """Возвращает (attachments_json, сохранено, пропущено_из_за_размера)."""
+    """Возвращает (attachments_json, сохранено, пропущено_из_за_размера).
+
+    ``downloaded`` — результат ``_download_attachments``; чего в нём нет,
+    скачивается здесь же по одному.
+    """
     if not msg.attachments:
         return [], 0, 0
 
-    limit_bytes = int(getattr(settings, "GMAIL_MAX_ATTACHMENT_MB", 25)) * 1024 * 1024
+    downloaded = downloaded or {}
+    limit_bytes = _attachment_limit_bytes()
     media_root = Path(settings.MEDIA_ROOT)
     now = msg.received_at or timezone.now()
 
@@ -707,7 +931,11 @@ def _persist_attachments(
             skipped += 1
             continue
         try:
-            data = client.get_attachment(msg.gmail_id, att.attachment_id)
+            data = downloaded.get((msg.gmail_id, att.attachment_id))
+            if isinstance(data, Exception):
+                raise data
+            if data is None:
+                data = client.get_attachment(msg.gmail_id, att.attachment_id)
         except Exception as exc:
             logger.warning("[gmail_sync] attachment fetch failed (%s): %s", att.filename, exc)
             meta["skipped_reason"] = f"fetch_error: {exc}"
@@ -0,0 +1,222 @@
+"""
+Live-обновления панелей переписки в карточках (контейнер, машина, рейс
+автовоза, заявка на автовоз).
+
+Две части:
+
+* **push** — ``publish_email_links(email_ids)`` после коммита рендерит баблы
+  новых писем и рассылает их в Channels-группы открытых карточек
+  (``EmailPanelConsumer``, ``ws/emails/<kind>/<id>/``). Вызывается там, где
+  создаются связи письма с карточками: ингест Gmail и отправка из карточки.
+* **версия панели** — счётчик в кэше на каждую карточку. Меняется при любом
+  изменении переписки карточки (новая связь, прочитано/непрочитано).
+  Polling-эндпоинты ``email_*_updates`` остаются запасным каналом: если
+  клиент прислал актуальную версию (``?v=``), они отвечают «без изменений»,
+  не трогая таблицы писем.
+
+Версия хранится с TTL (``EMAIL_PANEL_VERSION_TTL``): после истечения
+появляется новое значение, и следующий poll пересчитает панель честно. Это
+страховка для путей, которые меняют связи в обход этого модуля
+(management-команды, админ-экшены).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+PANEL_CONTAINER = "container"
+PANEL_CAR = "car"
+PANEL_AUTOTRANSPORT = "autotransport"
+PANEL_TRANSPORT_REQUEST = "transportrequest"
+PANEL_KINDS = (PANEL_CONTAINER, PANEL_CAR, PANEL_AUTOTRANSPORT, PANEL_TRANSPORT_REQUEST)
+
+BUBBLE_TEMPLATE = "admin/core/container/_email_bubble.html"
+
+# Больше баблов за раз не пушим. Вместо них — ``reload`` без версии: клиент
+# сохраняет прежнюю версию и сразу делает poll, который отдаст письма честно.
+MAX_PUSH_BUBBLES = 50
+
+Panel = tuple[str, int]
+
+
+def panel_group(kind: str, entity_id: int) -> str:
+    """Имя Channels-группы открытых панелей одной карточки."""
+    return f"email_panel.{kind}.{entity_id}"
+
+
+def _version_key(kind: str, entity_id: int) -> str:
+    return f"email_panel_ver:{kind}:{entity_id}"
+
+
+def _version_ttl() -> int:
+    return int(getattr(settings, "EMAIL_PANEL_VERSION_TTL", 300))
+
+
+_stamp_lock = threading.Lock()
+_last_stamp = 0
+
+
+def _new_stamp() -> int:
+    """Новая версия: микросекунды (точно помещаются в Number в JS), строго
+    возрастающие в пределах процесса."""
+    global _last_stamp
+    with _stamp_lock:
+        _last_stamp = max(time.time_ns() // 1000, _last_stamp + 1)
+        return _last_stamp
+
+
+def get_panel_version(kind: str, entity_id: int) -> int:
+    """Текущая версия переписки карточки (создаётся при первом обращении)."""
+    key = _version_key(kind, entity_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_stamp(), _version_ttl())
+        version = cache.get(key)
+    return int(version or 0)
+
+
+def bump_panel_versions(panels: Iterable[Panel]) -> dict[Panel, int]:
+    """Сменить версию у карточек — одним ``set_many``."""
+    panels = set(panels)
+    if not panels:
+        return {}
+    stamp = _new_stamp()
+    versions = {panel: stamp for panel in panels}
+    try:
+        cache.set_many({_version_key(*panel): stamp for panel in panels}, _version_ttl())
+    except Exception as exc:
+        # Кэш недоступен — poll просто будет считать панели каждый раз.
+        logger.warning("[email_live] cannot bump panel versions: %s", exc)
+    return versions
+
+
+def _panel_links(email_ids: Iterable[int]) -> dict[Panel, dict[int, bool]]:
+    """``{(kind, id): {email_id: is_read_here}}`` для всех карточек писем."""
+    from core.models import AutoTransport
+    from core.models_email import CarEmailLink, ContainerEmailLink, TransportRequestEmailLink
+
+    email_ids = list(set(email_ids))
+    panels: dict[Panel, dict[int, bool]] = defaultdict(dict)
+    if not email_ids:
+        return panels
+
+    for container_id, email_id, is_read in ContainerEmailLink.objects.filter(email_id__in=email_ids).values_list(
+        "container_id", "email_id", "is_read"
+    ):
+        panels[(PANEL_CONTAINER, container_id)][email_id] = is_read
+
+    car_links: dict[int, list[tuple[int, bool]]] = defaultdict(list)
+    for car_id, email_id, is_read in CarEmailLink.objects.filter(email_id__in=email_ids).values_list(
+        "car_id", "email_id", "is_read"
+    ):
+        panels[(PANEL_CAR, car_id)][email_id] = is_read
+        car_links[car_id].append((email_id, is_read))
+
+    for request_id, email_id, is_read in TransportRequestEmailLink.objects.filter(email_id__in=email_ids).values_list(
+        "request_id", "email_id", "is_read"
+    ):
+        panels[(PANEL_TRANSPORT_REQUEST, request_id)][email_id] = is_read
+
+    if car_links:
+        # Панель рейса агрегирует письма машин: прочитано, только если
+        # прочитано у всех машин рейса, где письмо засветилось.
+        for at_id, car_id in AutoTransport.cars.through.objects.filter(car_id__in=car_links).values_list(
+            "autotransport_id", "car_id"
+        ):
+            bucket = panels[(PANEL_AUTOTRANSPORT, at_id)]
+            for email_id, is_read in car_links[car_id]:
+                bucket[email_id] = bucket.get(email_id, True) and is_read
+    return panels
+
+
+def bump_versions_for_emails(email_ids: Iterable[int]) -> None:
+    """Сменить версию у всех карточек, где засветились письма."""
+    bump_panel_versions(_panel_links(email_ids))
+
+
+def publish_email_links(email_ids: Iterable[int]) -> None:
+    """После коммита: новые версии карточек + push баблов в открытые панели."""
+    email_ids = [pk for pk in set(email_ids) if pk]
+    if not email_ids:
+        return
+    transaction.on_commit(lambda: _publish(email_ids))
+
+
+def _publish(email_ids: list[int]) -> None:
+    try:
+        panels = _panel_links(email_ids)
+        versions = bump_panel_versions(panels)
+        if not panels:
+            return
+        _push_bubbles(panels, versions)
+    except Exception:
+        # Live-обновления — удобство: письма уже сохранены, клиент догонит
+        # через poll.
+        logger.exception("[email_live] publish failed for %d emails", len(email_ids))
+
+
+def _push_bubbles(panels: dict[Panel, dict[int, bool]], versions: dict[Panel, int]) -> None:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+
+    from core.models import AutoTransport
+    from core.models_email import ContainerEmail
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    email_ids = {email_id for links in panels.values() for email_id in links}
+    emails = ContainerEmail.objects.prefetch_related("cars").in_bulk(email_ids)
+    at_ids = [entity_id for kind, entity_id in panels if kind == PANEL_AUTOTRANSPORT]
+    at_cars: dict[int, set[int]] = defaultdict(set)
+    for at_id, car_id in AutoTransport.cars.through.objects.filter(autotransport_id__in=at_ids).values_list(
+        "autotransport_id", "car_id"
+    ):
+        at_cars[at_id].add(car_id)
+
+    rendered: dict[tuple[int, bool], str] = {}
+    for (kind, entity_id), links in panels.items():
+        if len(links) > MAX_PUSH_BUBBLES:
+            async_to_sync(channel_layer.group_send)(
+                panel_group(kind, entity_id),
+                {"type": "email_bubbles", "data": {"version": None, "bubbles": [], "reload": True}},
+            )
+            continue
+        ordered = sorted(
+            (emails[email_id] for email_id in links if email_id in emails),
+            key=lambda email: (email.received_at, email.pk),
+            reverse=True,
+        )
+        bubbles = []
+        for email in ordered:
+            is_read = links[email.pk]
+            email.is_read_here = is_read
+            if kind == PANEL_AUTOTRANSPORT:
+                html = render_to_string(
+                    BUBBLE_TEMPLATE, {"email": email, "autotransport_car_ids": at_cars.get(entity_id, set())}
+                )
+            else:
+                # Бабл не зависит от карточки, только от is_read_here.
+                html = rendered.get((email.pk, is_read))
+                if html is None:
+                    html = rendered[(email.pk, is_read)] = render_to_string(BUBBLE_TEMPLATE, {"email": email})
+            bubbles.append({"id": email.pk, "html": html})
+        async_to_sync(channel_layer.group_send)(
+            panel_group(kind, entity_id),
+            {
+                "type": "email_bubbles",
+                "data": {"version": versions.get((kind, entity_id)), "bubbles": bubbles},
+            },
+        )
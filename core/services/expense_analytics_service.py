@@ -3,6 +3,11 @@ ExpenseAnalyticsService
 =======================
 Aggregates personal expense data and generates AI-powered insights.
 Used by the analytics page and the dashboard widget.
+
+Totals, monthly trend and receipt items are read from the monthly
+``ExpenseRollup`` table (``core.services.expense_rollup``); only the
+partial first month of a rolling period is aggregated live. AI insights
+are cached per rollup version.
 """
 
 import json
@@ -10,12 +15,14 @@ import logging
 import os
 from collections import defaultdict
 from datetime import timedelta
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 
 from django.core.cache import cache
-from django.db.models import Count, Sum
+from django.db.models import Sum
 from django.utils import timezone
 
+from core.services import expense_rollup
+
 logger = logging.getLogger(__name__)
 
 PERIOD_MAP = {
@@ -26,6 +33,12 @@ PERIOD_MAP = {
     "all": None,
 }
 
+# Personal cash expenses — filters valid for both Transaction and ExpenseRollup.
+PERSONAL_CASH = {"method": "CASH", "category__category_type": "PERSONAL"}
+
+# Insights are keyed by rollup version and day, so they can live longer.
+INSIGHTS_CACHE_TIMEOUT = 24 * 3600
+
 
 class ExpenseAnalyticsService:
     """Analytics for personal cash expenses."""
@@ -35,47 +48,47 @@ class ExpenseAnalyticsService:
 
         self.company = company or Company.objects.filter(name__icontains="Caromoto").first()
 
-    def _base_queryset(self, period="1m"):
-        from core.models_billing import ExpenseCategory, Transaction
-
-        personal_cats = list(ExpenseCategory.objects.filter(category_type="PERSONAL").values_list("id", flat=True))
+    def _period_start(self, period):
+        months = PERIOD_MAP.get(period)
+        if months is None:
+            return None
+        return timezone.now() - timedelta(days=months * 30)
 
-        qs = Transaction.objects.filter(
-            from_company=self.company,
-            status="COMPLETED",
-            method="CASH",
-            category_id__in=personal_cats,
-        )
+    def _base_queryset(self, period="1m"):
+        from core.models_billing import Transaction
 
-        months = PERIOD_MAP.get(period)
-        if months is not None:
-            start = timezone.now() - timedelta(days=months * 30)
+        qs = Transaction.objects.filter(from_company=self.company, status="COMPLETED", **PERSONAL_CASH)
+        start = self._period_start(period)
+        if start is not None:
             qs = qs.filter(date__gte=start)
-
         return qs
 
+    def _rows(self, period):
+        """Rollup rows for the period (the partial first month is aggregated live)."""
+        return expense_rollup.period_rows(self.company, self._period_start(period), **PERSONAL_CASH)
+
     def get_category_breakdown(self, period="1m"):
         """Returns list of {category, total, count, percentage} sorted by total desc."""
-        qs = self._base_queryset(period)
+        return self._breakdown(self._rows(period))
 
-        data = list(
-            qs.values("category__name", "category__id")
-            .annotate(
-                total=Sum("amount"),
-                count=Count("id"),
-            )
-            .order_by("-total")
-        )
+    def _breakdown(self, rows):
+        from core.models_billing import ExpenseCategory
+
+        totals = defaultdict(lambda: {"total": Decimal("0"), "count": 0})
+        for row in rows:
+            totals[row["category_id"]]["total"] += row["total"]
+            totals[row["category_id"]]["count"] += row["count"]
+        names = dict(ExpenseCategory.objects.filter(pk__in=list(totals)).values_list("id", "name"))
 
-        grand_total = sum(d["total"] for d in data) if data else Decimal("0")
+        grand_total = sum((d["total"] for d in totals.values()), Decimal("0"))
 
         result = []
-        for d in data:
+        for category_id, d in sorted(totals.items(), key=lambda kv: (-kv[1]["total"], names.get(kv[0], ""))):
             pct = (d["total"] / grand_total * 100) if grand_total > 0 else Decimal("0")
             result.append(
                 {
-                    "category_id": d["category__id"],
-                    "category": d["category__name"],
+                    "category_id": category_id,
+                    "category": names.get(category_id),
                     "total": float(d["total"]),
                     "count": d["count"],
                     "percentage": round(float(pct), 1),
@@ -85,59 +98,29 @@ class ExpenseAnalyticsService:
 
     def get_monthly_trend(self, months=6):
         """Returns list of {month: 'YYYY-MM', total: float} for the last N months."""
-        from django.db.models.functions import TruncMonth
-
-        from core.models_billing import ExpenseCategory, Transaction
-
-        personal_cats = list(ExpenseCategory.objects.filter(category_type="PERSONAL").values_list("id", flat=True))
+        from core.models import ExpenseRollup
 
-        now = timezone.now()
-        start = (now - timedelta(days=months * 30)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if self.company is None:
+            return []
+        start = expense_rollup.month_start(timezone.localtime(timezone.now() - timedelta(days=months * 30)).date())
 
         qs = (
-            Transaction.objects.filter(
-                from_company=self.company,
-                status="COMPLETED",
-                method="CASH",
-                category_id__in=personal_cats,
-                date__gte=start,
-            )
-            .annotate(month=TruncMonth("date"))
+            ExpenseRollup.objects.filter(company=self.company, month__gte=start, **PERSONAL_CASH)
             .values("month")
-            .annotate(total=Sum("amount"))
+            .annotate(total=Sum("total"))
             .order_by("month")
         )
 
         return [{"month": d["month"].strftime("%Y-%m"), "total": float(d["total"])} for d in qs]
 
     def get_top_items(self, period="1m", limit=15):
-        """Extract top purchased items from receipt_data across transactions."""
-        qs = self._base_queryset(period).exclude(receipt_data__isnull=True)
-
-        items_agg = defaultdict(lambda: {"qty": 0, "total": Decimal("0"), "count": 0})
-
-        for tx in qs.only("receipt_data"):
-            data = tx.receipt_data or {}
-            for item in data.get("items", []):
-                name = (item.get("name") or "").strip()
-                if not name:
-                    continue
-                key = name.lower()
-                # qty в receipt_data приходит из JSON как int/float (например 2.5 кг);
-                # price хранится как Decimal — без приведения qty к Decimal Python
-                # ругается TypeError на price * qty.
-                try:
-                    qty = Decimal(str(item.get("qty", 1)))
-                except (InvalidOperation, ValueError, TypeError):
-                    qty = Decimal("1")
-                try:
-                    price = Decimal(str(item.get("price", 0)))
-                except (InvalidOperation, ValueError, TypeError):
-                    price = Decimal("0")
-                items_agg[key]["name"] = name
-                items_agg[key]["qty"] += qty
-                items_agg[key]["total"] += price * qty
-                items_agg[key]["count"] += 1
+        """Top purchased items from receipt_data, pre-aggregated in the rollup."""
+        return self._top_items(self._rows(period), limit)
+
+    def _top_items(self, rows, limit):
+        items_agg = {}
+        for row in rows:
+            expense_rollup.merge_receipt_items(items_agg, row["receipt_items"])
 
         sorted_items = sorted(items_agg.values(), key=lambda x: x["total"], reverse=True)
         return [
@@ -154,18 +137,20 @@ class ExpenseAnalyticsService:
         """
         Generate AI-powered spending analysis.
         Sends expense summary to Claude and gets textual insights back.
+
+        Cached per company, period, day and rollup version: any change in
+        the company's expenses (or categories) produces a new key.
         """
-        cache_key = f"expense_insights_{period}"
+        company_id = self.company.pk if self.company else None
+        cache_key = (
+            f"expense_insights:{company_id}:{period}:{timezone.localdate()}:{expense_rollup.rollup_version(company_id)}"
+        )
         cached = cache.get(cache_key)
         if cached:
             return cached
 
-        breakdown = self.get_category_breakdown(period)
-        trend = self.get_monthly_trend(months=PERIOD_MAP.get(period, 3) or 12)
-        top_items = self.get_top_items(period, limit=20)
-
-        qs = self._base_queryset(period)
-        descriptions = list(qs.exclude(description="").values_list("description", flat=True)[:50])
+        rows = self._rows(period)
+        breakdown = self._breakdown(rows)
 
         total = sum(b["total"] for b in breakdown)
         if total == 0:
@@ -175,18 +160,24 @@ class ExpenseAnalyticsService:
                 "highlights": [],
             }
 
+        trend = self.get_monthly_trend(months=PERIOD_MAP.get(period, 3) or 12)
+        top_items = self._top_items(rows, limit=20)
+        descriptions = list(
+            self._base_queryset(period).exclude(description="").values_list("description", flat=True)[:30]
+        )
+
         prompt_data = {
             "period": period,
             "total_spent": total,
             "by_category": breakdown,
             "monthly_trend": trend,
             "top_items_from_receipts": top_items,
-            "expense_descriptions": descriptions[:30],
+            "expense_descriptions": descriptions,
         }
 
         try:
             result = self._call_ai_for_insights(prompt_data)
-            cache.set(cache_key, result, 3600)
+            cache.set(cache_key, result, INSIGHTS_CACHE_TIMEOUT)
             return result
         except Exception as e:
             logger.error("AI insights generation failed: %s", e, exc_info=True)
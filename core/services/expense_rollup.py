@@ -0,0 +1,321 @@
+"""
+Месячная свёртка расходов компании (``ExpenseRollup``).
+
+Аналитика расходов (``ExpenseAnalyticsService``) раньше на каждый просмотр
+страницы группировала сырые транзакции за период, а позиции чеков разбирала
+в Python по всем транзакциям с ``receipt_data``; генерация AI-инсайтов
+повторяла те же расчёты перед вызовом LLM.
+
+Теперь COMPLETED-транзакции компании с категорией свёрнуты по ключу
+(компания, месяц, категория, способ оплаты, получатель): сумма, число и
+агрегированные позиции чеков. Период аналитики = строки свёртки полных
+месяцев + живой расчёт неполного первого месяца тем же ``collect``, что
+строит свёртку.
+
+Когда пересчитывается (компания × месяц целиком):
+
+* сигналы (``core.signals.expense_rollup``) — удаление транзакции и
+  сохранение, изменившее поля свёртки, в т.ч. перенос даты или компании
+  (прежний месяц тоже); пары уходят в фоновую
+  ``refresh_expense_rollup_months_task`` через
+  :mod:`core.services.task_coalescer`;
+* ночная ``refresh_expense_rollup_task`` — последние
+  ``EXPENSE_ROLLUP_NIGHTLY_MONTHS`` месяцев; полная пересборка —
+  ``manage.py rebuild_expense_rollup``.
+
+Версия свёртки компании (``rollup_version``) меняется при каждом пересчёте
+и при правке категорий — по ней кэшируются AI-инсайты.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+from datetime import time as dt_time
+from decimal import Decimal, InvalidOperation
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import task_coalescer
+from .calendar_months import (
+    from_month_key,
+    iter_months,
+    last_months,
+    month_key,
+    month_start,
+    next_month,
+    year_chunks,
+)
+from .summary_refresh import bump_cache_versions, lock_rebuild
+
+_ZERO = Decimal("0.00")
+
+# Получатель транзакции: первое заполненное поле ``to_*``.
+COUNTERPARTIES = (
+    ("to_client_id", "client"),
+    ("to_warehouse_id", "warehouse"),
+    ("to_line_id", "line"),
+    ("to_carrier_id", "carrier"),
+    ("to_company_id", "company"),
+)
+
+_GROUP = ("from_company_id", "month", "category_id", "method", *(field for field, _ in COUNTERPARTIES))
+
+ROW_VALUES = ("month", "category_id", "total", "count", "receipt_items")
+
+
+def _aware(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def _key(row: dict) -> tuple:
+    cp_type, cp_id = "", 0
+    for field, kind in COUNTERPARTIES:
+        if row[field]:
+            cp_type, cp_id = kind, row[field]
+            break
+    return row["from_company_id"], row["month"], row["category_id"], row["method"], cp_type, cp_id
+
+
+# ---------------------------------------------------------------------------
+# Позиции чеков
+# ---------------------------------------------------------------------------
+
+
+def receipt_lines(receipt_data):
+    """Позиции чека: ``(ключ, название, qty, сумма)``; ключ — название в нижнем регистре."""
+    for item in (receipt_data or {}).get("items", []):
+        name = (item.get("name") or "").strip()
+        if not name:
+            continue
+        # qty в receipt_data приходит из JSON как int/float (например 2.5 кг);
+        # price хранится как Decimal — без приведения qty к Decimal Python
+        # ругается TypeError на price * qty.
+        try:
+            qty = Decimal(str(item.get("qty", 1)))
+        except (InvalidOperation, ValueError, TypeError):
+            qty = Decimal("1")
+        try:
+            price = Decimal(str(item.get("price", 0)))
+        except (InvalidOperation, ValueError, TypeError):
+            price = Decimal("0")
+        yield name.lower(), name, qty, price * qty
+
+
+def merge_receipt_items(target: dict, items: dict) -> None:
+    """Добавить позиции (из свёртки — суммы строками, из живого расчёта — Decimal)."""
+    for key, item in items.items():
+        entry = target.setdefault(key, {"name": item["name"], "qty": Decimal("0"), "total": Decimal("0"), "count": 0})
+        entry["qty"] += Decimal(str(item["qty"]))
+        entry["total"] += Decimal(str(item["total"]))
+        entry["count"] += item["count"]
+
+
+def _dump_items(items: dict) -> dict:
+    return {
+        key: {"name": item["name"], "qty": str(item["qty"]), "total": str(item["total"]), "count": item["count"]}
+        for key, item in sorted(items.items())
+    }
+
+
+# ---------------------------------------------------------------------------
+# Расчёт по транзакциям
+# ---------------------------------------------------------------------------
+
+
+def collect(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    company_ids: Iterable[int] | None = None,
+    **filters,
+) -> dict[tuple, dict]:
+    """Расходы за ``[start, end)``: ``{(компания, месяц, категория, способ, тип получателя, id): суммы}``.
+
+    ``filters`` — дополнительные условия на ``Transaction`` (те же имена
+    полей есть у ``ExpenseRollup``: ``method``, ``category__category_type``).
+    """
+    from core.models_billing import Transaction
+
+    qs = Transaction.objects.filter(status="COMPLETED", from_company__isnull=False, category__isnull=False, **filters)
+    if company_ids is not None:
+        qs = qs.filter(from_company_id__in=list(company_ids))
+    if start is not None:
+        qs = qs.filter(date__gte=start)
+    if end is not None:
+        qs = qs.filter(date__lt=end)
+    qs = qs.annotate(month=TruncMonth("date", output_field=DateField()))
+
+    rows: dict[tuple, dict] = {}
+    for row in qs.values(*_GROUP).annotate(amount=Sum("amount"), cnt=Count("id")).order_by():
+        entry = rows.setdefault(_key(row), {"total": _ZERO, "count": 0, "receipt_items": {}})
+        entry["total"] += row["amount"] or _ZERO
+        entry["count"] += row["cnt"]
+
+    for row in qs.exclude(receipt_data__isnull=True).values(*_GROUP, "receipt_data").order_by():
+        items = rows[_key(row)]["receipt_items"]
+        for key, name, qty, amount in receipt_lines(row["receipt_data"]):
+            merge_receipt_items(items, {key: {"name": name, "qty": qty, "total": amount, "count": 1}})
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Свёртка
+# ---------------------------------------------------------------------------
+
+
+def _rewrite(first: date, last: date, company_ids: set[int] | None = None) -> int:
+    """Пересобрать строки месяцев ``first..last`` (всех компаний или указанных).
+
+    Агрегаты читаются в той же транзакции под блокировкой месяцев:
+    параллельная пересборка ждёт и не запишет поверх свежих строк старые.
+    """
+    from core.models import ExpenseRollup
+
+    with transaction.atomic():
+        lock_rebuild("expense_rollup", (month_key(month) for month in iter_months(first, last)))
+        rows = collect(_aware(first), _aware(next_month(last)), company_ids=company_ids)
+        objs = [
+            ExpenseRollup(
+                company_id=company_id,
+                month=month,
+                category_id=category_id,
+                method=method,
+                counterparty_type=cp_type,
+                counterparty_id=cp_id,
+                total=entry["total"],
+                count=entry["count"],
+                receipt_items=_dump_items(entry["receipt_items"]),
+            )
+            for (company_id, month, category_id, method, cp_type, cp_id), entry in rows.items()
+        ]
+        stale = ExpenseRollup.objects.filter(month__gte=first, month__lte=last)
+        if company_ids is not None:
+            stale = stale.filter(company_id__in=company_ids)
+        stale.delete()
+        ExpenseRollup.objects.bulk_create(objs, batch_size=500)
+    return len(objs)
+
+
+def refresh_months(pairs: Iterable[tuple[int | None, date | None]]) -> int:
+    """Пересчитать пары (компания, месяц). Возвращает число записанных строк."""
+    by_month: dict[date, set[int]] = defaultdict(set)
+    for company_id, day in pairs:
+        if company_id and day:
+            by_month[month_start(day)].add(company_id)
+    written = 0
+    for month, company_ids in sorted(by_month.items()):
+        written += _rewrite(month, month, company_ids)
+    if by_month:
+        bump_versions(set().union(*by_month.values()))
+    return written
+
+
+def rebuild_rollup(*, months: int | None = None) -> dict[str, int]:
+    """Пересобрать последние ``months`` месяцев (``None`` — всю историю)."""
+    from core.models import ExpenseRollup
+    from core.models_billing import Transaction
+
+    today = timezone.localdate()
+    if months is not None:
+        first = last_months(today, months)
+        last = today
+    else:
+        bounds = Transaction.objects.filter(from_company__isnull=False, category__isnull=False).aggregate(
+            lo=Min("date"), hi=Max("date")
+        )
+        if not bounds["lo"]:
+            deleted, _ = ExpenseRollup.objects.all().delete()
+            bump_versions()
+            return {"months": 0, "rows": 0, "deleted": deleted}
+        first = month_start(timezone.localtime(bounds["lo"]).date())
+        last = max(today, timezone.localtime(bounds["hi"]).date())
+
+    all_months = list(iter_months(first, last))
+    deleted = 0
+    if months is None:
+        deleted, _ = ExpenseRollup.objects.exclude(month__in=all_months).delete()
+    written = sum(_rewrite(chunk[0], chunk[-1]) for chunk in year_chunks(all_months))
+    bump_versions()
+    return {"months": len(all_months), "rows": written, "deleted": deleted}
+
+
+def period_rows(company, start: datetime | None = None, **filters) -> list[dict]:
+    """Строки расходов компании с ``start`` (``None`` — вся история).
+
+    Полные месяцы — из свёртки, месяц, в который попадает ``start``, —
+    живым расчётом с точной границы. Строки: ``month``, ``category_id``,
+    ``total``, ``count``, ``receipt_items``.
+    """
+    from core.models import ExpenseRollup
+
+    if company is None:
+        return []
+    qs = ExpenseRollup.objects.filter(company=company, **filters)
+    if start is None:
+        return list(qs.values(*ROW_VALUES))
+
+    first = month_start(timezone.localtime(start).date())
+    if _aware(first) == start:
+        return list(qs.filter(month__gte=first).values(*ROW_VALUES))
+
+    full = next_month(first)
+    rows = list(qs.filter(month__gte=full).values(*ROW_VALUES))
+    for (_company, month, category_id, *_rest), entry in collect(
+        start, _aware(full), company_ids=[company.pk], **filters
+    ).items():
+        rows.append({"month": month, "category_id": category_id, **entry})
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Версии свёртки (ключи кэша AI-инсайтов)
+# ---------------------------------------------------------------------------
+
+_ALL_VERSION = "expense_rollup:v:all"
+
+
+def _company_version_key(company_id: int) -> str:
+    return f"expense_rollup:v:{company_id}"
+
+
+def bump_versions(company_ids: Iterable[int] | None = None) -> None:
+    """Сменить версию свёртки компаний (``None`` — всех: пересборка, правка категорий)."""
+    if company_ids is None:
+        bump_cache_versions([_ALL_VERSION])
+    else:
+        bump_cache_versions(_company_version_key(pk) for pk in company_ids)
+
+
+def rollup_version(company_id: int | None) -> str:
+    keys = [_company_version_key(company_id or 0), _ALL_VERSION]
+    versions = cache.get_many(keys)
+    return ".".join(str(versions.get(key, 0)) for key in keys)
+
+
+# ---------------------------------------------------------------------------
+# Фоновый пересчёт
+# ---------------------------------------------------------------------------
+
+# Ключ очереди: ``company_id * _COMPANY_FACTOR + YYYYMM``.
+_COMPANY_FACTOR = 1_000_000
+
+
+def schedule_refresh(pairs: Iterable[tuple[int | None, date | None]]) -> None:
+    """Пересчитать пары (компания, день → месяц) в фоне после коммита текущей транзакции."""
+    task_coalescer.schedule(
+        task_coalescer.JOB_EXPENSE_MONTHS,
+        (company_id * _COMPANY_FACTOR + month_key(day) for company_id, day in pairs if company_id and day),
+    )
+
+
+def refresh_month_keys(keys: Iterable[int]) -> int:
+    """Пересчитать пары из ключей очереди (``refresh_expense_rollup_months_task``)."""
+    return refresh_months(
+        (company_id, from_month_key(key)) for company_id, key in (divmod(int(key), _COMPANY_FACTOR) for key in keys)
+    )
@@ -0,0 +1,124 @@
+"""
+Кэш LLM-извлечений по содержимому документа.
+
+Аудит счетов, сканы (титулы, dock receipts, пакеты «одним файлом») и чеки
+отправляют в модель один и тот же документ при каждом ретрае и
+переобработке. Здесь результат запоминается в ``LLMExtractionCache`` по
+ключу (хэш содержимого, версия промпта, модель):
+
+    data = cached_extraction(
+        LLMExtractionCache.PIPELINE_SCAN,
+        content_hash=hash_images(images),
+        prompt=(system_prompt, user_text),
+        model=model,
+        compute=lambda: _call_api(...),
+        use_cache=use_cache,
+    )
+
+``use_cache=False`` — обход кэша для конкретного вызова (ответ всё равно
+сохраняется, заменяя старый). Пустые ответы и ответы с ``error`` не
+кэшируются: их стоит повторить.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from typing import Any, Callable, Iterable
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))
+
+
+def hash_images(images: Iterable[tuple[str, str]]) -> str:
+    """Хэш набора ``(media_type, base64)`` страниц — порядок страниц важен."""
+    digest = hashlib.sha256()
+    for media_type, b64 in images:
+        digest.update(media_type.encode("ascii"))
+        digest.update(b"\0")
+        digest.update(b64.encode("ascii"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def prompt_version(*parts: str) -> str:
+    """Версия промпта = хэш всех его частей (system + user text)."""
+    return hash_text("\0".join(parts))[:32]
+
+
+def _is_cacheable(result: Any) -> bool:
+    return isinstance(result, dict) and bool(result) and not result.get("error")
+
+
+def cached_extraction(
+    pipeline: str,
+    *,
+    content_hash: str,
+    prompt: tuple[str, ...],
+    model: str,
+    compute: Callable[[], dict],
+    use_cache: bool = True,
+) -> dict:
+    """Результат извлечения из кэша или из ``compute()`` (с сохранением)."""
+    from core.models import LLMExtractionCache
+
+    version = prompt_version(*prompt)
+    key = {"content_hash": content_hash, "prompt_version": version, "model": model}
+
+    if use_cache:
+        row = LLMExtractionCache.objects.filter(**key).only("pk", "result").first()
+        if row is not None:
+            LLMExtractionCache.objects.filter(pk=row.pk).update(hits=F("hits") + 1, last_hit_at=timezone.now())
+            logger.info("extraction_cache: HIT %s %s (%s)", pipeline, content_hash[:12], model)
+            return row.result
+
+    result = compute()
+    if not _is_cacheable(result):
+        return result
+
+    logger.info("extraction_cache: MISS %s %s (%s)", pipeline, content_hash[:12], model)
+    try:
+        with transaction.atomic():
+            LLMExtractionCache.objects.update_or_create(**key, defaults={"pipeline": pipeline, "result": result})
+    except IntegrityError:
+        # Параллельный воркер успел сохранить тот же ключ — его ответ не хуже.
+        pass
+    except Exception:
+        # Кэш — оптимизация: сбой записи не должен ронять извлечение.
+        logger.exception("extraction_cache: не удалось сохранить результат %s", pipeline)
+    return result
+
+
+def get_cache_stats() -> list[dict]:
+    """Hit/miss по пайплайнам: строка кэша = промах, ``hits`` = попадания."""
+    from core.models import LLMExtractionCache
+
+    rows = (
+        LLMExtractionCache.objects.values("pipeline")
+        .annotate(misses=Count("id"), hits=Sum("hits"))
+        .order_by("pipeline")
+    )
+    out = []
+    for row in rows:
+        hits = row["hits"] or 0
+        total = hits + row["misses"]
+        out.append(
+            {
+                "pipeline": row["pipeline"],
+                "hits": hits,
+                "misses": row["misses"],
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+            }
+        )
+    return out
@@ -16,6 +16,8 @@ from __future__ import annotations
 import base64
 import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 
@@ -42,6 +44,10 @@ class GmailHistoryExpired(RuntimeError):
 # set для фильтрации.
 _HISTORY_TYPES_ADDED = ["messageAdded"]
 
+# Gmail batch HTTP принимает до 100 запросов, но рекомендует не больше 50 —
+# крупнее батчи чаще ловят 429 rateLimitExceeded на отдельных элементах.
+_MESSAGES_BATCH_SIZE = 50
+
 
 @dataclass
 class ParsedAttachment:
@@ -219,10 +225,97 @@ class GmailApiClient:
         )
         return parse_gmail_message(raw)
 
+    def get_messages(self, gmail_ids: Iterable[str]) -> dict[str, ParsedMessage | Exception]:
+        """Пакетный ``messages.get(format=full)`` через Gmail batch HTTP.
+
+        Один HTTP-запрос на ``_MESSAGES_BATCH_SIZE`` писем вместо запроса на
+        каждое. Возвращает ``{gmail_id: ParsedMessage | Exception}`` — ошибка
+        отдельного письма (404, 429, битый payload) не роняет весь батч.
+        Элементы, отбитые лимитом (429), повторяются по одному через
+        :meth:`get_message`.
+        """
+        ids = list(dict.fromkeys(gid for gid in gmail_ids if gid))
+        out: dict[str, ParsedMessage | Exception] = {}
+
+        def _callback(request_id, response, exception):
+            if exception is not None:
+                out[request_id] = exception
+                return
+            try:
+                out[request_id] = parse_gmail_message(response)
+            except Exception as exc:
+                out[request_id] = exc
+
+        for chunk in _chunked(ids, _MESSAGES_BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=_callback)
+            for gid in chunk:
+                batch.add(
+                    self.service.users().messages().get(userId=self._user_email, id=gid, format="full"),
+                    request_id=gid,
+                )
+            try:
+                batch.execute()
+            except Exception as exc:
+                logger.warning("[gmail_client] batch messages.get failed for %d ids: %s", len(chunk), exc)
+                for gid in chunk:
+                    out.setdefault(gid, exc)
+
+        for gid, result in list(out.items()):
+            if _http_status(result) == 429:
+                try:
+                    out[gid] = self.get_message(gid)
+                except Exception as exc:
+                    out[gid] = exc
+        return out
+
     def get_attachment(self, gmail_id: str, attachment_id: str) -> bytes:
         """messages.attachments.get → raw bytes (декодированные из base64url)."""
+        return self._fetch_attachment(self.service, gmail_id, attachment_id)
+
+    def get_attachments(
+        self,
+        items: Iterable[tuple[str, str]],
+        *,
+        max_workers: int = 4,
+    ) -> dict[tuple[str, str], bytes | Exception]:
+        """Параллельное скачивание вложений: ``{(gmail_id, attachment_id): bytes | Exception}``.
+
+        Объект ``service`` (httplib2) не потокобезопасен, поэтому каждый
+        поток пула строит собственный — один раз на поток, а не на файл.
+        """
+        pairs = list(dict.fromkeys(items))
+        out: dict[tuple[str, str], bytes | Exception] = {}
+        if not pairs:
+            return out
+
+        if max_workers < 2 or len(pairs) == 1:
+            for gmail_id, attachment_id in pairs:
+                try:
+                    out[(gmail_id, attachment_id)] = self.get_attachment(gmail_id, attachment_id)
+                except Exception as exc:
+                    out[(gmail_id, attachment_id)] = exc
+            return out
+
+        local = threading.local()
+
+        def _fetch(pair: tuple[str, str]) -> bytes:
+            service = getattr(local, "service", None)
+            if service is None:
+                service = local.service = self._build_service()
+            return self._fetch_attachment(service, *pair)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs)), thread_name_prefix="gmail-att") as pool:
+            futures = {pool.submit(_fetch, pair): pair for pair in pairs}
+            for future in as_completed(futures):
+                try:
+                    out[futures[future]] = future.result()
+                except Exception as exc:
+                    out[futures[future]] = exc
+        return out
+
+    def _fetch_attachment(self, service, gmail_id: str, attachment_id: str) -> bytes:
         resp = (
-            self.service.users()
+            service.users()
             .messages()
             .attachments()
             .get(
@@ -460,6 +553,17 @@ def _b64url_decode(data: str) -> bytes:
     return base64.urlsafe_b64decode(data + padding)
 
 
+def _http_status(exc: Any) -> int | None:
+    """HTTP-статус ``HttpError`` (или None для прочих исключений/результатов)."""
+    if not isinstance(exc, Exception):
+        return None
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "resp", None), "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
 def _chunked(seq: list, size: int) -> Iterator[list]:
     """Режет список на чанки указанного размера — для batch-API с лимитами."""
     for i in range(0, len(seq), size):
@@ -1,7 +1,7 @@
 """
 InvoiceAuditService
 ===================
-1. Извлекает текст из PDF (pdfplumber)
+1. Извлекает текст из PDF (PyMuPDF, для сканов — рендер страниц, см. pdf_processing)
 2. Отправляет текст в OpenAI GPT-4o с промптом на структурированное извлечение
 3. Запускает движок сравнения с данными в БД
 4. Сохраняет результаты в модель InvoiceAudit
@@ -81,49 +81,65 @@ SYSTEM_PROMPT = f"""Ты — система обработки логистич
 """
 
 
+# Аудиторские сканы рендерим чуть крупнее сканов титулов: мелкий шрифт
+# таблиц счёта после ужатия до 1568 px должен оставаться читаемым.
+_AUDIT_RENDER_DPI = 200
+
+
 def extract_text_from_pdf(pdf_path: str) -> str:
-    """Извлекает текст из PDF файла."""
+    """Извлекает текст из PDF файла (PyMuPDF, запасной путь — pdfplumber)."""
+    from core.services.pdf_processing import extract_text
+
     try:
-        import pdfplumber
-
-        with pdfplumber.open(pdf_path) as pdf:
-            pages_text = []
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    pages_text.append(text)
-            return "\n\n".join(pages_text)
-    except ImportError:
-        logger.error("pdfplumber не установлен. Запустите: pip install pdfplumber")
-        raise
+        return extract_text(pdf_path)
     except Exception as e:
         logger.error(f"Ошибка при чтении PDF: {e}")
         raise
 
 
-def extract_images_from_pdf(pdf_path: str) -> list[str]:
-    """Renders PDF pages to base64-encoded PNG images for Vision API (scanned PDFs)."""
-    import base64
+def extract_images_from_pdf(pdf_path: str) -> list[tuple[str, str]]:
+    """Renders PDF pages to ``(media_type, base64)`` JPEG for Vision API (scanned PDFs).
+
+    Страницы ужимаются под лимиты Vision, многостраничные сканы рендерятся
+    параллельно и кэшируются на диске по хэшу файла (см. ``pdf_processing``).
+    """
+    from core.services.pdf_processing import render_pages_jpeg
+
+    return render_pages_jpeg(pdf_path, dpi=_AUDIT_RENDER_DPI)
 
-    try:
-        import fitz  # PyMuPDF
-    except ImportError:
-        logger.error("PyMuPDF не установлен. Запустите: pip install pymupdf")
-        raise
 
-    images = []
-    doc = fitz.open(pdf_path)
-    for page in doc:
-        pix = page.get_pixmap(dpi=200)
-        images.append(base64.b64encode(pix.tobytes("png")).decode("utf-8"))
-    doc.close()
-    return images
+_TEXT_INSTRUCTION = "Вот текст счёта-фактуры. Извлеки данные по схеме. Верни ТОЛЬКО JSON, без markdown:"
+_IMAGES_INSTRUCTION = "Вот отсканированный счёт-фактура. Извлеки данные по схеме. Верни ТОЛЬКО JSON, без markdown."
 
 
-def call_llm(text: str) -> dict:
+def _audit_model() -> str:
+    from django.conf import settings
+
+    return getattr(settings, "AGENT_MODEL", "claude-sonnet-5")
+
+
+def call_llm(text: str, *, use_cache: bool = True) -> dict:
     """
     Отправляет текст счёта в Anthropic Claude и получает структурированный JSON.
+
+    Ответ кэшируется по хэшу текста (см. ``extraction_cache``): повторная
+    обработка того же счёта в API не уходит. ``use_cache=False`` — обход.
     """
+    from core.models import LLMExtractionCache
+    from core.services.extraction_cache import cached_extraction, hash_text
+
+    model = _audit_model()
+    return cached_extraction(
+        LLMExtractionCache.PIPELINE_INVOICE_AUDIT,
+        content_hash=hash_text(text),
+        prompt=(SYSTEM_PROMPT, _TEXT_INSTRUCTION),
+        model=model,
+        compute=lambda: _request_text_extraction(text, model),
+        use_cache=use_cache,
+    )
+
+
+def _request_text_extraction(text: str, model: str) -> dict:
     import os
 
     try:
@@ -138,12 +154,10 @@ def call_llm(text: str) -> dict:
 
     client = anthropic.Anthropic(api_key=api_key)
 
-    from django.conf import settings
-
-    user_message = f"Вот текст счёта-фактуры. Извлеки данные по схеме. Верни ТОЛЬКО JSON, без markdown:\n\n{text}"
+    user_message = f"{_TEXT_INSTRUCTION}\n\n{text}"
 
     response = client.messages.create(
-        model=getattr(settings, "AGENT_MODEL", "claude-sonnet-5"),
+        model=model,
         max_tokens=4000,
         system=SYSTEM_PROMPT,
         messages=[
@@ -213,11 +227,28 @@ def _sanitize_extracted(data) -> dict:
     return data
 
 
-def call_llm_with_images(images_b64: list[str]) -> dict:
+def call_llm_with_images(images: list[tuple[str, str]], *, use_cache: bool = True) -> dict:
     """
     Sends PDF page images to Anthropic Claude Vision API for structured extraction.
     Used as fallback when PDF has no extractable text (scanned documents).
+
+    Ответ кэшируется по хэшу страниц, как и в ``call_llm``.
     """
+    from core.models import LLMExtractionCache
+    from core.services.extraction_cache import cached_extraction, hash_images
+
+    model = _audit_model()
+    return cached_extraction(
+        LLMExtractionCache.PIPELINE_INVOICE_AUDIT,
+        content_hash=hash_images(images),
+        prompt=(SYSTEM_PROMPT, _IMAGES_INSTRUCTION),
+        model=model,
+        compute=lambda: _request_images_extraction(images, model),
+        use_cache=use_cache,
+    )
+
+
+def _request_images_extraction(images: list[tuple[str, str]], model: str) -> dict:
     import os
 
     try:
@@ -233,28 +264,21 @@ def call_llm_with_images(images_b64: list[str]) -> dict:
     client = anthropic.Anthropic(api_key=api_key)
 
     content_blocks = []
-    for b64 in images_b64:
+    for media_type, b64 in images:
         content_blocks.append(
             {
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/png",
+                    "media_type": media_type,
                     "data": b64,
                 },
             }
         )
-    content_blocks.append(
-        {
-            "type": "text",
-            "text": "Вот отсканированный счёт-фактура. Извлеки данные по схеме. Верни ТОЛЬКО JSON, без markdown.",
-        }
-    )
-
-    from django.conf import settings
+    content_blocks.append({"type": "text", "text": _IMAGES_INSTRUCTION})
 
     response = client.messages.create(
-        model=getattr(settings, "AGENT_MODEL", "claude-sonnet-5"),
+        model=model,
         max_tokens=4000,
         system=SYSTEM_PROMPT,
         messages=[{"role": "user", "content": content_blocks}],
@@ -327,53 +351,181 @@ def _find_cars_by_vins(vins: set, brand_hints: dict | None = None) -> dict:
     return result
 
 
-def _fuzzy_match_service_name(description: str, entity_name_map: dict) -> int | None:
+def _normalize_service_name(s: str) -> str:
+    """Верхний регистр без диакритики: ``Sandėliavimas`` → ``SANDELIAVIMAS``."""
+    import unicodedata
+
+    s = s.strip().upper()
+    s = unicodedata.normalize("NFD", s)
+    return "".join(c for c in s if unicodedata.category(c) != "Mn")
+
+
+# Порог fuzzy-сравнения названий (толерантность к OCR-ошибкам).
+_FUZZY_SERVICE_RATIO = 0.8
+# Сколько результатов description → service_id помнит один матчер.
+_MATCHER_MEMO_SIZE = 2048
+
+
+class ServiceNameMatcher:
     """
-    Match invoice description against entity service names.
-    Handles OCR errors via fuzzy matching (SequenceMatcher).
-    Returns service_id or None.
+    Предкомпилированный матчер названий услуг одного контрагента.
+
+    Каталог нормализуется один раз при создании; дальше каждая строка счёта
+    классифицируется без повторной нормализации всех названий:
+
+    1. точное совпадение — через индекс ``normalized → service_id``;
+    2. вхождение — по уже нормализованным названиям;
+    3. fuzzy (SequenceMatcher) — только по кандидатам, у которых верхняя
+       граница ratio (по длине и мультимножеству символов) не ниже порога и
+       не ниже текущего лучшего результата.
+
+    Результат ``match`` совпадает с прежним ``_fuzzy_match_service_name``
+    (включая порядок приоритета при равенстве), а описания мемоизируются —
+    одинаковые строки многостраничного счёта и повторных аудитов считаются
+    один раз.
     """
-    import unicodedata
-    from difflib import SequenceMatcher
 
-    if not entity_name_map or not description:
+    def __init__(self, entity_name_map: dict):
+        from collections import Counter
+
+        # Порядок важен: при равных условиях побеждает первое название.
+        self._names: list[tuple[str, int]] = []
+        self._exact: dict[str, int] = {}
+        for name, sid in (entity_name_map or {}).items():
+            norm = _normalize_service_name(name)
+            self._names.append((norm, sid))
+            self._exact.setdefault(norm, sid)
+        self._char_counts = [Counter(norm) for norm, _ in self._names]
+        self._memo: dict[str, int | None] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._names)
+
+    def match(self, description: str) -> int | None:
+        """Возвращает service_id для описания строки счёта или None."""
+        if not self._names or not description:
+            return None
+        try:
+            return self._memo[description]
+        except KeyError:
+            pass
+        sid = self._match_uncached(_normalize_service_name(description))
+        if len(self._memo) >= _MATCHER_MEMO_SIZE:
+            self._memo.pop(next(iter(self._memo)))
+        self._memo[description] = sid
+        return sid
+
+    def _match_uncached(self, desc_norm: str) -> int | None:
+        from collections import Counter
+        from difflib import SequenceMatcher
+
+        # 1. Точное совпадение (нормализованное)
+        sid = self._exact.get(desc_norm)
+        if sid is not None:
+            return sid
+
+        # 2. Вхождение (нормализованное)
+        for name_norm, sid in self._names:
+            if name_norm in desc_norm or desc_norm in name_norm:
+                return sid
+
+        # 3. Fuzzy. ratio = 2*M / (len(a) + len(b)), где M не больше пересечения
+        # мультимножеств символов — это точная верхняя граница, по которой
+        # отсекаем кандидатов до дорогого SequenceMatcher.
+        desc_counts_by_len: dict[int, Counter] = {}
+        bounded = []
+        for idx, (name_norm, _sid) in enumerate(self._names):
+            prefix_len = min(len(desc_norm), len(name_norm) + 5)
+            total = len(name_norm) + prefix_len
+            if not total:
+                continue
+            prefix_counts = desc_counts_by_len.get(prefix_len)
+            if prefix_counts is None:
+                prefix_counts = Counter(desc_norm[:prefix_len])
+                desc_counts_by_len[prefix_len] = prefix_counts
+            common = sum((self._char_counts[idx] & prefix_counts).values())
+            bound = 2.0 * common / total
+            if bound >= _FUZZY_SERVICE_RATIO:
+                bounded.append((bound, idx))
+
+        # Самые перспективные — первыми; как только граница ниже лучшего
+        # найденного ratio, дальше искать бессмысленно.
+        bounded.sort(key=lambda t: (-t[0], t[1]))
+        best_idx = None
+        best_ratio = 0.0
+        matchers: dict[int, SequenceMatcher] = {}
+        for bound, idx in bounded:
+            if bound < best_ratio:
+                break
+            name_norm = self._names[idx][0]
+            desc_prefix = desc_norm[: len(name_norm) + 5]
+            # SequenceMatcher кэширует разбор seq2 — переиспользуем его для
+            # названий одинаковой длины (у них одинаковый префикс описания).
+            sm = matchers.get(len(desc_prefix))
+            if sm is None:
+                sm = SequenceMatcher(None)
+                sm.set_seq2(desc_prefix)
+                matchers[len(desc_prefix)] = sm
+            sm.set_seq1(name_norm)
+            ratio = sm.ratio()
+            if ratio > best_ratio or (ratio == best_ratio and best_idx is not None and idx < best_idx):
+                best_ratio = ratio
+                best_idx = idx
+
+        if best_idx is not None and best_ratio >= _FUZZY_SERVICE_RATIO:
+            return self._names[best_idx][1]
         return None
 
-    def _normalize(s: str) -> str:
-        s = s.strip().upper()
-        s = unicodedata.normalize("NFD", s)
-        s = "".join(c for c in s if unicodedata.category(c) != "Mn")
-        return s
 
-    desc_norm = _normalize(description)
+# (provider_type, entity_id) → (fingerprint каталога, ServiceNameMatcher).
+# Живёт в процессе воркера: повторные аудиты того же контрагента переиспользуют
+# нормализацию и мемо описаний, пока каталог услуг не изменился.
+_service_matcher_cache: dict[tuple[str, int], tuple[tuple, "ServiceNameMatcher"]] = {}
 
-    # 1. Exact match (normalized)
-    for name, sid in entity_name_map.items():
-        if _normalize(name) == desc_norm:
-            return sid
 
-    # 2. Containment match (normalized)
-    for name, sid in entity_name_map.items():
-        name_norm = _normalize(name)
-        if name_norm in desc_norm or desc_norm in name_norm:
-            return sid
+def get_service_matcher(provider_type: str | None, entity_id) -> ServiceNameMatcher:
+    """
+    Загружает названия услуг контрагента одним запросом и возвращает матчер.
 
-    # 3. Fuzzy match — tolerant to OCR errors (threshold 80%)
-    best_sid = None
-    best_ratio = 0.0
-    for name, sid in entity_name_map.items():
-        name_norm = _normalize(name)
-        # Compare against the beginning of desc (same length as service name)
-        desc_prefix = desc_norm[: len(name_norm) + 5]
-        ratio = SequenceMatcher(None, name_norm, desc_prefix).ratio()
-        if ratio > best_ratio:
-            best_ratio = ratio
-            best_sid = sid
-
-    if best_ratio >= 0.8:
-        return best_sid
+    Матчер строится один раз на состав каталога и переиспользуется между
+    аудитами; при любом изменении названий/состава услуг он пересобирается.
+    """
+    entity_name_map: dict = {}  # name → service_id
+    if provider_type and entity_id:
+        svc_model = _get_service_model(provider_type)
+        filter_field = _get_entity_field(provider_type)
+        if svc_model and filter_field:
+            for svc in svc_model.objects.filter(**{filter_field: entity_id}):
+                entity_name_map[svc.name.strip().upper()] = svc.pk
+                if getattr(svc, "short_name", None):
+                    entity_name_map[svc.short_name.strip().upper()] = svc.pk
+
+    if not entity_name_map:
+        return ServiceNameMatcher({})
+
+    key = (provider_type, entity_id)
+    fingerprint = tuple(entity_name_map.items())
+    cached = _service_matcher_cache.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    matcher = ServiceNameMatcher(entity_name_map)
+    _service_matcher_cache[key] = (fingerprint, matcher)
+    return matcher
 
-    return None
+
+def _fuzzy_match_service_name(description: str, entity_name_map: dict) -> int | None:
+    """
+    Match invoice description against entity service names.
+    Handles OCR errors via fuzzy matching (SequenceMatcher).
+    Returns service_id or None.
+
+    Разовый вызов; для классификации многих строк используйте
+    ``ServiceNameMatcher`` / ``get_service_matcher``.
+    """
+    if not entity_name_map or not description:
+        return None
+    return ServiceNameMatcher(entity_name_map).match(description)
 
 
 def _get_service_model(provider_type: str):
@@ -393,7 +545,7 @@ def _get_entity_field(provider_type: str) -> str | None:
     }.get(provider_type)
 
 
-def compare_with_db(extracted: dict) -> dict:
+def compare_with_db(extracted: dict, service_matcher: ServiceNameMatcher | None = None) -> dict:
     """
     Сравнивает извлечённые данные из счёта с данными в БД.
     Использует маппинг контрагента для сопоставления с правильными услугами.
@@ -419,18 +571,8 @@ def compare_with_db(extracted: dict) -> dict:
     entity_id = counterparty_conf.get("entity_id") if counterparty_conf else None
 
     # Загружаем все услуги контрагента для сопоставления по названию
-    entity_services = {}  # service_id → service_obj
-    entity_name_map = {}  # normalized_name → service_id
-    if provider_type and entity_id:
-        svc_model = _get_service_model(provider_type)
-        if svc_model:
-            filter_field = _get_entity_field(provider_type)
-            if filter_field:
-                for svc in svc_model.objects.filter(**{filter_field: entity_id}):
-                    entity_services[svc.pk] = svc
-                    entity_name_map[svc.name.strip().upper()] = svc.pk
-                    if hasattr(svc, "short_name") and svc.short_name:
-                        entity_name_map[svc.short_name.strip().upper()] = svc.pk
+    if service_matcher is None:
+        service_matcher = get_service_matcher(provider_type, entity_id)
 
     # Собираем все VIN и brand-подсказки из счёта
     all_vins_in_invoice = set()
@@ -473,7 +615,7 @@ def compare_with_db(extracted: dict) -> dict:
                 return matched, total
 
         # 2. Fallback: fuzzy name matching
-        name_sid = _fuzzy_match_service_name(description, entity_name_map)
+        name_sid = service_matcher.match(description)
         if name_sid is not None:
             matched = [s for s in services_list if s.service_id == name_sid]
             if matched:
@@ -748,6 +890,7 @@ def compare_with_db(extracted: dict) -> dict:
         "cars_missing": cars_missing,
         "issues_count": issues_count,
         "found_cars": found_cars,
+        "service_matcher": service_matcher,
     }
 
 
@@ -854,7 +997,9 @@ def _find_car_service(car, provider_type: str, service_id: int):
         return None
 
 
-def create_supplier_costs(audit, extracted: dict, found_cars: dict) -> dict:
+def create_supplier_costs(
+    audit, extracted: dict, found_cars: dict, service_matcher: ServiceNameMatcher | None = None
+) -> dict:
     """
     Создаёт записи SupplierCost для каждого VIN+услуги из извлечённых данных.
     Использует маппинг из invoice_service_mapping.json + сопоставление по названию для привязки к CarService.
@@ -862,6 +1007,7 @@ def create_supplier_costs(audit, extracted: dict, found_cars: dict) -> dict:
     Returns: dict с метриками привязки {linked, unlinked, no_mapping}.
     """
     from core.models_invoice_audit import SupplierCost
+    from core.services.car_profitability import schedule_refresh as schedule_profitability_refresh
 
     mapping = _load_service_mapping()
     # LLM может вернуть null вместо строки — dict.get(k, default) не спасает:
@@ -875,15 +1021,8 @@ def create_supplier_costs(audit, extracted: dict, found_cars: dict) -> dict:
     entity_id = counterparty_conf.get("entity_id") if counterparty_conf else None
 
     # Загружаем все услуги контрагента для name-based matching
-    entity_name_map = {}  # normalized_name → service_id
-    if provider_type and entity_id:
-        svc_model = _get_service_model(provider_type)
-        filter_field = _get_entity_field(provider_type)
-        if svc_model and filter_field:
-            for svc in svc_model.objects.filter(**{filter_field: entity_id}):
-                entity_name_map[svc.name.strip().upper()] = svc.pk
-                if hasattr(svc, "short_name") and svc.short_name:
-                    entity_name_map[svc.short_name.strip().upper()] = svc.pk
+    if service_matcher is None:
+        service_matcher = get_service_matcher(provider_type, entity_id)
 
     def _resolve_car_service(car, stype: str, description: str):
         """Найти CarService: маппинг → name matching, возвращает (car_service, status)."""
@@ -898,7 +1037,7 @@ def create_supplier_costs(audit, extracted: dict, found_cars: dict) -> dict:
                 return cs, "linked"
 
         # 2. По названию услуги (fuzzy для OCR)
-        name_sid = _fuzzy_match_service_name(description, entity_name_map)
+        name_sid = service_matcher.match(description)
         if name_sid is not None:
             cs = _find_car_service(car, provider_type, name_sid)
             if cs:
@@ -1005,6 +1144,8 @@ def create_supplier_costs(audit, extracted: dict, found_cars: dict) -> dict:
     if costs_to_create:
         SupplierCost.objects.filter(audit=audit).delete()
         SupplierCost.objects.bulk_create(costs_to_create)
+        # bulk_create без сигналов — сводку прибыли пересчитываем явно.
+        schedule_profitability_refresh(cost.car_id for cost in costs_to_create)
         logger.info(
             f"InvoiceAudit #{audit.pk}: создано {len(costs_to_create)} SupplierCost "
             f"(привязано={stats['linked']}, без услуги={stats['unlinked']}, без маппинга={stats['no_mapping']})"
@@ -1013,10 +1154,13 @@ def create_supplier_costs(audit, extracted: dict, found_cars: dict) -> dict:
     return stats
 
 
-def process_invoice_audit(audit_id: int) -> None:
+def process_invoice_audit(audit_id: int, *, use_cache: bool = True) -> None:
     """
     Основная функция обработки: читает PDF → LLM → сравнение → сохраняет.
     Вызывается асинхронно (через threading или Celery).
+
+    ``use_cache=False`` — заново спросить модель, не беря ответ из кэша
+    извлечений (например, если прошлый ответ оказался неверным).
     """
     from core.models_invoice_audit import InvoiceAudit
 
@@ -1036,14 +1180,14 @@ def process_invoice_audit(audit_id: int) -> None:
 
         if text.strip():
             # 2a. Текстовый PDF → извлечение из текста
-            extracted = call_llm(text)
+            extracted = call_llm(text, use_cache=use_cache)
         else:
             # 2b. Отсканированный PDF → рендерим страницы и отправляем в Vision API
             logger.info(f"InvoiceAudit #{audit_id}: текст не найден, используем Vision API для сканированного PDF")
-            images_b64 = extract_images_from_pdf(pdf_path)
-            if not images_b64:
+            images = extract_images_from_pdf(pdf_path)
+            if not images:
                 raise ValueError("PDF не содержит ни текста, ни изображений")
-            extracted = call_llm_with_images(images_b64)
+            extracted = call_llm_with_images(images, use_cache=use_cache)
 
         # 3. Парсим дату
         invoice_date = None
@@ -1087,7 +1231,12 @@ def process_invoice_audit(audit_id: int) -> None:
             status = InvoiceAudit.STATUS_OK
         else:
             comparison = compare_with_db(extracted)
-            create_supplier_costs(audit, extracted, comparison.get("found_cars", {}))
+            create_supplier_costs(
+                audit,
+                extracted,
+                comparison.get("found_cars", {}),
+                service_matcher=comparison.get("service_matcher"),
+            )
             if comparison["issues_count"] > 0 or comparison["cars_missing"] > 0:
                 status = InvoiceAudit.STATUS_HAS_ISSUES
             else:
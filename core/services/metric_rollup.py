@@ -0,0 +1,281 @@
+"""Даунсэмплинг метрик монитора: сырые снимки → 5 минут → час.
+
+``collect_system_metrics`` пишет широкую строку ``SystemMetric`` с JSON
+``data`` раз в 5 минут, ``ping_uptime`` — ``UptimeCheck`` раз в минуту.
+Графики за 7–90 дней агрегировали сырые таблицы на каждый запрос; теперь
+``rollup_system_metrics`` (beat, раз в 5 минут) сворачивает их по уровням:
+
+* ``5m`` — из сырых ``SystemMetric`` / ``UptimeCheck`` законченных bucket'ов;
+* ``1h`` — из ``5m`` законченных часов (min/max — по min/max, avg —
+  взвешенно по числу снимков).
+
+После свёртки у сырых строк очищается ``data``, сами строки живут
+``MONITORING_RAW_RETENTION_HOURS``. Свёртки хранятся
+``MONITORING_5M_RETENTION_DAYS`` / ``MONITORING_HOURLY_RETENTION_DAYS``.
+
+``chart_points(since, tier)`` / ``uptime_summary(since, tier)`` —
+данные для графиков /admin/system-monitor/ из нужного уровня.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TIER_SECONDS = {"5m": 300, "1h": 3600}
+
+# Колонки SystemMetric, которые сворачиваются (min/avg/max).
+ROLLUP_FIELDS = (
+    "cpu_percent",
+    "load_avg_1",
+    "mem_percent",
+    "mem_used_mb",
+    "mem_available_mb",
+    "swap_used_mb",
+    "disk_percent",
+    "gunicorn_rss_mb",
+    "celery_rss_mb",
+    "mysql_rss_mb",
+    "postgres_rss_mb",
+    "postgres_connections",
+    "postgres_db_size_mb",
+    "redis_memory_mb",
+)
+# Из JSON ``data`` переживает свёртку только длина очереди Celery.
+QUEUE_LEN_KEY = "celery_queue_len"
+
+# Точки графиков: поле → округление (None — целое).
+_CHART_FIELDS = {
+    "cpu_percent": 1,
+    "mem_percent": 1,
+    "mem_used_mb": None,
+    "mem_available_mb": None,
+    "swap_used_mb": None,
+    "disk_percent": 1,
+    "gunicorn_rss_mb": None,
+    "celery_rss_mb": None,
+    "mysql_rss_mb": None,
+    "postgres_rss_mb": None,
+    "postgres_connections": None,
+    "redis_memory_mb": 1,
+}
+
+
+def _floor(dt: datetime, seconds: int) -> datetime:
+    ts = int(dt.timestamp())
+    return dt - timedelta(seconds=ts % seconds, microseconds=dt.microsecond)
+
+
+def raw_retention() -> timedelta:
+    # Сырые точки нужны графику «24 часа» — меньше суток не храним.
+    return timedelta(hours=max(int(getattr(settings, "MONITORING_RAW_RETENTION_HOURS", 48)), 24))
+
+
+# ---------------------------------------------------------------------------
+# Свёртка
+# ---------------------------------------------------------------------------
+
+
+def _last_bucket(tier: str) -> datetime | None:
+    from core.models import SystemMetricRollup
+
+    return SystemMetricRollup.objects.filter(tier=tier).aggregate(last=Max("bucket_start"))["last"]
+
+
+def _resume_from(tier: str, source_start: datetime | None) -> datetime | None:
+    """Начало первого несвёрнутого bucket'а уровня.
+
+    Сворачиваются только законченные bucket'ы, поэтому готовые не
+    пересчитываются: у их сырых строк ``data`` уже очищен.
+    """
+    last = _last_bucket(tier)
+    if last is not None:
+        return last + timedelta(seconds=TIER_SECONDS[tier])
+    return _floor(source_start, TIER_SECONDS[tier]) if source_start else None
+
+
+def _save_buckets(tier: str, buckets: dict[datetime, dict[str, Any]]) -> int:
+    from core.models import SystemMetricRollup
+
+    with transaction.atomic():
+        for bucket_start, values in buckets.items():
+            SystemMetricRollup.objects.update_or_create(tier=tier, bucket_start=bucket_start, defaults=values)
+    return len(buckets)
+
+
+def rollup_raw(now: datetime | None = None) -> int:
+    """Свернуть сырые снимки и пинги законченных 5-минутных bucket'ов в ``5m``."""
+    from core.models import SystemMetric, UptimeCheck
+
+    end = _floor(now or timezone.now(), TIER_SECONDS["5m"])
+    first = SystemMetric.objects.aggregate(first=Min("created_at"))["first"]
+    first_ping = UptimeCheck.objects.aggregate(first=Min("created_at"))["first"]
+    start = _resume_from("5m", min(filter(None, (first, first_ping)), default=None))
+    if start is None or start >= end:
+        return 0
+
+    samples: dict[datetime, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    rows = SystemMetric.objects.filter(created_at__gte=start, created_at__lt=end).values_list(
+        "created_at", *ROLLUP_FIELDS, "data__celery_queue__queue_len"
+    )
+    for created_at, *values, queue_len in rows:
+        bucket = samples[_floor(created_at, TIER_SECONDS["5m"])]
+        bucket["_n"].append(1)
+        for name, value in zip((*ROLLUP_FIELDS, QUEUE_LEN_KEY), (*values, queue_len), strict=True):
+            if value is not None:
+                bucket[name].append(float(value))
+
+    pings: dict[datetime, list[tuple[bool, int | None]]] = defaultdict(list)
+    for created_at, ok, response_ms in UptimeCheck.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    ).values_list("created_at", "ok", "response_ms"):
+        pings[_floor(created_at, TIER_SECONDS["5m"])].append((ok, response_ms))
+
+    buckets: dict[datetime, dict[str, Any]] = {}
+    for bucket_start in sorted(set(samples) | set(pings)):
+        values = samples.get(bucket_start, {})
+        checks = pings.get(bucket_start, [])
+        ok_ms = [ms for ok, ms in checks if ok and ms is not None]
+        buckets[bucket_start] = {
+            "samples": len(values.get("_n", ())),
+            "stats": {
+                name: {"min": min(series), "avg": sum(series) / len(series), "max": max(series)}
+                for name, series in values.items()
+                if name != "_n"
+            },
+            "uptime_checks": len(checks),
+            "uptime_ok": sum(1 for ok, _ in checks if ok),
+            "uptime_avg_ms": sum(ok_ms) / len(ok_ms) if ok_ms else None,
+        }
+    written = _save_buckets("5m", buckets)
+
+    # JSON-снимок после свёртки не нужен — это основной объём таблицы.
+    SystemMetric.objects.filter(created_at__lt=end).exclude(data={}).update(data={})
+    return written
+
+
+def _merge_stats(rows: list) -> dict[str, dict[str, float]]:
+    merged: dict[str, dict[str, float]] = {}
+    weights: dict[str, int] = defaultdict(int)
+    for row in rows:
+        weight = max(row.samples, 1)
+        for name, s in (row.stats or {}).items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = {"min": s["min"], "avg": s["avg"] * weight, "max": s["max"]}
+            else:
+                target["min"] = min(target["min"], s["min"])
+                target["max"] = max(target["max"], s["max"])
+                target["avg"] += s["avg"] * weight
+            weights[name] += weight
+    for name, s in merged.items():
+        s["avg"] /= weights[name]
+    return merged
+
+
+def rollup_hourly(now: datetime | None = None) -> int:
+    """Свернуть ``5m`` законченных часов в ``1h``."""
+    from core.models import SystemMetricRollup
+
+    end = _floor(now or timezone.now(), TIER_SECONDS["1h"])
+    first = SystemMetricRollup.objects.filter(tier="5m").aggregate(first=Min("bucket_start"))["first"]
+    start = _resume_from("1h", first)
+    if start is None or start >= end:
+        return 0
+
+    hours: dict[datetime, list] = defaultdict(list)
+    for row in SystemMetricRollup.objects.filter(tier="5m", bucket_start__gte=start, bucket_start__lt=end):
+        hours[_floor(row.bucket_start, TIER_SECONDS["1h"])].append(row)
+
+    buckets = {}
+    for hour, rows in hours.items():
+        ok_weighted = [(r.uptime_avg_ms, r.uptime_ok) for r in rows if r.uptime_avg_ms is not None and r.uptime_ok]
+        ok_n = sum(n for _, n in ok_weighted)
+        buckets[hour] = {
+            "samples": sum(r.samples for r in rows),
+            "stats": _merge_stats(rows),
+            "uptime_checks": sum(r.uptime_checks for r in rows),
+            "uptime_ok": sum(r.uptime_ok for r in rows),
+            "uptime_avg_ms": sum(ms * n for ms, n in ok_weighted) / ok_n if ok_n else None,
+        }
+    return _save_buckets("1h", buckets)
+
+
+def prune(now: datetime | None = None) -> dict[str, int]:
+    """Удалить сырые снимки старше raw retention (только уже свёрнутые) и старые свёртки."""
+    from core.models import SystemMetric, SystemMetricRollup
+
+    now = now or timezone.now()
+    last_5m = _last_bucket("5m")
+    deleted_raw = 0
+    if last_5m is not None:
+        cutoff = min(now - raw_retention(), last_5m + timedelta(seconds=TIER_SECONDS["5m"]))
+        deleted_raw, _ = SystemMetric.objects.filter(created_at__lt=cutoff).delete()
+    days_5m = int(getattr(settings, "MONITORING_5M_RETENTION_DAYS", 14))
+    days_1h = int(getattr(settings, "MONITORING_HOURLY_RETENTION_DAYS", 400))
+    deleted_5m, _ = SystemMetricRollup.objects.filter(
+        tier="5m", bucket_start__lt=now - timedelta(days=days_5m)
+    ).delete()
+    deleted_1h, _ = SystemMetricRollup.objects.filter(
+        tier="1h", bucket_start__lt=now - timedelta(days=days_1h)
+    ).delete()
+    return {"raw": deleted_raw, "5m": deleted_5m, "1h": deleted_1h}
+
+
+# ---------------------------------------------------------------------------
+# Чтение для графиков
+# ---------------------------------------------------------------------------
+
+
+def _round(value: float | None, digits: int | None):
+    value = value or 0
+    return int(value) if digits is None else round(value, digits)
+
+
+def chart_points(since: datetime, tier: str) -> list[dict[str, Any]]:
+    """Точки графиков из уровня ``tier``: средние за bucket + пик CPU."""
+    from core.models import SystemMetricRollup
+
+    points = []
+    rows = SystemMetricRollup.objects.filter(tier=tier, bucket_start__gte=since, samples__gt=0).order_by("bucket_start")
+    for bucket_start, stats in rows.values_list("bucket_start", "stats"):
+        point: dict[str, Any] = {"ts": bucket_start.isoformat()}
+        for name, digits in _CHART_FIELDS.items():
+            point[name] = _round((stats.get(name) or {}).get("avg"), digits)
+        point["cpu_percent_max"] = _round((stats.get("cpu_percent") or {}).get("max"), 1)
+        points.append(point)
+    return points
+
+
+def uptime_summary(since: datetime, tier: str) -> dict[str, Any]:
+    """Итог и bucket'ы uptime из уровня ``tier`` (формат как у сырого расчёта)."""
+    from core.models import SystemMetricRollup
+
+    rows = list(
+        SystemMetricRollup.objects.filter(tier=tier, bucket_start__gte=since, uptime_checks__gt=0)
+        .order_by("bucket_start")
+        .values_list("bucket_start", "uptime_checks", "uptime_ok", "uptime_avg_ms")
+    )
+    total = sum(r[1] for r in rows)
+    ok_count = sum(r[2] for r in rows)
+    ok_ms_n = sum(ok for _, _, ok, ms in rows if ms is not None)
+    avg_response = sum(ms * ok for _, _, ok, ms in rows if ms is not None) / ok_ms_n if ok_ms_n else None
+    return {
+        "total_checks": total,
+        "ok_checks": ok_count,
+        "pct": round(ok_count / total * 100, 3) if total else None,
+        "avg_response_ms": round(avg_response, 1) if avg_response else None,
+        "buckets": [
+            {"ts": ts.isoformat(), "pct": round(ok / checks * 100, 2), "avg_ms": round(ms or 0, 1)}
+            for ts, checks, ok, ms in rows
+        ],
+    }
@@ -0,0 +1,332 @@
+"""
+Общая обработка PDF/сканов для AI-пайплайнов (аудит счетов, сканы, пакеты).
+
+Раньше каждый пайплайн сам открывал документ: аудит читал текст через
+pdfplumber и рендерил все страницы в PNG 200 dpi, ``scan_extractor`` ещё раз
+рендерил те же страницы в JPEG. Здесь всё в одном месте:
+
+* ``extract_text`` — текстовый слой через PyMuPDF (в разы быстрее
+  pdfplumber); pdfplumber остаётся запасным вариантом, если PyMuPDF нет или
+  он не смог открыть файл.
+* ``render_pages_jpeg`` — страницы как ``(media_type, base64)`` JPEG под
+  лимиты Vision API (≤ 1568 px по длинной стороне, ≤ ~4.8 MB base64).
+  У многостраничных PDF масштабирование и JPEG-кодирование идут в пуле
+  потоков; результат кэшируется на диске по SHA-256 содержимого файла, поэтому повторная
+  обработка (ретрай Celery, перезапуск скана) рендер не повторяет.
+* ``load_page_images`` — PIL-страницы для дальнейшей нарезки (тайлы VIN).
+
+Каталог кэша — ``settings.PDF_RENDER_CACHE_DIR`` (пусто = кэш выключен),
+чистка старых записей — ``prune_render_cache`` (beat-задача
+``core.tasks.cleanup_pdf_render_cache``).
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Anthropic limit: 5 MB на одно изображение (поле base64). Сама base64-строка
+# в ~1.34 раза больше исходных байт, поэтому raw держим заметно ниже.
+MAX_RAW_IMAGE_BYTES = int(3.6 * 1024 * 1024)  # ≈ 4.8 MB после base64
+
+# Anthropic сам уменьшает изображения до ~1568 px по длинной стороне —
+# отправлять больше бессмысленно (только трафик и токены).
+MAX_LONG_SIDE = 1568
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# Меньше этого числа страниц пул потоков не поднимаем: пара страниц быстрее
+# кодируется подряд.
+_PARALLEL_MIN_PAGES = 4
+
+# Версия формата записи кэша: меняем при изменении кодирования страниц.
+_CACHE_VERSION = 1
+
+
+def _import_pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.error("Pillow не установлен. Запустите: pip install Pillow")
+        raise
+    return Image
+
+
+def _import_fitz():
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        logger.error("PyMuPDF не установлен. Запустите: pip install pymupdf")
+        raise
+    return fitz
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 содержимого файла (читаем блоками — сканы бывают по 50 МБ)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ── Текст ──────────────────────────────────────────────────────────────────
+
+
+def extract_text(path: str) -> str:
+    """Текстовый слой PDF, страницы через пустую строку.
+
+    Пустая строка — текста нет (скан), вызывающий код уходит в Vision.
+    """
+    try:
+        fitz = _import_fitz()
+    except ImportError:
+        return _extract_text_pdfplumber(path)
+
+    try:
+        doc = fitz.open(path)
+    except Exception as e:
+        logger.warning("pdf_processing: PyMuPDF не открыл %s (%s), пробуем pdfplumber", path, e)
+        return _extract_text_pdfplumber(path)
+    try:
+        pages_text = []
+        for page in doc:
+            text = page.get_text().strip()
+            if text:
+                pages_text.append(text)
+        return "\n\n".join(pages_text)
+    finally:
+        doc.close()
+
+
+def _extract_text_pdfplumber(path: str) -> str:
+    try:
+        import pdfplumber
+    except ImportError:
+        logger.error("pdfplumber не установлен. Запустите: pip install pdfplumber")
+        raise
+
+    with pdfplumber.open(path) as pdf:
+        pages_text = []
+        for page in pdf.pages:
+            text = page.extract_text()
+            if text:
+                pages_text.append(text)
+        return "\n\n".join(pages_text)
+
+
+# ── Рендер ─────────────────────────────────────────────────────────────────
+
+
+def encode_jpeg_under_limit(img, *, max_side: int = MAX_LONG_SIDE) -> tuple[str, str]:
+    """PIL.Image → ``("image/jpeg", base64)`` с гарантией лимита Anthropic.
+
+    Сначала ужимаем до max_side по длинной стороне, затем понижаем JPEG
+    quality, пока raw-размер не уложится в ``MAX_RAW_IMAGE_BYTES``.
+    """
+    Image = _import_pillow()
+    if max(img.size) > max_side:
+        img = img.copy()
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    for quality in (88, 80, 72, 65):
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        if buf.tell() <= MAX_RAW_IMAGE_BYTES:
+            break
+    else:
+        logger.warning("pdf_processing: image didn't fit limit even at q=65 (%d bytes)", buf.tell())
+    return ("image/jpeg", base64.b64encode(buf.getvalue()).decode("utf-8"))
+
+
+def _pixmap_to_image(pix):
+    Image = _import_pillow()
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def _render_page_range(path: str, page_numbers: list[int], dpi: int, max_side: int) -> list[tuple[str, str]]:
+    """Рендер указанных страниц (с 0) в JPEG — последовательно."""
+    fitz = _import_fitz()
+    out = []
+    doc = fitz.open(path)
+    try:
+        for number in page_numbers:
+            pix = doc[number].get_pixmap(dpi=dpi, alpha=False)
+            out.append(encode_jpeg_under_limit(_pixmap_to_image(pix), max_side=max_side))
+    finally:
+        doc.close()
+    return out
+
+
+def _render_workers() -> int:
+    try:
+        from django.conf import settings
+
+        configured = int(getattr(settings, "PDF_RENDER_WORKERS", 0) or 0)
+    except Exception:
+        configured = 0
+    return configured or min(4, os.cpu_count() or 1)
+
+
+def _render_pdf(path: str, *, dpi: int, max_side: int) -> list[tuple[str, str]]:
+    """Все страницы в JPEG.
+
+    PyMuPDF не потокобезопасен: страницы растрируются по очереди в текущем
+    потоке, а масштабирование и подбор качества JPEG (Pillow отпускает GIL)
+    уходят в пул потоков. Пул процессов не годится: prefork-воркер Celery —
+    демонический процесс, детей он заводить не может.
+    """
+    fitz = _import_fitz()
+    doc = fitz.open(path)
+    try:
+        page_count = doc.page_count
+    finally:
+        doc.close()
+    if not page_count:
+        return []
+
+    workers = min(_render_workers(), page_count)
+    if page_count < _PARALLEL_MIN_PAGES or workers < 2:
+        return _render_page_range(path, list(range(page_count)), dpi, max_side)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    futures = []
+    doc = fitz.open(path)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for number in range(page_count):
+                # В памяти — не больше ``workers`` растрированных страниц.
+                if number >= workers:
+                    futures[number - workers].result()
+                pix = doc[number].get_pixmap(dpi=dpi, alpha=False)
+                futures.append(pool.submit(encode_jpeg_under_limit, _pixmap_to_image(pix), max_side=max_side))
+    finally:
+        doc.close()
+    return [future.result() for future in futures]
+
+
+def _cache_dir() -> str:
+    try:
+        from django.conf import settings
+
+        return str(getattr(settings, "PDF_RENDER_CACHE_DIR", "") or "")
+    except Exception:
+        return ""
+
+
+def _cache_path(file_hash: str, dpi: int, max_side: int) -> str | None:
+    base = _cache_dir()
+    if not base:
+        return None
+    return os.path.join(base, file_hash[:2], f"{file_hash}_{dpi}_{max_side}_v{_CACHE_VERSION}.json")
+
+
+def _cache_read(path: str | None) -> list[tuple[str, str]] | None:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            pages = json.load(f)
+        os.utime(path)  # «последнее использование» для prune_render_cache
+        return [(media_type, b64) for media_type, b64 in pages]
+    except Exception as e:
+        logger.warning("pdf_processing: битая запись кэша %s: %s", path, e)
+        return None
+
+
+def _cache_write(path: str | None, pages: list[tuple[str, str]]) -> None:
+    if not path or not pages:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pages, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("pdf_processing: не удалось записать кэш %s: %s", path, e)
+
+
+def render_pages_jpeg(path: str, *, dpi: int, max_side: int = MAX_LONG_SIDE) -> list[tuple[str, str]]:
+    """Страницы документа как ``(media_type, base64)`` JPEG под лимиты Vision.
+
+    PDF рендерится с заданным dpi (параллельно для многостраничных файлов),
+    JPG/PNG берутся как есть. Результат кэшируется на диске по хэшу файла.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        Image = _import_pillow()
+        with Image.open(path) as img:
+            return [encode_jpeg_under_limit(img.convert("RGB"), max_side=max_side)]
+
+    cache_path = _cache_path(file_sha256(path), dpi, max_side) if _cache_dir() else None
+    cached = _cache_read(cache_path)
+    if cached is not None:
+        logger.info("pdf_processing: %s — %d стр. из кэша рендера", os.path.basename(path), len(cached))
+        return cached
+
+    started = time.monotonic()
+    pages = _render_pdf(path, dpi=dpi, max_side=max_side)
+    logger.info(
+        "pdf_processing: %s — отрендерено %d стр. за %.2f с",
+        os.path.basename(path),
+        len(pages),
+        time.monotonic() - started,
+    )
+    _cache_write(cache_path, pages)
+    return pages
+
+
+def load_page_images(path: str, *, dpi: int, max_pages: int | None = None) -> list:
+    """PIL.Image страниц документа (для нарезки на тайлы и т.п.).
+
+    ``max_pages`` ограничивает рендер первыми страницами — остальные не
+    растрируются вовсе.
+    """
+    Image = _import_pillow()
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in IMAGE_EXTENSIONS:
+        with Image.open(path) as img:
+            return [img.convert("RGB")]
+
+    fitz = _import_fitz()
+    pages = []
+    doc = fitz.open(path)
+    try:
+        for number, page in enumerate(doc):
+            if max_pages is not None and number >= max_pages:
+                break
+            pages.append(_pixmap_to_image(page.get_pixmap(dpi=dpi, alpha=False)))
+    finally:
+        doc.close()
+    return pages
+
+
+def prune_render_cache(max_age_days: int = 14) -> int:
+    """Удаляет записи кэша рендера, которыми не пользовались ``max_age_days``."""
+    base = _cache_dir()
+    if not base or not os.path.isdir(base):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for root, _dirs, files in os.walk(base):
+        for name in files:
+            full = os.path.join(root, name)
+            try:
+                if os.path.getmtime(full) < cutoff:
+                    os.remove(full)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
@@ -69,11 +69,36 @@ def _read_image_as_base64(file_path: str) -> tuple[str, str]:
     return data, media_type
 
 
-def parse_receipt_image(image_path: str) -> dict:
+_RECEIPT_INSTRUCTION = "Распознай этот кассовый чек. Верни ТОЛЬКО JSON."
+
+
+def parse_receipt_image(image_path: str, *, use_cache: bool = True) -> dict:
     """
     Send a receipt image to Claude Vision and get structured data back.
     Returns dict with store_name, items, total, etc.
+
+    Результат кэшируется по хэшу файла (см. ``extraction_cache``), так что
+    повторный разбор того же чека в API не уходит. ``use_cache=False`` — обход.
     """
+    from django.conf import settings
+
+    from core.models import LLMExtractionCache
+    from core.services.extraction_cache import cached_extraction, hash_bytes
+
+    with open(image_path, "rb") as f:
+        content_hash = hash_bytes(f.read())
+    model = getattr(settings, "AGENT_MODEL", "claude-sonnet-5")
+    return cached_extraction(
+        LLMExtractionCache.PIPELINE_RECEIPT,
+        content_hash=content_hash,
+        prompt=(SYSTEM_PROMPT, _RECEIPT_INSTRUCTION),
+        model=model,
+        compute=lambda: _request_receipt_extraction(image_path, model),
+        use_cache=use_cache,
+    )
+
+
+def _request_receipt_extraction(image_path: str, model: str) -> dict:
     try:
         import anthropic
     except ImportError:
@@ -88,10 +113,8 @@ def parse_receipt_image(image_path: str) -> dict:
 
     client = anthropic.Anthropic(api_key=api_key)
 
-    from django.conf import settings
-
     response = client.messages.create(
-        model=getattr(settings, "AGENT_MODEL", "claude-sonnet-5"),
+        model=model,
         max_tokens=2000,
         system=SYSTEM_PROMPT,
         messages=[
@@ -108,7 +131,7 @@ def parse_receipt_image(image_path: str) -> dict:
                     },
                     {
                         "type": "text",
-                        "text": "Распознай этот кассовый чек. Верни ТОЛЬКО JSON.",
+                        "text": _RECEIPT_INSTRUCTION,
                     },
                 ],
             }
@@ -120,7 +143,7 @@ def parse_receipt_image(image_path: str) -> dict:
     return _parse_json_response(anthropic_response_text(response))
 
 
-def parse_transaction_receipt(transaction_id: int) -> dict | None:
+def parse_transaction_receipt(transaction_id: int, *, use_cache: bool = True) -> dict | None:
     """
     Parse the receipt attached to a Transaction and save result to receipt_data.
     Returns the parsed data or None if no attachment / parsing failed.
@@ -139,7 +162,7 @@ def parse_transaction_receipt(transaction_id: int) -> dict | None:
 
     try:
         file_path = tx.attachment.path
-        result = parse_receipt_image(file_path)
+        result = parse_receipt_image(file_path, use_cache=use_cache)
         tx.receipt_data = result
         tx.save(update_fields=["receipt_data"])
         logger.info("Receipt parsed for transaction %d: %s", transaction_id, result.get("ai_summary", ""))
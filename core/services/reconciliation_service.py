@@ -1,17 +1,36 @@
 """
 ReconciliationService
 =====================
-Расчёт прибыли per car/container, статус подтверждённости затрат, генерация подсказок.
+Расчёт прибыли per car/container/client, статус подтверждённости затрат, генерация подсказок.
 Работает на основе SupplierCost (фактические затраты) и CarService (выручка).
+
+Dashboard без фильтра по счетам читает поддерживаемую таблицу
+``CarProfitability`` (см. ``core.services.car_profitability``); живой расчёт
+``get_car_profitability`` остаётся для среза по выбранным счетам.
 """
 
 from collections import defaultdict
 from decimal import Decimal
 
-from django.db.models import Count, Sum
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 
 from core.models import Car, CarService
-from core.models_invoice_audit import SupplierCost
+from core.models_invoice_audit import CarProfitability, SupplierCost
+from core.services.car_profitability import refresh_stale_revenue
+
+CARS_PER_PAGE = 50
+ROLLUPS_PER_PAGE = 25
+
+# ?sort= → (поле CarProfitability, ключ dict'а машины). Все поля с индексом.
+SORTS = {
+    "profit": ("profit", "profit"),
+    "margin": ("margin_pct", "margin_pct"),
+    "cost": ("total_cost", "total_cost"),
+    "revenue": ("revenue", "total_revenue"),
+}
+DEFAULT_SORT = "profit"
 
 
 def get_cost_confirmation_status(car_id):
@@ -198,50 +217,58 @@ def get_car_profitability(car_ids=None, container_ids=None, audit_ids=None):
     return result
 
 
-def get_container_profitability(audit_ids=None):
-    """Группирует get_car_profitability по контейнерам."""
-    cars = get_car_profitability(audit_ids=audit_ids)
-
-    by_container = defaultdict(
-        lambda: {
-            "cars": [],
-            "total_cost": 0.0,
-            "total_revenue": 0.0,
-        }
-    )
-
+def _rollup(cars, key, name_key):
+    """Группирует dict'ы машин по ``key`` → список сводок (с машинами)."""
+    groups = defaultdict(list)
     for car in cars:
-        key = car["container_number"] or "—"
-        entry = by_container[key]
-        entry["container_number"] = car["container_number"]
-        entry["container_id"] = car["container_id"]
-        entry["cars"].append(car)
-        entry["total_cost"] += car["total_cost"]
-        entry["total_revenue"] += car["total_revenue"]
+        groups[car[key]].append(car)
 
     result = []
-    for key, data in by_container.items():
-        profit = data["total_revenue"] - data["total_cost"]
-        margin = (profit / data["total_revenue"] * 100) if data["total_revenue"] > 0 else 0
-        all_final = all(c["is_final"] for c in data["cars"])
+    for group_id, group in groups.items():
+        total_cost = sum(c["total_cost"] for c in group)
+        total_revenue = sum(c["total_revenue"] for c in group)
         result.append(
-            {
-                "container_number": data["container_number"],
-                "container_id": data["container_id"],
-                "cars_count": len(data["cars"]),
-                "total_cost": round(data["total_cost"], 2),
-                "total_revenue": round(data["total_revenue"], 2),
-                "profit": round(profit, 2),
-                "margin_pct": round(margin, 1),
-                "is_final": all_final,
-                "cars": data["cars"],
-            }
+            _rollup_row(
+                group_id,
+                group[0][name_key],
+                cars_count=len(group),
+                total_cost=total_cost,
+                total_revenue=total_revenue,
+                is_final=all(c["is_final"] for c in group),
+                cars=group,
+            )
         )
-
     result.sort(key=lambda x: x["profit"])
     return result
 
 
+def _rollup_row(group_id, name, *, cars_count, total_cost, total_revenue, is_final, cars=()):
+    total_cost, total_revenue = float(total_cost or 0), float(total_revenue or 0)
+    profit = total_revenue - total_cost
+    margin = (profit / total_revenue * 100) if total_revenue > 0 else 0
+    return {
+        "id": group_id,
+        "name": name,
+        # Ключи вкладки «По контейнерам» (шаблон Dashboard).
+        "container_number": name,
+        "container_id": group_id,
+        "cars_count": cars_count,
+        "total_cost": round(total_cost, 2),
+        "total_revenue": round(total_revenue, 2),
+        "profit": round(profit, 2),
+        "margin_pct": round(margin, 1),
+        "is_final": is_final,
+        "cars": list(cars),
+    }
+
+
+def get_container_profitability(audit_ids=None, cars=None):
+    """Группирует get_car_profitability по контейнерам."""
+    if cars is None:
+        cars = get_car_profitability(audit_ids=audit_ids)
+    return _rollup(cars, "container_id", "container_number")
+
+
 def generate_hints(audit_ids=None):
     """Генерирует подсказки и замечания."""
     hints = []
@@ -282,18 +309,14 @@ def generate_hints(audit_ids=None):
             }
         )
 
-    # 3. THS убытки
-    ths_costs = cost_qs.filter(service_type="THS", car__isnull=False, car_service__isnull=False)
-    ths_loss_vins = []
-    ths_total_loss = Decimal("0")
-    for sc in ths_costs:
-        if not sc.car_service:
-            continue
-        our_price = float(sc.car_service.custom_price or 0)
-        diff = our_price - float(sc.amount)
-        if diff < -5:
-            ths_loss_vins.append(sc.vin)
-            ths_total_loss += sc.amount - Decimal(str(our_price))
+    # 3. THS убытки (затрата поставщика дороже выставленного клиенту > 5 €)
+    ths_losses = (
+        cost_qs.filter(service_type="THS", car__isnull=False, car_service__isnull=False)
+        .annotate(our_price=Coalesce("car_service__custom_price", Decimal("0")))
+        .filter(amount__gt=F("our_price") + 5)
+    )
+    ths_loss_vins = list(ths_losses.values_list("vin", flat=True))
+    ths_total_loss = ths_losses.aggregate(t=Sum(F("amount") - F("our_price")))["t"] or Decimal("0")
 
     if ths_loss_vins:
         hints.append(
@@ -323,10 +346,14 @@ def generate_hints(audit_ids=None):
         )
 
     # 5. Машины с нулевой выручкой но есть затраты
-    cars_with_costs = cost_qs.filter(car__isnull=False).values_list("car_id", flat=True).distinct()
-    zero_revenue_list = list(
-        Car.objects.filter(id__in=cars_with_costs, total_price__lte=0).values_list("vin", flat=True)
-    )
+    if audit_ids:
+        cars_with_costs = cost_qs.filter(car__isnull=False).values_list("car_id", flat=True).distinct()
+        zero_revenue = Car.objects.filter(id__in=cars_with_costs, total_price__lte=0)
+        zero_revenue_list = list(zero_revenue.values_list("vin", flat=True))
+    else:
+        zero_revenue_list = list(
+            CarProfitability.objects.filter(revenue__lte=0).order_by("pk").values_list("car__vin", flat=True)
+        )
     if zero_revenue_list:
         hints.append(
             {
@@ -339,10 +366,6 @@ def generate_hints(audit_ids=None):
             }
         )
 
-    # 6. Контрагент без маппинга
-    cost_qs.filter(car__isnull=False, car_service__isnull=True).values_list("counterparty", flat=True).distinct()
-    # already covered by "unlinked" hint — skip duplicate
-
     hints.sort(key=lambda h: {"error": 0, "warning": 1, "info": 2}.get(h["severity"], 9))
     return hints
 
@@ -355,38 +378,189 @@ def get_unlinked_costs(audit_ids=None):
     return qs
 
 
-def get_reconciliation_summary(audit_ids=None):
-    """
-    Полная сводка для Dashboard.
-    """
+def parse_sort(value):
+    """``?sort=`` → (ключ из ``SORTS``, по убыванию). Неизвестное — по прибыли."""
+    value = value or DEFAULT_SORT
+    desc = value.startswith("-")
+    key = value.lstrip("-")
+    if key not in SORTS:
+        return DEFAULT_SORT, False
+    return key, desc
+
+
+def _profitability_row(row):
+    """``CarProfitability`` → dict машины (ключи как у ``get_car_profitability``)."""
+    car = row.car
+    return {
+        "car_id": row.car_id,
+        "vin": car.vin,
+        "brand": car.brand or "",
+        "vehicle_type": car.get_vehicle_type_display(),
+        "client_name": str(row.client) if row.client_id else "—",
+        "client_id": row.client_id,
+        "container_number": row.container.number if row.container_id else "—",
+        "container_id": row.container_id,
+        "total_cost": float(row.total_cost),
+        "total_revenue": float(row.revenue),
+        "profit": float(row.profit),
+        "margin_pct": float(row.margin_pct),
+        "cost_breakdown": {stype: Decimal(amount) for stype, amount in row.cost_breakdown.items()},
+        "has_costs": row.total_cost > 0,
+        "cost_status": row.cost_status,
+        "total_services": row.total_services,
+        "confirmed_services": row.confirmed_services,
+        "unlinked_costs": row.unlinked_costs,
+        "is_final": row.is_final,
+    }
+
+
+def _table_rollups(qs, field, name_field, order):
+    """Сводка по ``field`` (container / client) через GROUP BY по таблице прибыли."""
+    return (
+        qs.values(f"{field}_id", name_field)
+        .annotate(
+            cars_count=Count("pk"),
+            total_cost=Sum("total_cost"),
+            total_revenue=Sum("revenue"),
+            profit_sum=Sum("profit"),
+            open_count=Count("pk", filter=Q(is_final=False)),
+        )
+        .order_by(order, f"{field}_id")
+    )
+
+
+def _table_rollup_page(qs, field, name_field, order, page, per_page, with_cars=False):
+    page_obj = Paginator(_table_rollups(qs, field, name_field, order), per_page).get_page(page)
+    cars_by_group = defaultdict(list)
+    if with_cars:
+        ids = [g[f"{field}_id"] for g in page_obj]
+        scope = Q(**{f"{field}_id__in": [pk for pk in ids if pk]})
+        if None in ids:
+            scope |= Q(**{f"{field}__isnull": True})
+        for row in qs.filter(scope).select_related("car", "client", "container").order_by("profit", "pk"):
+            cars_by_group[getattr(row, f"{field}_id")].append(_profitability_row(row))
+    page_obj.object_list = [
+        _rollup_row(
+            g[f"{field}_id"],
+            g[name_field] or "—",
+            cars_count=g["cars_count"],
+            total_cost=g["total_cost"],
+            total_revenue=g["total_revenue"],
+            is_final=g["open_count"] == 0,
+            cars=cars_by_group[g[f"{field}_id"]],
+        )
+        for g in page_obj
+    ]
+    return page_obj
+
+
+def _list_page(items, page, per_page):
+    return Paginator(items, per_page).get_page(page)
+
+
+def _audit_pages(audit_ids, sort, desc, pages, per_page):
+    """Срез по конкретным счетам: живой расчёт по их затратам (объём — один-два счёта)."""
     cars = get_car_profitability(audit_ids=audit_ids)
-    containers = get_container_profitability(audit_ids=audit_ids)
-    hints = generate_hints(audit_ids=audit_ids)
-    unlinked = get_unlinked_costs(audit_ids=audit_ids)
+    containers = get_container_profitability(cars=cars)
+    clients = _rollup(cars, "client_id", "client_name")
+    cars = sorted(cars, key=lambda c: c[SORTS[sort][1]], reverse=desc)
 
     total_cost = sum(c["total_cost"] for c in cars)
     total_revenue = sum(c["total_revenue"] for c in cars)
-    total_profit = total_revenue - total_cost
-    avg_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+    totals = {
+        "total_cost": total_cost,
+        "total_revenue": total_revenue,
+        "cars_count": len(cars),
+        "containers_count": len(containers),
+        "clients_count": len(clients),
+        "loss_cars_count": sum(1 for c in cars if c["profit"] < 0),
+        "final_cars_count": sum(1 for c in cars if c["is_final"]),
+    }
+    return totals, {
+        "cars": _list_page(cars, pages.get("cars"), per_page),
+        "containers": _list_page(containers, pages.get("containers"), ROLLUPS_PER_PAGE),
+        "clients": _list_page(clients, pages.get("clients"), ROLLUPS_PER_PAGE),
+    }
+
 
-    loss_cars = [c for c in cars if c["profit"] < 0]
-    final_cars = [c for c in cars if c["is_final"]]
+def _table_pages(sort, desc, pages, per_page):
+    """Все счета: чтение поддерживаемой таблицы ``CarProfitability``."""
+    refresh_stale_revenue()
+    qs = CarProfitability.objects.all()
+    agg = qs.aggregate(
+        total_cost=Sum("total_cost"),
+        total_revenue=Sum("revenue"),
+        cars_count=Count("pk"),
+        loss_cars_count=Count("pk", filter=Q(profit__lt=0)),
+        final_cars_count=Count("pk", filter=Q(is_final=True)),
+        containers=Count("container", distinct=True),
+        without_container=Count("pk", filter=Q(container__isnull=True)),
+        clients=Count("client", distinct=True),
+        without_client=Count("pk", filter=Q(client__isnull=True)),
+    )
+    totals = {
+        "total_cost": float(agg["total_cost"] or 0),
+        "total_revenue": float(agg["total_revenue"] or 0),
+        "cars_count": agg["cars_count"],
+        # Машины без контейнера / клиента — отдельная группа «—».
+        "containers_count": agg["containers"] + bool(agg["without_container"]),
+        "clients_count": agg["clients"] + bool(agg["without_client"]),
+        "loss_cars_count": agg["loss_cars_count"],
+        "final_cars_count": agg["final_cars_count"],
+    }
+
+    field = SORTS[sort][0]
+    cars_qs = qs.select_related("car", "client", "container").order_by(f"-{field}" if desc else field, "pk")
+    cars_page = Paginator(cars_qs, per_page).get_page(pages.get("cars"))
+    cars_page.object_list = [_profitability_row(row) for row in cars_page]
+    return totals, {
+        "cars": cars_page,
+        "containers": _table_rollup_page(
+            qs, "container", "container__number", "profit_sum", pages.get("containers"), ROLLUPS_PER_PAGE, True
+        ),
+        "clients": _table_rollup_page(
+            qs, "client", "client__name", "profit_sum", pages.get("clients"), ROLLUPS_PER_PAGE
+        ),
+    }
+
+
+def get_reconciliation_summary(audit_ids=None, *, sort=DEFAULT_SORT, pages=None, per_page=CARS_PER_PAGE):
+    """
+    Сводка для Dashboard.
+
+    Без фильтра по счетам читает ``CarProfitability``: итоги и сводки по
+    контейнерам / клиентам — агрегаты SQL, машины — страница ``ORDER BY``
+    по индексу. ``pages`` — ``{"cars" | "containers" | "clients": номер}``.
+    """
+    sort, desc = parse_sort(sort)
+    pages = pages or {}
+    if audit_ids:
+        totals, paged = _audit_pages(audit_ids, sort, desc, pages, per_page)
+    else:
+        totals, paged = _table_pages(sort, desc, pages, per_page)
+
+    hints = generate_hints(audit_ids=audit_ids)
+    unlinked = get_unlinked_costs(audit_ids=audit_ids)
+    total_profit = totals["total_revenue"] - totals["total_cost"]
+    avg_margin = (total_profit / totals["total_revenue"] * 100) if totals["total_revenue"] > 0 else 0
 
     return {
         "totals": {
-            "total_cost": round(total_cost, 2),
-            "total_revenue": round(total_revenue, 2),
+            **totals,
+            "total_cost": round(totals["total_cost"], 2),
+            "total_revenue": round(totals["total_revenue"], 2),
             "total_profit": round(total_profit, 2),
             "avg_margin": round(avg_margin, 1),
-            "cars_count": len(cars),
-            "containers_count": len(containers),
-            "loss_cars_count": len(loss_cars),
-            "final_cars_count": len(final_cars),
             "hints_count": len(hints),
             "unlinked_count": unlinked.count(),
         },
-        "cars": cars,
-        "containers": containers,
+        "sort": f"-{sort}" if desc else sort,
+        "cars": paged["cars"].object_list,
+        "cars_page": paged["cars"],
+        "containers": paged["containers"].object_list,
+        "containers_page": paged["containers"],
+        "clients": paged["clients"].object_list,
+        "clients_page": paged["clients"],
         "hints": hints,
         "unlinked": list(
             unlinked.values(
@@ -0,0 +1,249 @@
+"""Производительность HTTP-запросов по эндпоинтам (``RequestMetric``).
+
+Системный монитор видит только хост (CPU/RSS/Postgres/Redis), поэтому
+регресс отдельной страницы админки было не заметить без профайлера.
+``core.middleware_performance.RequestMetricsMiddleware`` меряет каждый
+запрос — время ответа, число SQL-запросов и время в SQL — и передаёт их
+сюда:
+
+* ``record()`` — копит метрики в памяти процесса по ключу
+  (5-минутный bucket, route, method): сумма/максимум и гистограмма
+  латентности по ``LATENCY_BUCKETS_MS``. Под локом, без I/O;
+* ``maybe_flush()`` — раз в ``REQUEST_METRICS_FLUSH_SECONDS`` сливает
+  накопленное в БД: строка (bucket, route, method) одна на все процессы,
+  значения прибавляются под ``select_for_update``;
+* ``endpoint_stats(since)`` — «самые медленные / больше всего SQL» для
+  панели /admin/system-monitor/; p95 оценивается по гистограмме.
+
+При рестарте воркера теряется не больше одного интервала flush.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 300
+# Верхние границы корзин латентности, ms; всё выше — "inf".
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+
+# Эндпоинт попадает в рейтинг, если за окно было хотя бы столько запросов:
+# единичный холодный запрос не должен вытеснять рабочие страницы.
+MIN_REQUESTS_FOR_RANKING = 5
+
+
+def _bucket_start(now: datetime) -> datetime:
+    ts = int(now.timestamp())
+    return datetime.fromtimestamp(ts - ts % BUCKET_SECONDS, tz=now.tzinfo)
+
+
+def _histogram_key(duration_ms: float, bounds: tuple[int, ...] = LATENCY_BUCKETS_MS) -> str:
+    for bound in bounds:
+        if duration_ms <= bound:
+            return str(bound)
+    return "inf"
+
+
+def _flush_interval() -> float:
+    return float(getattr(settings, "REQUEST_METRICS_FLUSH_SECONDS", 60))
+
+
+class QueryTimer:
+    """``execute_wrapper``: считает SQL-запросы и суммарное время в них
+    (без ``DEBUG`` и ``connection.queries``)."""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# Накопление в процессе
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_pending: dict[tuple, dict[str, Any]] = {}
+_last_flush = time.monotonic()
+
+
+def _empty() -> dict[str, Any]:
+    return {
+        "count": 0,
+        "errors": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "sql_count": 0,
+        "sql_ms": 0.0,
+        "max_sql_count": 0,
+        "histogram": {},
+    }
+
+
+def record(route: str, method: str, status: int, duration_ms: float, sql_count: int, sql_ms: float) -> None:
+    """Учесть один запрос (в памяти процесса)."""
+    key = (_bucket_start(timezone.now()), route[:200], method[:8])
+    bucket = _histogram_key(duration_ms)
+    with _lock:
+        agg = _pending.get(key)
+        if agg is None:
+            agg = _pending[key] = _empty()
+        agg["count"] += 1
+        agg["errors"] += 1 if status >= 500 else 0
+        agg["total_ms"] += duration_ms
+        agg["max_ms"] = max(agg["max_ms"], duration_ms)
+        agg["sql_count"] += sql_count
+        agg["sql_ms"] += sql_ms
+        agg["max_sql_count"] = max(agg["max_sql_count"], sql_count)
+        agg["histogram"][bucket] = agg["histogram"].get(bucket, 0) + 1
+
+
+def maybe_flush() -> int:
+    """Слить накопленное, если прошёл интервал. Возвращает число строк."""
+    if time.monotonic() - _last_flush < _flush_interval():
+        return 0
+    return flush()
+
+
+def flush() -> int:
+    """Слить всё накопленное в ``RequestMetric``. Ошибки БД не пробрасываются —
+    метрики этого интервала теряются, запрос пользователя не страдает."""
+    global _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    written = 0
+    for key, agg in batch.items():
+        try:
+            _merge_row(key, agg)
+            written += 1
+        except Exception:
+            logger.exception("[request_metrics] failed to flush %s", key)
+    return written
+
+
+def _merge_row(key: tuple, agg: dict[str, Any]) -> None:
+    from core.models import RequestMetric
+
+    bucket_start, route, method = key
+    lookup = {"bucket_start": bucket_start, "route": route, "method": method}
+    for _attempt in range(2):
+        with transaction.atomic():
+            row = RequestMetric.objects.select_for_update().filter(**lookup).first()
+            if row is None:
+                try:
+                    with transaction.atomic():
+                        RequestMetric.objects.create(**lookup, **agg)
+                    return
+                except IntegrityError:
+                    # Параллельный процесс создал строку первым — прибавим к ней.
+                    continue
+            row.count += agg["count"]
+            row.errors += agg["errors"]
+            row.total_ms += agg["total_ms"]
+            row.max_ms = max(row.max_ms, agg["max_ms"])
+            row.sql_count += agg["sql_count"]
+            row.sql_ms += agg["sql_ms"]
+            row.max_sql_count = max(row.max_sql_count, agg["max_sql_count"])
+            histogram = dict(row.histogram or {})
+            for bucket, n in agg["histogram"].items():
+                histogram[bucket] = histogram.get(bucket, 0) + n
+            row.histogram = histogram
+            row.save()
+            return
+
+
+# ---------------------------------------------------------------------------
+# Чтение для панели
+# ---------------------------------------------------------------------------
+
+
+def _percentile_ms(
+    histogram: dict[str, int], count: int, max_ms: float, q: float, bounds: tuple[int, ...] = LATENCY_BUCKETS_MS
+) -> float | None:
+    """Оценка перцентиля: верхняя граница корзины, где набралось ``q`` запросов."""
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    for bound in bounds:
+        seen += histogram.get(str(bound), 0)
+        if seen >= target:
+            return float(min(bound, max_ms))
+    return round(max_ms, 1)
+
+
+def endpoint_stats(since: datetime, limit: int = 10) -> dict[str, list[dict[str, Any]]]:
+    """Рейтинги эндпоинтов за окно: ``slowest`` (среднее время ответа) и
+    ``most_queries`` (среднее число SQL на запрос)."""
+    from core.models import RequestMetric
+
+    rows = list(
+        RequestMetric.objects.filter(bucket_start__gte=since)
+        .values("route", "method")
+        .annotate(
+            n=Sum("count"),
+            err=Sum("errors"),
+            total=Sum("total_ms"),
+            peak=Max("max_ms"),
+            sql=Sum("sql_count"),
+            sql_time=Sum("sql_ms"),
+            sql_peak=Max("max_sql_count"),
+        )
+        .filter(n__gte=MIN_REQUESTS_FOR_RANKING)
+        .order_by()
+    )
+    stats = [
+        {
+            "route": row["route"],
+            "method": row["method"],
+            "count": row["n"],
+            "errors": row["err"],
+            "avg_ms": round(row["total"] / row["n"], 1),
+            "max_ms": round(row["peak"], 1),
+            "avg_queries": round(row["sql"] / row["n"], 1),
+            "max_queries": row["sql_peak"],
+            "avg_sql_ms": round(row["sql_time"] / row["n"], 1),
+        }
+        for row in rows
+    ]
+    slowest = sorted(stats, key=lambda s: s["avg_ms"], reverse=True)[:limit]
+    most_queries = sorted(stats, key=lambda s: s["avg_queries"], reverse=True)[:limit]
+
+    # Гистограммы — только для попавших в рейтинги.
+    wanted = {(s["route"], s["method"]) for s in slowest + most_queries}
+    merged: dict[tuple, dict[str, int]] = {}
+    histograms = RequestMetric.objects.filter(bucket_start__gte=since, route__in={r for r, _m in wanted}).values_list(
+        "route", "method", "histogram"
+    )
+    for route, method, histogram in histograms:
+        if (route, method) not in wanted:
+            continue
+        target = merged.setdefault((route, method), {})
+        for bucket, n in (histogram or {}).items():
+            target[bucket] = target.get(bucket, 0) + n
+    for s in stats:
+        key = (s["route"], s["method"])
+        if key in wanted:
+            s["p95_ms"] = _percentile_ms(merged.get(key, {}), s["count"], s["max_ms"], 0.95)
+    return {"slowest": slowest, "most_queries": most_queries}
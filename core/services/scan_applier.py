@@ -416,6 +416,7 @@ def apply_dock_receipt_job(job: ScanProcessingJob, *, applied_by=None) -> ScanPr
              year/brand из dock receipt).
            * Привязываем Car к контейнеру.
            * Записываем weight_kg (конвертируем из lbs если нужно).
+         Делается пакетно, см. ``_apply_dock_vehicles``.
       4. status=APPLIED, в applied_changes — список затронутых VIN.
     """
     if job.scan_type != ScanProcessingJob.SCAN_TYPE_DOCK_RECEIPT:
@@ -497,55 +498,7 @@ def apply_dock_receipt_job(job: ScanProcessingJob, *, applied_by=None) -> ScanPr
     else:
         container.save(update_fields=list({*update_fields, "dock_receipt_scan"}))
 
-    vehicles = data.get("vehicles") or []
-    affected = []
-    created_vins = []
-    for veh in vehicles:
-        vin = _normalize_vin(veh.get("vin"))
-        if not vin or len(vin) != 17:
-            # Невалидный VIN — пропускаем, но логируем.
-            logger.warning("Job #%s: пропущен невалидный VIN %r", job.pk, vin)
-            continue
-        weight_kg = _resolve_weight_kg(veh)
-        car = Car.objects.filter(vin=vin).first()
-        car_created = False
-        if car is None:
-            year = _safe_int(veh.get("year"))
-            brand_full = _build_brand(veh)
-            create_kwargs = {
-                "vin": vin,
-                "year": year or 0,
-                "brand": brand_full or "Unknown",
-                "status": container.status,  # обычно FLOATING
-                "container": container,
-            }
-            # Наследуем поля контейнера — так же, как это делает ручное
-            # добавление машины в inline контейнера (save_formset).
-            if container.warehouse_id:
-                create_kwargs["warehouse_id"] = container.warehouse_id
-            if container.client_id:
-                create_kwargs["client_id"] = container.client_id
-            if container.line_id:
-                create_kwargs["line_id"] = container.line_id
-            if container.unload_date:
-                create_kwargs["unload_date"] = container.unload_date
-            car = Car.objects.create(**create_kwargs)
-            car_created = True
-            created_vins.append(vin)
-        else:
-            if car.container_id != container.id:
-                car.container = container
-        if weight_kg is not None:
-            car.weight_kg = weight_kg
-        car.save(update_fields=["container", "weight_kg"])
-        affected.append(
-            {
-                "vin": vin,
-                "car_id": car.id,
-                "created": car_created,
-                "weight_kg": float(weight_kg) if weight_kg is not None else None,
-            }
-        )
+    affected, created_vins = _apply_dock_vehicles(job, container, data.get("vehicles") or [])
 
     job.linked_container = container
     # Если в Dock Receipt была одна машина — для удобства поставим её в linked_car.
@@ -594,6 +547,119 @@ def apply_dock_receipt_job(job: ScanProcessingJob, *, applied_by=None) -> ScanPr
     return job
 
 
+def _apply_dock_vehicles(job: ScanProcessingJob, container, vehicles: list) -> tuple[list[dict], list[str]]:
+    """Пакетно создать/привязать машины Dock Receipt к контейнеру.
+
+    Раньше на каждую машину шли ``filter(vin=...).first()``, ``create()`` и
+    ещё один ``save()`` — каждый со своим каскадом (пересоздание
+    ``CarService``, пересчёт цены, регенерация инвойсов). На контейнере из
+    4–8 машин это сотни запросов. Теперь:
+
+      * все VIN резолвятся одним запросом;
+      * новые машины — ``bulk_create``, существующие — ``bulk_update``
+        (container, weight_kg) под ``signals_disabled(*CAR_SIGNALS)``;
+      * услуги новых машин — один ``sync_car_services_for_cars``;
+      * пересчёт ``total_price`` — одна задача на все машины;
+      * фасеты портала владельцев — один сброс.
+
+    Число запросов не зависит от числа машин. Возвращает
+    ``(affected, created_vins)`` в формате ``applied_changes["vehicles"]``.
+    """
+    from core.services import client_portal_listing
+    from core.services.car_lifecycle_service import send_car_ws_notification
+    from core.services.car_service_manager import sync_car_services_for_cars
+    from core.services.cascade_control import CAR_SIGNALS, signals_disabled
+    from core.signals.service_catalog import _enqueue_recalc_cars_total_price
+
+    rows = []
+    for veh in vehicles:
+        vin = _normalize_vin(veh.get("vin"))
+        if not vin or len(vin) != 17:
+            # Невалидный VIN — пропускаем, но логируем.
+            logger.warning("Job #%s: пропущен невалидный VIN %r", job.pk, vin)
+            continue
+        rows.append((vin, veh, _resolve_weight_kg(veh)))
+    if not rows:
+        return [], []
+
+    existing = {car.vin: car for car in Car.objects.filter(vin__in={vin for vin, _veh, _w in rows})}
+
+    cars_by_vin: dict[str, Car] = {}
+    new_cars: list[Car] = []
+    created_vins: list[str] = []
+    for vin, veh, weight_kg in rows:
+        car = cars_by_vin.get(vin) or existing.get(vin)
+        if car is None:
+            create_kwargs = {
+                "vin": vin,
+                "year": _safe_int(veh.get("year")) or 0,
+                "brand": _build_brand(veh) or "Unknown",
+                "status": container.status,  # обычно FLOATING
+                "container": container,
+            }
+            # Наследуем поля контейнера — так же, как это делает ручное
+            # добавление машины в inline контейнера (save_formset).
+            if container.warehouse_id:
+                create_kwargs["warehouse_id"] = container.warehouse_id
+            if container.client_id:
+                create_kwargs["client_id"] = container.client_id
+            if container.line_id:
+                create_kwargs["line_id"] = container.line_id
+            if container.unload_date:
+                create_kwargs["unload_date"] = container.unload_date
+            car = Car(**create_kwargs)
+            car._sync_status_and_dates()
+            new_cars.append(car)
+            created_vins.append(vin)
+        else:
+            car.container = container
+        if weight_kg is not None:
+            car.weight_kg = weight_kg
+        cars_by_vin[vin] = car
+
+    created_set = set(created_vins)
+    existing_cars = [car for vin, car in cars_by_vin.items() if vin not in created_set]
+    with signals_disabled(*CAR_SIGNALS):
+        if new_cars:
+            Car.objects.bulk_create(new_cars, batch_size=100)
+            sync_car_services_for_cars(
+                new_cars, created=True, warehouse_changed=True, line_changed=True, carrier_changed=True
+            )
+        if existing_cars:
+            Car.objects.bulk_update(existing_cars, ["container", "weight_kg"], batch_size=100)
+
+    all_cars = list(cars_by_vin.values())
+    _enqueue_recalc_cars_total_price([car.pk for car in all_cars])
+    for car in all_cars:
+        send_car_ws_notification(car)
+    # bulk_* не шлют post_save — сбрасываем кэш статистики и фасеты портала один раз.
+    transaction.on_commit(lambda: _invalidate_car_stats(all_cars[0].pk))
+    client_portal_listing.invalidate_client_facets(car.client_id for car in all_cars)
+
+    affected = []
+    seen = set()
+    for vin, _veh, weight_kg in rows:
+        affected.append(
+            {
+                "vin": vin,
+                "car_id": cars_by_vin[vin].id,
+                "created": vin in created_set and vin not in seen,
+                "weight_kg": float(weight_kg) if weight_kg is not None else None,
+            }
+        )
+        seen.add(vin)
+    return affected, created_vins
+
+
+def _invalidate_car_stats(car_id: int) -> None:
+    try:
+        from core.cache_utils import invalidate_related_cache
+
+        invalidate_related_cache("Car", car_id)
+    except Exception as exc:
+        logger.debug("Cache invalidation skipped for dock receipt cars: %s", exc)
+
+
 def _schedule_eta_update(container_id: int) -> None:
     """Ставит фоновое обновление ETA; без брокера выполняет синхронно."""
     from core.tasks import update_container_eta_task
@@ -24,25 +24,22 @@ AI-извлечение данных из отсканированных док
 
 from __future__ import annotations
 
-import base64
-import io
 import json
 import logging
 import os
 from typing import Any, Iterable
 
+from core.services.pdf_processing import IMAGE_EXTENSIONS as _IMAGE_EXTENSIONS
+from core.services.pdf_processing import MAX_LONG_SIDE as _MAX_LONG_SIDE
+from core.services.pdf_processing import encode_jpeg_under_limit as _encode_jpeg_under_limit
+from core.services.pdf_processing import load_page_images, render_pages_jpeg
+
 logger = logging.getLogger(__name__)
 
 
 # ── Рендер документов под Claude Vision ───────────────────────────────────
-
-# Anthropic limit: 5 MB на одно изображение (поле base64). Сама base64-строка
-# в ~1.34 раза больше исходных байт, поэтому raw держим заметно ниже.
-_MAX_RAW_IMAGE_BYTES = int(3.6 * 1024 * 1024)  # ≈ 4.8 MB после base64
-
-# Anthropic сам уменьшает изображения до ~1568 px по длинной стороне —
-# отправлять больше бессмысленно (только трафик и токены).
-_MAX_LONG_SIDE = 1568
+# Сам рендер, JPEG-подгонка под лимиты Anthropic и дисковый кэш страниц —
+# в core.services.pdf_processing (общий с аудитом счетов и пакетами).
 
 # DPI рендера PDF-страниц. Для полной страницы хватает 150 (всё равно будет
 # ужато до 1568 px); тайлы для посимвольного чтения VIN рендерим в 300 —
@@ -57,84 +54,25 @@ _TILE_OVERLAP = 0.14
 # (титул — это 1-2 страницы; ограничение страхует от гигантских PDF).
 _MAX_VERIFY_PAGES = 2
 
-_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 SUPPORTED_EXTENSIONS = {".pdf", *_IMAGE_EXTENSIONS}
 
 
-def _import_pillow():
-    try:
-        from PIL import Image
-    except ImportError:
-        logger.error("Pillow не установлен. Запустите: pip install Pillow")
-        raise
-    return Image
-
-
-def _load_page_images(path: str, *, dpi: int) -> list:
+def _load_page_images(path: str, *, dpi: int, max_pages: int | None = None) -> list:
     """Возвращает список PIL.Image страниц документа.
 
     PDF рендерится через PyMuPDF с заданным dpi; JPG/PNG открываются напрямую
     (dpi для них не имеет смысла — берём как есть).
     """
-    Image = _import_pillow()
-    ext = os.path.splitext(path)[1].lower()
-
-    if ext in _IMAGE_EXTENSIONS:
-        img = Image.open(path)
-        return [img.convert("RGB")]
-
-    try:
-        import fitz  # PyMuPDF
-    except ImportError:
-        logger.error("PyMuPDF не установлен. Запустите: pip install pymupdf")
-        raise
-
-    pages = []
-    doc = fitz.open(path)
-    try:
-        for page in doc:
-            pix = page.get_pixmap(dpi=dpi, alpha=False)
-            pages.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
-    finally:
-        doc.close()
-    return pages
+    return load_page_images(path, dpi=dpi, max_pages=max_pages)
 
 
-def _encode_jpeg_under_limit(img, *, max_side: int = _MAX_LONG_SIDE) -> tuple[str, str]:
-    """PIL.Image → ``("image/jpeg", base64)`` с гарантией лимита Anthropic.
+def render_document_images(path: str) -> list[tuple[str, str]]:
+    """Полные страницы документа как ``(media_type, base64)`` — первый проход.
 
-    Сначала ужимаем до max_side по длинной стороне, затем понижаем JPEG
-    quality, пока raw-размер не уложится в ``_MAX_RAW_IMAGE_BYTES``.
+    Многостраничные PDF рендерятся параллельно, повторный вызов для того же
+    файла берёт страницы из дискового кэша (см. ``pdf_processing``).
     """
-    Image = _import_pillow()
-    if max(img.size) > max_side:
-        img = img.copy()
-        img.thumbnail((max_side, max_side), Image.LANCZOS)
-
-    buf = io.BytesIO()
-    for quality in (88, 80, 72, 65):
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=quality, optimize=True)
-        if buf.tell() <= _MAX_RAW_IMAGE_BYTES:
-            break
-    else:
-        logger.warning("scan_extractor: image didn't fit limit even at q=65 (%d bytes)", buf.tell())
-    return ("image/jpeg", base64.b64encode(buf.getvalue()).decode("utf-8"))
-
-
-def render_document_images(path: str) -> list[tuple[str, str]]:
-    """Полные страницы документа как ``(media_type, base64)`` — первый проход."""
-    out = []
-    for idx, img in enumerate(_load_page_images(path, dpi=_FULL_PAGE_DPI)):
-        payload = _encode_jpeg_under_limit(img)
-        out.append(payload)
-        logger.info(
-            "scan_extractor: rendered page %d of %s (%d bytes raw)",
-            idx,
-            os.path.basename(path),
-            len(payload[1]) * 3 // 4,
-        )
-    return out
+    return render_pages_jpeg(path, dpi=_FULL_PAGE_DPI, max_side=_MAX_LONG_SIDE)
 
 
 def _tile_image(img, *, overlap: float = _TILE_OVERLAP) -> list:
@@ -154,8 +92,8 @@ def _tile_image(img, *, overlap: float = _TILE_OVERLAP) -> list:
 def render_vin_verification_images(path: str) -> list[tuple[str, str]]:
     """Тайлы страниц крупным планом для посимвольного чтения VIN."""
     out: list[tuple[str, str]] = []
-    pages = _load_page_images(path, dpi=_TILE_PAGE_DPI)
-    for img in pages[:_MAX_VERIFY_PAGES]:
+    pages = _load_page_images(path, dpi=_TILE_PAGE_DPI, max_pages=_MAX_VERIFY_PAGES)
+    for img in pages:
         for tile in _tile_image(img):
             out.append(_encode_jpeg_under_limit(tile))
     return out
@@ -313,13 +251,39 @@ def _call_claude_vision(
     images: Iterable[tuple[str, str]],
     system_prompt: str,
     user_text: str,
+    *,
+    use_cache: bool = True,
 ) -> dict[str, Any]:
     """Отправляет изображения в Claude Vision и парсит JSON-ответ.
 
     ``images`` — итерируемое ``(media_type, base64)`` пар.
     Возвращает dict (даже при ошибке парсинга — пустой). Бросает только
     при отсутствии API-ключа или сетевых ошибках.
+
+    Ответ кэшируется по хэшу изображений + промпту + модели (см.
+    ``extraction_cache``); ``use_cache=False`` — спросить модель заново.
     """
+    from core.models import LLMExtractionCache
+    from core.services.extraction_cache import cached_extraction, hash_images
+
+    images = list(images)
+    model = _get_model_name()
+    return cached_extraction(
+        LLMExtractionCache.PIPELINE_SCAN,
+        content_hash=hash_images(images),
+        prompt=(system_prompt, user_text),
+        model=model,
+        compute=lambda: _request_claude_vision(images, system_prompt, user_text, model),
+        use_cache=use_cache,
+    )
+
+
+def _request_claude_vision(
+    images: list[tuple[str, str]],
+    system_prompt: str,
+    user_text: str,
+    model: str,
+) -> dict[str, Any]:
     try:
         import anthropic
     except ImportError:
@@ -351,7 +315,7 @@ def _call_claude_vision(
     # max_tokens=4000: у claude-sonnet-5 thinking-блоки расходуют тот же
     # бюджет токенов — при 2000 текст ответа может обрезаться.
     response = client.messages.create(
-        model=_get_model_name(),
+        model=model,
         max_tokens=4000,
         system=system_prompt,
         messages=[{"role": "user", "content": content_blocks}],
@@ -373,7 +337,7 @@ def _call_claude_vision(
         return {}
 
 
-def _second_pass_read_vins(path: str) -> list[str] | None:
+def _second_pass_read_vins(path: str, *, use_cache: bool = True) -> list[str] | None:
     """Второй проход: посимвольное чтение VIN с увеличенных тайлов.
 
     Возвращает список прочитанных VIN или None, если проход не удался
@@ -387,6 +351,7 @@ def _second_pass_read_vins(path: str) -> list[str] | None:
             tiles,
             system_prompt=VIN_VERIFY_PROMPT,
             user_text="Прочитай все VIN на этих фрагментах посимвольно.",
+            use_cache=use_cache,
         )
     except Exception as e:
         logger.warning("scan_extractor: second-pass VIN read failed for %s: %s", path, e)
@@ -430,7 +395,7 @@ def _match_second_pass(vin: str, second_pass_vins: list[str] | None) -> str | No
 # ── Публичные функции ─────────────────────────────────────────────────────
 
 
-def extract_title(path: str, *, use_second_pass: bool = True) -> dict[str, Any]:
+def extract_title(path: str, *, use_second_pass: bool = True, use_cache: bool = True) -> dict[str, Any]:
     """Извлечь данные из скана US car title (PDF/JPG/PNG).
 
     Возвращает dict вида ``TITLE_SCHEMA`` + ключи:
@@ -447,12 +412,13 @@ def extract_title(path: str, *, use_second_pass: bool = True) -> dict[str, Any]:
         images,
         system_prompt=TITLE_PROMPT,
         user_text="Это отсканированный US car title. Извлеки данные по схеме.",
+        use_cache=use_cache,
     )
-    _postprocess_title_vins(data, path, use_second_pass=use_second_pass)
+    _postprocess_title_vins(data, path, use_second_pass=use_second_pass, use_cache=use_cache)
     return data
 
 
-def extract_dock_receipt(path: str, *, use_second_pass: bool = True) -> dict[str, Any]:
+def extract_dock_receipt(path: str, *, use_second_pass: bool = True, use_cache: bool = True) -> dict[str, Any]:
     """Извлечь данные из скана Dock Receipt (PDF/JPG/PNG).
 
     Возвращает dict вида ``DOCK_RECEIPT_SCHEMA``. Каждое vehicle дополняется
@@ -466,15 +432,16 @@ def extract_dock_receipt(path: str, *, use_second_pass: bool = True) -> dict[str
         images,
         system_prompt=DOCK_RECEIPT_PROMPT,
         user_text="Это отсканированный US Dock Receipt. Извлеки данные по схеме.",
+        use_cache=use_cache,
     )
-    _postprocess_dock_receipt_vins(data, path, use_second_pass=use_second_pass)
+    _postprocess_dock_receipt_vins(data, path, use_second_pass=use_second_pass, use_cache=use_cache)
     return data
 
 
 # ── Пост-обработка VIN (нормализация, коррекция, валидация, уверенность) ──
 
 
-def _postprocess_title_vins(data: dict[str, Any], path: str, *, use_second_pass: bool) -> None:
+def _postprocess_title_vins(data: dict[str, Any], path: str, *, use_second_pass: bool, use_cache: bool = True) -> None:
     """Прогоняет VIN-ы титула через vin_corrector, обновляет data in-place."""
     from core.services.vin_corrector import process_extracted_vin
 
@@ -486,7 +453,7 @@ def _postprocess_title_vins(data: dict[str, Any], path: str, *, use_second_pass:
         data["vin_validations"] = []
         return
 
-    second_pass_vins = _second_pass_read_vins(path) if use_second_pass else None
+    second_pass_vins = _second_pass_read_vins(path, use_cache=use_cache) if use_second_pass else None
 
     final_vins: list[str] = []
     processing: list[dict[str, Any]] = []
@@ -521,7 +488,9 @@ def _postprocess_title_vins(data: dict[str, Any], path: str, *, use_second_pass:
     data["vin_confidences"] = confidences
 
 
-def _postprocess_dock_receipt_vins(data: dict[str, Any], path: str, *, use_second_pass: bool) -> None:
+def _postprocess_dock_receipt_vins(
+    data: dict[str, Any], path: str, *, use_second_pass: bool, use_cache: bool = True
+) -> None:
     """Прогоняет VIN каждого vehicle через vin_corrector, обновляет in-place."""
     from core.services.vin_corrector import process_extracted_vin
 
@@ -529,7 +498,7 @@ def _postprocess_dock_receipt_vins(data: dict[str, Any], path: str, *, use_secon
     if not isinstance(vehicles, list):
         return
     has_vins = any(isinstance(v, dict) and v.get("vin") for v in vehicles)
-    second_pass_vins = _second_pass_read_vins(path) if (use_second_pass and has_vins) else None
+    second_pass_vins = _second_pass_read_vins(path, use_cache=use_cache) if (use_second_pass and has_vins) else None
 
     for veh in vehicles:
         if not isinstance(veh, dict) or not veh.get("vin"):
@@ -0,0 +1,83 @@
+"""
+Общая обвязка поддерживаемых сводок.
+
+* :class:`DeferredRefresh` — ключи копятся в потоке и уходят одним вызовом
+  обработчика после коммита: каскад из сотни сохранений даёт один пересчёт.
+  Сбой обработчика только логируется — сводка это кэш, ночная сверка её
+  догонит. Так пересчитываются дешёвые построчные сводки
+  (``email_counters``, ``car_profitability``); месячные
+  (``comparison_buckets``, ``expense_rollup``) уходят в фон через
+  :mod:`core.services.task_coalescer`.
+* :func:`lock_rebuild` — сериализация пересборки по ключам.
+* :func:`bump_cache_versions` — версии-счётчики в кэше для ключей отчётов.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Hashable, Iterable
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredRefresh:
+    """Пересчёт ``handler(keys)`` после коммита с дедупликацией в пределах потока."""
+
+    def __init__(self, name: str, handler: Callable[[set], object]):
+        self.name = name
+        self.handler = handler
+        self._local = threading.local()
+
+    def _pending(self) -> set:
+        keys = getattr(self._local, "keys", None)
+        if keys is None:
+            keys = self._local.keys = set()
+        return keys
+
+    def schedule(self, keys: Iterable[Hashable]) -> None:
+        keys = set(keys)
+        if keys:
+            self._pending().update(keys)
+            transaction.on_commit(self.flush)
+
+    def flush(self) -> None:
+        pending = self._pending()
+        batch = set(pending)
+        pending.clear()
+        if batch:
+            self.run(self.handler, batch)
+
+    def run(self, func: Callable, *args) -> None:
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("[%s] refresh failed", self.name)
+
+
+def lock_rebuild(namespace: str, keys: Iterable[int]) -> None:
+    """Взять блокировки пересборки ``keys`` до конца текущей транзакции.
+
+    PostgreSQL — ``pg_advisory_xact_lock`` на каждый ключ по возрастанию,
+    так что пересборки пересекающихся наборов не дедлочат друг друга. На
+    других БД (SQLite в dev и тестах) записи и так идут в один поток.
+    """
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for key in sorted(set(keys)):
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s), %s)", [namespace, key])
+
+
+def bump_cache_versions(keys: Iterable[str]) -> None:
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Новый (или вытесненный) ключ стартует с time_ns — не совпадёт
+            # ни с одной из прежних версий.
+            cache.set(key, time.time_ns(), None)
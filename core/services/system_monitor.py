@@ -9,6 +9,8 @@
   Вызывается из celery beat (раз в 5 мин) для сохранения в БД,
   а также из view напрямую для real-time блока.
 - `ping_health()` — пингует /health/ endpoint для uptime-трекинга.
+- `compute_alerts()` — алерты по снимку, включая телеметрию Celery-задач
+  (time limit, долгое ожидание в очереди, серия ошибок).
 
 Платформо-зависимое:
 - На Windows (локальная разработка) `psutil` работает; systemd/systemctl
@@ -25,11 +27,13 @@ import shutil
 import socket
 import subprocess
 import time
+from datetime import timedelta
 from typing import Any
 
 import psutil
 from django.conf import settings
 from django.db import connection
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -315,6 +319,24 @@ def _collect_celery_queue() -> dict[str, Any]:
         return {"queue_len": 0, "available": False, "error": str(exc)[:200]}
 
 
+def _collect_task_coalescing() -> dict[str, Any]:
+    """Счётчики склейки фоновых пересчётов (core.services.task_coalescer)."""
+    from core.services.task_coalescer import coalescing_stats
+
+    return coalescing_stats()
+
+
+# Окно «сейчас» для телеметрии задач в снимке и алертах.
+TASK_TELEMETRY_WINDOW = timedelta(minutes=15)
+
+
+def _collect_task_telemetry() -> list[dict[str, Any]]:
+    """Сводка по Celery-задачам за последние 15 минут (core.services.task_metrics)."""
+    from core.services.task_metrics import task_stats
+
+    return task_stats(timezone.now() - TASK_TELEMETRY_WINDOW)
+
+
 # ── UPTIME / NETWORK ────────────────────────────────────────────────────────
 def _collect_host() -> dict[str, Any]:
     boot = psutil.boot_time()
@@ -342,6 +364,8 @@ def collect_snapshot() -> dict[str, Any]:
         "postgres": _safe(_collect_postgres, {}),
         "redis": _safe(_collect_redis, {}),
         "celery": _safe(_collect_celery_queue, {}),
+        "task_coalescing": _safe(_collect_task_coalescing, {}),
+        "task_telemetry": _safe(_collect_task_telemetry, []),
         "host": _safe(_collect_host, {}),
         "collected_at": time.time(),
     }
@@ -444,4 +468,29 @@ def compute_alerts(snapshot: dict[str, Any]) -> list[dict[str, str]]:
                 }
             )
 
+    wait_threshold_ms = int(getattr(settings, "TASK_WAIT_ALERT_SECONDS", 120)) * 1000
+    for task in snapshot.get("task_telemetry") or []:
+        name = task["task"].rsplit(".", 1)[-1]
+        if task.get("time_limit_hits"):
+            alerts.append(
+                {
+                    "level": "warning",
+                    "message": f"Celery: {name} упёрлась в time limit ({task['time_limit_hits']} раз за 15 мин)",
+                }
+            )
+        if task.get("avg_wait_ms") and task["avg_wait_ms"] > wait_threshold_ms:
+            alerts.append(
+                {
+                    "level": "warning",
+                    "message": f"Celery: {name} ждёт воркера в среднем {task['avg_wait_ms'] / 1000:.0f} с",
+                }
+            )
+        if task.get("failures", 0) >= 3 and (task.get("failure_rate") or 0) >= 0.5:
+            alerts.append(
+                {
+                    "level": "critical" if task["failure_rate"] >= 1 else "warning",
+                    "message": f"Celery: {name} — {task['failures']} ошибок из {task['count']} запусков за 15 мин",
+                }
+            )
+
     return alerts
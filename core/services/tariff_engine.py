@@ -0,0 +1,373 @@
+"""
+Пакетный движок THS и тарифов клиентов.
+
+``create_ths_services_for_container`` / ``apply_client_tariffs_for_container``
+работают по одному контейнеру: на каждую машину — DELETE старых THS,
+``create`` новой услуги, запрос ставки тарифа и ``save()`` каждой
+услуги с новой наценкой. Ретро-применение тарифа к сезону контейнеров
+(``recalculate_client_tariffs``, «Пересчитать THS» в админке линии) —
+тысячи запросов и сигнальных каскадов.
+
+Здесь тот же расчёт для набора контейнеров за фиксированное число
+запросов:
+
+* машины всех контейнеров — один запрос (``select_related("client")``);
+* коэффициенты THS — один запрос на все линии, THS-услуги каталога —
+  один запрос на тип плательщика (недостающие создаются как раньше);
+* ставки тарифов — один запрос на всех клиентов пачки, подбор ставки и
+  раскладка наценки — в памяти;
+* запись — два DELETE старых THS, ``bulk_create`` новых и один
+  ``bulk_update`` наценок.
+
+Сигналы ``CarService`` при этом не шлются: ``total_price`` и инвойсы
+пересчитывает вызывающий код (или :func:`reprice_cars_and_invoices`),
+сводку прибыли после пересборки THS — :func:`recalculate_containers`.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Q
+
+from core.service_codes import ServiceCode, is_storage_service
+
+logger = logging.getLogger(__name__)
+
+THS_NOTE = "THS рассчитан пропорционально. Тип ТС: {}"
+
+
+@dataclass
+class TariffBatchResult:
+    """Итог :func:`recalculate_containers`."""
+
+    containers: int = 0
+    ths_services: int = 0
+    markups_changed: int = 0
+    car_ids: list[int] = field(default_factory=list)
+
+
+def _ths_q() -> Q:
+    return Q(code=ServiceCode.THS) | Q(name__icontains="THS")
+
+
+def ths_shares(total_ths, cars, coefficients: dict) -> dict[int, Decimal]:
+    """{car.id: доля THS} — пропорционально коэффициентам типов ТС.
+
+    ``coefficients`` — ``{vehicle_type: коэффициент}`` линии (нет
+    записи — 1.00). Доли округляются вверх до 5 EUR.
+    """
+    from core.utils import round_up_to_5
+
+    total_ths = Decimal(str(total_ths or 0))
+    if total_ths <= 0 or not cars:
+        return {}
+    car_coefficients = {car.id: coefficients.get(car.vehicle_type, Decimal("1.00")) for car in cars}
+    total_coefficient = sum(car_coefficients.values(), Decimal("0.00"))
+    if total_coefficient == 0:
+        equal_share = total_ths / len(cars)
+        return {car.id: round_up_to_5(equal_share) for car in cars}
+    return {car.id: round_up_to_5(total_ths * car_coefficients[car.id] / total_coefficient) for car in cars}
+
+
+def load_ths_coefficients(line_ids: Iterable[int]) -> dict[int, dict[str, Decimal]]:
+    """``{line_id: {vehicle_type: коэффициент}}`` одним запросом."""
+    from core.models import LineTHSCoefficient
+
+    result: dict[int, dict[str, Decimal]] = defaultdict(dict)
+    rows = LineTHSCoefficient.objects.filter(line_id__in=set(line_ids)).values_list(
+        "line_id", "vehicle_type", "coefficient"
+    )
+    for line_id, vehicle_type, coefficient in rows:
+        result[line_id][vehicle_type] = Decimal(str(coefficient))
+    return result
+
+
+# ---------------------------------------------------------------------------
+# THS
+# ---------------------------------------------------------------------------
+
+
+def _ths_payer(container) -> str:
+    payer = getattr(container, "ths_payer", None) or "LINE"
+    if payer == "WAREHOUSE" and not container.warehouse_id:
+        logger.warning(
+            "Container %s: ths_payer=WAREHOUSE but no warehouse set. Falling back to LINE.",
+            container.number,
+        )
+        return "LINE"
+    return payer
+
+
+def _ths_catalog(model, owner_field: str, owners: dict) -> dict[int, object]:
+    """{owner_id: THS-услуга} — первая активная по pk, как ``.first()``.
+
+    ``owners`` — ``{owner_id: контейнер}``. Владельцев без THS-услуги
+    дополняем через ``get_or_create`` (как и одиночный путь) — это редкие
+    запросы только при первом расчёте.
+    """
+    found: dict[int, object] = {}
+    for service in (
+        model.objects.filter(**{f"{owner_field}_id__in": owners}, is_active=True).filter(_ths_q()).order_by("pk")
+    ):
+        found.setdefault(getattr(service, f"{owner_field}_id"), service)
+    for owner_id, container in owners.items():
+        if owner_id in found:
+            continue
+        owner = getattr(container, owner_field)
+        defaults = {
+            "code": ServiceCode.THS,
+            "description": "Услуга THS (рассчитывается пропорционально)",
+            "default_price": 0,
+            "is_active": True,
+        }
+        if owner_field == "warehouse":
+            defaults["add_by_default"] = False
+        found[owner_id], _ = model.objects.get_or_create(
+            **{owner_field: owner}, name=f"THS {owner.name}", defaults=defaults
+        )
+    return found
+
+
+def _rebuild_ths(containers: list, cars_by_container: dict) -> int:
+    """Пересоздать THS-услуги машин контейнеров с линией и THS > 0."""
+    from core.models import CarService, LineService, WarehouseService
+    from core.services.cascade_control import CAR_SERVICE_DELETE_SIGNALS, signals_disabled
+
+    coefficients = load_ths_coefficients(c.line_id for c in containers if c.line_id)
+    plans = []
+    for container in containers:
+        if not container.line_id:
+            continue
+        shares = ths_shares(
+            container.ths, cars_by_container.get(container.pk, []), coefficients.get(container.line_id, {})
+        )
+        if shares:
+            plans.append((container, _ths_payer(container), shares))
+    if not plans:
+        return 0
+
+    lines = {c.line_id: c for c, payer, _ in plans if payer == "LINE"}
+    warehouses = {c.warehouse_id: c for c, payer, _ in plans if payer == "WAREHOUSE"}
+    line_services = _ths_catalog(LineService, "line", lines) if lines else {}
+    warehouse_services = _ths_catalog(WarehouseService, "warehouse", warehouses) if warehouses else {}
+
+    cars = {car.id: car for container_cars in cars_by_container.values() for car in container_cars}
+    to_create = []
+    for container, payer, shares in plans:
+        service = line_services[container.line_id] if payer == "LINE" else warehouse_services[container.warehouse_id]
+        for car_id, amount in shares.items():
+            to_create.append(
+                CarService(
+                    car_id=car_id,
+                    service_type=payer,
+                    service_id=service.id,
+                    custom_price=amount,
+                    quantity=1,
+                    notes=THS_NOTE.format(cars[car_id].get_vehicle_type_display()),
+                )
+            )
+        logger.info("THS distribution for container %s: total=%s, result=%s", container.number, container.ths, shares)
+
+    car_ids = [car_id for _c, _p, shares in plans for car_id in shares]
+    with transaction.atomic(), signals_disabled(*CAR_SERVICE_DELETE_SIGNALS):
+        CarService.objects.filter(
+            car_id__in=car_ids,
+            service_type="LINE",
+            service_id__in=LineService.objects.filter(_ths_q()).values_list("id", flat=True),
+        ).delete()
+        CarService.objects.filter(
+            car_id__in=car_ids,
+            service_type="WAREHOUSE",
+            service_id__in=WarehouseService.objects.filter(_ths_q()).values_list("id", flat=True),
+        ).delete()
+        CarService.objects.bulk_create(to_create, batch_size=500)
+    return len(to_create)
+
+
+# ---------------------------------------------------------------------------
+# Тарифы клиентов
+# ---------------------------------------------------------------------------
+
+
+def count_vehicles_for_tariff(vehicle_types: list[str], vehicle_type: str) -> int:
+    """Кол-во ТС контейнера для подбора тарифа: мотоциклы и прочие — раздельно."""
+    from core.services.car_service_manager import MOTORCYCLE_TYPES
+
+    target_is_moto = vehicle_type in MOTORCYCLE_TYPES
+    return sum(1 for vt in vehicle_types if (vt in MOTORCYCLE_TYPES) == target_is_moto)
+
+
+def pick_agreed_total(client, rates: list, vehicle_type: str, count: int) -> Decimal | None:
+    """Ставка ``agreed_total_price`` из уже загруженных ``rates`` клиента
+    (в порядке ``ClientTariffRate.Meta.ordering``) — как ``_get_agreed_total``."""
+    for rate in rates:
+        if rate.vehicle_type != vehicle_type:
+            continue
+        if client.tariff_type == "FIXED":
+            return rate.agreed_total_price
+        if (
+            client.tariff_type == "FLEXIBLE"
+            and rate.min_cars <= count
+            and (rate.max_cars is None or rate.max_cars >= count)
+        ):
+            return rate.agreed_total_price
+    return None
+
+
+def distribute_markup(services: list, agreed_total: Decimal) -> list:
+    """Наценки услуг одной машины, приводящие складской пакет ровно к тарифу.
+
+    Хранение — наценка 0, остальные услуги склада делят ``agreed_total -
+    база`` поровну (остаток — последней). Меняет объекты в памяти и
+    возвращает изменённые.
+    """
+    changed = []
+    for svc in services:
+        if is_storage_service(svc) and svc.markup_amount != 0:
+            svc.markup_amount = Decimal("0")
+            changed.append(svc)
+
+    package = [svc for svc in services if svc.service_type == "WAREHOUSE" and not is_storage_service(svc)]
+    if not package:
+        return changed
+    diff = agreed_total - sum(Decimal(str(svc.final_price)) for svc in package)
+    share = (diff / len(package)).quantize(Decimal("0.01"))
+    remainder = diff - share * len(package)
+    for i, svc in enumerate(package):
+        markup = share + remainder if i == len(package) - 1 else share
+        if svc.markup_amount != markup:
+            svc.markup_amount = markup
+            changed.append(svc)
+    return changed
+
+
+def apply_client_tariffs_for_cars(cars: list) -> int:
+    """Применить тарифы клиентов FIXED/FLEXIBLE к пачке машин.
+
+    Машины — с ``select_related("client")``. Число ТС для FLEXIBLE
+    считается по всему контейнеру машины (одним запросом на пачку),
+    машина без контейнера — одна. Клиенты без тарифа не трогаются.
+    Возвращает число услуг с изменённой наценкой.
+    """
+    return len(apply_client_tariffs(cars))
+
+
+def apply_client_tariffs(cars: list) -> list:
+    """То же, что :func:`apply_client_tariffs_for_cars`, но возвращает
+    услуги с изменённой наценкой (по ним видно, чьи инвойсы регенерировать)."""
+    from core.models import Car, CarService, ClientTariffRate
+    from core.models.services import prefetch_service_objects
+
+    cars = [car for car in cars if car.client_id and car.client.tariff_type in ("FIXED", "FLEXIBLE")]
+    if not cars:
+        return []
+
+    container_types: dict[int, list[str]] = defaultdict(list)
+    container_ids = {car.container_id for car in cars if car.container_id}
+    for container_id, vehicle_type in Car.objects.filter(container_id__in=container_ids).values_list(
+        "container_id", "vehicle_type"
+    ):
+        container_types[container_id].append(vehicle_type)
+
+    rates: dict[int, list] = defaultdict(list)
+    for rate in ClientTariffRate.objects.filter(client_id__in={car.client_id for car in cars}):
+        rates[rate.client_id].append(rate)
+
+    services: dict[int, list] = defaultdict(list)
+    all_services = list(CarService.objects.filter(car_id__in=[car.pk for car in cars]).order_by("pk"))
+    prefetch_service_objects(all_services)
+    for svc in all_services:
+        services[svc.car_id].append(svc)
+
+    changed = []
+    for car in cars:
+        types = container_types.get(car.container_id) if car.container_id else None
+        count = count_vehicles_for_tariff(types, car.vehicle_type) if types else 1
+        agreed_total = pick_agreed_total(car.client, rates[car.client_id], car.vehicle_type, count)
+        if agreed_total is None:
+            logger.debug(
+                "Нет тарифа для %s (%s), тип ТС: %s, кол-во ТС: %s",
+                car.client.name,
+                car.client.tariff_type,
+                car.vehicle_type,
+                count,
+            )
+            continue
+        changed.extend(distribute_markup(services[car.pk], agreed_total))
+
+    if changed:
+        CarService.objects.bulk_update(changed, ["markup_amount"], batch_size=500)
+    return changed
+
+
+# ---------------------------------------------------------------------------
+# Пачка контейнеров
+# ---------------------------------------------------------------------------
+
+
+def recalculate_containers(containers: Iterable, *, ths: bool = True, tariffs: bool = True) -> TariffBatchResult:
+    """THS + тарифы клиентов для набора контейнеров одной транзакцией.
+
+    ``containers`` — объекты (берутся как есть) или pk. THS пересоздаётся у контейнеров с
+    линией и THS > 0, тарифы применяются ко всем машинам пачки.
+    """
+    from core.models import Car, Container
+    from core.services import car_profitability
+
+    containers = list(containers)
+    loaded = [c for c in containers if not isinstance(c, int)]
+    pks = [c for c in containers if isinstance(c, int)]
+    if pks:
+        loaded += list(Container.objects.filter(pk__in=pks).select_related("line", "warehouse"))
+    result = TariffBatchResult()
+    if not loaded:
+        return result
+    ids = [c.pk for c in loaded]
+
+    cars_by_container: dict[int, list] = defaultdict(list)
+    for car in Car.objects.filter(container_id__in=ids).select_related("client").order_by("pk"):
+        cars_by_container[car.container_id].append(car)
+
+    with transaction.atomic():
+        if ths:
+            result.ths_services = _rebuild_ths(loaded, cars_by_container)
+        if tariffs:
+            result.markups_changed = apply_client_tariffs_for_cars(
+                [car for container_cars in cars_by_container.values() for car in container_cars]
+            )
+    result.containers = len(loaded)
+    result.car_ids = [car.pk for container_cars in cars_by_container.values() for car in container_cars]
+    if ths:
+        # Удалённые THS отвязывают затраты (``SupplierCost.car_service`` — SET_NULL).
+        car_profitability.schedule_refresh(result.car_ids)
+    logger.info(
+        "[tariff_engine] %s containers: %s THS services, %s markups changed",
+        result.containers,
+        result.ths_services,
+        result.markups_changed,
+    )
+    return result
+
+
+def reprice_cars_and_invoices(car_ids: list[int]) -> int:
+    """Пересчитать ``days``/``storage_cost``/``total_price`` машин батчем и
+    поставить регенерацию их инвойсов. Возвращает число машин."""
+    from core.models import Car
+    from core.services.car_pricing import PRICE_FIELDS, reprice_cars
+    from core.services.comparison_buckets import schedule_refresh_for_cars
+    from core.services.task_coalescer import JOB_CAR_INVOICES, schedule
+
+    if not car_ids:
+        return 0
+    cars = list(Car.objects.filter(pk__in=car_ids).select_related("warehouse").prefetch_related("car_services"))
+    repriced = reprice_cars(cars)
+    Car.objects.bulk_update(repriced, list(PRICE_FIELDS), batch_size=200)
+    schedule_refresh_for_cars(repriced)
+    schedule(JOB_CAR_INVOICES, [car.pk for car in cars])
+    return len(repriced)
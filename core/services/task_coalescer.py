@@ -0,0 +1,249 @@
+"""
+Debounce и склейка фоновых пересчётов (``recalculate_cars_total_price_task``,
+``regenerate_invoices_for_cars_task``, пересборка месячных сводок).
+
+Сигналы ставят пересчёт на каждую машину, а дедупликация была только
+thread-local — в пределах одной транзакции. Серия правок карточки из
+нескольких запросов или воркеров порождала одну и ту же задачу десятки раз.
+
+Здесь работа копится как множество целых ключей (id машин, месяцы ``YYYYMM``)
+в Redis:
+
+1. ``schedule(job, ids)`` — после коммита ``SADD`` в ``coalesce:pending:<job>``;
+   первый вызов в окне взводит таймер (``SET NX``) и ставит
+   ``flush_coalesced_jobs_task`` с ``countdown=TASK_COALESCE_WINDOW``;
+2. ``flush(job)`` — снимает таймер и вычерпывает множество (``SPOP``)
+   пачками по ``BATCH_SIZE``; каждая пачка — одна целевая задача.
+
+Всё, что пришло за окно, уходит несколькими батчами вместо потока задач.
+Таймер снимается до вычерпывания, поэтому ключи, пришедшие во время flush,
+взведут новый. Таймер живёт с запасом (``_TIMER_TTL_FACTOR`` окон): если
+flush-задача потерялась, следующий ``schedule`` взведёт таймер заново.
+
+Метрики склейки — хэш ``coalesce:stats:<job>`` (requested / dispatched /
+batches), см. ``coalescing_stats()``; попадают в снимок system monitor.
+
+Без Redis (``TASK_COALESCE_REDIS_URL`` пуст — dev/тесты) или при его
+недоступности задача ставится сразу, как раньше; при недоступности брокера —
+выполняется inline.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from functools import partial
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+JOB_CAR_PRICES = "car_prices"
+JOB_CAR_INVOICES = "car_invoices"
+JOB_COMPARISON_MONTHS = "comparison_months"
+JOB_EXPENSE_MONTHS = "expense_months"
+
+# job → целевая задача (принимает список ключей одним аргументом).
+JOB_TASKS = {
+    JOB_CAR_PRICES: "recalculate_cars_total_price_task",
+    JOB_CAR_INVOICES: "regenerate_invoices_for_cars_task",
+    JOB_COMPARISON_MONTHS: "refresh_comparison_months_task",
+    JOB_EXPENSE_MONTHS: "refresh_expense_rollup_months_task",
+}
+
+BATCH_SIZE = 500
+_TIMER_TTL_FACTOR = 10
+
+
+def _pending_key(job: str) -> str:
+    return f"coalesce:pending:{job}"
+
+
+def _timer_key(job: str) -> str:
+    return f"coalesce:timer:{job}"
+
+
+def _stats_key(job: str) -> str:
+    return f"coalesce:stats:{job}"
+
+
+def _window() -> int:
+    return int(getattr(settings, "TASK_COALESCE_WINDOW", 5))
+
+
+_client_lock = threading.Lock()
+_client = None
+_client_url = None
+
+
+def _redis():
+    """Клиент Redis для очереди склейки или ``None`` (выключено)."""
+    global _client, _client_url
+    url = getattr(settings, "TASK_COALESCE_REDIS_URL", "")
+    if not url:
+        return None
+    with _client_lock:
+        if _client is None or _client_url != url:
+            import redis as redis_lib
+
+            _client = redis_lib.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            _client_url = url
+        return _client
+
+
+def _task(job: str):
+    from core import tasks
+
+    return getattr(tasks, JOB_TASKS[job])
+
+
+# ---------------------------------------------------------------------------
+# Постановка
+# ---------------------------------------------------------------------------
+
+_local = threading.local()
+
+
+def _seen_in_transaction(job: str) -> set[int]:
+    """id, уже запланированные в текущей транзакции.
+
+    Привязано к списку on_commit-коллбэков соединения: Django заводит новый
+    список на каждый commit/rollback, так что после отката множество
+    сбрасывается само и не глушит последующие постановки.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return set()
+    if getattr(_local, "owner", None) is not connection.run_on_commit:
+        _local.owner = connection.run_on_commit
+        _local.seen = {name: set() for name in JOB_TASKS}
+    return _local.seen[job]
+
+
+def schedule(job: str, ids: Iterable[int]) -> None:
+    """Запланировать ``job`` для ``ids`` после коммита текущей транзакции.
+
+    Повторные id в пределах транзакции (10 ``post_save`` от услуг одной
+    машины) отбрасываются сразу, остальное склеивается в Redis.
+    """
+    if job not in JOB_TASKS:
+        raise ValueError(f"Unknown coalesced job: {job}")
+    seen = _seen_in_transaction(job)
+    new_ids = sorted({int(pk) for pk in ids if pk} - seen)
+    if not new_ids:
+        return
+    seen.update(new_ids)
+    transaction.on_commit(partial(_submit_safe, job, new_ids))
+
+
+def _submit_safe(job: str, ids: list[int]) -> None:
+    # Транзакция закоммичена — её id больше не дубли для следующих постановок.
+    _local.owner = None
+    try:
+        _submit(job, ids)
+    except Exception:
+        logger.exception("[task_coalescer] failed to submit %s (%s ids)", job, len(ids))
+
+
+def _submit(job: str, ids: list[int]) -> None:
+    window = _window()
+    client = _redis() if window > 0 else None
+    if client is not None:
+        try:
+            armed = _record(client, job, ids, window)
+        except Exception as exc:
+            logger.warning("[task_coalescer] redis unavailable, dispatching %s directly: %s", job, exc)
+        else:
+            if armed:
+                _arm_flush(client, job, window)
+            return
+    _dispatch(job, ids)
+
+
+def _record(client, job: str, ids: list[int], window: int) -> bool:
+    """Добавить ключи в очередь; ``True``, если этот вызов взвёл таймер."""
+    pipe = client.pipeline()
+    pipe.sadd(_pending_key(job), *ids)
+    pipe.hincrby(_stats_key(job), "requested", len(ids))
+    pipe.set(_timer_key(job), "1", nx=True, ex=window * _TIMER_TTL_FACTOR)
+    return bool(pipe.execute()[-1])
+
+
+def _arm_flush(client, job: str, window: int) -> None:
+    from core.tasks import flush_coalesced_jobs_task
+
+    try:
+        flush_coalesced_jobs_task.apply_async((job,), countdown=window)
+    except Exception:
+        logger.exception("[task_coalescer] cannot enqueue flush for %s — flushing inline", job)
+        flush(job)
+
+
+def _dispatch(job: str, ids: list[int]) -> None:
+    """Поставить целевую задачу пачками; брокер недоступен — выполнить inline."""
+    task = _task(job)
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start : start + BATCH_SIZE]
+        try:
+            task.delay(chunk)
+        except Exception:
+            logger.exception("Celery enqueue failed for %s(%s ids) — running inline", JOB_TASKS[job], len(chunk))
+            try:
+                task(chunk)
+            except Exception:
+                logger.exception("Inline %s failed for %s ids", JOB_TASKS[job], len(chunk))
+
+
+# ---------------------------------------------------------------------------
+# Сброс
+# ---------------------------------------------------------------------------
+
+
+def flush(job: str) -> int:
+    """Вычерпать очередь ``job`` и поставить целевые задачи. Возвращает число id."""
+    client = _redis()
+    if client is None:
+        return 0
+    # Сначала таймер: ключи, пришедшие во время вычерпывания, взведут новый.
+    client.delete(_timer_key(job))
+    dispatched = 0
+    batches = 0
+    while True:
+        raw = client.spop(_pending_key(job), BATCH_SIZE)
+        if not raw:
+            break
+        ids = sorted(int(pk) for pk in raw)
+        _dispatch(job, ids)
+        dispatched += len(ids)
+        batches += 1
+    if dispatched:
+        pipe = client.pipeline()
+        pipe.hincrby(_stats_key(job), "dispatched", dispatched)
+        pipe.hincrby(_stats_key(job), "batches", batches)
+        pipe.execute()
+        logger.info("[task_coalescer] %s: flushed %s ids in %s batches", job, dispatched, batches)
+    return dispatched
+
+
+def coalescing_stats() -> dict[str, dict]:
+    """Счётчики склейки по job: запрошено ключей, поставлено, батчей и
+    ``ratio`` — во сколько раз склейка сократила работу (requested / dispatched)."""
+    client = _redis()
+    if client is None:
+        return {}
+    result = {}
+    for job in JOB_TASKS:
+        raw = client.hgetall(_stats_key(job)) or {}
+        stats = {key.decode() if isinstance(key, bytes) else key: int(value) for key, value in raw.items()}
+        requested = stats.get("requested", 0)
+        dispatched = stats.get("dispatched", 0)
+        result[job] = {
+            "requested": requested,
+            "dispatched": dispatched,
+            "batches": stats.get("batches", 0),
+            "pending": int(client.scard(_pending_key(job))),
+            "ratio": round(requested / dispatched, 2) if dispatched else None,
+        }
+    return result
@@ -0,0 +1,214 @@
+"""Телеметрия Celery-задач (``TaskMetric``).
+
+Системный монитор видел только длину очереди ``celery`` — какая из задач
+``core/tasks*.py`` медленная, ретраится или стоит в очереди, было не
+понять. Сигналы Celery (:mod:`core.signals.task_telemetry`) передают сюда
+по каждому запуску:
+
+* ожидание — от публикации (заголовок ``enqueued_at``) или ``eta`` до старта;
+* время выполнения, число SQL-запросов, итог (успех / ошибка / ретрай);
+* попадания в soft/hard time limit.
+
+Накопление и слив — как у HTTP-метрик (:mod:`core.services.request_metrics`):
+в памяти процесса по 5-минутным bucket'ам, раз в
+``TASK_METRICS_FLUSH_SECONDS`` прибавляется к строке (bucket, task_name).
+``task_stats(since)`` — таблица для /admin/system-monitor/ и алертов
+``compute_alerts``.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from core.services.request_metrics import _bucket_start, _histogram_key, _percentile_ms
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин времени выполнения, ms: задачи идут от долей
+# секунды (пересчёт цены) до минут (синхронизация почты/банка).
+RUNTIME_BUCKETS_MS = (100, 500, 1000, 5000, 30000, 120000, 600000)
+
+_SUM_FIELDS = (
+    "count",
+    "failures",
+    "retries",
+    "time_limit_hits",
+    "total_runtime_ms",
+    "wait_samples",
+    "total_wait_ms",
+    "sql_count",
+)
+_MAX_FIELDS = ("max_runtime_ms", "max_wait_ms", "max_sql_count")
+
+
+def _flush_interval() -> float:
+    return float(getattr(settings, "TASK_METRICS_FLUSH_SECONDS", 60))
+
+
+# ---------------------------------------------------------------------------
+# Накопление в процессе
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_pending: dict[tuple, dict[str, Any]] = {}
+_last_flush = time.monotonic()
+
+
+def _agg(task_name: str) -> dict[str, Any]:
+    """Агрегат текущего bucket'а задачи; вызывать под ``_lock``."""
+    key = (_bucket_start(timezone.now()), task_name[:200])
+    agg = _pending.get(key)
+    if agg is None:
+        agg = _pending[key] = {**dict.fromkeys(_SUM_FIELDS, 0), **dict.fromkeys(_MAX_FIELDS, 0), "histogram": {}}
+    return agg
+
+
+def record_run(
+    task_name: str, *, runtime_ms: float, wait_ms: float | None, sql_count: int, failed: bool, retried: bool
+) -> None:
+    """Учесть завершённый запуск задачи."""
+    bucket = _histogram_key(runtime_ms, RUNTIME_BUCKETS_MS)
+    with _lock:
+        agg = _agg(task_name)
+        agg["count"] += 1
+        agg["failures"] += 1 if failed else 0
+        agg["retries"] += 1 if retried else 0
+        agg["total_runtime_ms"] += runtime_ms
+        agg["max_runtime_ms"] = max(agg["max_runtime_ms"], runtime_ms)
+        if wait_ms is not None:
+            agg["wait_samples"] += 1
+            agg["total_wait_ms"] += wait_ms
+            agg["max_wait_ms"] = max(agg["max_wait_ms"], wait_ms)
+        agg["sql_count"] += sql_count
+        agg["max_sql_count"] = max(agg["max_sql_count"], sql_count)
+        agg["histogram"][bucket] = agg["histogram"].get(bucket, 0) + 1
+
+
+def record_time_limit(task_name: str, *, hard: bool) -> None:
+    """Задача упёрлась в time limit. Hard limit убивает процесс задачи —
+    ``task_postrun`` не будет, поэтому запуск и ошибка учитываются здесь."""
+    with _lock:
+        agg = _agg(task_name)
+        agg["time_limit_hits"] += 1
+        if hard:
+            agg["count"] += 1
+            agg["failures"] += 1
+
+
+def maybe_flush() -> int:
+    if time.monotonic() - _last_flush < _flush_interval():
+        return 0
+    return flush()
+
+
+def flush() -> int:
+    """Слить накопленное в ``TaskMetric``; ошибки БД логируются и глотаются."""
+    global _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    written = 0
+    for key, agg in batch.items():
+        try:
+            _merge_row(key, agg)
+            written += 1
+        except Exception:
+            logger.exception("[task_metrics] failed to flush %s", key)
+    return written
+
+
+def _merge_row(key: tuple, agg: dict[str, Any]) -> None:
+    from core.models import TaskMetric
+
+    bucket_start, task_name = key
+    lookup = {"bucket_start": bucket_start, "task_name": task_name}
+    for _attempt in range(2):
+        with transaction.atomic():
+            row = TaskMetric.objects.select_for_update().filter(**lookup).first()
+            if row is None:
+                try:
+                    with transaction.atomic():
+                        TaskMetric.objects.create(**lookup, **agg)
+                    return
+                except IntegrityError:
+                    continue
+            for name in _SUM_FIELDS:
+                setattr(row, name, getattr(row, name) + agg[name])
+            for name in _MAX_FIELDS:
+                setattr(row, name, max(getattr(row, name), agg[name]))
+            histogram = dict(row.histogram or {})
+            for bucket, n in agg["histogram"].items():
+                histogram[bucket] = histogram.get(bucket, 0) + n
+            row.histogram = histogram
+            row.save()
+            return
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+
+def task_stats(since: datetime) -> list[dict[str, Any]]:
+    """Сводка по задачам за окно, самые долгие по суммарному времени — сверху."""
+    from core.models import TaskMetric
+
+    qs = TaskMetric.objects.filter(bucket_start__gte=since)
+    rows = (
+        qs.values("task_name")
+        .annotate(
+            n=Sum("count"),
+            fail=Sum("failures"),
+            retry=Sum("retries"),
+            limits=Sum("time_limit_hits"),
+            runtime=Sum("total_runtime_ms"),
+            runtime_peak=Max("max_runtime_ms"),
+            waits=Sum("wait_samples"),
+            wait=Sum("total_wait_ms"),
+            wait_peak=Max("max_wait_ms"),
+            sql=Sum("sql_count"),
+            sql_peak=Max("max_sql_count"),
+        )
+        .order_by()
+    )
+    histograms: dict[str, dict[str, int]] = {}
+    for name, histogram in qs.values_list("task_name", "histogram"):
+        target = histograms.setdefault(name, {})
+        for bucket, n in (histogram or {}).items():
+            target[bucket] = target.get(bucket, 0) + n
+
+    stats = []
+    for row in rows:
+        n = row["n"] or 0
+        stats.append(
+            {
+                "task": row["task_name"],
+                "count": n,
+                "failures": row["fail"],
+                "retries": row["retry"],
+                "time_limit_hits": row["limits"],
+                "failure_rate": round(row["fail"] / n, 3) if n else None,
+                "total_runtime_s": round(row["runtime"] / 1000, 1),
+                "avg_runtime_ms": round(row["runtime"] / n, 1) if n else None,
+                "p95_runtime_ms": _percentile_ms(
+                    histograms.get(row["task_name"], {}), n, row["runtime_peak"], 0.95, RUNTIME_BUCKETS_MS
+                ),
+                "max_runtime_ms": round(row["runtime_peak"], 1),
+                "avg_wait_ms": round(row["wait"] / row["waits"], 1) if row["waits"] else None,
+                "max_wait_ms": round(row["wait_peak"], 1) if row["waits"] else None,
+                "avg_queries": round(row["sql"] / n, 1) if n else None,
+                "max_queries": row["sql_peak"],
+            }
+        )
+    stats.sort(key=lambda s: s["total_runtime_s"], reverse=True)
+    return stats
@@ -0,0 +1,92 @@
+"""Кэш ответов публичного ``/api/track/`` (:mod:`core.views_website.tracking`).
+
+Трекинг дёргают анонимно и часто — один и тот же номер опрашивается
+повторно, а каждый запрос это iexact-поиск машины/контейнера, префетч фото
+и полный проход сериализатора. Здесь хранится готовый ответ по
+нормализованному номеру:
+
+* найденный груз — ``FOUND_TTL``, сбрасывается сигналами Car / Container /
+  CarPhoto / ContainerPhoto (:mod:`core.signals.tracking_cache`) и явно из
+  массовых путей без сигналов;
+* «не найдено» — короткий ``NOT_FOUND_TTL`` (negative caching против
+  перебора несуществующих номеров); создание машины/контейнера с этим
+  номером сбрасывает ключ сразу.
+
+Ссылки на фото хранятся относительными — абсолютный URL зависит от хоста
+запроса и достраивается в view. ``etag`` — хэш тела, для conditional GET.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import Iterable
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+FOUND_TTL = 60 * 5
+NOT_FOUND_TTL = 60
+
+_KEY_PREFIX = "track:v1:"
+
+
+def normalize_tracking_number(value: str) -> str:
+    """Верхний регистр, без пробелов и тире — как в ``track_shipment``."""
+    return (value or "").upper().replace(" ", "").replace("-", "")
+
+
+def _key(normalized: str) -> str:
+    return f"{_KEY_PREFIX}{normalized}"
+
+
+def get_entry(normalized: str) -> dict | None:
+    return cache.get(_key(normalized))
+
+
+def store_entry(normalized: str, *, status: int, body: dict, car_id=None, container_id=None) -> dict:
+    """Сохранить ответ для номера; вернуть запись (с ``etag``)."""
+    raw = json.dumps(body, cls=DjangoJSONEncoder, sort_keys=True, ensure_ascii=False)
+    entry = {
+        "status": status,
+        "body": body,
+        "etag": '"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"',
+        "car_id": car_id,
+        "container_id": container_id,
+    }
+    cache.set(_key(normalized), entry, FOUND_TTL if status == 200 else NOT_FOUND_TTL)
+    return entry
+
+
+def invalidate_numbers(numbers: Iterable[str]) -> None:
+    """Сбросить ответы по номерам — сразу и ещё раз после коммита.
+
+    Второй сброс нужен, чтобы параллельный запрос не закэшировал данные
+    до коммита текущей транзакции.
+    """
+    keys = [_key(normalize_tracking_number(n)) for n in numbers if n]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as exc:  # кэш не должен ронять сохранение
+        logger.debug("tracking cache invalidation failed: %s", exc)
+        return
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_containers(container_ids: Iterable[int]) -> None:
+    """Сбросить ответы по контейнерам и всем их машинам (в ответе машины —
+    данные и фото контейнера). Два запроса на любую пачку."""
+    from core.models import Car, Container
+
+    container_ids = [cid for cid in container_ids if cid]
+    if not container_ids:
+        return
+    numbers = list(Container.objects.filter(pk__in=container_ids).values_list("number", flat=True))
+    numbers += list(Car.objects.filter(container_id__in=container_ids).values_list("vin", flat=True))
+    invalidate_numbers(numbers)
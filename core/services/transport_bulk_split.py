@@ -3,10 +3,13 @@
 Клиент грузит один PDF со всем пакетом («Одним файлом»), а мы:
 
 1. рендерим страницы в JPEG (``scan_extractor.render_document_images``);
-2. отправляем их в Claude Vision и просим определить тип каждой страницы;
+2. отправляем их в Claude Vision чанками и просим определить тип каждой
+   страницы — чанки уходят параллельно (``BULK_SPLIT_CLASSIFY_WORKERS``),
+   прогресс пишется в ``TransportBulkUpload.pages_done``;
 3. склеиваем идущие подряд страницы одного типа в один документ и режем
-   исходный PDF на эти куски (PyMuPDF);
-4. сохраняем куски как документы пакета (``TransportRequestDocument``).
+   исходный PDF на эти куски (PyMuPDF, исходник открывается один раз);
+4. сохраняем куски как документы пакета (``TransportRequestDocument``)
+   одним ``bulk_create``.
 
 Страницы с низкой уверенностью и неизвестные типы уходят в «Остальное» —
 клиент видит их в кабинете и может указать тип вручную. Это осознанный
@@ -22,7 +25,9 @@ from __future__ import annotations
 import io
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
 
@@ -219,9 +224,14 @@ def _run(upload: TransportBulkUpload) -> dict:
         )
 
     upload.pages_total = len(images)
-    upload.save(update_fields=["pages_total"])
+    upload.pages_done = 0
+    upload.save(update_fields=["pages_total", "pages_done"])
 
-    page_types = _classify_pages(images)
+    def _report(done: int) -> None:
+        upload.pages_done = done
+        TransportBulkUpload.objects.filter(pk=upload.pk).update(pages_done=done)
+
+    page_types = _classify_pages(images, on_progress=_report)
     groups = _group_pages(page_types)
     created = _save_documents(upload, groups)
 
@@ -231,20 +241,66 @@ def _run(upload: TransportBulkUpload) -> dict:
     return {"documents": created, "unrecognized": unrecognized}
 
 
-def _classify_pages(images: list[tuple[str, str]]) -> list[str]:
-    """Тип каждой страницы по порядку; неуверенные — ``OTHER``."""
+def _classify_workers() -> int:
+    return max(1, int(getattr(settings, "BULK_SPLIT_CLASSIFY_WORKERS", 4) or 1))
+
+
+def _classify_chunk(chunk: list[tuple[str, str]]) -> list[str]:
     from core.services.scan_extractor import _call_claude_vision
 
-    types: list[str] = []
-    for start in range(0, len(images), PAGES_PER_CALL):
-        chunk = images[start : start + PAGES_PER_CALL]
-        user_text = (
-            f"Определи тип каждой из {len(chunk)} страниц. "
-            f"Нумеруй их с 1 в том порядке, в котором они показаны."
-        )
-        data = _call_claude_vision(chunk, CLASSIFY_PROMPT, user_text)
-        types.extend(_read_chunk_answer(data, len(chunk)))
-    return types
+    user_text = f"Определи тип каждой из {len(chunk)} страниц. Нумеруй их с 1 в том порядке, в котором они показаны."
+    data = _call_claude_vision(chunk, CLASSIFY_PROMPT, user_text)
+    return _read_chunk_answer(data, len(chunk))
+
+
+def _classify_chunk_in_thread(chunk: list[tuple[str, str]]) -> list[str]:
+    """Обёртка для потока пула: кэш извлечений ходит в БД, а соединение
+    потока само не закрывается — закрываем, чтобы не копить их."""
+    from django.db import connection
+
+    try:
+        return _classify_chunk(chunk)
+    finally:
+        connection.close()
+
+
+def _classify_pages(images: list[tuple[str, str]], on_progress=None) -> list[str]:
+    """Тип каждой страницы по порядку; неуверенные — ``OTHER``.
+
+    Чанки по ``PAGES_PER_CALL`` страниц классифицируются параллельно в
+    ограниченном пуле потоков (запросы к API — ожидание сети, не CPU).
+    ``on_progress(done)`` вызывается в текущем потоке после каждого
+    готового чанка с числом разобранных страниц. Первая ошибка чанка
+    отменяет ещё не начатые и пробрасывается как есть — временные сбои
+    Anthropic по-прежнему уводят задачу в повтор.
+    """
+    chunks = [images[start : start + PAGES_PER_CALL] for start in range(0, len(images), PAGES_PER_CALL)]
+    results: list[list[str] | None] = [None] * len(chunks)
+    done = 0
+
+    workers = min(_classify_workers(), len(chunks))
+    if workers < 2:
+        for index, chunk in enumerate(chunks):
+            results[index] = _classify_chunk(chunk)
+            done += len(chunk)
+            if on_progress:
+                on_progress(done)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-split") as pool:
+            futures = {pool.submit(_classify_chunk_in_thread, chunk): index for index, chunk in enumerate(chunks)}
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    results[index] = future.result()
+                    done += len(chunks[index])
+                    if on_progress:
+                        on_progress(done)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    return [doc_type for part in results for doc_type in part or []]
 
 
 def _read_chunk_answer(data: dict, expected: int) -> list[str]:
@@ -281,57 +337,68 @@ def _group_pages(page_types: list[str]) -> list[tuple[str, list[int]]]:
 
 
 def _save_documents(upload: TransportBulkUpload, groups: list[tuple[str, list[int]]]) -> list[dict]:
-    """Нарезать исходник по группам страниц и сохранить как документы пакета."""
+    """Нарезать исходник по группам страниц и сохранить как документы пакета.
+
+    Файлы пишутся в storage по одному, а записи в БД — одним
+    ``bulk_create``.
+    """
     path = upload.file.path
     extension = os.path.splitext(path)[1].lower()
-    created: list[dict] = []
-
-    for doc_type, pages in groups:
-        if extension == ".pdf":
-            content = _extract_pdf_pages(path, pages)
-            suffix = ".pdf"
-        else:
-            # Картинка — одна страница, резать нечего.
-            with upload.file.open("rb") as fh:
-                content = fh.read()
-            suffix = extension
 
+    if extension == ".pdf":
+        contents = _extract_pdf_groups(path, [pages for _doc_type, pages in groups])
+        suffix = ".pdf"
+    else:
+        # Картинка — одна страница, резать нечего.
+        with upload.file.open("rb") as fh:
+            image = fh.read()
+        contents = [image for _group in groups]
+        suffix = extension
+
+    documents: list[TransportRequestDocument] = []
+    created: list[dict] = []
+    for (doc_type, pages), content in zip(groups, contents, strict=True):
         filename = _build_filename(upload, doc_type, pages, suffix)
-        doc = TransportRequestDocument.objects.create(
+        doc = TransportRequestDocument(
             request=upload.request,
             car=upload.car,
             doc_type=doc_type,
-            file=ContentFile(content, name=filename),
             uploaded_by=upload.uploaded_by,
         )
-        created.append(
-            {
-                "doc_type": doc_type,
-                "pages": pages,
-                "filename": filename,
-                "document_id": doc.pk,
-            }
-        )
+        doc.file.save(filename, ContentFile(content), save=False)
+        documents.append(doc)
+        created.append({"doc_type": doc_type, "pages": pages, "filename": filename})
+
+    TransportRequestDocument.objects.bulk_create(documents)
+    for item, doc in zip(created, documents, strict=True):
+        item["document_id"] = doc.pk
     return created
 
 
-def _extract_pdf_pages(path: str, pages: list[int]) -> bytes:
-    """Новый PDF из указанных страниц исходника (номера с 1)."""
+def _extract_pdf_groups(path: str, groups: list[list[int]]) -> list[bytes]:
+    """Новые PDF из групп страниц исходника (номера с 1).
+
+    Исходник открывается один раз на все группы — раньше каждый кусок
+    заново открывал и парсил весь файл.
+    """
     import fitz  # PyMuPDF
 
+    out: list[bytes] = []
     source = fitz.open(path)
     try:
-        target = fitz.open()
-        try:
-            for page in pages:
-                target.insert_pdf(source, from_page=page - 1, to_page=page - 1)
-            buffer = io.BytesIO()
-            target.save(buffer)
-        finally:
-            target.close()
+        for pages in groups:
+            target = fitz.open()
+            try:
+                for page in pages:
+                    target.insert_pdf(source, from_page=page - 1, to_page=page - 1)
+                buffer = io.BytesIO()
+                target.save(buffer)
+            finally:
+                target.close()
+            out.append(buffer.getvalue())
     finally:
         source.close()
-    return buffer.getvalue()
+    return out
 
 
 def _build_filename(upload: TransportBulkUpload, doc_type: str, pages: list[int], suffix: str) -> str:
@@ -348,9 +415,7 @@ def _autofill_from_passport(upload: TransportBulkUpload) -> None:
     """
     from core.services.transport_package_actions import apply_passport_ai
 
-    passport = (
-        upload.request.documents.filter(car=upload.car, doc_type="PASSPORT").order_by("-created_at").first()
-    )
+    passport = upload.request.documents.filter(car=upload.car, doc_type="PASSPORT").order_by("-created_at").first()
     if passport is None:
         return
     package, _ = TransportDocumentPackage.objects.get_or_create(request=upload.request, car=upload.car)
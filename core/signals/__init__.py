@@ -34,6 +34,19 @@ submodules — при импорте каждого декораторы ``@rece
 * :mod:`.autotransport`       — генерация инвойсов автовоза, массовый
   ``TRANSFERRED``, m2m-валидация «Важное».
 * :mod:`.cache_invalidation`  — инвалидация stats/payment_objects-кэша.
+* :mod:`.email_counters`      — пересчёт счётчиков писем (непрочитанные,
+  «ждут ответа») на машинах, контейнерах и заявках.
+* :mod:`.expense_rollup`      — пересчёт месячной свёртки расходов
+  (``ExpenseRollup``) для аналитики расходов.
+* :mod:`.car_profitability`   — пересчёт сводки прибыли по машинам
+  (``CarProfitability``) для Dashboard сверки.
+* :mod:`.comparison_buckets`  — пересчёт месячных бакетов отчёта
+  сравнения (``ComparisonBucket``) по затронутым месяцам.
+* :mod:`.tracking_cache`      — сброс кэша ответов публичного трекинга.
+* :mod:`.task_telemetry`      — сигналы Celery: ожидание в очереди, время,
+  SQL и time limit задач (не Django-сигналы, но тоже грузятся при старте).
+* :mod:`.portal_listing`      — сброс фасетов (счётчиков по статусам)
+  в кабинете клиента.
 
 Backward-compat реэкспорт: ``core.admin.container`` импортирует
 ``car_post_save`` и пару ``recalculate_*`` напрямую из ``core.signals``;
@@ -45,14 +58,21 @@ Backward-compat реэкспорт: ``core.admin.container`` импортиру
 # явным вызовом BillingService.create_payment_for_bank_match().
 from core.signals import (  # noqa: F401
     car,
+    car_profitability,
     car_service,
     cache_invalidation,
+    comparison_buckets,
     container,
+    email_counters,
+    expense_rollup,
     invoice,
     partners,
     photos,
+    portal_listing,
     service_cache,
     service_catalog,
+    task_telemetry,
+    tracking_cache,
     transaction,
 )
 
@@ -24,6 +24,7 @@ from django.db.models.signals import m2m_changed, post_save, pre_save
 from django.dispatch import receiver
 
 from core.models import Car, Container
+from core.services import client_portal_listing
 
 logger = logging.getLogger(__name__)
 
@@ -85,12 +86,16 @@ def _mark_cars_as_transferred(autotransport, transfer_date=None):
 
     if transfer_date is None:
         transfer_date = tz.now().date()
-    affected_cars = list(autotransport.cars.exclude(status="TRANSFERRED").values_list("id", "container_id"))
+    affected_cars = list(
+        autotransport.cars.exclude(status="TRANSFERRED").values_list("id", "container_id", "client_id")
+    )
     if not affected_cars:
         return
     car_ids = [c[0] for c in affected_cars]
     container_ids = {c[1] for c in affected_cars if c[1]}
     Car.objects.filter(id__in=car_ids).update(status="TRANSFERRED", transfer_date=transfer_date)
+    # update() не шлёт post_save — фасеты статусов портала сбрасываем сами.
+    client_portal_listing.invalidate_client_facets(c[2] for c in affected_cars)
     logger.info(
         "AutoTransport %s: %d cars -> TRANSFERRED (date: %s)",
         autotransport.number,
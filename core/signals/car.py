@@ -33,9 +33,22 @@ logger = logging.getLogger(__name__)
 
 @receiver(pre_save, sender=Car)
 def save_old_car_values(sender, instance, **kwargs):
+    instance._pre_save_client_id = None
+    instance._pre_save_comparison = None
     update_fields = kwargs.get("update_fields")
     if update_fields is not None:
-        tracked = {"warehouse_id", "line_id", "carrier_id", "unload_date", "container_id", "status", "is_important"}
+        tracked = {
+            "warehouse_id",
+            "line_id",
+            "carrier_id",
+            "unload_date",
+            "container_id",
+            "status",
+            "is_important",
+            "client",
+            "client_id",
+            "total_price",
+        }
         if not tracked.intersection(update_fields):
             instance._pre_save_contractors = None
             instance._pre_save_car_notification = None
@@ -48,7 +61,15 @@ def save_old_car_values(sender, instance, **kwargs):
             old = (
                 Car.objects.filter(pk=instance.pk)
                 .values(
-                    "warehouse_id", "line_id", "carrier_id", "unload_date", "container_id", "status", "is_important"
+                    "warehouse_id",
+                    "line_id",
+                    "carrier_id",
+                    "unload_date",
+                    "container_id",
+                    "status",
+                    "is_important",
+                    "client_id",
+                    "total_price",
                 )
                 .first()
             )
@@ -64,6 +85,11 @@ def save_old_car_values(sender, instance, **kwargs):
                 }
                 instance._pre_save_status = old["status"]
                 instance._pre_save_is_important = old["is_important"]
+                # Смена владельца — фасеты кабинета сбрасываются и у прежнего клиента.
+                instance._pre_save_client_id = old["client_id"]
+                # Бакет сравнения: пересчёт только при смене этих полей, при
+                # переносе разгрузки — и за прежний месяц.
+                instance._pre_save_comparison = (old["unload_date"], old["total_price"], old["client_id"])
             else:
                 instance._pre_save_contractors = None
                 instance._pre_save_car_notification = None
@@ -146,11 +172,11 @@ def car_post_save(sender, instance, **kwargs):
 
     # --- 1. Invoice regeneration ---
     # Единый путь регенерации: делегируем в `car_service._deferred_invoice_regeneration`,
-    # который ставит Celery-задачу `regenerate_invoices_for_car_task` (с inline-fallback
-    # при недоступности брокера) и фильтрует инвойсы по `REGENERATABLE_INVOICE_STATUSES`.
+    # который ставит пакетную Celery-задачу `regenerate_invoices_for_cars_task` через
+    # core.services.task_coalescer (с inline-fallback при недоступности брокера).
     # Раньше здесь был отдельный СИНХРОННЫЙ путь (`_deferred_invoice_regeneration_for_car`)
     # — он дублировал логику и не дедуплицировался с путём от CarService. Теперь оба
-    # триггера (Car.save и CarService.save) делят один thread-local bucket и одну задачу.
+    # триггера (Car.save и CarService.save) делят одну очередь склейки и одну задачу.
     #
     # Регенерируем только когда изменились ценообразующие поля машины
     # (контрактники / unload_date) либо машина только что создана — иначе любое
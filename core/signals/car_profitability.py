@@ -0,0 +1,55 @@
+"""Поддержка сводки прибыли по машинам (``CarProfitability``).
+
+Строки пересчитываются :mod:`core.services.car_profitability` после коммита
+с дедупликацией в пределах потока. Здесь — штучные изменения:
+
+* создание/изменение/удаление ``SupplierCost`` (в т.ч. перенос затраты на
+  другую машину и каскад при удалении счёта);
+* создание/удаление ``CarService`` — меняет число услуг и подтверждённость;
+* сохранение машины с новой ценой, контейнером или клиентом.
+
+Массовые пути (``bulk_create``/``update``) сигналов не шлют: затраты из
+счёта и пакетная пересинхронизация услуг планируют пересчёт явно, выручку
+догоняет ``refresh_stale_revenue``.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import Car, CarService
+from core.models_invoice_audit import SupplierCost
+from core.services.car_profitability import schedule_refresh
+
+_CAR_FIELDS = frozenset({"total_price", "container", "container_id", "client", "client_id"})
+
+
+@receiver(pre_save, sender=SupplierCost)
+def save_old_supplier_cost_car(sender, instance, update_fields=None, **kwargs):
+    instance._pre_save_car_id = None
+    if not instance.pk or (update_fields is not None and "car" not in update_fields):
+        return
+    instance._pre_save_car_id = SupplierCost.objects.filter(pk=instance.pk).values_list("car_id", flat=True).first()
+
+
+@receiver(post_save, sender=SupplierCost)
+@receiver(post_delete, sender=SupplierCost)
+def supplier_cost_changed(sender, instance, **kwargs):
+    schedule_refresh([instance.car_id, getattr(instance, "_pre_save_car_id", None)])
+
+
+@receiver(post_save, sender=CarService)
+@receiver(post_delete, sender=CarService)
+def car_service_changed(sender, instance, created=True, **kwargs):
+    # Правка цены услуги меняет Car.total_price через .update() —
+    # это догонит refresh_stale_revenue; здесь важен только состав услуг.
+    if created:
+        schedule_refresh([instance.car_id])
+
+
+@receiver(post_save, sender=Car)
+def car_revenue_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not _CAR_FIELDS.intersection(update_fields):
+        return
+    schedule_refresh([instance.pk])
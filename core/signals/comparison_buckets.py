@@ -0,0 +1,105 @@
+"""Поддержка месячных бакетов отчёта сравнения (``ComparisonBucket``).
+
+Затронутые месяцы пересчитываются в фоне
+(:func:`core.services.comparison_buckets.schedule_refresh`). Сохранение
+ставит пересчёт, только если отслеживаемые значения действительно
+изменились (сравнение со снимком ``pre_save``); удаление — всегда:
+
+* машина — месяц разгрузки (новый и прежний; снимок —
+  :func:`core.signals.car.save_old_car_values`) при смене даты, цены или
+  клиента;
+* инвойс — месяц даты (новый и прежний; снимок —
+  :func:`core.signals.invoice.save_old_invoice_status`) при смене даты,
+  суммы или склада-выставителя;
+* состав машин инвойса (``m2m_changed``) — месяц инвойса;
+* транзакция — месяц даты (новый и прежний; снимок —
+  :func:`core.signals.transaction.save_old_transaction_values`) при смене
+  даты, суммы или склада-получателя;
+* переименование клиента / склада — сброс версии имён в кэше отчётов.
+
+Массовые пересчёты цен машин (``bulk_update``/``update``) сигналов не шлют
+и вызывают ``schedule_refresh_for_cars`` сами.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Car, Client, Warehouse
+from core.models_billing import NewInvoice, Transaction
+from core.services.calendar_months import local_date
+from core.services.comparison_buckets import bump_names_version, schedule_refresh
+from core.signals.transaction import snapshot_unchanged
+
+_CAR_FIELDS = frozenset({"unload_date", "total_price", "client", "client_id"})
+_INVOICE_FIELDS = frozenset({"date", "total", "issuer_warehouse", "issuer_warehouse_id"})
+_TRANSACTION_FIELDS = frozenset({"date", "amount", "to_warehouse", "to_warehouse_id"})
+_TRANSACTION_VALUES = ("date", "amount", "to_warehouse_id")
+
+
+def _skip(update_fields, tracked) -> bool:
+    return update_fields is not None and not tracked.intersection(update_fields)
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, created, update_fields=None, **kwargs):
+    if _skip(update_fields, _CAR_FIELDS):
+        return
+    old = getattr(instance, "_pre_save_comparison", None)
+    if not created and old == (instance.unload_date, instance.total_price, instance.client_id):
+        return
+    schedule_refresh([instance.unload_date, old[0] if old else None])
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, **kwargs):
+    schedule_refresh([instance.unload_date])
+
+
+@receiver(post_save, sender=NewInvoice)
+def invoice_saved(sender, instance, created, update_fields=None, **kwargs):
+    if _skip(update_fields, _INVOICE_FIELDS):
+        return
+    old = getattr(instance, "_pre_save_comparison", None)
+    if not created and old == (instance.date, instance.total, instance.issuer_warehouse_id):
+        return
+    schedule_refresh([instance.date, old[0] if old else None])
+
+
+@receiver(post_delete, sender=NewInvoice)
+def invoice_deleted(sender, instance, **kwargs):
+    schedule_refresh([instance.date])
+
+
+@receiver(m2m_changed, sender=NewInvoice.cars.through)
+def invoice_cars_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            schedule_refresh([instance.date])
+    elif action == "pre_clear":
+        # После очистки со стороны машины прежние инвойсы уже не найти.
+        schedule_refresh(instance.invoices_new.values_list("date", flat=True))
+    elif action in ("post_add", "post_remove") and pk_set:
+        schedule_refresh(NewInvoice.objects.filter(pk__in=pk_set).values_list("date", flat=True))
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, update_fields=None, **kwargs):
+    if _skip(update_fields, _TRANSACTION_FIELDS):
+        return
+    if not created and snapshot_unchanged(instance, _TRANSACTION_VALUES):
+        return
+    old = getattr(instance, "_pre_save_values", None)
+    schedule_refresh([local_date(instance.date), local_date(old["date"]) if old else None])
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    schedule_refresh([local_date(instance.date)])
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Warehouse)
+def partner_renamed(sender, instance, created, update_fields=None, **kwargs):
+    if created or _skip(update_fields, {"name"}):
+        return
+    bump_names_version()
@@ -0,0 +1,50 @@
+"""Поддержка денормализованных счётчиков переписки карточек.
+
+``Car`` / ``Container`` / ``TransportRequest`` хранят ``emails_unread`` и
+``emails_need_reply`` (см. :mod:`core.services.email_counters`). Здесь —
+пересчёт при штучных изменениях:
+
+* создание/изменение/удаление связи письма с карточкой (в т.ч. каскад при
+  удалении письма или карточки);
+* смена ``needs_reply``/``direction`` у письма.
+
+Пересчёт идёт после коммита и дедуплицируется в пределах потока. Массовые
+пути (``bulk_create``/``update``) сигналов не шлют — там сервис вызывается
+явно.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models_email import CarEmailLink, ContainerEmail, ContainerEmailLink, TransportRequestEmailLink
+from core.services.email_counters import schedule_refresh, schedule_refresh_for_emails
+
+_REPLY_FIELDS = frozenset({"needs_reply", "direction"})
+
+
+@receiver(post_save, sender=ContainerEmailLink)
+@receiver(post_delete, sender=ContainerEmailLink)
+def container_email_link_changed(sender, instance, **kwargs):
+    schedule_refresh(container_ids=[instance.container_id])
+
+
+@receiver(post_save, sender=CarEmailLink)
+@receiver(post_delete, sender=CarEmailLink)
+def car_email_link_changed(sender, instance, **kwargs):
+    schedule_refresh(car_ids=[instance.car_id])
+
+
+@receiver(post_save, sender=TransportRequestEmailLink)
+@receiver(post_delete, sender=TransportRequestEmailLink)
+def transport_request_email_link_changed(sender, instance, **kwargs):
+    schedule_refresh(request_ids=[instance.request_id])
+
+
+@receiver(post_save, sender=ContainerEmail)
+def container_email_reply_flag_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Новое письмо ещё без связей — их посчитают сигналы связей / ингест.
+    if created:
+        return
+    if update_fields is not None and not _REPLY_FIELDS.intersection(update_fields):
+        return
+    schedule_refresh_for_emails([instance.pk])
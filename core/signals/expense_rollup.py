@@ -0,0 +1,47 @@
+"""Поддержка месячной свёртки расходов (``ExpenseRollup``).
+
+Затронутые пары (компания, месяц) пересчитываются в фоне
+(:func:`core.services.expense_rollup.schedule_refresh`):
+
+* удаление транзакции — месяц её даты у компании-плательщика;
+* сохранение, изменившее поля свёртки, — та же пара и прежняя (перенос
+  даты или смена компании); прежние значения — общий снимок
+  :func:`core.signals.transaction.save_old_transaction_values`;
+* правка / удаление категории расходов — смена версии свёртки всех
+  компаний (имя и тип категории читаются при построении аналитики).
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models_billing import ExpenseCategory, Transaction
+from core.services.calendar_months import local_date
+from core.services.expense_rollup import bump_versions, schedule_refresh
+from core.signals.transaction import SNAPSHOT_FIELDS, fields_untouched, snapshot_unchanged
+
+# Свёртка зависит от всех полей снимка: сумма, статус, категория, получатель, чек.
+_TRACKED = SNAPSHOT_FIELDS
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_expense_saved(sender, instance, created, update_fields=None, **kwargs):
+    if fields_untouched(update_fields, _TRACKED):
+        return
+    if not created and snapshot_unchanged(instance, _TRACKED):
+        return
+    pairs = [(instance.from_company_id, local_date(instance.date))]
+    old = getattr(instance, "_pre_save_values", None)
+    if old:
+        pairs.append((old["from_company_id"], local_date(old["date"])))
+    schedule_refresh(pairs)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_expense_deleted(sender, instance, **kwargs):
+    schedule_refresh([(instance.from_company_id, local_date(instance.date))])
+
+
+@receiver(post_save, sender=ExpenseCategory)
+@receiver(post_delete, sender=ExpenseCategory)
+def expense_category_changed(sender, instance, **kwargs):
+    bump_versions()
@@ -3,7 +3,8 @@
 * :func:`auto_categorize_invoice` — назначает категорию
   ``OPERATIONAL`` инвойсам от логистических контрагентов, если
   пользователь не выбрал категорию вручную.
-* :func:`save_old_invoice_status` — снимок старого статуса для
+* :func:`save_old_invoice_status` — снимок старого статуса (и даты,
+  суммы, склада — для бакетов сравнения) для
   ``post_save``-обработчиков.
 * :func:`auto_push_invoice_to_sitepro` — ставит пуш в site.pro в
   очередь Celery после commit транзакции (с inline-fallback при
@@ -38,16 +39,27 @@ def auto_categorize_invoice(sender, instance, **kwargs):
             logger.warning("Не удалось назначить категорию: %s", e)
 
 
+_SNAPSHOT_FIELDS = frozenset({"status", "date", "total", "issuer_warehouse", "issuer_warehouse_id"})
+
+
 @receiver(pre_save, sender=NewInvoice)
 def save_old_invoice_status(sender, instance, **kwargs):
+    # Старые дата/сумма/склад — для пересчёта бакетов сравнения (core.signals.comparison_buckets).
+    instance._pre_save_comparison = None
     update_fields = kwargs.get("update_fields")
-    if update_fields is not None and "status" not in update_fields:
+    if update_fields is not None and not _SNAPSHOT_FIELDS.intersection(update_fields):
         instance._pre_save_status = None
         return
     if instance.pk:
         try:
-            old = NewInvoice.objects.filter(pk=instance.pk).values("status").first()
+            old = (
+                NewInvoice.objects.filter(pk=instance.pk)
+                .values("status", "date", "total", "issuer_warehouse_id")
+                .first()
+            )
             instance._pre_save_status = old["status"] if old else None
+            if old:
+                instance._pre_save_comparison = (old["date"], old["total"], old["issuer_warehouse_id"])
         except Exception:
             instance._pre_save_status = None
     else:
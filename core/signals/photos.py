@@ -9,6 +9,10 @@ Drive) появлялись в галерее только после истеч
 Здесь мы сбрасываем этот ключ при любом изменении ``ContainerPhoto``
 (create/update/delete), на ``transaction.on_commit`` — чтобы читатель
 кэша увидел уже закоммиченные данные.
+
+Там же сбрасывается резолв файла для ``/photo/s/<token>/``
+(``photo_path_cache_key``) у ``ContainerPhoto`` и ``CarPhoto``: снятое с
+публикации или удалённое фото не должно отдаваться до истечения TTL.
 """
 
 import logging
@@ -18,7 +22,7 @@ from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from core.models_website import ContainerPhoto
+from core.models_website import CarPhoto, ContainerPhoto
 
 logger = logging.getLogger(__name__)
 
@@ -40,11 +44,29 @@ def _invalidate_container_gallery_cache(container_id):
     transaction.on_commit(_do)
 
 
+def _invalidate_photo_path_cache(kind, photo_id):
+    from core.views_website.signed_photos import photo_path_cache_key
+
+    keys = [photo_path_cache_key(kind, photo_id, variant) for variant in ("full", "thumb")]
+    # Сразу — чтобы не отдать файл в окне до коммита, и после коммита —
+    # чтобы не остался резолв, закэшированный параллельным запросом.
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
 @receiver(post_save, sender=ContainerPhoto)
 def invalidate_gallery_on_photo_save(sender, instance, **kwargs):
     _invalidate_container_gallery_cache(instance.container_id)
+    _invalidate_photo_path_cache("container", instance.pk)
 
 
 @receiver(post_delete, sender=ContainerPhoto)
 def invalidate_gallery_on_photo_delete(sender, instance, **kwargs):
     _invalidate_container_gallery_cache(instance.container_id)
+    _invalidate_photo_path_cache("container", instance.pk)
+
+
+@receiver(post_save, sender=CarPhoto)
+@receiver(post_delete, sender=CarPhoto)
+def invalidate_car_photo_path(sender, instance, **kwargs):
+    _invalidate_photo_path_cache("car", instance.pk)
@@ -0,0 +1,20 @@
+"""Инвалидация фасетов кабинета клиента (:mod:`core.services.client_portal_listing`).
+
+Счётчики по статусам кэшируются на клиента, поэтому сохранение/удаление
+машины сбрасывает ключ её владельца, а смена владельца — ещё и прежнего
+(``_pre_save_client_id`` снимает :func:`core.signals.car.save_old_car_values`).
+Массовые ``update()``/``bulk_update`` сигналов не шлют — там сервис
+вызывается явно (см. ``set_containers_status``).
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Car
+from core.services.client_portal_listing import invalidate_client_facets
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def invalidate_portal_facets_on_car_change(sender, instance, **kwargs):
+    invalidate_client_facets([instance.client_id, getattr(instance, "_pre_save_client_id", None)])
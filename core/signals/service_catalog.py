@@ -13,12 +13,10 @@
 import logging
 from decimal import Decimal
 
-from django.db import transaction
 from django.db.models.signals import post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
 from core.models import (
-    Car,
     CarrierService,
     CarService,
     CompanyService,
@@ -31,52 +29,19 @@ logger = logging.getLogger(__name__)
 
 
 def _enqueue_recalc_cars_total_price(car_ids):
-    """Поставить пересчёт Car.total_price в Celery; fallback inline.
+    """Поставить пересчёт Car.total_price в фон (после коммита).
 
     Раньше пересчёт делался синхронно в HTTP-потоке (N+1 SELECT + N UPDATE),
-    при импорте 100+ машин это блокировало запрос. Теперь HTTP отдаёт ответ
-    сразу, тяжёлая работа идёт в фоне с graceful inline-fallback при
-    недоступности брокера.
+    при импорте 100+ машин это блокировало запрос. Постановка идёт через
+    :mod:`core.services.task_coalescer`: правки одних и тех же машин за
+    окно debounce склеиваются в один батч ``recalculate_cars_total_price_task``;
+    без Redis задача ставится сразу, при недоступном брокере — inline.
     """
     if not car_ids:
         return
-    car_ids = list({int(cid) for cid in car_ids if cid})
-
-    def _dispatch():
-        try:
-            from core.tasks import recalculate_cars_total_price_task
-
-            try:
-                recalculate_cars_total_price_task.delay(car_ids)
-            except Exception:
-                logger.exception(
-                    "Celery enqueue failed for recalculate_cars_total_price(%s ids) — running inline",
-                    len(car_ids),
-                )
-                _recalc_cars_total_price_inline(car_ids)
-        except Exception:
-            logger.exception(
-                "Failed to dispatch cars total_price recalc for %s ids",
-                len(car_ids),
-            )
-
-    transaction.on_commit(_dispatch)
-
-
-def _recalc_cars_total_price_inline(car_ids):
-    """Синхронный fallback для ``recalculate_cars_total_price_task``.
-
-    Обновляет те же три поля, что и Celery-таска: ``calculate_total_price()``
-    через ``update_days_and_storage()`` меняет days/storage_cost, поэтому
-    bulk_update тянет все три (раньше fallback сохранял только total_price,
-    из-за чего при недоступном брокере days/storage_cost расходились с БД).
-    """
-    cars_to_update = []
-    for car in Car.objects.filter(pk__in=car_ids).prefetch_related("car_services").select_related("warehouse"):
-        car.calculate_total_price()
-        cars_to_update.append(car)
-    if cars_to_update:
-        Car.objects.bulk_update(cars_to_update, ["total_price", "days", "storage_cost"], batch_size=200)
+    from core.services.task_coalescer import JOB_CAR_PRICES, schedule
+
+    schedule(JOB_CAR_PRICES, car_ids)
 
 
 # ---------------------------------------------------------------------------
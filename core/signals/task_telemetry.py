@@ -0,0 +1,115 @@
+"""Сигналы Celery → телеметрия задач (:mod:`core.services.task_metrics`).
+
+* ``before_task_publish`` (процесс, ставящий задачу) — заголовок
+  ``enqueued_at``: воркер по нему считает ожидание в очереди;
+* ``task_prerun`` — старт: время, ``execute_wrapper`` для счёта SQL;
+* ``task_postrun`` — итог запуска (SUCCESS / FAILURE / RETRY);
+* ``task_failure`` — soft/hard time limit, сливается сразу: soft приходит
+  в процессе задачи, который hard limit может вот-вот убить вместе с
+  буфером; hard — в главном процессе воркера, где задачи не идут и
+  ``maybe_flush`` по таймеру не сработал бы;
+* ``worker_process_shutdown`` / ``worker_shutdown`` — слить накопленное
+  перед выходом дочернего / главного процесса.
+
+Модуль грузится из ``core.signals`` и в web-, и в worker-процессах.
+Выключается ``TASK_METRICS_ENABLED=False``.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from datetime import datetime
+
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from django.conf import settings
+from django.db import connection
+
+from core.services import task_metrics
+from core.services.request_metrics import QueryTimer
+
+logger = logging.getLogger(__name__)
+
+# task_id → (perf_counter старта, wait_ms, SQL-таймер).
+_running: dict[str, tuple[float, float | None, QueryTimer]] = {}
+
+
+def _enabled() -> bool:
+    return getattr(settings, "TASK_METRICS_ENABLED", True)
+
+
+def _wait_ms(request) -> float | None:
+    """Ожидание от публикации (или ``eta``, если задача отложена) до старта."""
+    enqueued_at = getattr(request, "enqueued_at", None)
+    if not enqueued_at:
+        return None
+    ready_at = float(enqueued_at)
+    eta = getattr(request, "eta", None)
+    if eta:
+        try:
+            ready_at = max(ready_at, datetime.fromisoformat(str(eta)).timestamp())
+        except ValueError:
+            pass
+    return max((time.time() - ready_at) * 1000, 0.0)
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(sender=None, headers=None, **kwargs):
+    if headers is not None and _enabled():
+        headers.setdefault("enqueued_at", time.time())
+
+
+@task_prerun.connect
+def start_task_timer(sender=None, task_id=None, task=None, **kwargs):
+    if not _enabled() or task_id is None:
+        return
+    timer = QueryTimer()
+    connection.execute_wrappers.append(timer)
+    _running[task_id] = (time.perf_counter(), _wait_ms(task.request) if task else None, timer)
+
+
+@task_postrun.connect
+def stop_task_timer(sender=None, task_id=None, task=None, state=None, **kwargs):
+    started = _running.pop(task_id, None)
+    if started is None:
+        return
+    started_at, wait_ms, timer = started
+    try:
+        connection.execute_wrappers.remove(timer)
+    except ValueError:
+        pass
+    try:
+        task_metrics.record_run(
+            getattr(task, "name", None) or getattr(sender, "name", "?"),
+            runtime_ms=(time.perf_counter() - started_at) * 1000,
+            wait_ms=wait_ms,
+            sql_count=timer.count,
+            failed=state == "FAILURE",
+            retried=state == "RETRY",
+        )
+        task_metrics.maybe_flush()
+    except Exception:  # телеметрия не должна ронять задачу
+        logger.exception("[task_metrics] failed to record %s", task_id)
+
+
+@task_failure.connect
+def record_time_limit(sender=None, exception=None, **kwargs):
+    if not _enabled() or not isinstance(exception, SoftTimeLimitExceeded | TimeLimitExceeded):
+        return
+    task_metrics.record_time_limit(getattr(sender, "name", "?"), hard=isinstance(exception, TimeLimitExceeded))
+    task_metrics.flush()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_task_metrics(**kwargs):
+    if _enabled():
+        task_metrics.flush()
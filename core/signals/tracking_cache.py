@@ -0,0 +1,56 @@
+"""Инвалидация кэша публичного трекинга (:mod:`core.services.tracking_cache`).
+
+Ответ по машине содержит данные и фото её контейнера, ответ по контейнеру —
+число машин, поэтому:
+
+* ``Car`` — номер VIN и номер контейнера машины;
+* ``Container`` / ``ContainerPhoto`` — номер контейнера и VIN всех его машин;
+* ``CarPhoto`` — VIN машины.
+
+Создание машины/контейнера сбрасывает и negative-кэш «не найдено» по номеру.
+Массовые ``update()``/``bulk_update`` сигналов не шлют — там сервис
+вызывается явно (см. ``set_containers_status``).
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Car, Container
+from core.models_website import CarPhoto, ContainerPhoto
+from core.services.tracking_cache import invalidate_containers, invalidate_numbers
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def invalidate_tracking_on_car_change(sender, instance, **kwargs):
+    numbers = [instance.vin]
+    if instance.container_id:
+        container = Car._meta.get_field("container").get_cached_value(instance, default=None)
+        if container is None or container.pk != instance.container_id:
+            container = Container.objects.filter(pk=instance.container_id).only("number").first()
+        if container is not None:
+            numbers.append(container.number)
+    invalidate_numbers(numbers)
+
+
+@receiver(post_save, sender=Container)
+def invalidate_tracking_on_container_save(sender, instance, **kwargs):
+    invalidate_containers([instance.pk])
+
+
+@receiver(post_delete, sender=Container)
+def invalidate_tracking_on_container_delete(sender, instance, **kwargs):
+    invalidate_numbers([instance.number])
+
+
+@receiver(post_save, sender=ContainerPhoto)
+@receiver(post_delete, sender=ContainerPhoto)
+def invalidate_tracking_on_container_photo_change(sender, instance, **kwargs):
+    invalidate_containers([instance.container_id])
+
+
+@receiver(post_save, sender=CarPhoto)
+@receiver(post_delete, sender=CarPhoto)
+def invalidate_tracking_on_car_photo_change(sender, instance, **kwargs):
+    if instance.car_id:
+        invalidate_numbers(Car.objects.filter(pk=instance.car_id).values_list("vin", flat=True))
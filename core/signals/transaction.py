@@ -3,17 +3,60 @@
 Эти пересчёты делаются **синхронно** — пользователь должен увидеть
 актуальный ``paid_amount`` инвойса сразу после ответа на запрос. Расчёт
 дешёвый (один SUM + UPDATE), поэтому в очередь не уносим.
+
+Здесь же — общий снимок прежних значений (:func:`save_old_transaction_values`)
+для сводок ``comparison_buckets`` и ``expense_rollup``: один SELECT на
+сохранение вместо своего у каждой.
 """
 
 import logging
 
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from core.models_billing import Transaction
 
 logger = logging.getLogger(__name__)
 
+# Поля, прежние значения которых нужны сводкам.
+SNAPSHOT_FIELDS = (
+    "date",
+    "amount",
+    "status",
+    "method",
+    "category_id",
+    "from_company_id",
+    "receipt_data",
+    "to_client_id",
+    "to_warehouse_id",
+    "to_line_id",
+    "to_carrier_id",
+    "to_company_id",
+)
+
+
+def fields_untouched(update_fields, fields) -> bool:
+    """``save(update_fields=...)`` не задевает ``fields`` (FK — по имени поля или ``*_id``)."""
+    if update_fields is None:
+        return False
+    names = set(fields) | {field[:-3] for field in fields if field.endswith("_id")}
+    return not names.intersection(update_fields)
+
+
+@receiver(pre_save, sender=Transaction)
+def save_old_transaction_values(sender, instance, update_fields=None, **kwargs):
+    """Снять ``SNAPSHOT_FIELDS`` из БД в ``instance._pre_save_values`` (dict или ``None``)."""
+    instance._pre_save_values = None
+    if not instance.pk or fields_untouched(update_fields, SNAPSHOT_FIELDS):
+        return
+    instance._pre_save_values = Transaction.objects.filter(pk=instance.pk).values(*SNAPSHOT_FIELDS).first()
+
+
+def snapshot_unchanged(instance, fields) -> bool:
+    """Сохранение не меняло ``fields``: снимок есть и значения совпадают."""
+    old = getattr(instance, "_pre_save_values", None)
+    return old is not None and all(old[field] == getattr(instance, field) for field in fields)
+
 
 def _recalc_transaction_effects(instance):
     # B4 (AUDIT_ROUND3): деньги — исключения НЕ глотаем. Сбой пересчёта
@@ -0,0 +1,58 @@
+/**
+ * email_panel_live.js — push новых писем в панель переписки карточки.
+ *
+ * Подключается к ws/emails/<kind>/<id>/ (EmailPanelConsumer, только staff)
+ * и отдаёт панели готовые баблы: {version, bubbles: [{id, html}, ...]}.
+ * Polling-эндпоинт карточки остаётся запасным каналом: панель шлёт в нём
+ * ?v=<version>, и сервер отвечает «без изменений», не трогая БД.
+ * Если новых писем больше, чем влезает в один push, приходит
+ * {reload: true, bubbles: []} без версии — панель сразу делает poll.
+ *
+ *   var live = CMEmailLive.connect('container', containerId, function(data) {
+ *       if (data.reload) pollOnce(); else applyBubbles(data.bubbles);
+ *   });
+ *   fetch(url + '&v=' + live.version) ... live.version = data.version;
+ */
+(function () {
+    'use strict';
+
+    if (window.CMEmailLive) return;
+
+    var RECONNECT_BASE_MS = 2000;
+    var RECONNECT_MAX_MS = 60000;
+
+    function connect(kind, entityId, onBubbles) {
+        var live = { version: '', socket: null };
+        if (!('WebSocket' in window) || !entityId) return live;
+
+        var attempt = 0;
+        var proto = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+        var url = proto + window.location.host + '/ws/emails/' + kind + '/' + entityId + '/';
+
+        function open() {
+            var socket = new WebSocket(url);
+            live.socket = socket;
+            socket.onopen = function () { attempt = 0; };
+            socket.onmessage = function (e) {
+                var data;
+                try { data = JSON.parse(e.data); } catch (err) { return; }
+                if (!data || !Array.isArray(data.bubbles)) return;
+                if (data.version) live.version = String(data.version);
+                onBubbles(data);
+            };
+            socket.onclose = function (e) {
+                live.socket = null;
+                // 4401/4403/4404 — не пустили: переподключаться бессмысленно.
+                if (e && e.code >= 4400 && e.code < 4500) return;
+                attempt += 1;
+                var delay = Math.min(RECONNECT_BASE_MS * Math.pow(2, attempt - 1), RECONNECT_MAX_MS);
+                setTimeout(open, delay);
+            };
+        }
+
+        open();
+        return live;
+    }
+
+    window.CMEmailLive = { connect: connect };
+})();
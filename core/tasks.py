@@ -616,12 +616,15 @@ def _sync_bank_and_reconcile_inner():
 
 
 @shared_task(bind=True, max_retries=2, default_retry_delay=60, time_limit=120)
-def parse_receipt_task(self, transaction_id):
-    """Parse receipt image attached to a personal expense transaction via Claude Vision."""
+def parse_receipt_task(self, transaction_id, use_cache=True):
+    """Parse receipt image attached to a personal expense transaction via Claude Vision.
+
+    ``use_cache=False`` — распознать заново, минуя кэш LLM-извлечений.
+    """
     from core.services.receipt_parser_service import parse_transaction_receipt
 
     try:
-        result = parse_transaction_receipt(transaction_id)
+        result = parse_transaction_receipt(transaction_id, use_cache=use_cache)
         if result:
             logger.info("[parse_receipt] Transaction %d parsed: %s", transaction_id, result.get("ai_summary", ""))
         return result
@@ -745,12 +748,13 @@ def generate_autotransport_invoices_task(self, autotransport_id):
 
 
 @shared_task(bind=True, max_retries=2, default_retry_delay=120, soft_time_limit=180, time_limit=240)
-def process_invoice_audit_task(self, audit_id):
+def process_invoice_audit_task(self, audit_id, use_cache=True):
     """Асинхронный AI-разбор PDF инвойса через Anthropic.
 
     Выносит долгий LLM-вызов из threading.Thread (который умирает вместе
     с web-воркером и не имеет ретраев) в Celery. Retry — при сетевых
-    сбоях или временных 5xx Anthropic.
+    сбоях или временных 5xx Anthropic. Ответы модели берутся из кэша
+    LLM-извлечений, если документ уже разбирался (``use_cache=False`` — обход).
     """
     from core.models_invoice_audit import InvoiceAudit
     from core.services.invoice_audit_service import process_invoice_audit
@@ -765,7 +769,7 @@ def process_invoice_audit_task(self, audit_id):
         return {"ok": True, "skipped": f"already {audit.status}"}
 
     try:
-        process_invoice_audit(audit_id)
+        process_invoice_audit(audit_id, use_cache=use_cache)
         audit.refresh_from_db()
         return {"ok": True, "status": audit.status}
     except Exception as exc:
@@ -809,7 +813,7 @@ def push_invoice_to_sitepro_task(self, invoice_id):
 
 
 @shared_task(bind=True, max_retries=2, default_retry_delay=60, time_limit=300)
-def process_scan_job(self, job_id):
+def process_scan_job(self, job_id, use_cache=True):
     """AI-обработка одного отсканированного документа (Title или Dock Receipt).
 
     Этапы:
@@ -820,6 +824,9 @@ def process_scan_job(self, job_id):
       4. Если результат уверенный (см. scan_applier.evaluate_auto_apply) —
          применяем автоматически; иначе job остаётся на ручную проверку.
       5. При ошибке: status=ERROR, error_message заполнено.
+
+    Повторная обработка того же файла берёт ответы модели из кэша
+    LLM-извлечений; ``use_cache=False`` — спросить модель заново.
     """
     from core.models_scans import ScanProcessingJob
     from core.services.scan_extractor import (
@@ -853,9 +860,9 @@ def process_scan_job(self, job_id):
         # FileSystemStorage, поэтому идём напрямую через .path.
         scan_path = job.original_file.path
         if job.scan_type == ScanProcessingJob.SCAN_TYPE_TITLE:
-            extracted = extract_title(scan_path)
+            extracted = extract_title(scan_path, use_cache=use_cache)
         elif job.scan_type == ScanProcessingJob.SCAN_TYPE_DOCK_RECEIPT:
-            extracted = extract_dock_receipt(scan_path)
+            extracted = extract_dock_receipt(scan_path, use_cache=use_cache)
         else:
             raise ValueError(f"Unknown scan_type: {job.scan_type}")
     except Exception as exc:
@@ -987,12 +994,10 @@ def check_business_rules(self):
     INFO если нарушений «как обычно», WARNING если их стало больше
     baseline'а (Sentry поднимет issue).
 
-    `direction` — property, поэтому итерируем в Python (как и в исходном
-    audit-скрипте).
+    Правила считаются запросами (core/services/business_rules.py): в
+    Python — только проверка файлов вложений на диске.
     """
-    from decimal import Decimal
-
-    from core.models_billing import NewInvoice
+    from core.services.business_rules import audit_business_rules
 
     BASELINE = {
         # baseline = «известные нарушения, оставленные сознательно» на
@@ -1005,49 +1010,7 @@ def check_business_rules(self):
         "pardp_no_file": 0,
     }
 
-    def _has_file(inv):
-        if not inv.attachment:
-            return False
-        try:
-            from pathlib import Path
-
-            p = Path(inv.attachment.path)
-            return p.exists() and p.stat().st_size > 0
-        except (ValueError, NotImplementedError):
-            return True  # remote storage — считаем что файл есть
-
-    violations: dict[str, list[int]] = {k: [] for k in BASELINE}
-
-    fact_qs = NewInvoice.objects.filter(document_type="INVOICE_FACT").prefetch_related("transactions")
-    for inv in fact_qs:
-        if inv.direction != "INCOMING":
-            continue
-        txs = [t for t in inv.transactions.all() if t.type == "PAYMENT" and t.status == "COMPLETED"]
-        if not txs:
-            violations["fact_no_tx"].append(inv.id)
-        if not _has_file(inv):
-            violations["fact_no_file"].append(inv.id)
-
-    av_qs = NewInvoice.objects.filter(document_type="PROFORMA").prefetch_related("transactions")
-    for inv in av_qs:
-        if inv.direction != "OUTGOING":
-            continue
-        if inv.transactions.exists():
-            violations["av_with_tx"].append(inv.id)
-
-    pardp_qs = NewInvoice.objects.filter(document_type="INVOICE").prefetch_related("transactions")
-    for inv in pardp_qs:
-        if inv.direction != "OUTGOING":
-            continue
-        txs_completed = [t for t in inv.transactions.all() if t.type == "PAYMENT" and t.status == "COMPLETED"]
-        if not txs_completed:
-            violations["pardp_no_tx"].append(inv.id)
-        else:
-            paid = sum((t.amount for t in txs_completed), Decimal("0"))
-            if abs(paid - inv.total) > Decimal("0.01") and inv.status != "PAID":
-                violations["pardp_tx_mismatch"].append(inv.id)
-        if not _has_file(inv):
-            violations["pardp_no_file"].append(inv.id)
+    violations: dict[str, list[int]] = audit_business_rules()
 
     counts = {k: len(v) for k, v in violations.items()}
     overflow = {k: counts[k] for k in BASELINE if counts[k] > BASELINE[k]}
@@ -1134,6 +1097,54 @@ def regenerate_invoices_for_car_task(self, car_id):
     return {"car_id": car_id, "regenerated": regenerated, "skipped": skipped}
 
 
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, time_limit=600)
+def regenerate_invoices_for_cars_task(self, car_ids):
+    """Пакетный вариант ``regenerate_invoices_for_car_task``.
+
+    Инвойс с несколькими машинами пачки пересобирается один раз, а не по
+    разу на машину. Используется массовыми операциями (смена статуса
+    контейнеров, финализация передачи).
+    """
+    from django.db import transaction as db_transaction
+    from django.db.utils import OperationalError
+
+    from core.mixins import REGENERATABLE_INVOICE_STATUSES
+    from core.models_billing import NewInvoice
+
+    car_ids = list(car_ids or [])
+    if not car_ids:
+        return {"cars": 0, "regenerated": 0, "skipped": 0}
+    invoice_ids = list(
+        NewInvoice.objects.filter(
+            cars__id__in=car_ids,
+            status__in=REGENERATABLE_INVOICE_STATUSES,
+        )
+        .values_list("id", flat=True)
+        .distinct()
+        .order_by("id")
+    )
+    skipped = 0
+    regenerated = 0
+    for invoice_id in invoice_ids:
+        try:
+            with db_transaction.atomic():
+                invoice = NewInvoice.objects.select_for_update(nowait=True).get(id=invoice_id)
+                invoice.regenerate_items_from_cars()
+                regenerated += 1
+        except OperationalError:
+            logger.warning("[regenerate_invoices_for_cars] invoice %s locked, skipping", invoice_id)
+            skipped += 1
+        except NewInvoice.DoesNotExist:
+            pass
+    logger.info(
+        "[regenerate_invoices_for_cars] cars=%s regenerated=%s skipped=%s",
+        len(car_ids),
+        regenerated,
+        skipped,
+    )
+    return {"cars": len(car_ids), "regenerated": regenerated, "skipped": skipped}
+
+
 @shared_task(
     bind=True,
     max_retries=2,
@@ -1151,39 +1162,25 @@ def recalculate_cars_total_price_task(self, car_ids):
     в post_save / сигнале — это N+1 в HTTP-потоке. Celery-таска делает то же
     самое, но в фоне.
 
-    `calculate_total_price()` обновляет days/storage_cost через
-    `update_days_and_storage()`, поэтому bulk_update тянет все три поля.
+    Результат совпадает с `calculate_total_price()` (days/storage_cost
+    меняются вместе с ценой), поэтому bulk_update тянет все три поля.
     """
     from core.models import Car
-    from core.models.services import prefetch_service_objects
+    from core.services import comparison_buckets
+    from core.services.car_pricing import PRICE_FIELDS, reprice_cars
 
     if not car_ids:
         return {"updated": 0}
 
-    cars = list(Car.objects.filter(pk__in=car_ids).prefetch_related("car_services", "warehouse"))
-
-    # P2 (AUDIT_ROUND3): батч-резолвинг каталога услуг — максимум 4 запроса
-    # in_bulk + set_many вместо cache/DB-lookup'а на каждую услугу в цикле.
-    prefetch_service_objects(svc for car in cars for svc in car.car_services.all())
+    cars = list(Car.objects.filter(pk__in=car_ids).select_related("warehouse").prefetch_related("car_services"))
 
-    cars_to_update = []
-    for car in cars:
-        try:
-            car.calculate_total_price()
-            cars_to_update.append(car)
-        except Exception as exc:
-            logger.error(
-                "[recalculate_cars_total_price] car=%s failed: %s",
-                car.pk,
-                exc,
-                exc_info=True,
-            )
+    # Батч-пересчёт (core.services.car_pricing): ставки хранения одним
+    # запросом, каталог услуг — prefetch_service_objects, цены «Хранения» —
+    # одним bulk_update. Ошибки по отдельным машинам логируются там же.
+    cars_to_update = reprice_cars(cars)
     if cars_to_update:
-        Car.objects.bulk_update(
-            cars_to_update,
-            ["total_price", "days", "storage_cost"],
-            batch_size=200,
-        )
+        Car.objects.bulk_update(cars_to_update, PRICE_FIELDS, batch_size=200)
+        comparison_buckets.schedule_refresh_for_cars(cars_to_update)
     logger.info(
         "[recalculate_cars_total_price] requested=%s updated=%s",
         len(car_ids),
@@ -1192,6 +1189,15 @@ def recalculate_cars_total_price_task(self, car_ids):
     return {"requested": len(car_ids), "updated": len(cars_to_update)}
 
 
+@shared_task(bind=True, max_retries=0, time_limit=120)
+def flush_coalesced_jobs_task(self, job):
+    """Сбросить очередь склейки ``job`` (см. core.services.task_coalescer):
+    накопленные за окно debounce id уходят пачками в целевую задачу."""
+    from core.services.task_coalescer import flush
+
+    return {"job": job, "dispatched": flush(job)}
+
+
 @shared_task(bind=True, max_retries=2, default_retry_delay=60, time_limit=300)
 def finalize_autotransport_transfer_task(self, autotransport_id, car_ids):
     """Финализация передачи машин автовозом: пересчёт хранения + regen инвойсов.
@@ -1251,8 +1257,7 @@ def finalize_cars_transfer_task(self, car_ids):
     """
     car_ids = list(car_ids)
     recalculate_cars_total_price_task(car_ids)
-    for car_id in car_ids:
-        regenerate_invoices_for_car_task(car_id)
+    regenerate_invoices_for_cars_task(car_ids)
     return {"finalized": len(car_ids)}
 
 
@@ -1276,3 +1281,133 @@ def refresh_unloaded_storage_daily():
         recalculate_cars_total_price_task.delay(ids[i : i + batch_size])
     logger.info("[refresh_unloaded_storage_daily] enqueued %s cars", len(ids))
     return {"enqueued": len(ids)}
+
+
+@shared_task(time_limit=300)
+def cleanup_pdf_render_cache():
+    """Чистка дискового кэша отрендеренных PDF-страниц (pdf_processing).
+
+    Записи, к которым не обращались PDF_RENDER_CACHE_DAYS дней, удаляются:
+    ретраи и переобработка случаются в первые дни после загрузки.
+    """
+    from django.conf import settings
+
+    from core.services.pdf_processing import prune_render_cache
+
+    removed = prune_render_cache(int(getattr(settings, "PDF_RENDER_CACHE_DAYS", 14)))
+    if removed:
+        logger.info("[cleanup_pdf_render_cache] removed %s cached renders", removed)
+    return {"removed": removed}
+
+
+@shared_task(time_limit=1800, soft_time_limit=1700)
+def export_admin_queryset_task(model_label, fmt, name):
+    """Фоновый CSV/XLSX-экспорт большой выборки админки (core/admin/export.py).
+
+    Выборка лежит рядом с файлом (ADMIN_EXPORT_DIR/<name>.query), файл
+    пишется в ADMIN_EXPORT_DIR/<name> и скачивается по подписанной ссылке из
+    сообщения админки (``admin_export_download``).
+    """
+    from core.admin.export import build_export_file
+
+    path = build_export_file(model_label, fmt, name)
+    logger.info("[export_admin_queryset] %s → %s", model_label, path)
+    return {"name": name}
+
+
+@shared_task(time_limit=300)
+def cleanup_admin_exports():
+    """Удаляет файлы фоновых экспортов старше ADMIN_EXPORT_KEEP_DAYS
+    (ссылки на скачивание к этому времени уже истекли)."""
+    import os
+    import time
+
+    from django.conf import settings
+
+    from core.admin.export import export_dir
+
+    root = export_dir()
+    cutoff = time.time() - int(getattr(settings, "ADMIN_EXPORT_KEEP_DAYS", 3)) * 86400
+    removed = 0
+    for dirpath, _dirnames, filenames in os.walk(root, topdown=False):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return {"removed": removed}
+
+
+@shared_task(time_limit=1800, soft_time_limit=1700)
+def reconcile_car_profitability_task() -> dict:
+    """Ночная сверка сводки прибыли по машинам (``CarProfitability``).
+
+    Штатно строки пересчитываются сигналами и явными вызовами
+    ``core.services.car_profitability``; сверка догоняет пути в обход них
+    (массовые ``update`` цены, контейнера, клиента, упавший on_commit).
+    """
+    from core.services.car_profitability import reconcile_car_profitability
+
+    result = reconcile_car_profitability()
+    logger.info("[reconcile_car_profitability_task] %s", result)
+    return result
+
+
+@shared_task(time_limit=900, soft_time_limit=840)
+def refresh_comparison_buckets_task() -> dict:
+    """Ночной пересчёт месячных бакетов отчёта сравнения (``ComparisonBucket``).
+
+    Штатно месяцы пересчитывает ``refresh_comparison_months_task`` по
+    сигналам; ночной проход по последним ``COMPARISON_BUCKETS_NIGHTLY_MONTHS``
+    месяцам догоняет ``update`` без сигналов и потерянные задачи. Полная пересборка — ``manage.py rebuild_comparison_buckets``.
+    """
+    from django.conf import settings
+
+    from core.services.comparison_buckets import rebuild_buckets
+
+    result = rebuild_buckets(months=settings.COMPARISON_BUCKETS_NIGHTLY_MONTHS)
+    logger.info("[refresh_comparison_buckets_task] %s", result)
+    return result
+
+
+@shared_task(bind=True, max_retries=0, time_limit=300)
+def refresh_comparison_months_task(self, keys):
+    """Пересчитать месяцы бакетов сравнения после правок машин, инвойсов, транзакций.
+
+    Ставит :mod:`core.services.task_coalescer` (``JOB_COMPARISON_MONTHS``).
+    """
+    from core.services.comparison_buckets import refresh_month_keys
+
+    return {"keys": len(keys or []), "rows": refresh_month_keys(keys or [])}
+
+
+@shared_task(time_limit=900, soft_time_limit=840)
+def refresh_expense_rollup_task() -> dict:
+    """Ночной пересчёт месячной свёртки расходов (``ExpenseRollup``).
+
+    Штатно пары (компания, месяц) пересчитывает
+    ``refresh_expense_rollup_months_task`` по сигналам транзакций; ночной проход по последним ``EXPENSE_ROLLUP_NIGHTLY_MONTHS``
+    месяцам догоняет ``update`` без сигналов и упавший on_commit. Полная
+    пересборка — ``manage.py rebuild_expense_rollup``.
+    """
+    from django.conf import settings
+
+    from core.services.expense_rollup import rebuild_rollup
+
+    result = rebuild_rollup(months=settings.EXPENSE_ROLLUP_NIGHTLY_MONTHS)
+    logger.info("[refresh_expense_rollup_task] %s", result)
+    return result
+
+
+@shared_task(bind=True, max_retries=0, time_limit=300)
+def refresh_expense_rollup_months_task(self, keys):
+    """Пересчитать пары (компания, месяц) свёртки расходов после правок транзакций.
+
+    Ставит :mod:`core.services.task_coalescer` (``JOB_EXPENSE_MONTHS``):
+    правки за окно debounce склеиваются в один пересчёт месяца.
+    """
+    from core.services.expense_rollup import refresh_month_keys
+
+    return {"keys": len(keys or []), "rows": refresh_month_keys(keys or [])}
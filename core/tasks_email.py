@@ -90,3 +90,19 @@ def sync_emails_from_gmail(self, force_full: bool = False) -> dict:
         raise
     finally:
         cache.delete(_LOCK_KEY)
+
+
+@shared_task(time_limit=1800, soft_time_limit=1700)
+def reconcile_email_counters_task() -> dict:
+    """Ночная сверка денормализованных счётчиков писем (``emails_unread`` /
+    ``emails_need_reply``) на машинах, контейнерах и заявках.
+
+    Штатно счётчики пересчитываются сигналами и явными вызовами
+    ``core.services.email_counters``; сверка догоняет пути, которые меняют
+    связи в обход них (ручной SQL, сторонние скрипты, упавший on_commit).
+    """
+    from core.services.email_counters import reconcile_email_counters
+
+    result = reconcile_email_counters()
+    logger.info("[reconcile_email_counters_task] %s", result)
+    return result
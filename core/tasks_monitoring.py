@@ -3,11 +3,14 @@ healthcheck'ов.
 
 Расписание подключается в `logist2/celery.py` в `beat_schedule`:
 - `collect_system_metrics` — каждые 5 минут (288 точек/день)
+- `rollup_system_metrics` — каждые 5 минут: свёртки 5m/1h для графиков
 - `ping_uptime` — каждую минуту (1440 точек/день)
 - `cleanup_old_metrics` — раз в день в 04:00
 - `check_backup_freshness` — раз в день в 04:15 (после ночного бэкапа в 03:30)
 
-Retention: 30 дней (берётся из settings.MONITORING_RETENTION_DAYS, дефолт 30).
+Retention: сырые SystemMetric — MONITORING_RAW_RETENTION_HOURS (48 ч),
+свёртки — MONITORING_5M_RETENTION_DAYS / MONITORING_HOURLY_RETENTION_DAYS,
+остальное — MONITORING_RETENTION_DAYS (дефолт 30).
 """
 
 from __future__ import annotations
@@ -21,7 +24,8 @@ from celery import shared_task
 from django.conf import settings
 from django.utils import timezone
 
-from .models_monitoring import SystemMetric, UptimeCheck
+from .models_monitoring import RequestMetric, SystemMetric, TaskMetric, UptimeCheck
+from .services import metric_rollup
 from .services.system_monitor import collect_snapshot, ping_health
 
 logger = logging.getLogger(__name__)
@@ -70,6 +74,8 @@ def collect_system_metrics() -> dict:
         data={
             "services": snap.get("services") or [],
             "celery_queue": snap.get("celery") or {},
+            "task_coalescing": snap.get("task_coalescing") or {},
+            "task_telemetry": snap.get("task_telemetry") or [],
             "host": snap.get("host") or {},
             "top_processes": (snap.get("processes") or {}).get("top") or [],
         },
@@ -94,24 +100,46 @@ def ping_uptime() -> dict:
     return {"check_id": check.pk, "ok": check.ok, "ms": check.response_ms}
 
 
+@shared_task(name="core.tasks_monitoring.rollup_system_metrics")
+def rollup_system_metrics() -> dict:
+    """Сворачивает сырые SystemMetric/UptimeCheck в 5m, а 5m — в 1h."""
+    return {
+        "buckets_5m": metric_rollup.rollup_raw(),
+        "buckets_1h": metric_rollup.rollup_hourly(),
+    }
+
+
 @shared_task(name="core.tasks_monitoring.cleanup_old_metrics")
 def cleanup_old_metrics() -> dict:
-    """Удаляет SystemMetric/UptimeCheck старше MONITORING_RETENTION_DAYS."""
+    """Удаляет UptimeCheck/RequestMetric/TaskMetric старше MONITORING_RETENTION_DAYS,
+    сырые SystemMetric и свёртки — по их собственным retention."""
     retention_days = int(getattr(settings, "MONITORING_RETENTION_DAYS", 30))
     cutoff = timezone.now() - timedelta(days=retention_days)
 
-    deleted_metrics, _ = SystemMetric.objects.filter(created_at__lt=cutoff).delete()
+    pruned = metric_rollup.prune()
+    deleted_metrics = pruned["raw"]
     deleted_uptime, _ = UptimeCheck.objects.filter(created_at__lt=cutoff).delete()
+    deleted_requests, _ = RequestMetric.objects.filter(bucket_start__lt=cutoff).delete()
+    deleted_tasks, _ = TaskMetric.objects.filter(bucket_start__lt=cutoff).delete()
 
     logger.info(
-        "monitoring cleanup: deleted %d metrics, %d uptime checks (cutoff=%s)",
+        "monitoring cleanup: deleted %d metrics (%d/%d 5m/1h rollups), %d uptime checks, "
+        "%d request / %d task rollups (cutoff=%s)",
         deleted_metrics,
+        pruned["5m"],
+        pruned["1h"],
         deleted_uptime,
+        deleted_requests,
+        deleted_tasks,
         cutoff,
     )
     return {
         "deleted_metrics": deleted_metrics,
+        "deleted_rollups_5m": pruned["5m"],
+        "deleted_rollups_1h": pruned["1h"],
         "deleted_uptime": deleted_uptime,
+        "deleted_requests": deleted_requests,
+        "deleted_tasks": deleted_tasks,
         "cutoff": cutoff.isoformat(),
     }
 
@@ -230,6 +230,23 @@ def test_execute_create_container_with_cars():
     assert existing.container_id == container.pk
 
 
+def test_execute_create_container_matches_vin_case_insensitively():
+    from core.models import Car
+
+    existing = Car.objects.create(vin="LOWER000000000001", brand="BMW", year=2020, status="FLOATING")
+    Car.objects.filter(pk=existing.pk).update(vin="lower000000000001")
+    action = AgentAction.objects.create(
+        action_type=AgentAction.TYPE_CREATE_CONTAINER,
+        title="Создать контейнер MRSU6031876",
+        payload={"number": "MRSU6031876", "cars": [{"vin": "lower000000000001"}]},
+    )
+    result = execute_action(action, by="boss")
+    assert (result["cars_created"], result["cars_attached"]) == ([], ["LOWER000000000001"])
+    assert Car.objects.filter(vin__iexact="LOWER000000000001").count() == 1
+    existing.refresh_from_db()
+    assert existing.container_id == result["container_id"]
+
+
 def test_execute_create_container_duplicate_fails():
     from core.models import Container
 
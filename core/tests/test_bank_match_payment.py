@@ -1,7 +1,9 @@
 """
 Тесты ``BillingService.create_payment_for_bank_match`` — единой точки
 создания платежа при ручной привязке BankTransaction.matched_invoice
-(заменила post_save-сигнал ``auto_create_payment_on_bt_match``).
+(заменила post_save-сигнал ``auto_create_payment_on_bt_match``), и
+массовой привязки из админки: ошибка посреди пачки откатывает и резерв
+номеров серии.
 
 Запуск: pytest core/tests/test_bank_match_payment.py
 """
@@ -11,9 +13,12 @@ from __future__ import annotations
 from decimal import Decimal
 
 import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils import timezone
 
 from core.models import Client, Company
+from core.models.series import SeriesCounter
 from core.models_banking import BankConnection, BankTransaction
 from core.models_billing import InvoiceItem, NewInvoice, Transaction
 from core.services.billing_service import BillingService
@@ -131,3 +136,34 @@ class TestCreatePaymentForBankMatch:
         assert not Transaction.objects.filter(invoice=inv).exists()
         inv.refresh_from_db()
         assert inv.status == "ISSUED"
+
+
+@pytest.mark.django_db
+def test_link_to_invoice_failure_rolls_back_reserved_numbers(client, company, bank_connection, monkeypatch):
+    client.force_login(User.objects.create_superuser("banker", password="x"))
+    inv = _outgoing_invoice(company, Client.objects.create(name="Batch Client"), total="900.00")
+    bts = [_bt(bank_connection, f"{n}00.00", counterparty_name="Batch Client") for n in (1, 2, 3)]
+    create_payment = BillingService.create_payment_for_bank_match
+
+    def failing_middle(bank_trx_id):
+        payment = create_payment(bank_trx_id)
+        if bank_trx_id == bts[1].pk:
+            raise RuntimeError("ledger locked")
+        return payment
+
+    monkeypatch.setattr(BillingService, "create_payment_for_bank_match", staticmethod(failing_middle))
+    with pytest.raises(RuntimeError):
+        client.post(
+            reverse("admin:core_banktransaction_changelist"),
+            {
+                "action": "link_to_invoice",
+                "_selected_action": [bt.pk for bt in bts],
+                "confirm_link": "yes",
+                "invoice_id": inv.pk,
+            },
+        )
+
+    # Платежи первой операции и резерв TRX откатились вместе.
+    assert not Transaction.objects.exists()
+    assert not BankTransaction.objects.filter(matched_invoice__isnull=False).exists()
+    assert not SeriesCounter.objects.filter(prefix=Transaction.series_prefix()).exists()
@@ -180,3 +180,62 @@ class CompanyGetDefaultTest(TestCase):
         """get_default() возвращает None если компании нет"""
         result = Company.get_default()
         self.assertIsNone(result)
+
+
+class SeriesBlockReservationTest(TestCase):
+    """Блочный резерв номеров серии (reserve_document_numbers)."""
+
+    PREFIX = NewInvoice.series_prefix("PROFORMA_BLC")
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Caromoto Lithuania")
+        self.client = Client.objects.create(name="Test Client")
+
+    def _create(self):
+        return NewInvoice.objects.create(
+            issuer_company=self.company,
+            recipient_client=self.client,
+            document_type="PROFORMA_BLC",
+            date=timezone.now().date(),
+        )
+
+    def test_block_numbers_are_contiguous_and_tail_returned(self):
+        """Номера из блока идут подряд, неиспользованный хвост возвращается в серию"""
+        from core.models.series import SeriesCounter, next_document_number, reserve_document_numbers
+
+        self._create()  # AVBLC-000001, счётчик создан
+        with reserve_document_numbers(NewInvoice, self.PREFIX, 5):
+            with self.assertNumQueries(0):
+                numbers = [next_document_number(NewInvoice, self.PREFIX, 6) for _ in range(2)]
+        self.assertEqual(numbers, ["AVBLC-000002", "AVBLC-000003"])
+        self.assertEqual(SeriesCounter.objects.get(prefix=self.PREFIX).last_value, 3)
+        # Штучное создание после блока — без пропуска.
+        self.assertEqual(self._create().number, "AVBLC-000004")
+
+    def test_failed_document_returns_its_numbers(self):
+        """Документ, откатившийся в savepoint, отдаёт номер следующему — без пропуска"""
+        from core.models.series import SeriesCounter, document_savepoint, reserve_document_numbers
+
+        with reserve_document_numbers(NewInvoice, self.PREFIX, 4) as block:
+            for fail in (False, True, False):
+                try:
+                    with document_savepoint(block):
+                        self._create()
+                        if fail:
+                            raise RuntimeError("item failed")
+                except RuntimeError:
+                    pass
+        numbers = sorted(NewInvoice.objects.values_list("number", flat=True))
+        self.assertEqual(numbers, ["AVBLC-000001", "AVBLC-000002"])
+        self.assertEqual(SeriesCounter.objects.get(prefix=self.PREFIX).last_value, 2)
+
+    def test_tail_kept_when_series_moved_on(self):
+        """Если серию продвинули во время блока, хвост остаётся пропуском"""
+        from core.models.series import SeriesCounter, reserve_document_numbers
+
+        with reserve_document_numbers(NewInvoice, self.PREFIX, 3):
+            first = self._create().number
+            SeriesCounter.next_value(self.PREFIX)  # «другой процесс» взял номер
+        self.assertEqual(first, "AVBLC-000001")
+        self.assertEqual(SeriesCounter.objects.get(prefix=self.PREFIX).last_value, 4)
+        self.assertEqual(self._create().number, "AVBLC-000005")
@@ -0,0 +1,164 @@
+"""Аудит бизнес-правил учёта (core.services.business_rules).
+
+- запросы дают те же нарушения, что и прежний обход инвойсов в Python
+  по property ``direction``;
+- проверка файлов вложений кэшируется по пути + mtime каталога и
+  замечает удалённый файл;
+- задача возвращает счётчики, baseline и образцы id.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from core.models import Client, Company
+from core.models_billing import NewInvoice, Transaction
+from core.services import business_rules
+from core.services.business_rules import attachments_present, audit_business_rules
+
+pytestmark = pytest.mark.django_db
+
+
+def _reference_audit() -> dict[str, list[int]]:
+    """Прежняя реализация check_business_rules (обход в Python)."""
+    from pathlib import Path
+
+    def _has_file(inv):
+        if not inv.attachment:
+            return False
+        p = Path(inv.attachment.path)
+        return p.exists() and p.stat().st_size > 0
+
+    out: dict[str, list[int]] = {
+        k: [] for k in ("fact_no_tx", "fact_no_file", "av_with_tx", "pardp_no_tx", "pardp_tx_mismatch", "pardp_no_file")
+    }
+    for inv in NewInvoice.objects.prefetch_related("transactions").order_by("-date", "-created_at", "-id"):
+        paid = [t for t in inv.transactions.all() if t.type == "PAYMENT" and t.status == "COMPLETED"]
+        if inv.document_type == "INVOICE_FACT" and inv.direction == "INCOMING":
+            if not paid:
+                out["fact_no_tx"].append(inv.id)
+            if not _has_file(inv):
+                out["fact_no_file"].append(inv.id)
+        elif inv.document_type == "PROFORMA" and inv.direction == "OUTGOING":
+            if inv.transactions.all():
+                out["av_with_tx"].append(inv.id)
+        elif inv.document_type == "INVOICE" and inv.direction == "OUTGOING":
+            if not paid:
+                out["pardp_no_tx"].append(inv.id)
+            elif abs(sum(t.amount for t in paid) - inv.total) > Decimal("0.01") and inv.status != "PAID":
+                out["pardp_tx_mismatch"].append(inv.id)
+            if not _has_file(inv):
+                out["pardp_no_file"].append(inv.id)
+    return out
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def ledger(media, settings):
+    us = Company.objects.create(name=settings.COMPANY_NAME)
+    supplier = Company.objects.create(name="Supplier UAB")
+    client = Client.objects.create(name="Rules Client")
+    (media / "docs").mkdir()
+    (media / "docs" / "ok.pdf").write_bytes(b"%PDF")
+    (media / "docs" / "empty.pdf").write_bytes(b"")
+
+    n = 0
+
+    def invoice(doc_type, *, outgoing, total="100.00", status="ISSUED", attachment="", payments=(), other=()):
+        nonlocal n
+        n += 1
+        parties = (
+            {"issuer_company": us, "recipient_client": client}
+            if outgoing
+            else {"issuer_company": supplier, "recipient_company": us}
+        )
+        inv = NewInvoice.objects.create(
+            number=f"R-{n}",
+            document_type=doc_type,
+            date=timezone.now().date(),
+            attachment=attachment,
+            **parties,
+        )
+        NewInvoice.objects.filter(pk=inv.pk).update(total=Decimal(total), status=status)
+        txs = [
+            Transaction(
+                number=f"T-{n}-{i}", type="PAYMENT", method="TRANSFER", status="COMPLETED", amount=a, invoice=inv
+            )
+            for i, a in enumerate(payments)
+        ]
+        txs += [
+            Transaction(
+                number=f"T-{n}-x{i}", type=t, method="TRANSFER", status=s, amount=Decimal("5"), invoice=inv
+            )
+            for i, (t, s) in enumerate(other)
+        ]
+        Transaction.objects.bulk_create(txs)
+        return inv
+
+    invoice("INVOICE_FACT", outgoing=False, payments=[Decimal("100")], attachment="docs/ok.pdf")  # ok
+    invoice("INVOICE_FACT", outgoing=False, other=[("PAYMENT", "PENDING")], attachment="docs/empty.pdf")
+    invoice("INVOICE_FACT", outgoing=False, attachment="docs/missing.pdf")
+    invoice("INVOICE_FACT", outgoing=True)  # не INCOMING — не проверяется
+    invoice("PROFORMA", outgoing=True, other=[("REFUND", "CANCELLED")])
+    invoice("PROFORMA", outgoing=True)  # ok
+    invoice("PROFORMA", outgoing=False, other=[("PAYMENT", "COMPLETED")])  # входящая — не проверяется
+    invoice("INVOICE", outgoing=True, payments=[Decimal("60"), Decimal("40")], attachment="docs/ok.pdf")  # ok
+    invoice("INVOICE", outgoing=True, payments=[Decimal("60")], attachment="nodir/x.pdf")
+    invoice("INVOICE", outgoing=True, payments=[Decimal("60")], status="PAID", attachment="docs/ok.pdf")
+    invoice("INVOICE", outgoing=True, payments=[Decimal("100.01")], attachment="docs/ok.pdf")  # в допуске
+    invoice("INVOICE", outgoing=True, other=[("PAYMENT", "FAILED")])
+    return media
+
+
+def test_queries_match_python_reference(ledger, django_assert_max_num_queries):
+    expected = _reference_audit()
+
+    with django_assert_max_num_queries(8):
+        actual = audit_business_rules()
+
+    assert actual == expected
+    assert {k: len(v) for k, v in actual.items()} == {
+        "fact_no_tx": 2,
+        "fact_no_file": 2,
+        "av_with_tx": 1,
+        "pardp_no_tx": 1,
+        "pardp_tx_mismatch": 1,
+        "pardp_no_file": 2,
+    }
+
+
+def test_file_checks_cached_until_directory_changes(media, monkeypatch):
+    (media / "a").mkdir()
+    kept, dropped = media / "a" / "kept.pdf", media / "a" / "dropped.pdf"
+    kept.write_bytes(b"1")
+    dropped.write_bytes(b"1")
+    paths = [str(kept), str(dropped)]
+    assert attachments_present(paths) == {str(kept): True, str(dropped): True}
+
+    calls = []
+    real_file_ok = business_rules._file_ok
+    monkeypatch.setattr(business_rules, "_file_ok", lambda p: calls.append(p) or real_file_ok(p))
+    assert attachments_present(paths) == {str(kept): True, str(dropped): True}
+    assert calls == []  # всё из кэша
+
+    dropped.unlink()  # меняет mtime каталога
+    assert attachments_present(paths) == {str(kept): True, str(dropped): False}
+    assert sorted(calls) == sorted(paths)
+
+
+def test_task_reports_counts_and_samples(ledger):
+    from core.tasks import check_business_rules
+
+    result = check_business_rules.apply().get()
+
+    assert result["counts"]["fact_no_tx"] == 2
+    assert result["overflow"] == {"fact_no_tx": 2, "pardp_no_file": 2}
+    assert len(result["sample_ids"]["pardp_no_file"]) == 2
@@ -39,7 +39,7 @@ def _clear_pricing_thread_locals():
     from core.signals import car_service as cs_signals
 
     def _reset():
-        for attr in ("_pricing_local", "_regen_local"):
+        for attr in ("_pricing_local",):
             local = getattr(cs_signals, attr, None)
             if local is not None and getattr(local, "cars", None) is not None:
                 local.cars.clear()
@@ -0,0 +1,194 @@
+"""Сводка прибыли по машинам (core.services.car_profitability).
+
+- строки пересчитываются сигналами после коммита и совпадают с живым
+  расчётом ``get_car_profitability``;
+- услуги, добавленные пакетной синхронизацией (без сигналов), попадают в строку;
+- выручка, изменённая массовым ``update``, догоняется при открытии
+  Dashboard; сверка удаляет лишние строки;
+- Dashboard сортирует и листает страницы, число запросов не зависит от
+  числа машин с затратами.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import Car, CarProfitability, CarService, Client, Container, Warehouse, WarehouseService
+from core.models_invoice_audit import SupplierCost
+from core.services.car_profitability import refresh_car_profitability
+from core.services.reconciliation_service import get_car_profitability, get_reconciliation_summary
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def yard():
+    warehouse = Warehouse.objects.create(name="Profit WH")
+    unload = WarehouseService.objects.create(
+        warehouse=warehouse, name="Разгрузка", default_price=Decimal("100"), add_by_default=True
+    )
+    docs = WarehouseService.objects.create(
+        warehouse=warehouse, name="Документы", default_price=Decimal("50"), add_by_default=True
+    )
+    client = Client.objects.create(name="Profit Dealer")
+    container = Container.objects.create(number="PROFIT12345", status="FLOATING", warehouse=warehouse)
+    return {"warehouse": warehouse, "unload": unload, "docs": docs, "client": client, "container": container}
+
+
+def _car(yard, n, price):
+    car = Car.objects.create(
+        vin=f"PROFIT{n:011d}",
+        brand="Audi",
+        year=2022,
+        status="IN_PORT",
+        warehouse=yard["warehouse"],
+        container=yard["container"],
+        client=yard["client"],
+    )
+    Car.objects.filter(pk=car.pk).update(total_price=Decimal(price))
+    return car
+
+
+def _cost(car, amount, stype="UNLOADING", service=None):
+    return SupplierCost.objects.create(
+        car=car, car_service=service, counterparty="Port", service_type=stype, amount=Decimal(amount), vin=car.vin
+    )
+
+
+def _service(car, yard, key):
+    return CarService.objects.get(car=car, service_type="WAREHOUSE", service_id=yard[key].pk)
+
+
+def test_signals_keep_rows_in_sync(yard, django_capture_on_commit_callbacks):
+    car = _car(yard, 1, "150")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        cost = _cost(car, "60", service=_service(car, yard, "unload"))
+        _cost(car, "10", stype="DOCS")
+
+    row = CarProfitability.objects.get(car=car)
+    assert (row.revenue, row.total_cost, row.profit, row.margin_pct) == (
+        Decimal("150.00"),
+        Decimal("70.00"),
+        Decimal("80.00"),
+        Decimal("53.3"),
+    )
+    assert row.cost_breakdown == {"DOCS": "10.00", "UNLOADING": "60.00"}
+    assert (row.total_services, row.confirmed_services, row.unlinked_costs) == (2, 1, 1)
+    assert (row.cost_status, row.is_final, row.container_id, row.client_id) == (
+        "partial",
+        False,
+        yard["container"].pk,
+        yard["client"].pk,
+    )
+
+    other = _car(yard, 2, "0")
+    with django_capture_on_commit_callbacks(execute=True):
+        cost.car = other
+        cost.save()
+    assert CarProfitability.objects.get(car=car).total_cost == Decimal("10.00")
+    assert CarProfitability.objects.get(car=other).total_cost == Decimal("60.00")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        SupplierCost.objects.filter(car=car).delete()
+    assert not CarProfitability.objects.filter(car=car).exists()
+
+
+def test_bulk_service_sync_refreshes_rows(yard, django_capture_on_commit_callbacks):
+    from core.models import Line, LineService
+    from core.services.car_service_manager import sync_car_services_for_cars
+
+    car = _car(yard, 1, "150")
+    with django_capture_on_commit_callbacks(execute=True):
+        _cost(car, "60", service=_service(car, yard, "unload"))
+    assert CarProfitability.objects.get(car=car).total_services == 2
+
+    # Новая линия: услуги добавляются bulk_create, удалять нечего — сигналов нет.
+    line = Line.objects.create(name="Profit Line")
+    LineService.objects.create(line=line, name="Фрахт", default_price=Decimal("500"), add_by_default=True)
+    Car.objects.filter(pk=car.pk).update(line=line)
+    car.refresh_from_db()
+    with django_capture_on_commit_callbacks(execute=True):
+        sync_car_services_for_cars([car], created=False, line_changed=True)
+
+    row = CarProfitability.objects.get(car=car)
+    assert (row.total_services, row.confirmed_services, row.cost_status) == (3, 1, "partial")
+
+
+def test_rows_match_live_calculation(yard):
+    cars = [_car(yard, i, price) for i, price in enumerate(["300", "80", "0"])]
+    _cost(cars[0], "120", service=_service(cars[0], yard, "unload"))
+    _cost(cars[0], "40", stype="DOCS", service=_service(cars[0], yard, "docs"))
+    _cost(cars[1], "95")
+    _cost(cars[2], "30", stype="THS")
+    refresh_car_profitability(c.pk for c in cars)
+
+    live = get_car_profitability()
+    summary = get_reconciliation_summary()
+
+    assert summary["cars"] == live
+    assert [c["profit"] for c in live] == [-30.0, -15.0, 140.0]
+    assert live[2]["is_final"] is True
+    assert summary["totals"]["total_profit"] == 95.0
+    assert (summary["totals"]["loss_cars_count"], summary["totals"]["final_cars_count"]) == (2, 1)
+    [container] = summary["containers"]
+    assert (container["cars_count"], container["profit"], container["is_final"]) == (3, 95.0, False)
+    assert [c["car_id"] for c in container["cars"]] == [c["car_id"] for c in live]
+    [client] = summary["clients"]
+    assert (client["name"], client["total_cost"]) == ("Profit Dealer", 285.0)
+    # Срез по счетам — живой расчёт только по их затратам.
+    assert get_reconciliation_summary(audit_ids=[0])["totals"]["cars_count"] == 0
+
+
+def test_stale_revenue_and_reconcile(yard):
+    car = _car(yard, 1, "100")
+    orphan = _car(yard, 2, "100")
+    _cost(car, "40")
+    refresh_car_profitability([car.pk])
+
+    # Массовый путь без сигналов (bulk_update при перерасчёте цен).
+    Car.objects.filter(pk=car.pk).update(total_price=Decimal("250"))
+    assert get_reconciliation_summary()["cars"][0]["profit"] == 210.0
+
+    CarProfitability.objects.create(car=orphan, revenue=Decimal("100"))
+
+    out = StringIO()
+    call_command("reconcile_car_profitability", stdout=out)
+    assert "Пересчитано: 1, удалено: 1" in out.getvalue()
+    assert list(CarProfitability.objects.values_list("car_id", flat=True)) == [car.pk]
+
+
+def test_dashboard_sorts_and_paginates(yard, client):
+    cars = [_car(yard, i, str(100 + i * 10)) for i in range(4)]
+    for car in cars:
+        _cost(car, "50")
+    refresh_car_profitability(c.pk for c in cars)
+    staff = User.objects.create_user(username="recon", password="x", is_staff=True, is_superuser=True)
+    client.force_login(staff)
+
+    with CaptureQueriesContext(connection) as few:
+        response = client.get(reverse("reconciliation_dashboard"), {"sort": "-profit"})
+    assert response.status_code == 200
+    assert [c["car_id"] for c in response.context["cars"]] == [c.pk for c in reversed(cars)]
+
+    more = [_car(yard, i, "100") for i in range(4, 12)]
+    for car in more:
+        _cost(car, "20")
+    refresh_car_profitability(c.pk for c in more)
+    with CaptureQueriesContext(connection) as many:
+        client.get(reverse("reconciliation_dashboard"), {"sort": "-profit"})
+    assert len(many.captured_queries) == len(few.captured_queries)
+
+    summary = get_reconciliation_summary(sort="margin", pages={"cars": 2}, per_page=5)
+    assert summary["cars_page"].number == 2
+    assert summary["sort"] == "margin"
+    assert len(summary["cars"]) == 5
+    assert get_reconciliation_summary(sort="bogus")["sort"] == "profit"
@@ -193,3 +193,7 @@ class CreateTHSServicesTest(TestCase):
         count = create_ths_services_for_container(container)
         self.assertEqual(count, 2)
         self.assertEqual(CarService.objects.filter(service_type="LINE").count(), 2)
+        # Сервисы пишутся без сигналов — цена машин пересчитывается явно.
+        for car in Car.objects.filter(container=container):
+            ths = CarService.objects.get(car=car, service_type="LINE")
+            self.assertEqual(car.total_price, ths.custom_price)
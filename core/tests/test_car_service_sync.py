@@ -0,0 +1,162 @@
+"""Пакетная синхронизация ``CarService`` (core.services.car_service_manager).
+
+- создание услуг для пачки машин — фиксированное число запросов,
+  независимо от числа машин;
+- удалённые пользователем услуги (``DeletedCarService``) не
+  восстанавливаются, ручные услуги других типов не трогаются;
+- смена склада / линии контейнера пересоздаёт услуги машин пачкой.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import (
+    Car,
+    CarService,
+    Company,
+    CompanyService,
+    Container,
+    DeletedCarService,
+    Line,
+    LineService,
+    Warehouse,
+    WarehouseService,
+)
+from core.services.car_service_manager import sync_car_services_for_car, sync_car_services_for_cars
+from core.services.container_lifecycle_service import apply_ths_change, sync_cars_for_containers
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def catalog(settings):
+    company = Company.objects.create(name=settings.COMPANY_NAME)
+    CompanyService.objects.create(company=company, name="Оформление", default_price=Decimal("25"), add_by_default=True)
+    warehouses = []
+    for name in ("WH-A", "WH-B"):
+        warehouse = Warehouse.objects.create(name=name)
+        WarehouseService.objects.create(
+            warehouse=warehouse, name=f"Разгрузка {name}", default_price=Decimal("40"), add_by_default=True
+        )
+        WarehouseService.objects.create(
+            warehouse=warehouse, name=f"Документы {name}", default_price=Decimal("15"), add_by_default=True
+        )
+        warehouses.append(warehouse)
+    lines = []
+    for name in ("LINE-A", "LINE-B"):
+        line = Line.objects.create(name=name)
+        LineService.objects.create(line=line, name=f"Фрахт {name}", default_price=Decimal("900"), add_by_default=True)
+        lines.append(line)
+    return {"warehouses": warehouses, "lines": lines}
+
+
+def _bulk_cars(count, warehouse, line, container=None, prefix="BATCH"):
+    cars = [
+        Car(
+            vin=f"{prefix}{i:0{17 - len(prefix)}d}",
+            brand="Audi",
+            year=2022,
+            status="FLOATING",
+            warehouse=warehouse,
+            line=line,
+            container=container,
+        )
+        for i in range(count)
+    ]
+    return Car.objects.bulk_create(cars)
+
+
+def _sync_queries(cars):
+    """Запросы синхронизации, кроме INSERT (их число — ceil(строк / batch))."""
+    with CaptureQueriesContext(connection) as ctx:
+        sync_car_services_for_cars(cars, created=True, warehouse_changed=True, line_changed=True, carrier_changed=True)
+    return [q["sql"].split(" ", 1)[0] for q in ctx.captured_queries if not q["sql"].startswith("INSERT")]
+
+
+def test_batch_query_count_independent_of_car_count(catalog):
+    wh_a, wh_b = catalog["warehouses"]
+    line_a, line_b = catalog["lines"]
+    few = _bulk_cars(3, wh_a, line_a, prefix="FEW")
+    many = _bulk_cars(100, wh_a, line_a, prefix="MANY") + _bulk_cars(100, wh_b, line_b, prefix="MORE")
+
+    queries = _sync_queries(many)
+    assert queries == _sync_queries(few)
+    assert len(queries) <= 8
+    # 2 склада + 1 линия + 1 компания на машину.
+    assert CarService.objects.filter(car__in=many).count() == 200 * 4
+    car = many[-1]
+    assert set(CarService.objects.filter(car=car).values_list("service_type", "service_id")) == {
+        ("WAREHOUSE", sid) for sid in WarehouseService.objects.filter(warehouse=wh_b).values_list("id", flat=True)
+    } | {("LINE", LineService.objects.get(line=line_b).pk), ("COMPANY", CompanyService.objects.get().pk)}
+
+
+def test_user_deleted_services_not_restored(catalog):
+    wh_a, wh_b = catalog["warehouses"]
+    car = Car.objects.create(vin="DELETEDSVC0000001", brand="BMW", year=2021, status="FLOATING", warehouse=wh_a)
+    skipped = WarehouseService.objects.filter(warehouse=wh_b).first()
+    DeletedCarService.objects.create(car=car, service_type="WAREHOUSE", service_id=skipped.pk)
+    manual = CarService.objects.get(car=car, service_type="COMPANY")
+    CarService.objects.filter(pk=manual.pk).update(custom_price=Decimal("99"))
+
+    car.warehouse = wh_b
+    car.save()
+
+    warehouse_ids = set(
+        CarService.objects.filter(car=car, service_type="WAREHOUSE").values_list("service_id", flat=True)
+    )
+    assert warehouse_ids == set(
+        WarehouseService.objects.filter(warehouse=wh_b).exclude(pk=skipped.pk).values_list("id", flat=True)
+    )
+    assert CarService.objects.get(pk=manual.pk).custom_price == Decimal("99")
+
+
+def test_single_car_guard_and_noop(catalog, django_assert_num_queries):
+    wh_a, _ = catalog["warehouses"]
+    car = Car.objects.create(vin="GUARDSVC000000001", brand="BMW", year=2021, status="FLOATING", warehouse=wh_a)
+
+    with django_assert_num_queries(0):
+        sync_car_services_for_car(
+            car, created=False, warehouse_changed=False, line_changed=False, carrier_changed=False
+        )
+    car._creating_services = True
+    with django_assert_num_queries(0):
+        sync_car_services_for_car(car, created=True, warehouse_changed=True, line_changed=True, carrier_changed=True)
+
+
+def test_container_warehouse_change_resyncs_moved_cars(catalog):
+    wh_a, wh_b = catalog["warehouses"]
+    container = Container.objects.create(number="MOVE1234567", status="FLOATING", warehouse=wh_a)
+    cars = _bulk_cars(20, wh_a, None, container=container, prefix="MOVE")
+    sync_car_services_for_cars(cars, created=True, warehouse_changed=True)
+    Container.objects.filter(pk=container.pk).update(warehouse=wh_b)
+
+    with CaptureQueriesContext(connection) as ctx:
+        sync_cars_for_containers([container.pk])
+
+    assert not CarService.objects.filter(car__in=cars, service_type="WAREHOUSE", service_id__in=wh_a.services.all())
+    assert CarService.objects.filter(car__in=cars, service_type="WAREHOUSE").count() == 20 * 2
+    assert set(Car.objects.filter(pk__in=[c.pk for c in cars]).values_list("total_price", flat=True)) == {
+        Decimal("80.00")
+    }
+    assert len(ctx.captured_queries) < 30
+
+
+def test_container_line_change_resyncs_line_services(catalog):
+    wh_a, _ = catalog["warehouses"]
+    line_a, line_b = catalog["lines"]
+    container = Container.objects.create(number="LINE1234567", status="FLOATING", line=line_a)
+    cars = _bulk_cars(5, wh_a, line_a, container=container, prefix="LINECH")
+    sync_car_services_for_cars(cars, created=False, line_changed=True)
+    container.line = line_b
+    container.save(update_fields=["line"])
+
+    apply_ths_change(container, ["line"])
+
+    assert set(CarService.objects.filter(car__in=cars, service_type="LINE").values_list("service_id", flat=True)) == {
+        LineService.objects.get(line=line_b).pk
+    }
@@ -0,0 +1,187 @@
+"""Список авто кабинета клиента (core.services.client_portal_listing).
+
+- keyset-пагинация проходит выборку вперёд и назад в порядке дашборда,
+  включая NULL-даты, без пропусков и повторов;
+- фасеты по статусам кэшируются и сбрасываются при изменении машины,
+  в т.ч. у прежнего владельца и при массовых ``update()``;
+- поиск по подстроке, совпадения по префиксу — первыми;
+- дашборд листается по курсору и показывает «из N» из фасетов.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import User
+from django.db.models import Case, F, IntegerField, Value, When
+from django.urls import reverse
+
+from core.models import Car, Client, Container
+from core.models.website import ClientUser
+from core.services.client_portal_listing import paginate_cars, status_counts
+
+pytestmark = pytest.mark.django_db
+
+
+def _car(owner, vin, status, *, transfer=None, unload=None, container=None):
+    return Car.objects.create(
+        year=2022,
+        brand="Audi",
+        vin=vin,
+        status=status,
+        client=owner,
+        container=container,
+        transfer_date=transfer,
+        unload_date=unload,
+    )
+
+
+@pytest.fixture
+def owner():
+    return Client.objects.create(name="Dealer")
+
+
+@pytest.fixture
+def mixed_cars(owner):
+    rows = [
+        ("KEYSETVIN00000001", "UNLOADED", None, date(2026, 5, 1)),
+        ("KEYSETVIN00000002", "UNLOADED", None, date(2026, 3, 1)),
+        ("KEYSETVIN00000003", "UNLOADED", None, None),
+        ("KEYSETVIN00000004", "UNLOADED", None, date(2026, 3, 1)),
+        ("KEYSETVIN00000005", "IN_PORT", None, None),
+        ("KEYSETVIN00000006", "IN_PORT", None, None),
+        ("KEYSETVIN00000007", "TRANSFERRED", date(2026, 6, 1), date(2026, 4, 1)),
+        ("KEYSETVIN00000008", "TRANSFERRED", None, date(2026, 2, 1)),
+        ("KEYSETVIN00000009", "TRANSFERRED", date(2026, 7, 1), None),
+    ]
+    return [_car(owner, vin, status, transfer=transfer, unload=unload) for vin, status, transfer, unload in rows]
+
+
+def _expected_order(owner):
+    """Порядок дашборда до keyset — ORDER BY с nulls last."""
+    return list(
+        Car.objects.filter(client=owner)
+        .order_by(
+            Case(
+                When(status="UNLOADED", then=Value(0)),
+                When(status="IN_PORT", then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ),
+            F("transfer_date").desc(nulls_last=True),
+            F("unload_date").asc(nulls_last=True),
+            "-id",
+        )
+        .values_list("pk", flat=True)
+    )
+
+
+def test_keyset_walks_forward_and_back_in_dashboard_order(owner, mixed_cars):
+    qs = Car.objects.filter(client=owner)
+    expected = _expected_order(owner)
+
+    pages = [paginate_cars(qs, cursor_token=None, per_page=4)]
+    while pages[-1].has_next:
+        pages.append(paginate_cars(qs, cursor_token=pages[-1].next_cursor, per_page=4))
+
+    assert [len(p) for p in pages] == [4, 4, 1]
+    assert [car.pk for p in pages for car in p] == expected
+    assert [(p.number, p.start_index, p.end_index) for p in pages] == [(1, 1, 4), (2, 5, 8), (3, 9, 9)]
+    assert not pages[0].has_previous and pages[-1].has_previous
+
+    back = paginate_cars(qs, cursor_token=pages[-1].previous_cursor, per_page=4)
+    assert [car.pk for car in back] == expected[4:8]
+    assert back.has_next and back.has_previous
+    first = paginate_cars(qs, cursor_token=back.previous_cursor, per_page=4)
+    assert [car.pk for car in first] == expected[:4]
+    assert not first.has_previous and first.number == 1
+
+
+def test_invalid_cursor_falls_back_to_first_page(owner, mixed_cars):
+    page = paginate_cars(Car.objects.filter(client=owner), cursor_token="forged:token", per_page=4)
+    assert [car.pk for car in page] == _expected_order(owner)[:4]
+
+
+def test_search_prefix_hits_first_then_substring(owner, mixed_cars):
+    qs = Car.objects.filter(client=owner)
+    page = paginate_cars(qs, cursor_token=None, per_page=10, search="keysetvin0000000")
+    assert len(page) == 9
+
+    tail = paginate_cars(qs, cursor_token=None, per_page=10, search="00007")
+    assert [car.vin for car in tail] == ["KEYSETVIN00000007"]
+
+    # «7» — префикс номера контейнера и хвост VIN: обе находки, префикс первым.
+    container = Container.objects.create(number="7FACET00001", status="IN_PORT")
+    boxed = _car(owner, "ZZZZZZZZZZZZZZZZ1", "IN_PORT", container=container)
+    first = paginate_cars(qs, cursor_token=None, per_page=1, search="7")
+    assert [car.pk for car in first] == [boxed.pk]
+    second = paginate_cars(qs, cursor_token=first.next_cursor, per_page=1, search="7")
+    assert [car.vin for car in second] == ["KEYSETVIN00000007"]
+    assert not second.has_next
+    back = paginate_cars(qs, cursor_token=second.previous_cursor, per_page=1, search="7")
+    assert [car.pk for car in back] == [boxed.pk]
+
+
+def test_status_counts_cached_and_invalidated(owner, mixed_cars, django_assert_num_queries):
+    assert status_counts(owner.pk) == {"UNLOADED": 4, "IN_PORT": 2, "TRANSFERRED": 3}
+    with django_assert_num_queries(0):
+        status_counts(owner.pk)
+
+    car = mixed_cars[4]
+    car.status = "UNLOADED"
+    car.save()
+    assert status_counts(owner.pk)["UNLOADED"] == 5
+
+    other = Client.objects.create(name="Other dealer")
+    assert status_counts(other.pk) == {}
+    car.client = other
+    car.save()
+    assert status_counts(owner.pk)["UNLOADED"] == 4
+    assert status_counts(other.pk) == {"UNLOADED": 1}
+
+
+def test_container_sync_invalidates_facets(owner):
+    container = Container.objects.create(number="FACETCTR001", status="IN_PORT")
+    _car(owner, "FACETVIN000000001", "IN_PORT", container=container)
+    assert status_counts(owner.pk) == {"IN_PORT": 1}
+
+    from core.services.container_lifecycle_service import set_containers_status
+
+    set_containers_status([container.pk], "TRANSFERRED")
+    assert status_counts(owner.pk) == {"TRANSFERRED": 1}
+
+
+def test_autotransport_transfer_invalidates_facets(owner):
+    from core.models import AutoTransport, Carrier
+    from core.signals.autotransport import _mark_cars_as_transferred
+
+    car = _car(owner, "FACETVIN000000002", "UNLOADED")
+    assert status_counts(owner.pk) == {"UNLOADED": 1}
+
+    autotransport = AutoTransport.objects.create(carrier=Carrier.objects.create(name="Facet Carrier"))
+    autotransport.cars.add(car)
+    _mark_cars_as_transferred(autotransport, date(2026, 8, 1))
+    assert status_counts(owner.pk) == {"TRANSFERRED": 1}
+
+
+def test_dashboard_paginates_by_cursor(client, owner, mixed_cars):
+    user = User.objects.create_user(username="dealer", password="secret123")
+    ClientUser.objects.create(user=user, client=owner, is_verified=True)
+    client.force_login(user)
+    expected_vins = list(Car.objects.filter(pk__in=_expected_order(owner)[:2]).values_list("vin", flat=True))
+
+    with patch("core.views_website.client_portal.CARS_PER_PAGE", 2):
+        response = client.get(reverse("website:dashboard"))
+        html = response.content.decode()
+        assert "1–2 из 6" in html
+        assert "1 / 3" in html
+        assert all(vin in html for vin in expected_vins)
+        assert '<span class="text-muted">(4)</span>' in html
+
+        next_cursor = response.context["cars_page"].next_cursor
+        response = client.get(reverse("website:dashboard"), {"cursor": next_cursor})
+    page = response.context["cars_page"]
+    assert [car.pk for car in page] == _expected_order(owner)[2:4]
+    assert "3–4 из 6" in response.content.decode()
@@ -0,0 +1,240 @@
+"""Месячные бакеты отчёта сравнения (core.services.comparison_buckets).
+
+- бакеты полных месяцев + живые неполные края совпадают с прямым расчётом,
+  инвойс склада на несколько машин клиента считается один раз;
+- сравнение клиента без границ периода учитывает машины в пути;
+- сигналы пересчитывают затронутый месяц после коммита (при переносе — и
+  прежний) через очередь склейки и только при смене отслеживаемых значений,
+  ключ кэша меняется только у отчётов, чей период его задевает;
+- отчёт за год по границам месяцев читает только бакеты.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import Car, Client, ComparisonBucket, Warehouse
+from core.models_billing import NewInvoice, Transaction
+from core.services import comparison_buckets as buckets
+from core.services import task_coalescer
+from core.services.comparison_service import ComparisonService
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def ledger(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        data = _ledger()
+    # Цены и сумма — после пересчёта машин и регенерации инвойса (on_commit).
+    for car, price in zip(data["cars"], ("100", "200", "50", "70"), strict=True):
+        Car.objects.filter(pk=car.pk).update(total_price=Decimal(price))
+    NewInvoice.objects.filter(pk=data["invoice"].pk).update(total=Decimal("300"))
+    data["invoice"].total = Decimal("300")
+    return data
+
+
+def _ledger():
+    warehouse = Warehouse.objects.create(name="Bucket WH")
+    client = Client.objects.create(name="Bucket Dealer")
+
+    def car(n, unload):
+        return Car.objects.create(
+            vin=f"BUCKET{n:011d}",
+            brand="Audi",
+            year=2022,
+            status="UNLOADED",
+            warehouse=warehouse,
+            client=client,
+            unload_date=unload,
+        )
+
+    cars = [
+        car(1, date(2026, 1, 15)),
+        car(2, date(2026, 2, 10)),
+        car(3, date(2026, 2, 20)),
+        car(4, date(2026, 3, 20)),
+    ]
+    invoice = NewInvoice.objects.create(issuer_warehouse=warehouse, recipient_client=client, date=date(2026, 2, 5))
+    invoice.cars.add(cars[1], cars[2])
+    Transaction.objects.create(
+        type="PAYMENT",
+        method="CASH",
+        status="COMPLETED",
+        amount=Decimal("250"),
+        from_client=client,
+        to_warehouse=warehouse,
+        date=timezone.make_aware(datetime(2026, 2, 7, 12)),
+    )
+    return {"warehouse": warehouse, "client": client, "cars": cars, "invoice": invoice}
+
+
+def _live(start, end):
+    result = defaultdict(buckets._empty)
+    for (_month, kind, entity_id), counters in buckets.collect(start, end).items():
+        buckets._add(result[(kind, entity_id)], counters)
+    return dict(result)
+
+
+def test_buckets_plus_edges_match_live(ledger):
+    buckets.rebuild_buckets()
+
+    for start, end in [(date(2026, 1, 10), date(2026, 3, 25)), (date(2026, 2, 1), date(2026, 2, 28)), (None, None)]:
+        assert dict(buckets.period_totals(start, end)) == _live(start, end)
+
+    client = buckets.period_totals(date(2026, 2, 1), date(2026, 2, 28))[
+        (ComparisonBucket.KIND_CLIENT, ledger["client"].pk)
+    ]
+    # Две машины клиента в одном инвойсе склада — инвойс один.
+    assert (client["cars_count"], client["invoices_count"], client["invoices_total"]) == (2, 1, Decimal("300.00"))
+
+    [row] = ComparisonService().batch_compare_warehouses(date(2026, 2, 1), date(2026, 2, 28))
+    assert (row["invoices_total"], row["payments_total"], row["status"]) == ("300.00", "250.00", "invoices_higher")
+
+
+def test_open_period_client_comparison_counts_cars_in_transit(ledger):
+    buckets.rebuild_buckets()
+    client = ledger["client"]
+    car = Car.objects.create(vin="BUCKET00000000009", brand="Audi", year=2022, status="FLOATING", client=client)
+    Car.objects.filter(pk=car.pk).update(total_price=Decimal("30"))
+
+    service = ComparisonService()
+    result = service.compare_client_costs_with_warehouse_invoices(client)
+    # Машина в пути (без даты разгрузки) учитывается только без границ периода.
+    assert (result["cars_count"], result["cars_total_cost"]) == (5, "450.00")
+    dated = service.compare_client_costs_with_warehouse_invoices(client, date(2026, 1, 1))
+    assert (dated["cars_count"], dated["cars_total_cost"]) == (4, "420.00")
+
+    newcomer = Client.objects.create(name="Transit Only")
+    Car.objects.create(vin="BUCKET00000000010", brand="Audi", year=2022, status="FLOATING", client=newcomer)
+    assert service.compare_client_costs_with_warehouse_invoices(newcomer)["status"] != "no_data"
+
+
+def test_signals_refresh_month_and_cache_key(ledger, django_capture_on_commit_callbacks):
+    buckets.rebuild_buckets()
+    jan = buckets.report_cache_key("comparison_data", date(2026, 1, 1), date(2026, 1, 31))
+    feb = buckets.report_cache_key("comparison_data", date(2026, 2, 1), date(2026, 2, 28))
+
+    invoice = ledger["invoice"]
+    with django_capture_on_commit_callbacks(execute=True):
+        invoice.total = Decimal("250")
+        invoice.save(update_fields=["total"])
+
+    row = ComparisonBucket.objects.get(
+        month=date(2026, 2, 1), kind=ComparisonBucket.KIND_WAREHOUSE, entity_id=ledger["warehouse"].pk
+    )
+    assert row.invoices_total == Decimal("250.00")
+    assert buckets.report_cache_key("comparison_data", date(2026, 1, 1), date(2026, 1, 31)) == jan
+    assert buckets.report_cache_key("comparison_data", date(2026, 2, 1), date(2026, 2, 28)) != feb
+
+    # Перенос разгрузки — пересчитываются и новый, и прежний месяц.
+    car = Car.objects.get(pk=ledger["cars"][0].pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        car.unload_date = date(2026, 3, 2)
+        car.save()
+    totals = {
+        row.month: row.cars_count
+        for row in ComparisonBucket.objects.filter(kind=ComparisonBucket.KIND_TOTAL, cars_count__gt=0)
+    }
+    assert totals == {date(2026, 2, 1): 2, date(2026, 3, 1): 2}
+
+
+def test_moved_transaction_refreshes_both_months(ledger, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        tx = Transaction.objects.create(
+            type="PAYMENT",
+            method="CASH",
+            status="PENDING",
+            amount=Decimal("40"),
+            from_client=ledger["client"],
+            to_warehouse=ledger["warehouse"],
+            date=timezone.make_aware(datetime(2026, 1, 20, 12)),
+        )
+    buckets.rebuild_buckets()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        tx.date = timezone.make_aware(datetime(2026, 3, 3, 12))
+        tx.save()
+
+    payments = {
+        row.month: row.payments_total
+        for row in ComparisonBucket.objects.filter(
+            kind=ComparisonBucket.KIND_WAREHOUSE, entity_id=ledger["warehouse"].pk, payments_count__gt=0
+        )
+    }
+    assert payments == {date(2026, 2, 1): Decimal("250.00"), date(2026, 3, 1): Decimal("40.00")}
+
+
+def test_unchanged_saves_schedule_nothing(ledger, django_capture_on_commit_callbacks):
+    car = Car.objects.get(pk=ledger["cars"][0].pk)
+    tx = Transaction.objects.get(to_warehouse=ledger["warehouse"])
+
+    def scheduled(dispatch):
+        return [
+            keys
+            for job, keys in (c.args for c in dispatch.call_args_list)
+            if job == task_coalescer.JOB_COMPARISON_MONTHS
+        ]
+
+    with patch.object(task_coalescer, "_dispatch") as dispatch:
+        with django_capture_on_commit_callbacks(execute=True):
+            car.notes = "без влияния на отчёт"
+            car.save()
+            tx.description = "только описание"
+            tx.save()
+        assert scheduled(dispatch) == []
+
+        with django_capture_on_commit_callbacks(execute=True):
+            car.client = None
+            car.save()
+        assert scheduled(dispatch) == [[202601]]
+
+
+def test_refresh_collects_inside_rebuild_transaction(ledger, monkeypatch):
+    collect = buckets.collect
+    seen = []
+
+    def tracking_collect(*args, **kwargs):
+        seen.append(connection.in_atomic_block)
+        return collect(*args, **kwargs)
+
+    monkeypatch.setattr(buckets, "collect", tracking_collect)
+    with patch.object(buckets, "lock_rebuild") as lock:
+        buckets.refresh_months([date(2026, 1, 1), date(2026, 3, 1)])
+    lock.assert_called_once()
+    assert list(lock.call_args.args[1]) == [202601, 202603]
+    assert seen == [True, True]
+
+
+def test_year_report_reads_only_buckets(ledger):
+    buckets.rebuild_buckets()
+    service = ComparisonService()
+
+    with CaptureQueriesContext(connection) as ctx:
+        [client] = service.batch_compare_clients(date(2026, 1, 1), date(2026, 12, 31))
+    # GROUP BY по бакетам + имена клиентов; исходные таблицы не читаются.
+    assert len(ctx.captured_queries) == 2
+    assert (client["cars_count"], client["cars_total_cost"], client["invoices_count"]) == (4, "420.00", 1)
+
+    report = service.get_comparison_report(date(2026, 1, 1), date(2026, 12, 31))
+    assert report["summary"]["payments_total"] == "250.00"
+
+
+def test_rebuild_command_drops_stale_months(ledger):
+    ComparisonBucket.objects.create(month=date(2020, 1, 1), kind=ComparisonBucket.KIND_TOTAL, cars_count=5)
+
+    out = StringIO()
+    call_command("rebuild_comparison_buckets", stdout=out)
+
+    assert "удалено лишних: 1" in out.getvalue()
+    assert not ComparisonBucket.objects.filter(month=date(2020, 1, 1)).exists()
@@ -6,7 +6,9 @@
 Драйвят каскады напрямую (без HTTP) и фиксируют поведение:
 - смена статуса контейнера → статус проставляется всем авто;
 - смена даты разгрузки → авто получают дату + пересчёт дней/хранения;
-- THS-изменение → создаются THS-услуги линии для авто.
+- THS-изменение → создаются THS-услуги линии для авто;
+- массовая смена статуса (``set_containers_status``) — FSM/поля,
+  батч-пересчёт хранения и фиксированное число запросов на пачку.
 
 Запуск: pytest core/tests/test_container_lifecycle.py
 """
@@ -16,10 +18,12 @@ from __future__ import annotations
 from decimal import Decimal
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from core.models import Car, CarService, Container, Line, Warehouse, WarehouseService
-from core.services.container_lifecycle_service import apply_post_save_cascades
+from core.services.container_lifecycle_service import apply_post_save_cascades, set_containers_status
 
 
 @pytest.fixture(autouse=True)
@@ -27,7 +31,7 @@ def _clear_pricing_thread_locals():
     from core.signals import car_service as cs_signals
 
     def _reset():
-        for attr in ("_pricing_local", "_regen_local"):
+        for attr in ("_pricing_local",):
             local = getattr(cs_signals, attr, None)
             if local is not None and getattr(local, "cars", None) is not None:
                 local.cars.clear()
@@ -151,3 +155,83 @@ class TestThsCascade:
             status_auto_changed=False,
         )
         assert CarService.objects.filter(service_type="LINE").count() >= 1
+
+
+def _in_port_with_unload(number, warehouse, days_ago):
+    container = Container.objects.create(number=number, status="IN_PORT")
+    # pre_save сам переводит контейнер с датой разгрузки в UNLOADED —
+    # готовим «в порту, но с датой» в обход save().
+    Container.objects.filter(pk=container.pk).update(
+        warehouse=warehouse, unload_date=timezone.now().date() - timezone.timedelta(days=days_ago)
+    )
+    container.refresh_from_db()
+    return container
+
+
+@pytest.mark.django_db
+class TestBulkStatusChange:
+    def test_unloaded_syncs_cars_and_storage_price(self, warehouse, django_capture_on_commit_callbacks):
+        from unittest.mock import patch
+
+        storage = WarehouseService.objects.get(warehouse=warehouse, code="STORAGE")
+        container = _in_port_with_unload("CLC-BLK-1", warehouse, 2)
+        with django_capture_on_commit_callbacks(execute=True):
+            cars = _make_cars(container, warehouse, 2)
+            for car in cars:
+                CarService.objects.get_or_create(car=car, service_type="WAREHOUSE", service_id=storage.pk)
+
+        with patch("core.tasks.regenerate_invoices_for_cars_task.delay") as regen:
+            with django_capture_on_commit_callbacks(execute=True):
+                result = set_containers_status([container.pk], "UNLOADED")
+
+        assert result.updated == [container.pk]
+        container.refresh_from_db()
+        assert container.status == "UNLOADED"
+        assert container.unloaded_status_at is not None
+        for car in container.container_cars.all():
+            assert car.status == "UNLOADED"
+            assert car.unload_date == container.unload_date
+            # (2 + 1) дня * 5 = 15; хранение — единственная услуга.
+            assert car.storage_cost == Decimal("15.00")
+            assert car.total_price == Decimal("15.00")
+            assert car.car_services.get(service_id=storage.pk).custom_price == Decimal("15.00")
+        regen.assert_called_once()
+        assert sorted(regen.call_args.args[0]) == sorted(car.pk for car in cars)
+
+    def test_skips_invalid_transitions_and_incomplete(self, warehouse):
+        transferred = Container.objects.create(number="CLC-BLK-T", status="TRANSFERRED")
+        bare = Container.objects.create(number="CLC-BLK-B", status="IN_PORT")
+
+        result = set_containers_status([transferred.pk, bare.pk], "UNLOADED")
+        assert result.updated == []
+        assert sorted(result.skipped_incomplete) == ["CLC-BLK-B", "CLC-BLK-T"]
+
+        result = set_containers_status([transferred.pk], "FLOATING")
+        assert result.skipped_fsm == ["CLC-BLK-T"]
+        transferred.refresh_from_db()
+        assert transferred.status == "TRANSFERRED"
+
+    def test_query_count_does_not_grow_with_containers(self, warehouse):
+        def _run(prefix, n):
+            ids = []
+            for i in range(n):
+                container = _in_port_with_unload(f"{prefix}-{i}", warehouse, 1)
+                _make_cars_with_prefix(container, warehouse, 2, f"{prefix}{i}")
+                ids.append(container.pk)
+            with CaptureQueriesContext(connection) as ctx:
+                set_containers_status(ids, "UNLOADED")
+            return len(ctx.captured_queries)
+
+        assert _run("QA", 2) == _run("QB", 6)
+
+
+def _make_cars_with_prefix(container, warehouse, n, prefix):
+    for i in range(n):
+        Car.objects.create(
+            year=2023,
+            brand="Toyota",
+            vin=f"{prefix}{i}".ljust(17, "0")[:17],
+            status=container.status,
+            container=container,
+            warehouse=warehouse,
+        )
@@ -0,0 +1,121 @@
+"""Денормализованные счётчики писем на карточках (core.services.email_counters).
+
+- связи, созданные ингестом (bulk_create), попадают в счётчики;
+- «прочитано», «ответить позже» и удаление связи пересчитывают счётчики;
+- полный save() устаревшей карточки не затирает счётчики;
+- сверка чинит дрейф;
+- changelist контейнеров не джойнит таблицы писем.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Car, Container
+from core.models_email import CarEmailLink, ContainerEmail, ContainerEmailLink
+from core.services.email_counters import reconcile_email_counters
+
+pytestmark = pytest.mark.django_db
+
+
+def _email(n: int, **kwargs) -> ContainerEmail:
+    return ContainerEmail.objects.create(
+        message_id=f"<cnt{n}@example.com>",
+        thread_id=f"cnt-thread-{n}",
+        from_addr="broker@example.com",
+        subject=f"Notice {n}",
+        body_text="ETA changed",
+        received_at=datetime.now(tz=timezone.utc),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def staff_client(client):
+    client.force_login(User.objects.create_user("ops", password="x", is_staff=True, is_superuser=True))
+    return client
+
+
+def test_ingest_links_update_counters(django_capture_on_commit_callbacks):
+    from core.services.email_ingest import SyncReport, _ingest_page
+    from core.tests.test_email_ingest import FakeBatchClient, _parsed
+
+    container = Container.objects.create(number="MSKU1112223")
+    msg = _parsed(1, subject="MSKU1112223 discharged", labels=["INBOX", "UNREAD"])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        _ingest_page(FakeBatchClient([msg]), [msg.gmail_id], {}, SyncReport(), [])
+
+    container.refresh_from_db()
+    assert container.emails_unread == 1
+
+
+def test_mark_read_and_needs_reply_refresh(staff_client, django_capture_on_commit_callbacks):
+    container = Container.objects.create(number="MSKU7654321")
+    car = Car.objects.create(vin="WBA00000000000002", year=2020, brand="BMW")
+    email = _email(1)
+    with django_capture_on_commit_callbacks(execute=True):
+        ContainerEmailLink.objects.create(email=email, container=container, is_read=False)
+        CarEmailLink.objects.create(email=email, car=car, is_read=False)
+    container.refresh_from_db()
+    car.refresh_from_db()
+    assert (container.emails_unread, car.emails_unread) == (1, 1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        staff_client.post(f"/core/emails/{email.pk}/needs-reply/", {"value": "1"})
+    container.refresh_from_db()
+    car.refresh_from_db()
+    assert (container.emails_need_reply, car.emails_need_reply) == (1, 1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        staff_client.post(f"/core/emails/container/{container.pk}/mark-all-read/")
+    container.refresh_from_db()
+    car.refresh_from_db()
+    # Прочитано только в карточке контейнера — у машины письмо ещё новое.
+    assert (container.emails_unread, car.emails_unread) == (0, 1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        email.delete()
+    car.refresh_from_db()
+    assert (car.emails_unread, car.emails_need_reply) == (0, 0)
+
+
+def test_stale_full_save_keeps_counters(django_capture_on_commit_callbacks):
+    container = Container.objects.create(number="MSKU0000003")
+    stale = Container.objects.get(pk=container.pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        ContainerEmailLink.objects.create(email=_email(3), container=container, is_read=False)
+
+    stale.notes = "edited in admin"
+    stale.save()
+
+    container.refresh_from_db()
+    assert (container.notes, container.emails_unread) == ("edited in admin", 1)
+
+
+def test_reconcile_fixes_drift():
+    container = Container.objects.create(number="MSKU0000001")
+    ContainerEmailLink.objects.create(email=_email(2), container=container, is_read=False)
+    Container.objects.filter(pk=container.pk).update(emails_unread=7, emails_need_reply=3)
+
+    result = reconcile_email_counters(batch_size=1)
+
+    container.refresh_from_db()
+    assert (container.emails_unread, container.emails_need_reply) == (1, 0)
+    assert result["container"] == 1
+
+
+def test_container_changelist_reads_columns(staff_client):
+    container = Container.objects.create(number="MSKU0000002")
+    Container.objects.filter(pk=container.pk).update(emails_unread=2)
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = staff_client.get("/admin/core/container/", {"emails": "unread", "status_multi": "FLOATING"})
+    assert response.status_code == 200
+    assert "MSKU0000002" in response.content.decode()
+    assert not [q for q in ctx.captured_queries if "core_containeremail" in q["sql"]]
@@ -0,0 +1,151 @@
+"""Live-обновления панелей переписки (core.services.email_live).
+
+- ингест/отправка рассылают баблы в Channels-группы карточек и меняют
+  версию переписки; сверх лимита push — ``reload`` без версии;
+- polling-эндпоинт с актуальной версией отвечает без запросов к письмам;
+- EmailPanelConsumer пускает только staff.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import AutoTransport, Car, Carrier, Container
+from core.models_email import CarEmailLink, ContainerEmail, ContainerEmailLink
+from core.services import email_live
+
+pytestmark = pytest.mark.django_db
+
+
+def _email(n: int, **kwargs) -> ContainerEmail:
+    return ContainerEmail.objects.create(
+        message_id=f"<live{n}@example.com>",
+        thread_id=f"live-thread-{n}",
+        from_addr="broker@example.com",
+        subject=f"Notice {n}",
+        body_text="ETA changed",
+        received_at=datetime.now(tz=timezone.utc),
+        **kwargs,
+    )
+
+
+def _listen(group: str) -> str:
+    layer = get_channel_layer()
+    channel = async_to_sync(layer.new_channel)()
+    async_to_sync(layer.group_add)(group, channel)
+    return channel
+
+
+def _receive(channel: str) -> dict:
+    return async_to_sync(get_channel_layer().receive)(channel)
+
+
+@pytest.fixture
+def staff_client(client):
+    user = User.objects.create_user("ops", password="x", is_staff=True)
+    client.force_login(user)
+    return client
+
+
+def test_publish_pushes_bubbles_and_bumps_versions(django_capture_on_commit_callbacks):
+    container = Container.objects.create(number="MSKU1234567")
+    car = Car.objects.create(vin="WBA00000000000001", year=2020, brand="BMW")
+    at = AutoTransport.objects.create(carrier=Carrier.objects.create(name="Live Carrier"))
+    at.cars.add(car)
+    email = _email(1)
+    ContainerEmailLink.objects.create(email=email, container=container, is_read=False)
+    CarEmailLink.objects.create(email=email, car=car, is_read=True)
+
+    before = email_live.get_panel_version(email_live.PANEL_CONTAINER, container.pk)
+    container_channel = _listen(email_live.panel_group(email_live.PANEL_CONTAINER, container.pk))
+    at_channel = _listen(email_live.panel_group(email_live.PANEL_AUTOTRANSPORT, at.pk))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        email_live.publish_email_links([email.pk])
+
+    after = email_live.get_panel_version(email_live.PANEL_CONTAINER, container.pk)
+    assert after != before
+    message = _receive(container_channel)
+    assert message["type"] == "email_bubbles"
+    assert message["data"]["version"] == after
+    [bubble] = message["data"]["bubbles"]
+    assert bubble["id"] == email.pk
+    assert 'data-unread="1"' in bubble["html"]
+    assert 'data-unread="0"' in _receive(at_channel)["data"]["bubbles"][0]["html"]
+
+
+def test_publish_over_limit_asks_panel_to_poll(django_capture_on_commit_callbacks, monkeypatch):
+    monkeypatch.setattr(email_live, "MAX_PUSH_BUBBLES", 1)
+    container = Container.objects.create(number="MSKU2223334")
+    emails = [_email(n) for n in (3, 4)]
+    for email in emails:
+        ContainerEmailLink.objects.create(email=email, container=container)
+    channel = _listen(email_live.panel_group(email_live.PANEL_CONTAINER, container.pk))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        email_live.publish_email_links([email.pk for email in emails])
+
+    # Без версии: клиент оставит прежнюю, и poll отдаст все письма.
+    assert _receive(channel)["data"] == {"version": None, "bubbles": [], "reload": True}
+
+
+def test_updates_endpoint_answers_from_version(staff_client):
+    container = Container.objects.create(number="MSKU7654321")
+    email = _email(2)
+    ContainerEmailLink.objects.create(email=email, container=container)
+    url = f"/core/emails/container/{container.pk}/updates/"
+
+    first = staff_client.get(url, {"since_id": 0}).json()
+    assert [b["id"] for b in first["bubbles"]] == [email.pk]
+
+    with CaptureQueriesContext(connection) as ctx:
+        again = staff_client.get(url, {"since_id": email.pk, "v": first["version"]}).json()
+    assert again["unchanged"] is True
+    assert not [q for q in ctx.captured_queries if "core_containeremail" in q["sql"]]
+
+    staff_client.post(f"/core/emails/container/{container.pk}/mark-all-read/")
+    changed = staff_client.get(url, {"since_id": email.pk, "v": first["version"]}).json()
+    assert "unchanged" not in changed
+    assert changed["unread"] == 0
+    assert changed["version"] != first["version"]
+
+
+def test_ingest_publishes_new_links(django_capture_on_commit_callbacks):
+    from core.services.email_ingest import SyncReport, _ingest_page
+    from core.tests.test_email_ingest import FakeBatchClient, _parsed
+
+    container = Container.objects.create(number="MSKU1112223")
+    channel = _listen(email_live.panel_group(email_live.PANEL_CONTAINER, container.pk))
+    msg = _parsed(1, subject="MSKU1112223 discharged")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        _ingest_page(FakeBatchClient([msg]), [msg.gmail_id], {}, SyncReport(), [])
+
+    email = ContainerEmail.objects.get(gmail_id=msg.gmail_id)
+    assert [b["id"] for b in _receive(channel)["data"]["bubbles"]] == [email.pk]
+
+
+@pytest.mark.parametrize(("is_staff", "accepted"), [(True, True), (False, False)])
+def test_consumer_accepts_staff_only(is_staff, accepted):
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+
+    from core.routing import websocket_urlpatterns
+
+    user = User.objects.create_user(f"user-{is_staff}", password="x", is_staff=is_staff)
+
+    async def _connect():
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/emails/container/1/")
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        await communicator.disconnect()
+        return connected
+
+    assert async_to_sync(_connect)() is accepted
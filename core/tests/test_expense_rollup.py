@@ -0,0 +1,149 @@
+"""Месячная свёртка расходов (core.services.expense_rollup).
+
+- сигналы транзакций пересчитывают свёртку после коммита (только если
+  поменялись поля свёртки — через очередь склейки), аналитика за
+  скользящий период (свёртка + живой первый месяц) совпадает с прямым
+  расчётом по транзакциям, позиции чеков агрегируются;
+- AI-инсайты кэшируются по версии свёртки: новая транзакция — новый вызов;
+- команда пересборки удаляет лишние строки.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import Company, ExpenseRollup
+from core.models_billing import ExpenseCategory, Transaction
+from core.services import task_coalescer
+from core.services.expense_analytics_service import ExpenseAnalyticsService
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def wallet(django_capture_on_commit_callbacks):
+    company = Company.objects.create(name="Caromoto Lithuania, MB")
+    food = ExpenseCategory.objects.create(name="Rollup Food", category_type="PERSONAL")
+    rent = ExpenseCategory.objects.create(name="Rollup Rent", category_type="OTHER")
+
+    def spend(days_ago, amount, category=food, method="CASH", receipt=None):
+        return Transaction.objects.create(
+            type="PAYMENT",
+            method=method,
+            status="COMPLETED",
+            amount=Decimal(amount),
+            from_company=company,
+            category=category,
+            description=f"spend {amount}",
+            receipt_data=receipt,
+            date=timezone.now() - timedelta(days=days_ago),
+        )
+
+    with django_capture_on_commit_callbacks(execute=True):
+        txs = [
+            spend(1, "12.50", receipt={"items": [{"name": "Milk", "qty": 2, "price": "1.25"}]}),
+            spend(29, "40", receipt={"items": [{"name": "Milk", "qty": 1.5, "price": "1.20"}]}),
+            spend(31, "99"),
+            spend(70, "25"),
+            spend(3, "500", category=rent),
+            spend(2, "60", method="CARD"),
+        ]
+    return {"company": company, "food": food, "txs": txs, "spend": spend}
+
+
+def _live_total(company, days):
+    qs = Transaction.objects.filter(
+        from_company=company,
+        status="COMPLETED",
+        method="CASH",
+        category__category_type="PERSONAL",
+        date__gte=timezone.now() - timedelta(days=days),
+    )
+    return float(qs.aggregate(total=Sum("amount"))["total"] or 0)
+
+
+def test_rollup_matches_live_period(wallet, django_capture_on_commit_callbacks):
+    svc = ExpenseAnalyticsService(wallet["company"])
+
+    assert ExpenseRollup.objects.filter(company=wallet["company"]).exists()
+    # Первый месяц «1m» неполный: 29 дней назад — внутри, 31 — снаружи.
+    for period, days in (("1m", 30), ("3m", 90)):
+        [row] = svc.get_category_breakdown(period)
+        assert (row["category"], row["total"], row["percentage"]) == (
+            "Rollup Food",
+            _live_total(wallet["company"], days),
+            100.0,
+        )
+    assert svc.get_category_breakdown("all")[0]["count"] == 4
+
+    [milk] = svc.get_top_items("1m")
+    assert (milk["name"], milk["qty"], milk["total"], milk["count"]) == ("Milk", 3.5, 4.3, 2)
+    assert sum(m["total"] for m in svc.get_monthly_trend(months=6)) == 176.5
+
+    # Отмена проведённой транзакции — месяц пересчитывается.
+    tx = wallet["txs"][0]
+    with django_capture_on_commit_callbacks(execute=True):
+        tx.status = "CANCELLED"
+        tx.save(update_fields=["status"])
+    assert svc.get_category_breakdown("1m")[0]["total"] == _live_total(wallet["company"], 30) == 40.0
+    assert sum(m["total"] for m in svc.get_monthly_trend(months=6)) == 164.0
+
+
+def test_only_rollup_fields_schedule_refresh(wallet, django_capture_on_commit_callbacks):
+    tx = wallet["txs"][0]
+    company_id = wallet["company"].pk
+    with patch.object(task_coalescer, "_dispatch") as dispatch:
+        with django_capture_on_commit_callbacks(execute=True):
+            tx.description = "только описание"
+            tx.save()
+        dispatch.assert_not_called()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            tx.status = "CANCELLED"
+            tx.save()
+    day = timezone.localtime(tx.date).date()
+    dispatch.assert_called_once_with(
+        task_coalescer.JOB_EXPENSE_MONTHS, [company_id * 1_000_000 + day.year * 100 + day.month]
+    )
+
+
+def test_ai_insights_cached_per_rollup_version(wallet, django_capture_on_commit_callbacks, monkeypatch):
+    calls = []
+
+    def fake_ai(self, data):
+        calls.append(data)
+        return {"summary": f"{data['total_spent']}", "highlights": [], "recommendations": []}
+
+    monkeypatch.setattr(ExpenseAnalyticsService, "_call_ai_for_insights", fake_ai)
+    svc = ExpenseAnalyticsService(wallet["company"])
+
+    first = svc.get_ai_insights("1m")
+    assert svc.get_ai_insights("1m") == first
+    assert len(calls) == 1
+    assert calls[0]["by_category"] == svc.get_category_breakdown("1m")
+    assert calls[0]["top_items_from_receipts"][0]["name"] == "Milk"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        wallet["spend"](0, "8")
+    assert svc.get_ai_insights("1m")["summary"] == "60.5"
+    assert len(calls) == 2
+
+
+def test_rebuild_command_drops_stale_rows(wallet):
+    ExpenseRollup.objects.create(
+        company=wallet["company"], month=date(2020, 1, 1), category=wallet["food"], method="CASH", total=Decimal("5")
+    )
+
+    out = StringIO()
+    call_command("rebuild_expense_rollup", stdout=out)
+
+    assert "удалено лишних: 1" in out.getvalue()
+    assert not ExpenseRollup.objects.filter(month=date(2020, 1, 1)).exists()
@@ -0,0 +1,135 @@
+"""Тесты кэша LLM-извлечений (аудит счетов, сканы, чеки).
+
+Сеть не используется: «запрос к модели» — счётчик вызовов compute().
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from core.models import LLMExtractionCache
+from core.services import extraction_cache as ec
+
+pytestmark = pytest.mark.django_db
+
+
+class _Counter:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+def _extract(compute, *, content="doc", prompt=("system", "user"), model="m1", use_cache=True):
+    return ec.cached_extraction(
+        LLMExtractionCache.PIPELINE_SCAN,
+        content_hash=ec.hash_text(content),
+        prompt=prompt,
+        model=model,
+        compute=compute,
+        use_cache=use_cache,
+    )
+
+
+def test_second_call_is_served_from_cache():
+    compute = _Counter({"vins": ["1HGCM82633A004352"]})
+    assert _extract(compute) == {"vins": ["1HGCM82633A004352"]}
+    assert _extract(compute) == {"vins": ["1HGCM82633A004352"]}
+    assert compute.calls == 1
+    row = LLMExtractionCache.objects.get()
+    assert row.hits == 1
+    assert row.last_hit_at is not None
+
+
+def test_key_includes_prompt_and_model():
+    compute = _Counter({"ok": True})
+    _extract(compute)
+    _extract(compute, prompt=("system v2", "user"))
+    _extract(compute, model="m2")
+    _extract(compute, content="other doc")
+    assert compute.calls == 4
+    assert LLMExtractionCache.objects.count() == 4
+
+
+def test_bypass_asks_model_and_refreshes_entry():
+    _extract(_Counter({"total": 1}))
+    fresh = _Counter({"total": 2})
+    assert _extract(fresh, use_cache=False) == {"total": 2}
+    assert fresh.calls == 1
+    assert _extract(_Counter({"total": 3})) == {"total": 2}
+    assert LLMExtractionCache.objects.count() == 1
+
+
+@pytest.mark.parametrize("result", [{}, {"error": "Не удалось распознать чек", "items": []}])
+def test_failed_answers_are_not_cached(result):
+    compute = _Counter(result)
+    _extract(compute)
+    _extract(compute)
+    assert compute.calls == 2
+    assert not LLMExtractionCache.objects.exists()
+
+
+def test_hash_images_depends_on_page_order():
+    a = [("image/jpeg", "AAAA"), ("image/jpeg", "BBBB")]
+    assert ec.hash_images(a) == ec.hash_images(list(a))
+    assert ec.hash_images(a) != ec.hash_images(a[::-1])
+
+
+def test_cache_stats_per_pipeline():
+    compute = _Counter({"ok": True})
+    _extract(compute)
+    _extract(compute)
+    _extract(compute)
+    ec.cached_extraction(
+        LLMExtractionCache.PIPELINE_RECEIPT,
+        content_hash="r" * 64,
+        prompt=("p",),
+        model="m1",
+        compute=compute,
+    )
+    stats = {row["pipeline"]: row for row in ec.get_cache_stats()}
+    assert stats["SCAN"] == {"pipeline": "SCAN", "hits": 2, "misses": 1, "hit_rate": 0.667}
+    assert stats["RECEIPT"]["misses"] == 1
+
+
+def test_scan_vision_call_uses_cache(monkeypatch):
+    from core.services import scan_extractor
+
+    calls = []
+
+    def fake_request(images, system_prompt, user_text, model):
+        calls.append(len(images))
+        return {"vins": ["5YJ3E1EA7KF317000"]}
+
+    monkeypatch.setattr(scan_extractor, "_request_claude_vision", fake_request)
+    images = [("image/jpeg", "cGFnZTE=")]
+    for _ in range(3):
+        data = scan_extractor._call_claude_vision(images, scan_extractor.TITLE_PROMPT, "title")
+    assert data == {"vins": ["5YJ3E1EA7KF317000"]}
+    assert calls == [1]
+
+    scan_extractor._call_claude_vision(images, scan_extractor.TITLE_PROMPT, "title", use_cache=False)
+    assert calls == [1, 1]
+
+
+def test_receipt_parse_keyed_by_file_content(monkeypatch, tmp_path):
+    from core.services import receipt_parser_service as rps
+
+    calls = []
+
+    def fake_request(image_path, model):
+        calls.append(image_path)
+        return {"store_name": "Maxima", "items": [], "total": 3.5}
+
+    monkeypatch.setattr(rps, "_request_receipt_extraction", fake_request)
+    first = tmp_path / "a.jpg"
+    copy = tmp_path / "b.jpg"
+    first.write_bytes(b"\xff\xd8receipt-bytes")
+    copy.write_bytes(b"\xff\xd8receipt-bytes")
+
+    assert rps.parse_receipt_image(str(first))["store_name"] == "Maxima"
+    assert rps.parse_receipt_image(str(copy))["total"] == 3.5
+    assert calls == [str(first)]
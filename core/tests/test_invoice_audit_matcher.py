@@ -0,0 +1,124 @@
+"""Тесты предкомпилированного матчера названий услуг для AI-аудита счетов.
+
+Главное требование — ``ServiceNameMatcher`` классифицирует строки счёта так
+же, как прежний построчный ``_fuzzy_match_service_name`` (exact → вхождение →
+fuzzy ≥ 0.8), только без повторной нормализации каталога на каждый вызов.
+"""
+
+from __future__ import annotations
+
+import unicodedata
+from difflib import SequenceMatcher
+
+import pytest
+
+from core.models import Warehouse, WarehouseService
+from core.services import invoice_audit_service as ias
+
+
+def _reference_match(description: str, entity_name_map: dict) -> int | None:
+    """Исходная (до матчера) реализация — эталон для сравнения."""
+    if not entity_name_map or not description:
+        return None
+
+    def _normalize(s: str) -> str:
+        s = s.strip().upper()
+        s = unicodedata.normalize("NFD", s)
+        return "".join(c for c in s if unicodedata.category(c) != "Mn")
+
+    desc_norm = _normalize(description)
+    for name, sid in entity_name_map.items():
+        if _normalize(name) == desc_norm:
+            return sid
+    for name, sid in entity_name_map.items():
+        name_norm = _normalize(name)
+        if name_norm in desc_norm or desc_norm in name_norm:
+            return sid
+    best_sid, best_ratio = None, 0.0
+    for name, sid in entity_name_map.items():
+        name_norm = _normalize(name)
+        ratio = SequenceMatcher(None, name_norm, desc_norm[: len(name_norm) + 5]).ratio()
+        if ratio > best_ratio:
+            best_ratio, best_sid = ratio, sid
+    return best_sid if best_ratio >= 0.8 else None
+
+
+CATALOG = {
+    "KONTEINERIO PERVEŽIMAS": 1,
+    "SANDĖLIAVIMAS": 2,
+    "VIETINIAI UOSTO MOKESČIAI": 3,
+    "DOKUMENTŲ PARUOŠIMAS": 4,
+    "BDK ADMINISTRAVIMAS": 5,
+    "IŠKROVIMAS": 6,
+    "IŠKROVIMAS+": 7,
+    "DEKLARACIJA": 8,
+}
+
+DESCRIPTIONS = [
+    "Konteinerio pervežimas",
+    "KONTEINERIO PERVEZIMAS Klaipeda",
+    "Konteinerio pervezlmas",  # OCR: i → l
+    "Sandeliavimas 3 d.",
+    "Sandel1avimas",
+    "Vietiniai uosto mokesciai",
+    "Vietiniai uost0 mokesčial",
+    "Dokumentu paruosimas",
+    "BDK administration",
+    "Iskrovimas",
+    "Iškrovimas+",
+    "Deklaracija EX1",
+    "Deklaracjia",
+    "Transportas",
+    "Kompensacija",
+    "",
+    "   ",
+    "X",
+]
+
+
+@pytest.mark.parametrize("description", DESCRIPTIONS)
+def test_matcher_agrees_with_reference(description):
+    matcher = ias.ServiceNameMatcher(CATALOG)
+    assert matcher.match(description) == _reference_match(description, CATALOG)
+
+
+def test_wrapper_keeps_old_signature():
+    assert ias._fuzzy_match_service_name("Sandėliavimas", CATALOG) == 2
+    assert ias._fuzzy_match_service_name("Sandeliavimas", {}) is None
+
+
+def test_matcher_memoizes_descriptions(monkeypatch):
+    matcher = ias.ServiceNameMatcher(CATALOG)
+    calls = []
+    original = matcher._match_uncached
+
+    def _spy(desc_norm):
+        calls.append(desc_norm)
+        return original(desc_norm)
+
+    monkeypatch.setattr(matcher, "_match_uncached", _spy)
+    for _ in range(50):
+        assert matcher.match("Vietiniai uost0 mokesčial") == 3
+    assert len(calls) == 1
+
+
+@pytest.mark.django_db
+def test_get_service_matcher_reuses_until_catalog_changes():
+    ias._service_matcher_cache.clear()
+    wh = Warehouse.objects.create(name="WH-AUDIT")
+    svc = WarehouseService.objects.create(warehouse=wh, name="Sandėliavimas", default_price=5)
+
+    first = ias.get_service_matcher("WAREHOUSE", wh.pk)
+    assert first.match("Sandeliavimas 2 d.") == svc.pk
+    assert ias.get_service_matcher("WAREHOUSE", wh.pk) is first
+
+    other = WarehouseService.objects.create(warehouse=wh, name="Iškrovimas", default_price=10)
+    rebuilt = ias.get_service_matcher("WAREHOUSE", wh.pk)
+    assert rebuilt is not first
+    assert rebuilt.match("Iskrovimas") == other.pk
+
+
+def test_get_service_matcher_without_counterparty_is_empty():
+    matcher = ias.get_service_matcher(None, None)
+    assert not matcher
+    assert matcher.match("Sandeliavimas") is None
@@ -0,0 +1,144 @@
+"""Свёртка метрик монитора по уровням (core.services.metric_rollup).
+
+- сырые снимки и пинги законченных 5-минутных bucket'ов → ``5m``
+  (min/avg/max), ``data`` после свёртки очищается;
+- ``5m`` законченных часов → ``1h`` со взвешенным средним;
+- prune не трогает несвёрнутые сырые строки;
+- история монитора за 7/90 дней читается из свёрток.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import SystemMetric, SystemMetricRollup, UptimeCheck
+from core.services import metric_rollup
+
+pytestmark = pytest.mark.django_db
+
+T0 = datetime(2026, 10, 19, 10, 0, tzinfo=dt_timezone.utc)
+
+
+def _metric(at: datetime, cpu: float, queue_len: int = 0) -> SystemMetric:
+    metric = SystemMetric.objects.create(
+        cpu_percent=cpu,
+        mem_total_mb=2000,
+        mem_used_mb=1000,
+        mem_available_mb=1000,
+        mem_percent=50,
+        disk_total_gb=100,
+        disk_used_gb=40,
+        disk_percent=40,
+        data={"celery_queue": {"queue_len": queue_len}, "top_processes": [{"pid": 1}]},
+    )
+    SystemMetric.objects.filter(pk=metric.pk).update(created_at=at)
+    return metric
+
+
+def _ping(at: datetime, ok: bool, ms: int | None) -> None:
+    check = UptimeCheck.objects.create(ok=ok, response_ms=ms)
+    UptimeCheck.objects.filter(pk=check.pk).update(created_at=at)
+
+
+def test_raw_rollup_min_avg_max_and_strips_blob():
+    _metric(T0 + timedelta(minutes=1), 10, queue_len=3)
+    _metric(T0 + timedelta(minutes=3), 30, queue_len=9)
+    _metric(T0 + timedelta(minutes=6), 50)  # следующий bucket
+    _metric(T0 + timedelta(minutes=11), 90)  # незаконченный bucket
+    _ping(T0 + timedelta(minutes=1), True, 100)
+    _ping(T0 + timedelta(minutes=2), True, 300)
+    _ping(T0 + timedelta(minutes=4), False, None)
+
+    assert metric_rollup.rollup_raw(now=T0 + timedelta(minutes=12)) == 2
+
+    first = SystemMetricRollup.objects.get(tier="5m", bucket_start=T0)
+    assert first.samples == 2
+    assert first.stats["cpu_percent"] == {"min": 10.0, "avg": 20.0, "max": 30.0}
+    assert first.stats["celery_queue_len"]["max"] == 9.0
+    assert (first.uptime_checks, first.uptime_ok, first.uptime_avg_ms) == (3, 2, 200.0)
+
+    stripped = SystemMetric.objects.filter(created_at__lt=T0 + timedelta(minutes=10))
+    assert list(stripped.values_list("data", flat=True)) == [{}, {}, {}]
+    assert SystemMetric.objects.get(created_at=T0 + timedelta(minutes=11)).data
+
+    # Повторный запуск не пересчитывает готовые bucket'ы.
+    assert metric_rollup.rollup_raw(now=T0 + timedelta(minutes=12)) == 0
+    assert metric_rollup.rollup_raw(now=T0 + timedelta(minutes=15)) == 1
+
+
+def test_hourly_rollup_weights_average_by_samples():
+    SystemMetricRollup.objects.create(
+        tier="5m",
+        bucket_start=T0,
+        samples=3,
+        stats={"cpu_percent": {"min": 5, "avg": 10, "max": 20}},
+        uptime_checks=5,
+        uptime_ok=5,
+        uptime_avg_ms=100,
+    )
+    SystemMetricRollup.objects.create(
+        tier="5m",
+        bucket_start=T0 + timedelta(minutes=5),
+        samples=1,
+        stats={"cpu_percent": {"min": 40, "avg": 50, "max": 95}},
+        uptime_checks=5,
+        uptime_ok=4,
+        uptime_avg_ms=200,
+    )
+
+    assert metric_rollup.rollup_hourly(now=T0 + timedelta(minutes=30)) == 0  # час не закончен
+    assert metric_rollup.rollup_hourly(now=T0 + timedelta(hours=1, minutes=1)) == 1
+
+    hour = SystemMetricRollup.objects.get(tier="1h")
+    assert hour.samples == 4
+    assert hour.stats["cpu_percent"] == {"min": 5, "avg": 20.0, "max": 95}
+    assert (hour.uptime_checks, hour.uptime_ok) == (10, 9)
+    assert hour.uptime_avg_ms == pytest.approx((100 * 5 + 200 * 4) / 9)
+
+
+def test_prune_keeps_unrolled_raw_rows(settings):
+    settings.MONITORING_RAW_RETENTION_HOURS = 24
+    now = T0 + timedelta(days=3)
+    _metric(T0, 10)
+    _metric(T0 + timedelta(days=1), 10)
+
+    assert metric_rollup.prune(now=now)["raw"] == 0  # ещё ничего не свёрнуто
+
+    metric_rollup.rollup_raw(now=T0 + timedelta(minutes=5))
+    assert metric_rollup.prune(now=now)["raw"] == 1
+    assert SystemMetric.objects.count() == 1
+
+
+def test_history_long_ranges_read_rollups(client):
+    staff = User.objects.create_user(username="ops", password="x", is_staff=True, is_superuser=True)
+    client.force_login(staff)
+    recent = timezone.now() - timedelta(days=40)
+    SystemMetricRollup.objects.create(
+        tier="1h",
+        bucket_start=recent,
+        samples=12,
+        stats={
+            "cpu_percent": {"min": 1, "avg": 12.34, "max": 80},
+            "mem_used_mb": {"min": 1, "avg": 900.7, "max": 1000},
+        },
+        uptime_checks=60,
+        uptime_ok=57,
+        uptime_avg_ms=120,
+    )
+
+    data = client.get(reverse("system_monitor_history"), {"range": "90d"}).json()
+
+    assert data["bucket"] == "hour"
+    assert len(data["points"]) == 1
+    point = data["points"][0]
+    assert (point["cpu_percent"], point["cpu_percent_max"], point["mem_used_mb"]) == (12.3, 80.0, 900)
+    assert data["uptime"]["pct"] == 95.0
+    assert data["uptime"]["buckets"][0]["avg_ms"] == 120.0
+
+    assert client.get(reverse("system_monitor_history"), {"range": "30d"}).json()["points"] == []
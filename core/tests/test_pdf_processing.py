@@ -0,0 +1,88 @@
+"""Тесты общего сервиса обработки PDF (текст, рендер страниц, дисковый кэш)."""
+
+from __future__ import annotations
+
+import base64
+
+import fitz
+import pytest
+
+from core.services import pdf_processing
+
+
+def _make_pdf(path, pages: int, *, text: bool = True) -> str:
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=595, height=842)
+        if text:
+            page.insert_text((72, 72), f"Invoice page {number + 1}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_extract_text_uses_pymupdf(tmp_path):
+    pdf = _make_pdf(tmp_path / "inv.pdf", 2)
+    text = pdf_processing.extract_text(pdf)
+    assert "Invoice page 1" in text
+    assert "Invoice page 2" in text
+
+
+def test_extract_text_empty_for_scans(tmp_path):
+    pdf = _make_pdf(tmp_path / "scan.pdf", 1, text=False)
+    assert pdf_processing.extract_text(pdf) == ""
+
+
+def test_render_pages_jpeg_respects_vision_limits(tmp_path):
+    pdf = _make_pdf(tmp_path / "scan.pdf", 2)
+    pages = pdf_processing.render_pages_jpeg(pdf, dpi=300, max_side=800)
+    assert len(pages) == 2
+    for media_type, b64 in pages:
+        assert media_type == "image/jpeg"
+        img = fitz.Pixmap(base64.b64decode(b64))
+        assert max(img.width, img.height) <= 800
+
+
+def test_render_pages_parallel_keeps_page_order(tmp_path, settings):
+    settings.PDF_RENDER_WORKERS = 2
+    pdf = _make_pdf(tmp_path / "multi.pdf", 5)
+    sequential = pdf_processing._render_page_range(pdf, list(range(5)), 72, 800)
+
+    pages = pdf_processing.render_pages_jpeg(pdf, dpi=72, max_side=800)
+    assert pages == sequential
+
+
+def test_render_pages_served_from_disk_cache(tmp_path, settings, monkeypatch):
+    settings.PDF_RENDER_CACHE_DIR = str(tmp_path / "cache")
+    pdf = _make_pdf(tmp_path / "scan.pdf", 2)
+    first = pdf_processing.render_pages_jpeg(pdf, dpi=72)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("повторный рендер при наличии кэша")
+
+    monkeypatch.setattr(pdf_processing, "_render_pdf", _fail)
+    assert pdf_processing.render_pages_jpeg(pdf, dpi=72) == first
+    # Другой dpi — другая запись кэша.
+    with pytest.raises(AssertionError):
+        pdf_processing.render_pages_jpeg(pdf, dpi=100)
+
+
+def test_prune_render_cache_removes_stale_entries(tmp_path, settings):
+    import os
+    import time
+
+    settings.PDF_RENDER_CACHE_DIR = str(tmp_path / "cache")
+    pdf = _make_pdf(tmp_path / "scan.pdf", 1)
+    pdf_processing.render_pages_jpeg(pdf, dpi=72)
+    assert pdf_processing.prune_render_cache(max_age_days=1) == 0
+
+    old = time.time() - 3 * 86400
+    for root, _dirs, files in os.walk(settings.PDF_RENDER_CACHE_DIR):
+        for name in files:
+            os.utime(os.path.join(root, name), (old, old))
+    assert pdf_processing.prune_render_cache(max_age_days=1) == 1
+
+
+def test_load_page_images_limits_pages(tmp_path):
+    pdf = _make_pdf(tmp_path / "title.pdf", 4)
+    assert len(pdf_processing.load_page_images(pdf, dpi=72, max_pages=2)) == 2
@@ -0,0 +1,90 @@
+"""Замер запросов по эндпоинтам (core.middleware_performance + request_metrics).
+
+- middleware считает запросы, SQL и раскладывает время по гистограмме;
+- flush прибавляет к существующей строке bucket'а, а не плодит новые;
+- рейтинг эндпоинтов отсекает редкие и сортирует по времени / SQL;
+- панель истории system monitor отдаёт рейтинг.
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import RequestMetric
+from core.services import request_metrics
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _clean_pending():
+    request_metrics._pending.clear()
+    yield
+    request_metrics._pending.clear()
+
+
+@pytest.fixture
+def metrics_on(settings):
+    settings.REQUEST_METRICS_ENABLED = True
+    # Без автоматического flush — тест сливает явно.
+    settings.REQUEST_METRICS_FLUSH_SECONDS = 10**6
+
+
+def test_middleware_records_latency_and_sql(client, metrics_on):
+    staff = User.objects.create_user(username="ops", password="x", is_staff=True, is_superuser=True)
+    client.force_login(staff)
+    for _ in range(2):
+        assert client.get(reverse("admin:core_car_changelist")).status_code == 200
+    client.get("/static/nothing.css")
+
+    assert request_metrics.flush() == 1
+    row = RequestMetric.objects.get()
+    assert (row.route, row.method, row.count, row.errors) == ("admin:core_car_changelist", "GET", 2, 0)
+    assert row.sql_count >= 2 and row.max_sql_count >= 1
+    assert row.total_ms > 0 and row.max_ms <= row.total_ms
+    assert sum(row.histogram.values()) == 2
+
+
+def test_flush_merges_into_existing_bucket():
+    for duration in (30, 700, 9000):
+        request_metrics.record("admin:index", "GET", 200, duration, 4, 2.5)
+    request_metrics.flush()
+    request_metrics.record("admin:index", "GET", 502, 80, 10, 1.0)
+    request_metrics.flush()
+
+    row = RequestMetric.objects.get()
+    assert (row.count, row.errors, row.sql_count, row.max_sql_count) == (4, 1, 22, 10)
+    assert row.max_ms == 9000
+    assert row.histogram == {"50": 1, "100": 1, "1000": 1, "inf": 1}
+
+
+def test_endpoint_stats_ranks_endpoints():
+    for _ in range(5):
+        request_metrics.record("slow-page", "GET", 200, 900, 3, 5)
+        request_metrics.record("chatty-page", "GET", 200, 40, 120, 30)
+    request_metrics.record("rare-page", "GET", 200, 20000, 500, 100)
+    request_metrics.flush()
+
+    stats = request_metrics.endpoint_stats(timezone.now() - timedelta(hours=1))
+    assert [s["route"] for s in stats["slowest"]] == ["slow-page", "chatty-page"]
+    assert [s["route"] for s in stats["most_queries"]] == ["chatty-page", "slow-page"]
+    slow = stats["slowest"][0]
+    assert (slow["avg_ms"], slow["p95_ms"], slow["avg_queries"]) == (900.0, 900.0, 3.0)
+
+
+def test_history_endpoint_includes_endpoint_ranking(client):
+    staff = User.objects.create_user(username="ops2", password="x", is_staff=True, is_superuser=True)
+    client.force_login(staff)
+    for _ in range(5):
+        request_metrics.record("slow-page", "GET", 200, 300, 3, 5)
+    request_metrics.flush()
+
+    response = client.get(reverse("system_monitor_history"), {"range": "7d"})
+
+    assert response.status_code == 200
+    assert response.json()["endpoints"]["slowest"][0]["route"] == "slow-page"
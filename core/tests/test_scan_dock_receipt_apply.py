@@ -0,0 +1,128 @@
+"""
+Пакетное применение Dock Receipt (scan_applier.apply_dock_receipt_job).
+
+Проверяем, что:
+- новые машины получают тот же набор CarService, что и при обычном
+  ``Car.objects.create`` в контейнере;
+- существующие машины перепривязываются к контейнеру с весом;
+- число SQL-запросов не растёт с числом машин.
+
+Запуск: pytest core/tests/test_scan_dock_receipt_apply.py
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import (
+    Car,
+    CarService,
+    Company,
+    CompanyService,
+    Container,
+    Line,
+    LineService,
+    Warehouse,
+    WarehouseService,
+)
+from core.models.scans import ScanProcessingJob
+from core.services.scan_applier import apply_dock_receipt_job
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def container():
+    warehouse = Warehouse.objects.create(name="WH-DOCK", free_days=0)
+    WarehouseService.objects.create(
+        warehouse=warehouse, name="Разгрузка", default_price=Decimal("50"), add_by_default=True
+    )
+    WarehouseService.objects.create(
+        warehouse=warehouse, name="Хранение", code="STORAGE", default_price=Decimal("5"), add_by_default=True
+    )
+    line = Line.objects.create(name="LINE-DOCK")
+    LineService.objects.create(line=line, name="Фрахт", default_price=Decimal("900"), add_by_default=True)
+    company = Company.objects.create(name=getattr(settings, "COMPANY_NAME", "Caromoto Lithuania"))
+    CompanyService.objects.create(company=company, name="Оформление", default_price=Decimal("30"), add_by_default=True)
+    return Container.objects.create(number="MSDU7654321", status="FLOATING", warehouse=warehouse, line=line)
+
+
+def _vin(n: int) -> str:
+    return f"DOCKAPPLY{n:08d}"
+
+
+def _apply(container, vins, *, weight="1500"):
+    job = ScanProcessingJob.objects.create(
+        scan_type=ScanProcessingJob.SCAN_TYPE_DOCK_RECEIPT,
+        status=ScanProcessingJob.STATUS_NEEDS_REVIEW,
+        extracted_data={
+            "container_number": container.number,
+            "vehicles": [{"vin": vin, "year": 2021, "make": "BMW", "model": "X5", "weight_kg": weight} for vin in vins],
+        },
+        target_container=container,
+    )
+    return apply_dock_receipt_job(job)
+
+
+def _services(car):
+    return sorted(
+        (svc.service_type, svc.service_id, svc.custom_price, svc.markup_amount) for svc in car.car_services.all()
+    )
+
+
+def test_new_cars_get_same_services_as_regular_create(container):
+    reference = Car.objects.create(
+        vin=_vin(0),
+        year=2021,
+        brand="BMW X5",
+        status="FLOATING",
+        container=container,
+        warehouse=container.warehouse,
+        line=container.line,
+    )
+
+    job = _apply(container, [_vin(1), _vin(2)])
+
+    assert job.status == ScanProcessingJob.STATUS_APPLIED
+    assert job.created_new_car is True
+    for vin in (_vin(1), _vin(2)):
+        car = Car.objects.get(vin=vin)
+        assert car.container_id == container.id
+        assert car.warehouse_id == container.warehouse_id
+        assert car.weight_kg == Decimal("1500.00")
+        assert _services(car) == _services(reference)
+    assert len(_services(reference)) == 4
+    assert [v["created"] for v in job.applied_changes["vehicles"]] == [True, True]
+
+
+def test_existing_car_is_relinked_with_weight(container):
+    other = Container.objects.create(number="MSDU0000001", status="FLOATING")
+    car = Car.objects.create(vin=_vin(5), year=2020, brand="Audi", status="FLOATING", container=other)
+    services_before = _services(car)
+
+    job = _apply(container, [_vin(5), _vin(5)], weight="1234.5")
+
+    car.refresh_from_db()
+    assert car.container_id == container.id
+    assert car.weight_kg == Decimal("1234.50")
+    assert _services(car) == services_before
+    assert job.created_new_car is False
+    assert job.linked_car_id is None
+    assert [v["car_id"] for v in job.applied_changes["vehicles"]] == [car.id, car.id]
+
+
+def test_query_count_does_not_grow_with_vehicles(container):
+    def _count(vins):
+        with CaptureQueriesContext(connection) as ctx:
+            _apply(container, vins)
+        return len(ctx.captured_queries)
+
+    small = _count([_vin(10), _vin(11)])
+    large = _count([_vin(n) for n in range(20, 28)])
+    assert large == small
+    assert CarService.objects.filter(car__vin=_vin(27)).count() == 4
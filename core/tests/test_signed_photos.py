@@ -4,7 +4,7 @@
 - round-trip make/parse photo_token,
 - round-trip make/parse container_token,
 - невалидные подписи / просроченные подписи / битый payload,
-- view serve_signed_photo (200/410/403/404),
+- view serve_signed_photo (200/410/403/404, X-Accel-Redirect, кэш резолва),
 - download_photos_archive отвергает запрос без container_token,
   с битым / просроченным / неподходящим (для другого контейнера) токеном.
 """
@@ -170,6 +170,36 @@ def test_serve_signed_photo_not_public(client, container_photo):
     assert response.status_code == 404
 
 
+def test_serve_signed_photo_x_accel(client, container_photo, settings, django_assert_num_queries):
+    settings.PHOTO_X_ACCEL = True
+    url = reverse(
+        "website:serve_signed_photo",
+        kwargs={"token": make_photo_token("container", container_photo.id, "full")},
+    )
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response["X-Accel-Redirect"] == f"/protected-media/{container_photo.photo.name}"
+    assert response["Content-Type"] == "image/jpeg"
+    assert response.content == b""
+
+    # Повторная отдача — резолв из кэша, без запросов к БД.
+    with django_assert_num_queries(0):
+        assert client.get(url).status_code == 200
+
+
+def test_serve_signed_photo_unpublish_drops_cached_path(client, container_photo, django_capture_on_commit_callbacks):
+    url = reverse(
+        "website:serve_signed_photo",
+        kwargs={"token": make_photo_token("container", container_photo.id, "full")},
+    )
+    assert client.get(url).status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        container_photo.is_public = False
+        container_photo.save(update_fields=["is_public"])
+    assert client.get(url).status_code == 404
+
+
 # ---------------------------------------------------------------------------
 # download_photos_archive — требует container_token, фильтрует по контейнеру
 # ---------------------------------------------------------------------------
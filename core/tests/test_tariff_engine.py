@@ -0,0 +1,159 @@
+"""Пакетный движок THS и тарифов клиентов (core.services.tariff_engine).
+
+- THS делится по коэффициентам типов ТС линии, тариф FLEXIBLE
+  подбирается по числу ТС контейнера без учёта мотоциклов;
+- число запросов не растёт с числом контейнеров в пачке;
+- «Пересчитать THS» линии и ``recalculate_client_tariffs`` работают
+  через движок (dry-run ничего не пишет); смена наценки без смены цены
+  тоже регенерирует инвойс машины.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import (
+    Car,
+    CarService,
+    Client,
+    ClientTariffRate,
+    Container,
+    Line,
+    LineService,
+    LineTHSCoefficient,
+    Warehouse,
+    WarehouseService,
+)
+from core.services.tariff_engine import recalculate_containers
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def season():
+    warehouse = Warehouse.objects.create(name="Tariff WH")
+    unload = WarehouseService.objects.create(
+        warehouse=warehouse, name="Разгрузка", default_price=Decimal("40"), add_by_default=True
+    )
+    line = Line.objects.create(name="Tariff Line")
+    LineTHSCoefficient.objects.create(line=line, vehicle_type="SUV", coefficient=Decimal("2.00"))
+    client = Client.objects.create(name="Flex Dealer", tariff_type="FLEXIBLE")
+    ClientTariffRate.objects.create(
+        client=client, vehicle_type="SEDAN", min_cars=1, max_cars=2, agreed_total_price=Decimal("100")
+    )
+    ClientTariffRate.objects.create(client=client, vehicle_type="SEDAN", min_cars=3, agreed_total_price=Decimal("80"))
+
+    def container(number, ths, vehicle_types):
+        box = Container.objects.create(number=number, status="FLOATING", line=line, warehouse=warehouse, ths=ths)
+        cars = [
+            Car.objects.create(
+                vin=f"{number}{i:0{17 - len(number)}d}",
+                brand="Audi",
+                year=2022,
+                status="IN_PORT",
+                container=box,
+                warehouse=warehouse,
+                vehicle_type=vtype,
+                client=client if vtype != "MOTO" else None,
+            )
+            for i, vtype in enumerate(vehicle_types)
+        ]
+        return box, cars
+
+    big, big_cars = container("BIGBOX", Decimal("300"), ["SEDAN", "SEDAN", "SEDAN", "MOTO"])
+    small, small_cars = container("SMALLBOX", Decimal("100"), ["SEDAN", "SUV"])
+    return {"line": line, "unload": unload, "big": (big, big_cars), "small": (small, small_cars)}
+
+
+def _ths(car):
+    return CarService.objects.get(car=car, service_type="LINE").custom_price
+
+
+def _unload_markup(car, season):
+    return CarService.objects.get(car=car, service_type="WAREHOUSE", service_id=season["unload"].pk).markup_amount
+
+
+def test_ths_shares_and_flexible_tariff(season):
+    big, big_cars = season["big"]
+    small, small_cars = season["small"]
+
+    result = recalculate_containers([big.pk, small.pk])
+
+    assert (result.containers, result.ths_services) == (2, 6)
+    assert [_ths(car) for car in big_cars] == [Decimal("75")] * 4
+    # 100 × 1/3 = 33.33 → 35, 100 × 2/3 = 66.67 → 70 (вверх до 5 EUR).
+    assert [_ths(car) for car in small_cars] == [Decimal("35"), Decimal("70")]
+    assert LineService.objects.filter(line=season["line"], name__icontains="THS").count() == 1
+
+    # 3 легковых (мотоцикл не считается) → ставка 80; 2 ТС → ставка 100.
+    assert [_unload_markup(car, season) for car in big_cars[:3]] == [Decimal("40")] * 3
+    assert _unload_markup(big_cars[3], season) == Decimal("0")  # без клиента
+    assert _unload_markup(small_cars[0], season) == Decimal("60")
+    assert _unload_markup(small_cars[1], season) == Decimal("0")  # нет ставки для SUV
+
+
+def test_query_count_independent_of_container_count(season):
+    big, _ = season["big"]
+    small, _ = season["small"]
+    recalculate_containers([big.pk, small.pk])  # THS-услуга каталога создана
+
+    with CaptureQueriesContext(connection) as one:
+        recalculate_containers([big.pk])
+    with CaptureQueriesContext(connection) as two:
+        recalculate_containers([big.pk, small.pk])
+
+    assert len(two.captured_queries) == len(one.captured_queries)
+
+
+def test_line_recalculate_view_reprices_cars(season, client):
+    staff = User.objects.create_user(username="lines", password="x", is_staff=True, is_superuser=True)
+    client.force_login(staff)
+    _, big_cars = season["big"]
+
+    response = client.get(reverse("admin:core_line_recalculate_ths", args=[season["line"].pk]))
+
+    assert response.status_code == 302
+    car = Car.objects.get(pk=big_cars[0].pk)
+    assert car.total_price == Decimal("155.00")  # разгрузка 40 + наценка 40 + THS 75
+
+
+def test_recalculate_client_tariffs_command(season):
+    _, small_cars = season["small"]
+    car = small_cars[0]
+
+    out = StringIO()
+    call_command("recalculate_client_tariffs", "--dry-run", stdout=out)
+    assert "[dry-run] Изменено авто: 5 из 5" in out.getvalue()
+    assert _unload_markup(car, season) == Decimal("0")
+
+    call_command("recalculate_client_tariffs", stdout=StringIO())
+    assert _unload_markup(car, season) == Decimal("60")
+    assert Car.objects.get(pk=car.pk).total_price == Decimal("100.00")
+
+
+def test_recalculate_client_tariffs_regenerates_invoices_of_redistributed_markups(season, monkeypatch):
+    _, small_cars = season["small"]
+    car = small_cars[0]
+    call_command("recalculate_client_tariffs", stdout=StringIO())
+    docs = WarehouseService.objects.create(warehouse=car.warehouse, name="Документы", default_price=Decimal("0"))
+    CarService.objects.create(car=car, service_type="WAREHOUSE", service_id=docs.pk, custom_price=Decimal("0"))
+
+    scheduled = []
+    monkeypatch.setattr(
+        "core.management.commands.recalculate_client_tariffs.schedule", lambda job, ids: scheduled.append(ids)
+    )
+    out = StringIO()
+    call_command("recalculate_client_tariffs", stdout=out)
+
+    # Наценка 60 делится на две услуги, цена машины та же — инвойс всё равно регенерируется.
+    assert "Изменено авто: 0 из 5" in out.getvalue()
+    assert _unload_markup(car, season) == Decimal("30")
+    assert scheduled == [[car.pk]]
@@ -0,0 +1,151 @@
+"""Склейка фоновых пересчётов (core.services.task_coalescer).
+
+- постановки из разных транзакций в пределах окна уходят одним батчем;
+- статистика склейки считает запрошенные и поставленные ключи;
+- без Redis или при его недоступности задача ставится сразу.
+"""
+
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import pytest
+
+from core.services import task_coalescer
+from core.services.task_coalescer import JOB_CAR_INVOICES, JOB_CAR_PRICES, coalescing_stats, flush, schedule
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeRedis:
+    """Минимальный in-memory Redis: set / hash / строковые ключи с NX."""
+
+    def __init__(self, fail=False):
+        self.sets: dict[str, set] = {}
+        self.hashes: dict[str, dict] = {}
+        self.strings: dict[str, str] = {}
+        self.fail = fail
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError("redis down")
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def sadd(self, key, *values):
+        self._check()
+        bucket = self.sets.setdefault(key, set())
+        before = len(bucket)
+        bucket.update(str(v).encode() for v in values)
+        return len(bucket) - before
+
+    def spop(self, key, count):
+        self._check()
+        bucket = self.sets.get(key, set())
+        return [bucket.pop() for _ in range(min(count, len(bucket)))]
+
+    def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    def hincrby(self, key, field, amount):
+        self._check()
+        bucket = self.hashes.setdefault(key, {})
+        bucket[field] = bucket.get(field, 0) + amount
+        return bucket[field]
+
+    def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+    def set(self, key, value, nx=False, ex=None):
+        self._check()
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    def delete(self, key):
+        self.strings.pop(key, None)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return _queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+@pytest.fixture
+def fake_redis():
+    client = FakeRedis()
+    with patch.object(task_coalescer, "_redis", return_value=client):
+        yield client
+
+
+def test_window_coalesces_repeated_schedules(fake_redis, settings, django_capture_on_commit_callbacks):
+    settings.TASK_COALESCE_WINDOW = 5
+    with (
+        patch("core.tasks.flush_coalesced_jobs_task.apply_async") as arm,
+        patch("core.tasks.recalculate_cars_total_price_task.delay") as recalc,
+    ):
+        # Три «запроса» с пересекающимися машинами.
+        for ids in ([1, 2], [2, 3], [1, 3, 4]):
+            with django_capture_on_commit_callbacks(execute=True):
+                schedule(JOB_CAR_PRICES, ids)
+
+        assert arm.call_count == 1
+        assert arm.call_args.kwargs["countdown"] == 5
+        recalc.assert_not_called()
+
+        assert flush(JOB_CAR_PRICES) == 4
+
+    recalc.assert_called_once_with([1, 2, 3, 4])
+    stats = coalescing_stats()[JOB_CAR_PRICES]
+    assert (stats["requested"], stats["dispatched"], stats["batches"], stats["pending"]) == (7, 4, 1, 0)
+    assert stats["ratio"] == 1.75
+
+    # Таймер снят — следующий schedule взводит новый flush.
+    with (
+        patch("core.tasks.flush_coalesced_jobs_task.apply_async") as arm,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        schedule(JOB_CAR_PRICES, [5])
+    assert arm.call_count == 1
+
+
+def test_same_transaction_dedupes(fake_redis, django_capture_on_commit_callbacks):
+    with (
+        patch("core.tasks.flush_coalesced_jobs_task.apply_async") as arm,
+        django_capture_on_commit_callbacks(execute=True) as callbacks,
+    ):
+        for car_id in (7, 7, 8, 7):
+            schedule(JOB_CAR_INVOICES, [car_id])
+    assert len(callbacks) == 2
+    assert arm.call_count == 1
+    assert fake_redis.scard("coalesce:pending:car_invoices") == 2
+
+
+def test_without_redis_dispatches_immediately(django_capture_on_commit_callbacks):
+    with patch("core.tasks.regenerate_invoices_for_cars_task.delay") as regen:
+        with django_capture_on_commit_callbacks(execute=True):
+            schedule(JOB_CAR_INVOICES, [3, 1, 3])
+    regen.assert_called_once_with([1, 3])
+
+
+def test_redis_failure_falls_back_to_direct_dispatch(django_capture_on_commit_callbacks):
+    with (
+        patch.object(task_coalescer, "_redis", return_value=FakeRedis(fail=True)),
+        patch("core.tasks.recalculate_cars_total_price_task.delay") as recalc,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        schedule(JOB_CAR_PRICES, [10])
+    recalc.assert_called_once_with([10])
@@ -0,0 +1,97 @@
+"""Телеметрия Celery-задач (core.signals.task_telemetry + task_metrics).
+
+- eager-запуск проходит prerun/postrun: время, SQL, итог пишутся в TaskMetric;
+- ожидание считается от ``enqueued_at`` или ``eta`` отложенной задачи;
+- soft/hard time limit сливаются сразу, вместе с буфером процесса;
+- soft/hard time limit и серия ошибок поднимают алерты монитора.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from types import SimpleNamespace
+
+import pytest
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded
+from celery.signals import task_failure
+from django.utils import timezone
+
+from core.models import TaskMetric
+from core.services import task_metrics
+from core.services.system_monitor import compute_alerts
+from core.signals.task_telemetry import _wait_ms, stamp_enqueued_at
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def telemetry_on(settings):
+    settings.TASK_METRICS_ENABLED = True
+    settings.TASK_METRICS_FLUSH_SECONDS = 10**6
+    task_metrics._pending.clear()
+    yield
+    task_metrics._pending.clear()
+
+
+def test_eager_run_recorded_with_sql_count():
+    from core.tasks import check_overdue_invoices
+
+    check_overdue_invoices.delay()
+    check_overdue_invoices.delay()
+    assert task_metrics.flush() == 1
+
+    row = TaskMetric.objects.get()
+    assert row.task_name == "core.tasks.check_overdue_invoices"
+    assert (row.count, row.failures, row.retries) == (2, 0, 0)
+    assert row.sql_count >= 2
+    assert row.wait_samples == 0  # eager — без публикации в брокер
+    assert sum(row.histogram.values()) == 2
+
+
+def test_wait_measured_from_publish_or_eta():
+    headers = {}
+    stamp_enqueued_at(headers=headers)
+    assert headers["enqueued_at"] <= time.time()
+
+    request = SimpleNamespace(enqueued_at=time.time() - 3, eta=None)
+    assert 2900 < _wait_ms(request) < 4000
+
+    eta = (datetime.now(dt_timezone.utc) - timedelta(seconds=1)).isoformat()
+    delayed = SimpleNamespace(enqueued_at=time.time() - 600, eta=eta)
+    assert _wait_ms(delayed) < 2000
+    assert _wait_ms(SimpleNamespace()) is None
+
+
+def test_time_limit_flushes_at_once():
+    from core.tasks import sync_bank_and_reconcile as sender
+
+    task_metrics.record_run(sender.name, runtime_ms=300, wait_ms=None, sql_count=1, failed=False, retried=False)
+    # Интервал слива в фикстуре огромный — строка всё равно записана.
+    task_failure.send(sender=sender, exception=TimeLimitExceeded(600))
+
+    row = TaskMetric.objects.get()
+    assert (row.count, row.failures, row.time_limit_hits) == (2, 1, 1)
+    assert not task_metrics._pending
+
+
+def test_time_limits_and_failures_raise_alerts():
+    from core.tasks import sync_bank_and_reconcile as sender
+
+    task_failure.send(sender=sender, exception=SoftTimeLimitExceeded())
+    task_failure.send(sender=sender, exception=TimeLimitExceeded(600))
+    for _ in range(2):
+        task_metrics.record_run(sender.name, runtime_ms=1200, wait_ms=200_000, sql_count=5, failed=True, retried=False)
+    task_metrics.flush()
+
+    stats = task_metrics.task_stats(timezone.now() - timedelta(minutes=15))
+    assert len(stats) == 1
+    bank = stats[0]
+    assert (bank["count"], bank["failures"], bank["time_limit_hits"]) == (3, 3, 2)
+    assert bank["avg_wait_ms"] == 200_000
+
+    messages = [a["message"] for a in compute_alerts({"task_telemetry": stats})]
+    assert any("time limit" in m for m in messages)
+    assert any("ждёт воркера" in m for m in messages)
+    assert any("3 ошибок из 3" in m for m in messages)
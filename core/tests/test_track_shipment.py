@@ -7,7 +7,9 @@
 * пустой ``tracking_number`` → 400;
 * слишком короткий ``tracking_number`` (защита от перебора) → 400;
 * **битый JSON** → 400 (раньше падало в 500 из-за широкого ``except
-  Exception`` в ``track_shipment``).
+  Exception`` в ``track_shipment``);
+* кэш ответов: повтор без запросов за грузом, ETag/304, сброс сигналами,
+  negative-кэш «не найдено».
 """
 
 from __future__ import annotations
@@ -93,3 +95,55 @@ def test_track_shipment_wrong_content_type_returns_400(client, db):
     url = reverse("website:track_shipment")
     response = client.post(url, data={"foo": "bar"})  # default form-data
     assert response.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Кэш ответов (core.services.tracking_cache)
+# ---------------------------------------------------------------------------
+
+
+def test_track_shipment_served_from_cache(client, tracked_container, django_assert_num_queries):
+    url = reverse("website:track_shipment")
+    first = client.post(url, data={"tracking_number": "caru-1234567"}, content_type="application/json")
+    assert first.status_code == 200
+
+    # Повтор по тому же нормализованному номеру — только INSERT TrackingRequest.
+    with django_assert_num_queries(1):
+        again = client.post(url, data={"tracking_number": "CARU1234567"}, content_type="application/json")
+    assert again.json() == first.json()
+
+
+def test_track_shipment_conditional_get(client, tracked_container):
+    url = reverse("website:track_shipment")
+    response = client.get(url, {"tracking_number": tracked_container.number})
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    not_modified = client.get(url, {"tracking_number": tracked_container.number}, HTTP_IF_NONE_MATCH=etag)
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_track_shipment_invalidated_on_change(client, tracked_container, django_capture_on_commit_callbacks):
+    from core.models import Car
+
+    url = reverse("website:track_shipment")
+    etag = client.get(url, {"tracking_number": tracked_container.number})["ETag"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Car.objects.create(vin="WBA00000000000777", year=2020, brand="BMW", container=tracked_container)
+
+    response = client.get(url, {"tracking_number": tracked_container.number}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()["data"]["cars_count"] == 1
+
+
+def test_track_shipment_negative_cache_cleared_on_create(client, db, django_capture_on_commit_callbacks):
+    url = reverse("website:track_shipment")
+    assert client.post(url, data={"tracking_number": "MSKU7777777"}, content_type="application/json").status_code == 404
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Container.objects.create(number="MSKU7777777", status="IN_PORT")
+
+    response = client.post(url, data={"tracking_number": "MSKU7777777"}, content_type="application/json")
+    assert response.status_code == 200
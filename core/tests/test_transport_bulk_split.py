@@ -86,22 +86,25 @@ def fake_ai(monkeypatch):
         monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
         monkeypatch.setattr(
             "core.services.scan_extractor.render_document_images",
-            lambda path: [("image/jpeg", "fake") for _ in page_answers],
+            lambda path: [("image/jpeg", f"page-{index}") for index in range(len(page_answers))],
         )
 
         def fake_call(images, system_prompt, user_text):
             # Модель отвечает только про показанный чанк — нумерация с 1.
-            offset = fake_call.sent
-            fake_call.sent += len(images)
+            # Чанки уходят параллельно, поэтому ответ строим по самим
+            # страницам, а не по порядку вызовов.
+            fake_call.calls += 1
+            answers = [page_answers[int(b64.split("-")[1])] for _media, b64 in images]
             return {
                 "pages": [
                     {"page": index + 1, "doc_type": doc_type, "confidence": confidence}
-                    for index, (doc_type, confidence) in enumerate(page_answers[offset : offset + len(images)])
+                    for index, (doc_type, confidence) in enumerate(answers)
                 ]
             }
 
-        fake_call.sent = 0
+        fake_call.calls = 0
         monkeypatch.setattr("core.services.scan_extractor._call_claude_vision", fake_call)
+        return fake_call
 
     return _install
 
@@ -173,6 +176,46 @@ def test_pages_are_classified_in_chunks(transport_request, car, settings, tmp_pa
     assert result["documents"][0]["pages"] == [1, 2]
 
 
+def test_parallel_chunks_keep_page_order_and_report_progress(
+    transport_request, car, settings, tmp_path, fake_ai, monkeypatch
+):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.BULK_SPLIT_CLASSIFY_WORKERS = 3
+    monkeypatch.setattr(bulk, "PAGES_PER_CALL", 2)
+    answers = [("PASSPORT", "high")] * 3 + [("INVOICE", "high")] * 4 + [("CONTRACT", "high")] * 2
+    fake_call = fake_ai(answers)
+    upload = _make_upload(transport_request, car, len(answers))
+    progress = []
+    real_classify = bulk._classify_pages
+    monkeypatch.setattr(
+        bulk, "_classify_pages", lambda images, on_progress: real_classify(images, on_progress=progress.append)
+    )
+
+    result = bulk.split_upload(upload)
+
+    assert fake_call.calls == 5
+    assert [(item["doc_type"], item["pages"]) for item in result["documents"]] == [
+        ("PASSPORT", [1, 2, 3]),
+        ("INVOICE", [4, 5, 6, 7]),
+        ("CONTRACT", [8, 9]),
+    ]
+    assert sorted(progress) == progress
+    assert progress[-1] == len(answers)
+    docs = {doc.doc_type: doc for doc in transport_request.documents.all()}
+    assert {item["document_id"] for item in result["documents"]} == {doc.pk for doc in docs.values()}
+
+
+def test_upload_progress_is_saved(transport_request, car, settings, tmp_path, fake_ai):
+    settings.MEDIA_ROOT = str(tmp_path)
+    fake_ai([("PASSPORT", "high"), ("INVOICE", "high"), ("INVOICE", "high")])
+    upload = _make_upload(transport_request, car, 3)
+
+    bulk.split_upload(upload)
+
+    upload.refresh_from_db()
+    assert (upload.pages_done, upload.pages_total) == (3, 3)
+
+
 def test_too_many_pages_is_rejected(transport_request, car, settings, tmp_path, fake_ai, monkeypatch):
     settings.MEDIA_ROOT = str(tmp_path)
     monkeypatch.setattr(bulk, "MAX_PAGES", 2)
@@ -254,9 +297,7 @@ def test_generated_document_cannot_be_retyped(transport_request, car, settings,
         bulk.retype_document(doc, "OTHER")
 
 
-def test_client_bulk_upload_view_queues_split(
-    logged_client, transport_request, car, settings, tmp_path, fake_ai
-):
+def test_client_bulk_upload_view_queues_split(logged_client, transport_request, car, settings, tmp_path, fake_ai):
     settings.MEDIA_ROOT = str(tmp_path)
     fake_ai([("PASSPORT", "high"), ("INVOICE", "high")])
 
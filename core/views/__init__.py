@@ -20,6 +20,7 @@ TODO (структурная унификация P2 #15): постепенно
 from .admin_views import (  # noqa: F401
     add_cash_expense,
     add_cash_income,
+    admin_export_download,
     cash_wallet_reset,
     company_dashboard,
     expense_analytics,
@@ -728,3 +728,51 @@ def personal_card_balance_reset(request, card_id):
         }
     )
     return render(request, "admin/personal_card_balance_reset.html", context)
+
+
+@staff_member_required
+def admin_export_download(request, token):
+    """Скачивание файла фонового экспорта админки (core/admin/export.py).
+
+    Ссылка подписана и привязана к пользователю, запустившему экспорт;
+    пока задача не дописала файл — страница «ещё готовится», если задача
+    упала — ошибка.
+    """
+    import os
+
+    from django.core.signing import BadSignature
+    from django.http import FileResponse, Http404, HttpResponse
+
+    from core.admin.export import CONTENT_TYPES, ERROR_SUFFIX, export_dir, parse_download_token
+
+    try:
+        user_id, name = parse_download_token(token)
+    except BadSignature:
+        raise Http404("Ссылка недействительна или устарела") from None
+    if user_id != request.user.pk:
+        raise Http404
+
+    root = os.path.realpath(export_dir())
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep):
+        raise Http404
+    if os.path.exists(path + ERROR_SUFFIX):
+        return HttpResponse(
+            "Экспорт не удался — запустите его из списка заново.",
+            status=500,
+            content_type="text/plain; charset=utf-8",
+        )
+    if not os.path.exists(path):
+        return HttpResponse(
+            "Файл ещё готовится — обновите страницу через минуту.",
+            status=202,
+            content_type="text/plain; charset=utf-8",
+            headers={"Refresh": "30"},
+        )
+    ext = os.path.splitext(path)[1].lstrip(".")
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=os.path.basename(path),
+        content_type=CONTENT_TYPES.get(ext),
+    )
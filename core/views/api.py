@@ -603,10 +603,12 @@ def add_services(request, car_id):
             try:
                 if car.client and car.client.tariff_type in ("FIXED", "FLEXIBLE") and car.status != "TRANSFERRED":
                     from core.services.car_service_manager import apply_client_tariff_for_car
+                    from core.services.comparison_buckets import schedule_refresh_for_cars
 
                     apply_client_tariff_for_car(car)
                     car.calculate_total_price()
                     Car.objects.filter(pk=car.pk).update(total_price=car.total_price)
+                    schedule_refresh_for_cars([car])
             except Exception:
                 # B4 (AUDIT_ROUND3): деньги — пользователь должен видеть сбой,
                 # а не ложный успех с неверными ценами.
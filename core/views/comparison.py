@@ -11,6 +11,7 @@ from django.views.decorators.http import require_GET
 
 from core.cache_utils import CACHE_TIMEOUTS
 from core.models import Car, Client, Warehouse
+from core.services.comparison_buckets import period_totals, report_cache_key
 from core.services.comparison_service import ComparisonService
 
 logger = logging.getLogger(__name__)
@@ -29,7 +30,9 @@ def comparison_dashboard(request):
     except ValueError:
         return JsonResponse({"error": "Неверный формат даты. Используйте YYYY-MM-DD"}, status=400)
 
-    cache_key = f"comparison_dashboard:{start_date}:{end_date}"
+    # Версии месяцев в ключе: пересчёт бакета сбрасывает только отчёты,
+    # чей период его задевает, поэтому TTL — medium.
+    cache_key = report_cache_key("comparison_dashboard", start_date, end_date)
     cached_context = cache.get(cache_key)
 
     if cached_context is not None:
@@ -39,18 +42,10 @@ def comparison_dashboard(request):
 
     comparison_service = ComparisonService()
     report = comparison_service.get_comparison_report(start_date, end_date)
-    client_comparisons = comparison_service.batch_compare_clients(start_date, end_date)
-    warehouse_comparisons = comparison_service.batch_compare_warehouses(start_date, end_date)
-
-    discrepancies = [
-        {"type": "client_comparison", "entity": c["client_name"], "comparison": c}
-        for c in client_comparisons
-        if c["status"] not in ("match", "no_data")
-    ] + [
-        {"type": "warehouse_comparison", "entity": w["warehouse_name"], "comparison": w}
-        for w in warehouse_comparisons
-        if w["status"] not in ("match", "no_data")
-    ]
+    rows = period_totals(start_date, end_date)
+    client_comparisons = comparison_service.batch_compare_clients(start_date, end_date, rows=rows)
+    warehouse_comparisons = comparison_service.batch_compare_warehouses(start_date, end_date, rows=rows)
+    discrepancies = comparison_service.discrepancies(client_comparisons, warehouse_comparisons)
 
     context = {
         "report": report,
@@ -61,7 +56,7 @@ def comparison_dashboard(request):
         "end_date": end_date,
     }
 
-    cache.set(cache_key, context, CACHE_TIMEOUTS["short"])
+    cache.set(cache_key, context, CACHE_TIMEOUTS["medium"])
     return render(request, "admin/comparison_dashboard.html", context)
 
 
@@ -25,6 +25,15 @@ from core.models_email import (
     TransportRequestEmailLink,
 )
 from core.services.email_compose import resolve_group_addrs, sanitize_email_html
+from core.services.email_counters import schedule_refresh, schedule_refresh_for_emails
+from core.services.email_live import (
+    PANEL_AUTOTRANSPORT,
+    PANEL_CAR,
+    PANEL_CONTAINER,
+    PANEL_TRANSPORT_REQUEST,
+    bump_versions_for_emails,
+    get_panel_version,
+)
 from core.services.email_reply_parser import (
     format_quoted_reply,
     split_reply_and_quote,
@@ -214,6 +223,9 @@ def email_mark_read(request, email_id: int):
             qs = qs.filter(container_id=container_id)
         updated = qs.update(is_read=new_val)
 
+    if updated:
+        schedule_refresh_for_emails([email.pk])
+        bump_versions_for_emails([email.pk])
     if new_val and updated and email.direction == ContainerEmail.DIRECTION_INCOMING and email.gmail_id:
         _enqueue_gmail_mark_read([email.gmail_id])
 
@@ -277,6 +289,8 @@ def email_mark_car_read(request, car_id: int):
     ).update(is_read=True)
 
     if affected:
+        schedule_refresh(car_ids=[car_id])
+        bump_versions_for_emails(affected)
         gmail_ids = list(
             ContainerEmail.objects.filter(
                 pk__in=affected,
@@ -307,6 +321,8 @@ def email_mark_transportrequest_read(request, request_id: int):
     ).update(is_read=True)
 
     if affected:
+        schedule_refresh(request_ids=[request_id])
+        bump_versions_for_emails(affected)
         gmail_ids = list(
             ContainerEmail.objects.filter(
                 pk__in=affected,
@@ -322,10 +338,26 @@ def email_mark_transportrequest_read(request, request_id: int):
     return JsonResponse({"ok": True, "updated": updated})
 
 
+def _unchanged_panel_response(request, kind: str, entity_id: int) -> tuple[int, JsonResponse | None]:
+    """Версия переписки карточки и готовый ответ, если у клиента она актуальна.
+
+    Версию читаем ДО подсчётов: изменение, случившееся во время ответа,
+    сменит версию, и следующий poll пересчитает панель.
+    """
+    version = get_panel_version(kind, entity_id)
+    if request.GET.get("v") == str(version):
+        return version, JsonResponse({"ok": True, "unchanged": True, "version": version, "bubbles": []})
+    return version, None
+
+
 @staff_member_required
 @require_GET
 def email_transportrequest_updates(request, request_id: int):
     """Polling-эндпоинт для панели переписки в карточке заявки на автовоз."""
+    version, unchanged = _unchanged_panel_response(request, PANEL_TRANSPORT_REQUEST, request_id)
+    if unchanged is not None:
+        return unchanged
+
     try:
         since_id = int(request.GET.get("since_id", 0))
     except (TypeError, ValueError):
@@ -367,6 +399,7 @@ def email_transportrequest_updates(request, request_id: int):
             "total": total,
             "unread": unread,
             "bubbles": bubbles,
+            "version": version,
         }
     )
 
@@ -395,6 +428,8 @@ def email_mark_autotransport_read(request, at_id: int):
     ).update(is_read=True)
 
     if affected:
+        schedule_refresh(car_ids=car_ids)
+        bump_versions_for_emails(affected)
         gmail_ids = list(
             ContainerEmail.objects.filter(
                 pk__in=affected,
@@ -431,6 +466,8 @@ def email_mark_container_read(request, container_id: int):
     ).update(is_read=True)
 
     if affected_links:
+        schedule_refresh(container_ids=[container_id])
+        bump_versions_for_emails(affected_links)
         gmail_ids = list(
             ContainerEmail.objects.filter(
                 pk__in=affected_links,
@@ -1035,10 +1072,20 @@ def email_container_updates(request, container_id: int):
           latest_id: <max pk среди всех писем контейнера>,
           total: <всего писем>,
           unread: <непрочитанных писем>,
-          bubbles: [{id, html}, ...]  // только письма с pk > since_id,
+          bubbles: [{id, html}, ...], // только письма с pk > since_id,
                                        // уже отрендеренные в _email_bubble.html
+          version: <версия переписки карточки>
         }
+
+    ``?v=<version>`` из прошлого ответа — если переписка с тех пор не
+    менялась, ответ ``{ok, unchanged: true, version, bubbles: []}`` без
+    запросов к таблицам писем (см. ``core.services.email_live``). Основной
+    канал новых писем — push через ``ws/emails/container/<id>/``.
     """
+    version, unchanged = _unchanged_panel_response(request, PANEL_CONTAINER, container_id)
+    if unchanged is not None:
+        return unchanged
+
     try:
         since_id = int(request.GET.get("since_id", 0))
     except (TypeError, ValueError):
@@ -1084,6 +1131,7 @@ def email_container_updates(request, container_id: int):
             "total": total,
             "unread": unread,
             "bubbles": bubbles,
+            "version": version,
         }
     )
 
@@ -1097,6 +1145,10 @@ def email_car_updates(request, car_id: int):
     этой машины (из ``CarEmailLink``). Строго per-VIN; ни thread, ни
     ``sent_from_container`` тут не влияют.
     """
+    version, unchanged = _unchanged_panel_response(request, PANEL_CAR, car_id)
+    if unchanged is not None:
+        return unchanged
+
     try:
         since_id = int(request.GET.get("since_id", 0))
     except (TypeError, ValueError):
@@ -1139,6 +1191,7 @@ def email_car_updates(request, car_id: int):
             "total": total,
             "unread": unread,
             "bubbles": bubbles,
+            "version": version,
         }
     )
 
@@ -1156,6 +1209,10 @@ def email_autotransport_updates(request, at_id: int):
 
     from core.models import AutoTransport
 
+    version, unchanged = _unchanged_panel_response(request, PANEL_AUTOTRANSPORT, at_id)
+    if unchanged is not None:
+        return unchanged
+
     at = get_object_or_404(AutoTransport, pk=at_id)
     car_ids = list(at.cars.values_list("id", flat=True))
 
@@ -1173,6 +1230,7 @@ def email_autotransport_updates(request, at_id: int):
                 "total": 0,
                 "unread": 0,
                 "bubbles": [],
+                "version": version,
             }
         )
 
@@ -1213,6 +1271,7 @@ def email_autotransport_updates(request, at_id: int):
             "total": total,
             "unread": unread,
             "bubbles": bubbles,
+            "version": version,
         }
     )
 
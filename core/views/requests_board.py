@@ -213,7 +213,7 @@ def _board_card(transport_request) -> dict:
         "declarations": blocks,
         "readiness": readiness,
         "unread": getattr(transport_request, "unread_client_msgs", 0) or 0,
-        "unread_emails": transport_request.email_links.filter(is_read=False).count(),
+        "unread_emails": transport_request.emails_unread,
         "url": reverse("admin_request_card", args=[transport_request.pk]),
     }
 
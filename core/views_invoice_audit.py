@@ -271,7 +271,13 @@ def reconciliation_dashboard(request):
         status__in=[InvoiceAudit.STATUS_OK, InvoiceAudit.STATUS_HAS_ISSUES]
     ).order_by("-invoice_date")
 
-    data = get_reconciliation_summary(audit_ids=audit_ids)
+    # Страница — только у активной вкладки, остальные открываются с первой.
+    active_tab = request.GET.get("tab", "cars")
+    data = get_reconciliation_summary(
+        audit_ids=audit_ids,
+        sort=request.GET.get("sort"),
+        pages={active_tab: request.GET.get("page")},
+    )
 
     context = admin_site.each_context(request)
     context.update(
@@ -280,12 +286,17 @@ def reconciliation_dashboard(request):
             "data": data,
             "totals": data["totals"],
             "cars": data["cars"],
+            "cars_page": data["cars_page"],
             "containers": data["containers"],
+            "containers_page": data["containers_page"],
+            "clients": data["clients"],
+            "clients_page": data["clients_page"],
+            "sort": data["sort"],
             "hints": data["hints"],
             "unlinked": data.get("unlinked", []),
             "all_audits": all_audits,
             "selected_audits": audit_ids or [],
-            "active_tab": request.GET.get("tab", "cars"),
+            "active_tab": active_tab,
         }
     )
     return render(request, "admin/reconciliation_dashboard.html", context)
@@ -3,18 +3,19 @@
 from urllib.parse import urlencode
 
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models import Count, Exists, IntegerField, OuterRef, Prefetch, Subquery, Value
 from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404, render
 
 from core.models import Car, CarModelImage, Container
 from core.models.website import TransportRequest
 from core.models_website import CarPhoto, ClientUser, ContainerPhoto
+from core.services import client_portal_listing
 
 # Размер страницы списка авто в кабинете клиента. Раньше дашборд грузил
 # ВСЕ авто клиента (со всеми публичными фото) — для клиента с сотнями
-# машин это тяжёлый запрос и большой HTML. Теперь — постранично.
+# машин это тяжёлый запрос и большой HTML. Теперь — постранично, по
+# курсору (keyset, см. core.services.client_portal_listing).
 CARS_PER_PAGE = 50
 
 
@@ -102,43 +103,31 @@ def client_dashboard(request):
             )
         )
 
-        if search_query:
-            cars_qs = cars_qs.filter(
-                Q(vin__icontains=search_query)
-                | Q(brand__icontains=search_query)
-                | Q(container__number__icontains=search_query)
-            )
-
         valid_statuses = {code for code, _label in Container.STATUS_CHOICES}
         status_codes = [s for s in selected_statuses if s in valid_statuses]
-        if status_codes:
-            cars_qs = cars_qs.filter(status__in=status_codes)
-        else:
-            # По умолчанию: только «Разгружен» и «В порту». Остальное — через фильтр.
-            cars_qs = cars_qs.filter(status__in=["UNLOADED", "IN_PORT"])
+        # По умолчанию: только «Разгружен» и «В порту». Остальное — через фильтр.
+        effective_statuses = status_codes or ["UNLOADED", "IN_PORT"]
+        cars_qs = cars_qs.filter(status__in=effective_statuses)
         in_request = "IN_REQUEST" in selected_statuses
         no_request = "NO_REQUEST" in selected_statuses
         # Оба сразу = «все», фильтровать нечего.
         if in_request != no_request:
             cars_qs = cars_qs.filter(in_active_request=in_request)
 
-        # UNLOADED — давние разгрузки сверху (рабочий список склада).
-        # TRANSFERRED — свежие передачи сверху: у старых часто нет фото,
-        # иначе первая страница фильтра «Передан» идёт без иконки галереи.
-        cars_qs = cars_qs.order_by(
-            Case(
-                When(status="UNLOADED", then=Value(0)),
-                When(status="IN_PORT", then=Value(1)),
-                default=Value(2),
-                output_field=IntegerField(),
-            ),
-            F("transfer_date").desc(nulls_last=True),
-            F("unload_date").asc(nulls_last=True),
-            "-id",
+        # Счётчики по статусам — из кэша; без поиска и фильтра по заявкам
+        # из них же известен итог («из N»), COUNT по выборке не нужен.
+        counts = client_portal_listing.status_counts(client.pk)
+        total = None
+        if not search_query and in_request == no_request:
+            total = sum(counts.get(code, 0) for code in effective_statuses)
+
+        cars_page = client_portal_listing.paginate_cars(
+            cars_qs,
+            cursor_token=request.GET.get("cursor"),
+            per_page=CARS_PER_PAGE,
+            search=search_query,
+            total=total,
         )
-
-        paginator = Paginator(cars_qs, CARS_PER_PAGE)
-        cars_page = paginator.get_page(request.GET.get("page"))
         _attach_model_images(cars_page.object_list)
 
         # Параметры поиска/фильтра — для сохранения в ссылках пагинации.
@@ -155,7 +144,7 @@ def client_dashboard(request):
             "cars_page": cars_page,
             "search_query": search_query,
             "selected_statuses": selected_statuses,
-            "car_status_choices": Container.STATUS_CHOICES,
+            "car_status_choices": [(code, label, counts.get(code, 0)) for code, label in Container.STATUS_CHOICES],
             "qs_extra": qs_extra,
         }
 
@@ -756,6 +756,8 @@ def transport_request_bulk_status(request, pk):
             "car_id": upload.car_id,
             "status": upload.status,
             "running": upload.is_running,
+            "pages_total": upload.pages_total,
+            "pages_done": upload.pages_done,
             "filename": upload.filename,
             "sorted": upload.sorted_labels,
             "error": upload.error_message,
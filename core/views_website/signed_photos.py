@@ -11,19 +11,24 @@
    защита от подбора ``photo_ids`` сторонним скриптом.
 3. ``GET  /photo/s/<token>/`` — отдаёт сам файл по подписанному токену.
    Throttle снят, потому что в галерее одного контейнера живут сотни
-   превью и глобальный ``AnonRateThrottle`` (30/min) ломал UX.
+   превью и глобальный ``AnonRateThrottle`` (30/min) ломал UX. При
+   ``PHOTO_X_ACCEL`` Django только проверяет подпись, а байты отдаёт nginx
+   (``X-Accel-Redirect`` на internal-location ``PHOTO_X_ACCEL_PREFIX``).
 
 Все детали подписи — в :mod:`core.services.signed_urls`.
 """
 
 import logging
+import mimetypes
 import os
 import tempfile
 import zipfile
+from urllib.parse import quote
 
+from django.conf import settings
 from django.core.cache import cache as django_cache
-from django.http import FileResponse, Http404
-from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
 from django.urls import reverse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
@@ -43,6 +48,59 @@ from core.throttles import PhotoDownloadThrottle
 
 logger = logging.getLogger(__name__)
 
+# Резолв (kind, id, variant) → файл. Сбрасывается сигналами фото
+# (core.signals.photos) при сохранении/удалении, TTL — страховка.
+PHOTO_PATH_CACHE_TTL = 60 * 10
+
+
+def photo_path_cache_key(kind, photo_id, variant):
+    return f"signed_photo_path:{kind}:{photo_id}:{variant}"
+
+
+def _resolve_photo_file(kind, photo_id, variant):
+    """``{"name", "parent_id"}`` публичного фото или ``None``.
+
+    Галерея на сотни превью дёргала БД на каждую картинку; результат
+    кэшируется по ``(kind, id, variant)`` — подписи разные, файл один.
+    """
+    cache_key = photo_path_cache_key(kind, photo_id, variant)
+    cached = django_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if kind == "container":
+        model, parent_field = ContainerPhoto, "container_id"
+    elif kind == "car":
+        model, parent_field = CarPhoto, "car_id"
+    else:
+        return None
+    photo = model.objects.filter(id=photo_id, is_public=True).first()
+    if photo is None:
+        return None
+
+    if variant == "thumb" and getattr(photo, "thumbnail", None):
+        file_field = photo.thumbnail
+    else:
+        file_field = photo.photo
+    if not file_field:
+        return None
+
+    resolved = {"name": file_field.name, "parent_id": getattr(photo, parent_field)}
+    django_cache.set(cache_key, resolved, PHOTO_PATH_CACHE_TTL)
+    return resolved
+
+
+def _accel_response(name):
+    """Пустой ответ с ``X-Accel-Redirect``: файл отдаёт nginx из
+    internal-location, gthread-воркер освобождается сразу."""
+    prefix = getattr(settings, "PHOTO_X_ACCEL_PREFIX", "/protected-media/")
+    response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or "application/octet-stream")
+    response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(name)
+    # nginx пробрасывает Cache-Control из исходного ответа; URL живёт не
+    # дольше подписи, так что браузер может держать превью до её истечения.
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
+
 
 def _build_signed_photo_url(request, kind, photo_id, variant):
     """Абсолютный URL ``/photo/s/<token>/`` для отдачи фотографии.
@@ -281,6 +339,11 @@ def serve_signed_photo(request, token):
     :func:`get_container_photos` под ``PhotoDownloadThrottle`` (30/min),
     а сами подписи живут только 1 час.
 
+    Отдача: при ``PHOTO_X_ACCEL`` — только заголовок ``X-Accel-Redirect``
+    (байты шлёт nginx, воркер не занят на время передачи), иначе —
+    ``FileResponse``. Путь к файлу берётся из :func:`_resolve_photo_file`
+    (кэш, без запроса к БД на повторные превью).
+
     Логирование: каждый скачанный файл записывается в ``logger.info(...)``
     с client_ip, photo_id, container/car_id — для аудита массовых
     выгрузок через Sentry / ``grep`` по journalctl.
@@ -296,29 +359,14 @@ def serve_signed_photo(request, token):
         )
         return Response({"error": "Недопустимая ссылка"}, status=403)
 
-    if kind == "container":
-        photo = get_object_or_404(
-            ContainerPhoto.objects.select_related("container"),
-            id=photo_id,
-            is_public=True,
-        )
-        parent_id = photo.container_id
-    elif kind == "car":
-        photo = get_object_or_404(
-            CarPhoto.objects.select_related("car"),
-            id=photo_id,
-            is_public=True,
-        )
-        parent_id = photo.car_id
-    else:
+    resolved = _resolve_photo_file(kind, photo_id, variant)
+    if resolved is None:
         raise Http404
 
-    if variant == "thumb" and getattr(photo, "thumbnail", None):
-        file_field = photo.thumbnail
-    else:
-        file_field = photo.photo
-
-    if not file_field or not os.path.exists(file_field.path):
+    accel = getattr(settings, "PHOTO_X_ACCEL", False)
+    path = default_storage.path(resolved["name"])
+    # С X-Accel отсутствующий файл — 404 от самого nginx; stat в Django не нужен.
+    if not accel and not os.path.exists(path):
         raise Http404
 
     logger.info(
@@ -326,8 +374,11 @@ def serve_signed_photo(request, token):
         kind,
         photo_id,
         variant,
-        parent_id,
+        resolved["parent_id"],
         request.META.get("REMOTE_ADDR"),
     )
 
-    return FileResponse(file_field.open("rb"))
+    if accel:
+        return _accel_response(resolved["name"])
+    # dev / без nginx: стримим сами.
+    return FileResponse(open(path, "rb"))
@@ -2,7 +2,8 @@
 
 Throttle (`TrackShipmentThrottle`) ограничивает частоту запросов на IP,
 чтобы исключить перебор номеров. Найденный груз пишется в
-``TrackingRequest`` для аналитики и аудита.
+``TrackingRequest`` для аналитики и аудита. Ответы кэшируются по
+нормализованному номеру (:mod:`core.services.tracking_cache`).
 """
 
 import logging
@@ -17,23 +18,106 @@ from rest_framework.response import Response
 from core.models import Car, Container
 from core.models_website import CarPhoto, ContainerPhoto, TrackingRequest
 from core.serializers_website import ClientCarSerializer, ClientContainerSerializer
+from core.services import tracking_cache
 from core.throttles import TrackShipmentThrottle
 
 logger = logging.getLogger(__name__)
 
 
-@api_view(["POST"])
+_PHOTO_LISTS = ("photos", "container_photos")
+_PHOTO_URL_FIELDS = ("photo", "photo_url")
+
+
+def _absolutize_photo_urls(body, request):
+    """Копия тела ответа с абсолютными ссылками на фото.
+
+    В кэше ссылки относительные: абсолютный URL зависит от хоста запроса.
+    """
+    data = body.get("data")
+    if not data:
+        return body
+    data = dict(data)
+    for list_name in _PHOTO_LISTS:
+        photos = data.get(list_name)
+        if not photos:
+            continue
+        absolute = []
+        for photo in photos:
+            photo = dict(photo)
+            for field in _PHOTO_URL_FIELDS:
+                if photo.get(field):
+                    photo[field] = request.build_absolute_uri(photo[field])
+            absolute.append(photo)
+        data[list_name] = absolute
+    return {**body, "data": data}
+
+
+def _lookup(tracking_number, normalized_number):
+    """Найти груз и собрать запись кэша (тело ответа + id найденного)."""
+    # ClientCarSerializer сериализует и фото авто, и фото контейнера —
+    # префетчим оба, иначе по запросу на каждую коллекцию.
+    car_qs = Car.objects.select_related("container", "container__warehouse", "warehouse").prefetch_related(
+        Prefetch("photos", queryset=CarPhoto.objects.filter(is_public=True)),
+        Prefetch("container__photos", queryset=ContainerPhoto.objects.filter(is_public=True)),
+    )
+
+    # Только точное совпадение VIN. Раньше тут был vin__icontains в качестве
+    # fallback — это давало возможность по частичному совпадению получать
+    # данные чужих автомобилей (security leak).
+    car = car_qs.filter(vin__iexact=tracking_number).first()
+    if not car and normalized_number != tracking_number.upper():
+        car = car_qs.filter(vin__iexact=normalized_number).first()
+
+    if car:
+        logger.info("[TRACK] Найден автомобиль: %s", car.vin)
+        # Без request в контексте сериализатор отдаёт относительные ссылки —
+        # их и кэшируем.
+        body = {"type": "car", "data": ClientCarSerializer(car).data}
+        return tracking_cache.store_entry(normalized_number, status=200, body=body, car_id=car.pk)
+
+    # ClientContainerSerializer.get_cars_count читает container_cars —
+    # префетчим, чтобы не делать отдельный COUNT.
+    container_qs = Container.objects.select_related("warehouse").prefetch_related(
+        Prefetch("photos", queryset=ContainerPhoto.objects.filter(is_public=True)),
+        "container_cars",
+    )
+    container = container_qs.filter(number__iexact=tracking_number).first()
+    if not container and normalized_number != tracking_number.upper():
+        container = container_qs.filter(number__iexact=normalized_number).first()
+
+    if container:
+        logger.info("[TRACK] Найден контейнер: %s", container.number)
+        body = {"type": "container", "data": ClientContainerSerializer(container).data}
+        return tracking_cache.store_entry(normalized_number, status=200, body=body, container_id=container.pk)
+
+    logger.info("[TRACK] Груз не найден: '%s'", tracking_number)
+    body = {"error": "Груз не найден. Проверьте правильность номера."}
+    return tracking_cache.store_entry(normalized_number, status=404, body=body)
+
+
+@api_view(["GET", "POST"])
 @authentication_classes([])
 @permission_classes([AllowAny])
 @throttle_classes([TrackShipmentThrottle])
 def track_shipment(request):
-    """Отследить груз по номеру VIN или контейнера."""
+    """Отследить груз по номеру VIN или контейнера.
+
+    ``POST`` (форма сайта) или ``GET ?tracking_number=`` — для повторных
+    опросов: ответ несёт ``ETag``, и ``GET`` с совпавшим ``If-None-Match``
+    получает ``304`` без тела.
+
+    Ответ кэшируется по нормализованному номеру
+    (:mod:`core.services.tracking_cache`), включая «не найдено» — на
+    короткий срок. Повторный опрос того же номера не ходит в БД за грузом;
+    ``TrackingRequest`` для аналитики пишется на каждый запрос.
+    """
     # H7: ``request.data`` доступ для не-JSON / битого JSON бросает DRF
     # ``ParseError``. Раньше он попадал в ``except Exception`` ниже и
     # отдавался как 500 (с шумом в Sentry и без понятной ошибки клиенту).
     # Достаём данные ДО try/except: DRF сам обработает ParseError → 400.
-    tracking_number = (request.data.get("tracking_number") or "").strip()
-    email = (request.data.get("email") or "").strip()
+    params = request.query_params if request.method == "GET" else request.data
+    tracking_number = (params.get("tracking_number") or "").strip()
+    email = (params.get("email") or "").strip()
 
     logger.info("[TRACK] Поиск груза: '%s'", tracking_number)
 
@@ -45,7 +129,7 @@ def track_shipment(request):
 
     try:
         # Нормализуем: убираем пробелы/тире, переводим в верхний регистр.
-        normalized_number = tracking_number.upper().replace(" ", "").replace("-", "")
+        normalized_number = tracking_cache.normalize_tracking_number(tracking_number)
         logger.info("[TRACK] Нормализованный номер: '%s'", normalized_number)
 
         # Безопасность: VIN — 17 символов, номер контейнера ~11. Слишком короткий
@@ -57,59 +141,34 @@ def track_shipment(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # ClientCarSerializer сериализует и фото авто, и фото контейнера —
-        # префетчим оба, иначе по запросу на каждую коллекцию.
-        car_qs = Car.objects.select_related("container", "container__warehouse", "warehouse").prefetch_related(
-            Prefetch("photos", queryset=CarPhoto.objects.filter(is_public=True)),
-            Prefetch("container__photos", queryset=ContainerPhoto.objects.filter(is_public=True)),
-        )
-
-        # Только точное совпадение VIN. Раньше тут был vin__icontains в качестве
-        # fallback — это давало возможность по частичному совпадению получать
-        # данные чужих автомобилей (security leak).
-        car = car_qs.filter(vin__iexact=tracking_number).first()
-        if not car and normalized_number != tracking_number.upper():
-            car = car_qs.filter(vin__iexact=normalized_number).first()
-
-        container = None
-
-        if not car:
-            # ClientContainerSerializer.get_cars_count читает container_cars —
-            # префетчим, чтобы не делать отдельный COUNT.
-            container_qs = Container.objects.select_related("warehouse").prefetch_related(
-                Prefetch("photos", queryset=ContainerPhoto.objects.filter(is_public=True)),
-                "container_cars",
-            )
-            container = container_qs.filter(number__iexact=tracking_number).first()
-            if not container and normalized_number != tracking_number.upper():
-                container = container_qs.filter(number__iexact=normalized_number).first()
+        entry = tracking_cache.get_entry(normalized_number)
+        if entry is None:
+            entry = _lookup(tracking_number, normalized_number)
 
         # Логируем сам запрос для аналитики (не блокирующее).
         try:
             TrackingRequest.objects.create(
                 tracking_number=tracking_number,
                 email=email,
-                car=car,
-                container=container,
+                car_id=entry["car_id"],
+                container_id=entry["container_id"],
                 ip_address=request.META.get("REMOTE_ADDR"),
             )
         except Exception as e:
             logger.warning("[TRACK] Не удалось сохранить TrackingRequest: %s", e)
 
-        if car:
-            logger.info("[TRACK] Найден автомобиль: %s", car.vin)
-            serializer = ClientCarSerializer(car, context={"request": request})
-            return Response({"type": "car", "data": serializer.data})
-        elif container:
-            logger.info("[TRACK] Найден контейнер: %s", container.number)
-            serializer = ClientContainerSerializer(container, context={"request": request})
-            return Response({"type": "container", "data": serializer.data})
+        if (
+            request.method == "GET"
+            and entry["status"] == 200
+            and entry["etag"] in request.headers.get("If-None-Match", "")
+        ):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
         else:
-            logger.info("[TRACK] Груз не найден: '%s'", tracking_number)
-            return Response(
-                {"error": "Груз не найден. Проверьте правильность номера."},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+            response = Response(_absolutize_photo_urls(entry["body"], request), status=entry["status"])
+        if entry["status"] == 200:
+            response["ETag"] = entry["etag"]
+            response["Cache-Control"] = "private, no-cache"
+        return response
     except APIException:
         # Любые DRF-исключения (ParseError, NotAuthenticated, Throttled,
         # NotFound и т.д.) пробрасываем — DRF сам отдаст правильный код.
@@ -55,6 +55,30 @@ app.conf.beat_schedule = {
         # меньше запусков и риск 429 от Gmail.
         "schedule": crontab(minute="*/2"),
     },
+    "reconcile-email-counters-nightly": {
+        # Сверка денормализованных счётчиков писем на карточках
+        # (core/services/email_counters.py) — страховка от дрейфа.
+        "task": "core.tasks_email.reconcile_email_counters_task",
+        "schedule": crontab(hour=2, minute=40),
+    },
+    "reconcile-car-profitability-nightly": {
+        # Пересборка сводки прибыли по машинам для Dashboard сверки
+        # (core/services/car_profitability.py) — страховка от дрейфа.
+        "task": "core.tasks.reconcile_car_profitability_task",
+        "schedule": crontab(hour=2, minute=50),
+    },
+    "refresh-comparison-buckets-nightly": {
+        # Пересборка месячных бакетов отчёта сравнения за последние
+        # COMPARISON_BUCKETS_NIGHTLY_MONTHS месяцев (core/services/comparison_buckets.py).
+        "task": "core.tasks.refresh_comparison_buckets_task",
+        "schedule": crontab(hour=2, minute=55),
+    },
+    "refresh-expense-rollup-nightly": {
+        # Пересборка месячной свёртки расходов за последние
+        # EXPENSE_ROLLUP_NIGHTLY_MONTHS месяцев (core/services/expense_rollup.py).
+        "task": "core.tasks.refresh_expense_rollup_task",
+        "schedule": crontab(hour=3, minute=5),
+    },
     "check-business-rules-daily": {
         # Аудит 3 бизнес-правил (FACT/AV/PARDP). При превышении baseline
         # логируется warning → Sentry создаёт issue. См. core/tasks.py
@@ -77,16 +101,33 @@ app.conf.beat_schedule = {
         "task": "core.tasks_monitoring.collect_system_metrics",
         "schedule": crontab(minute="*/5"),
     },
+    # Свёртка метрик в 5m/1h для графиков 7–90 дней (core/services/metric_rollup.py).
+    # Минута со сдвигом — чтобы снимок :x0/:x5 уже был записан.
+    "rollup-system-metrics": {
+        "task": "core.tasks_monitoring.rollup_system_metrics",
+        "schedule": crontab(minute="1-59/5"),
+    },
     # Пинг /health/ для расчёта SLA-аптайма.
     "ping-uptime": {
         "task": "core.tasks_monitoring.ping_uptime",
         "schedule": crontab(minute="*"),
     },
-    # Удаление метрик старше MONITORING_RETENTION_DAYS (по дефолту 30 дней).
+    # Удаление метрик старше MONITORING_RETENTION_DAYS (по дефолту 30 дней),
+    # сырых SystemMetric и свёрток — по MONITORING_*_RETENTION_*.
     "cleanup-old-metrics-daily": {
         "task": "core.tasks_monitoring.cleanup_old_metrics",
         "schedule": crontab(hour=4, minute=0),
     },
+    # Кэш отрендеренных страниц PDF для Vision (core/services/pdf_processing.py).
+    "cleanup-pdf-render-cache-daily": {
+        "task": "core.tasks.cleanup_pdf_render_cache",
+        "schedule": crontab(hour=4, minute=30),
+    },
+    # Файлы фоновых экспортов админки (core/admin/export.py).
+    "cleanup-admin-exports-daily": {
+        "task": "core.tasks.cleanup_admin_exports",
+        "schedule": crontab(hour=4, minute=45),
+    },
     # Проверка свежести ночного PostgreSQL-бэкапа. Ночной cron делает
     # /var/backups/logist2/${DB_NAME}_YYYY-MM-DD.dump в 03:30, эта задача
     # в 04:15 убеждается, что свежий .dump существует и не старше 36 часов.
@@ -130,6 +130,8 @@ MIDDLEWARE = [
     # M7: structured logging — request_id / user_id / path в каждой
     # записи лога. Должен идти ПОСЛЕ AuthenticationMiddleware.
     "core.middleware_logging.RequestContextMiddleware",
+    # Время ответа / число SQL по эндпоинтам → RequestMetric (system monitor).
+    "core.middleware_performance.RequestMetricsMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -258,6 +260,19 @@ CELERY_TIMEZONE = "UTC"
 CELERY_TASK_TIME_LIMIT = 300
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Склейка фоновых пересчётов (core.services.task_coalescer): ключи
+# (id машин) копятся в Redis и уходят одним батчем через окно debounce,
+# секунд. 0 или пустой URL — постановка задачи сразу, без склейки.
+TASK_COALESCE_WINDOW = int(os.getenv("TASK_COALESCE_WINDOW", "5"))
+TASK_COALESCE_REDIS_URL = os.getenv(
+    "TASK_COALESCE_REDIS_URL",
+    (
+        f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', '6379')}/3"
+        if _cache_backend == "redis"
+        else ""
+    ),
+)
+
 # ---------------------------------------------------------------------------
 # Auth
 # ---------------------------------------------------------------------------
@@ -316,6 +331,13 @@ STORAGES = {
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.getenv("MEDIA_ROOT", BASE_DIR / "media")
 
+# Отдача фото по подписанным ссылкам (/photo/s/<token>/) через nginx:
+# Django проверяет подпись и возвращает X-Accel-Redirect на internal-
+# location PHOTO_X_ACCEL_PREFIX (alias на MEDIA_ROOT, см. nginx/default.conf).
+# Выключено — файл стримит сам Django (dev / без nginx).
+PHOTO_X_ACCEL = str(os.getenv("PHOTO_X_ACCEL", "False")).lower() == "true"
+PHOTO_X_ACCEL_PREFIX = os.getenv("PHOTO_X_ACCEL_PREFIX", "/protected-media/")
+
 # ---------------------------------------------------------------------------
 # DRF
 # ---------------------------------------------------------------------------
@@ -569,6 +591,23 @@ AGENT_MODEL = os.getenv("AGENT_MODEL", "claude-sonnet-5")
 # Модель для AI-обработки сканов (титулы / dock receipts). По умолчанию —
 # та же, что у агента; можно переопределить отдельно через env.
 SCAN_AI_MODEL = os.getenv("SCAN_AI_MODEL", AGENT_MODEL)
+# Рендер PDF-страниц для Vision (core/services/pdf_processing.py): дисковый
+# кэш по SHA-256 файла (пусто = выключен) и число потоков JPEG-кодирования
+# (0 = min(4, CPU)). Каталог НЕ под MEDIA_ROOT — там сканы клиентов.
+PDF_RENDER_CACHE_DIR = os.getenv("PDF_RENDER_CACHE_DIR", os.path.join(BASE_DIR, "data", "pdf_render_cache"))
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "0"))
+PDF_RENDER_CACHE_DAYS = int(os.getenv("PDF_RENDER_CACHE_DAYS", "14"))
+# Экспорт выборок админки (core/admin/export.py): выше ADMIN_EXPORT_ASYNC_ROWS
+# строк файл собирается celery-задачей в ADMIN_EXPORT_DIR (не под MEDIA_ROOT —
+# отдаётся только staff по подписанной ссылке) и хранится ADMIN_EXPORT_KEEP_DAYS.
+ADMIN_EXPORT_ASYNC_ROWS = int(os.getenv("ADMIN_EXPORT_ASYNC_ROWS", "50000"))
+ADMIN_EXPORT_DIR = os.getenv("ADMIN_EXPORT_DIR", os.path.join(BASE_DIR, "data", "admin_exports"))
+ADMIN_EXPORT_KEEP_DAYS = int(os.getenv("ADMIN_EXPORT_KEEP_DAYS", "3"))
+
+# Разбор пакета «одним файлом» (core/services/transport_bulk_split.py):
+# сколько чанков страниц классифицируется в Claude Vision одновременно.
+# Ограничено, чтобы один большой файл не выбирал весь лимит запросов API.
+BULK_SPLIT_CLASSIFY_WORKERS = int(os.getenv("BULK_SPLIT_CLASSIFY_WORKERS", "4"))
 
 # ── Track & Trace API морских линий (обновление ETA контейнеров) ──────────
 # Maersk: developer.maersk.com → приложение → Consumer Key + Client Secret
@@ -609,6 +648,11 @@ GMAIL_REFRESH_TOKEN = os.getenv("GMAIL_REFRESH_TOKEN", "").strip()
 GMAIL_USER_EMAIL = os.getenv("GMAIL_USER_EMAIL", "").strip()
 GMAIL_INITIAL_LOOKBACK_DAYS = int(os.getenv("GMAIL_INITIAL_LOOKBACK_DAYS", "30"))
 GMAIL_MAX_ATTACHMENT_MB = int(os.getenv("GMAIL_MAX_ATTACHMENT_MB", "25"))
+# Параллельные загрузки вложений при синке ящика (потоков на страницу писем).
+GMAIL_ATTACHMENT_WORKERS = int(os.getenv("GMAIL_ATTACHMENT_WORKERS", "4"))
+# Сколько живёт версия переписки карточки (core.services.email_live) —
+# страховка для путей, меняющих связи писем в обход live-модуля.
+EMAIL_PANEL_VERSION_TTL = int(os.getenv("EMAIL_PANEL_VERSION_TTL", "300"))
 GMAIL_TOKEN_URI = "https://oauth2.googleapis.com/token"
 # Scopes: чтение + отправка (Phase 2).
 # При изменении — перегенерировать refresh_token через
@@ -676,9 +720,29 @@ COMPANY_WEBSITE = "https://caromoto-lt.com"
 # Сколько дней хранить SystemMetric/UptimeCheck. По дефолту 30 дней
 # (~8 600 + 43 200 строк = ≈10 MB на postgres).
 MONITORING_RETENTION_DAYS = int(os.getenv("MONITORING_RETENTION_DAYS", "30"))
+# Уровни хранения SystemMetric (core.services.metric_rollup): сырые снимки
+# (не меньше 24 ч — график «24 часа»), свёртки 5 минут (график 7 дней)
+# и часовые (30/90 дней).
+MONITORING_RAW_RETENTION_HOURS = int(os.getenv("MONITORING_RAW_RETENTION_HOURS", "48"))
+MONITORING_5M_RETENTION_DAYS = int(os.getenv("MONITORING_5M_RETENTION_DAYS", "14"))
+MONITORING_HOURLY_RETENTION_DAYS = int(os.getenv("MONITORING_HOURLY_RETENTION_DAYS", "400"))
 # URL для ping_uptime task. Локально — gunicorn/runserver, на сервере —
 # nginx upstream. По дефолту локальный health endpoint.
 MONITORING_HEALTH_URL = os.getenv("MONITORING_HEALTH_URL", "http://127.0.0.1:8000/health/")
+# Замер запросов по эндпоинтам (core.middleware_performance): метрики
+# копятся в памяти процесса и сливаются в RequestMetric раз в N секунд.
+REQUEST_METRICS_ENABLED = str(os.getenv("REQUEST_METRICS_ENABLED", "True")).lower() == "true"
+REQUEST_METRICS_FLUSH_SECONDS = int(os.getenv("REQUEST_METRICS_FLUSH_SECONDS", "60"))
+# Телеметрия Celery-задач (core.signals.task_telemetry) → TaskMetric.
+TASK_METRICS_ENABLED = str(os.getenv("TASK_METRICS_ENABLED", "True")).lower() == "true"
+TASK_METRICS_FLUSH_SECONDS = int(os.getenv("TASK_METRICS_FLUSH_SECONDS", "60"))
+# Алерт монитора, если задача в среднем ждёт воркера дольше N секунд.
+TASK_WAIT_ALERT_SECONDS = int(os.getenv("TASK_WAIT_ALERT_SECONDS", "120"))
+# Сколько последних месяцев бакетов отчёта сравнения пересобирать ночью
+# (core.services.comparison_buckets) — догоняет пути в обход сигналов.
+COMPARISON_BUCKETS_NIGHTLY_MONTHS = int(os.getenv("COMPARISON_BUCKETS_NIGHTLY_MONTHS", "3"))
+# То же для месячной свёртки расходов (core.services.expense_rollup).
+EXPENSE_ROLLUP_NIGHTLY_MONTHS = int(os.getenv("EXPENSE_ROLLUP_NIGHTLY_MONTHS", "3"))
 
 # ---------------------------------------------------------------------------
 # Sentry (error monitoring) — optional, enabled only when SENTRY_DSN is set
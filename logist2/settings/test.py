@@ -67,9 +67,21 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Без Redis: пересчёты ставятся сразу (тесты склейки подставляют клиент).
+TASK_COALESCE_REDIS_URL = ""
+
 PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.MD5PasswordHasher",
 ]
 
+# Дисковый кэш рендера PDF в тестах выключен (тесты кэша включают его
+# через settings-фикстуру во временный каталог).
+PDF_RENDER_CACHE_DIR = ""
+
+# Замер запросов/задач пишет в БД после ответа — это ломало бы бюджеты
+# запросов в тестах; тесты телеметрии включают его через settings-фикстуру.
+REQUEST_METRICS_ENABLED = False
+TASK_METRICS_ENABLED = False
+
 # Не тянем Sentry в тестах даже если DSN утёк в env.
 SENTRY_DSN = ""
@@ -10,6 +10,7 @@ from core.views import (
     get_container_data,
     get_client_balance,
     company_dashboard,
+    admin_export_download,
     get_payment_objects,
     search_partners_api,
     get_warehouse_cars_api,
@@ -121,6 +122,7 @@ urlpatterns = [
     path("admin/cash-income/", add_cash_income, name="add_cash_income"),
     path("admin/cash-wallet/reset/", cash_wallet_reset, name="cash_wallet_reset"),
     path("admin/expense-analytics/", expense_analytics, name="expense_analytics"),
+    path("admin/exports/<str:token>/", admin_export_download, name="admin_export_download"),
     path("admin/expense-receipt/<int:tx_id>/", upload_expense_receipt, name="upload_expense_receipt"),
     path("admin/personal-cards/", personal_cards_page, name="personal_cards_page"),
     path("admin/personal-cards/add/", personal_card_add, name="personal_card_add"),